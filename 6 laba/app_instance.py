@@ -1,11 +1,17 @@
 # Импортируем Flask — это микрофреймворк для создания веб-приложений.
 from flask import Flask, jsonify
 
+# Модуль argparse разбирает аргументы, переданные при запуске программы.
+import argparse
+
+# Модуль random — случайные задержки и ошибки (для проверки балансировщика).
+import random
+
 # Модуль socket нужен, чтобы узнать имя компьютера (хоста).
 import socket
 
-# Модуль sys позволяет получать аргументы, переданные при запуске программы.
-import sys
+# Модуль time — искусственная задержка ответа.
+import time
 
 # Создаём объект приложения Flask.
 app = Flask(__name__)
@@ -13,7 +19,19 @@ app = Flask(__name__)
 # Получаем порт, который передаётся при запуске программы.
 # Например: python app_instance.py 5001
 # Если порт не указан, то по умолчанию используем 5001.
-port = int(sys.argv[1]) if len(sys.argv) > 1 else 5001
+#
+# Необязательные параметры делают инстанс "плохим" — чтобы проверить повторы,
+# хеджирование и выключатели балансировщика:
+#   python app_instance.py 5002 --latency 5 --slow-rate 0.05 --slow-latency 300 --error-rate 0.1
+parser = argparse.ArgumentParser(description="Инстанс приложения")
+parser.add_argument("port", type=int, nargs="?", default=5001)
+parser.add_argument("--latency", type=float, default=0, help="задержка каждого ответа /process, мс")
+parser.add_argument("--slow-rate", type=float, default=0, help="доля запросов с дополнительной задержкой")
+parser.add_argument("--slow-latency", type=float, default=0, help="дополнительная задержка, мс")
+parser.add_argument("--error-rate", type=float, default=0, help="доля запросов, на которые отвечаем 500")
+parser.add_argument("--cache-control", default="", help='заголовок Cache-Control ответа /process, например "max-age=30"')
+args = parser.parse_args()
+port = args.port
 
 
 @app.route('/health')
@@ -38,9 +56,24 @@ def process():
     Симулирует обработку запроса.
     В реальном проекте здесь могла бы быть бизнес-логика (например, расчёты).
     """
-    return jsonify({
+    # Искусственная задержка: постоянная часть и редкие долгие ответы ("хвост").
+    delay = args.latency
+    if args.slow_rate and random.random() < args.slow_rate:
+        delay += args.slow_latency
+    if delay:
+        time.sleep(delay / 1000)
+
+    # Искусственная ошибка.
+    if args.error_rate and random.random() < args.error_rate:
+        return jsonify({"error": f"Simulated failure on port {port}"}), 500
+
+    response = jsonify({
         "message": f"Processed by instance on port {port}"
     })
+    # Разрешение кэшировать ответ (его учитывает кэш балансировщика).
+    if args.cache_control:
+        response.headers["Cache-Control"] = args.cache_control
+    return response
 
 
 # Эта конструкция гарантирует, что приложение запустится
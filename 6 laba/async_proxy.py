@@ -0,0 +1,505 @@
+# Асинхронный режим балансировщика: обратный прокси на asyncio.
+#
+# Flask-маршрут /process (load_balancer.py) разбирает JSON от инстанса и собирает его заново
+# через jsonify, отвечает всегда 200 и теряет заголовки инстанса, а каждый запрос
+# занимает поток. Этот прокси:
+#   * пересылает любой путь и любой метод на активный инстанс (та же стратегия выбора,
+#     тот же реестр инстансов и та же фоновая проверка здоровья, что в load_balancer.py);
+#   * передаёт тела запроса и ответа потоком, кусками, не разбирая их
+#     (Content-Length, Transfer-Encoding: chunked или "до закрытия соединения");
+#   * сохраняет код ответа и заголовки инстанса — убираются только hop-by-hop заголовки
+#     (Connection, Keep-Alive, Upgrade, ...), которые относятся к одному соединению;
+#   * держит keep-alive и с клиентами, и с инстансами (пул простаивающих соединений
+#     на каждый инстанс), так что тысячи клиентских соединений обслуживает одно ядро.
+#
+# Ошибки: если инстанс не ответил до начала ответа — клиент получает 503 "Инстанс недоступен".
+# Если обрыв случился посреди ответа, клиентское соединение закрывается — половину ответа
+# уже не исправить. Сбои и ответы 5xx учитывает пассивная проверка (health.py), как в /process.
+# Запросы, ошибки и задержки попадают в те же метрики (metrics.py, /metrics веб-интерфейса).
+#
+# Веб-интерфейс управления пулом (Flask) можно запустить в этом же процессе на отдельном
+# порту (--admin-port): он работает с тем же реестром инстансов.
+#
+# Запуск:
+#   python async_proxy.py
+#   python async_proxy.py --port 8080 --admin-port 8000
+
+# argparse — разбор аргументов командной строки.
+import argparse
+
+# asyncio — цикл событий, TCP-сервер и соединения с инстансами.
+import asyncio
+
+# json — тела ответов с ошибками.
+import json
+
+# os — настройки из переменных окружения.
+import os
+
+# threading — веб-интерфейс управления в отдельном потоке.
+import threading
+
+# time — время ответа инстанса (для стратегии peak_ewma).
+import time
+
+# deque — простаивающие соединения с инстансом.
+from collections import deque
+
+# Общий список инстансов, стратегия выбора и фоновая проверка здоровья.
+import load_balancer
+
+
+# ==================== Настройки ====================
+
+# Сколько простаивающих keep-alive соединений держать к каждому инстансу.
+POOL_SIZE = load_balancer.POOL_SIZE
+# Сколько запросов одновременно можно отправить одному инстансу; остальные сразу получают 503.
+MAX_IN_FLIGHT = load_balancer.MAX_IN_FLIGHT
+# Таймауты (в секундах): соединение с инстансом, ожидание данных от инстанса.
+CONNECT_TIMEOUT = load_balancer.CONNECT_TIMEOUT
+READ_TIMEOUT = load_balancer.READ_TIMEOUT
+# Сколько секунд ждать следующий запрос (или данные тела) от клиента.
+CLIENT_TIMEOUT = float(os.environ.get("LB_CLIENT_TIMEOUT", "60"))
+
+# Предельный размер заголовков; тело передаётся кусками по CHUNK_SIZE байт.
+MAX_HEADER_BYTES = 64 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# Заголовки одного соединения (RFC 9110, 7.6.1) — инстансу и клиенту не передаются.
+# Transfer-Encoding остаётся: тело пересылается как есть, в той же кодировке.
+HOP_BY_HOP = {b"connection", b"keep-alive", b"proxy-connection", b"proxy-authenticate",
+              b"proxy-authorization", b"te", b"trailer", b"upgrade"}
+
+
+class ReadFailed(Exception):
+    """
+    Источник тела (клиент или инстанс) оборвал соединение, замолчал или прислал неверные данные.
+    """
+
+
+class UpstreamFailed(Exception):
+    """
+    Инстанс не ответил: ошибка соединения, таймаут или неверный ответ.
+    """
+
+
+def error_response(status, reason, message, keep_alive):
+    payload = json.dumps({"error": message}, ensure_ascii=False).encode("utf-8") + b"\n"
+    head = (f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode("ascii") + payload
+
+
+# ==================== Разбор HTTP ====================
+
+def parse_head(head):
+    """
+    Разбирает заголовок сообщения: (первая строка, [(имя, значение), ...]) в байтах.
+    """
+    lines = head[:-4].split(b"\r\n")
+    headers = []
+    for line in lines[1:]:
+        name, sep, value = line.partition(b":")
+        if not sep or not name or name != name.strip():
+            raise ValueError("неверный заголовок")
+        headers.append((name, value.strip()))
+    return lines[0], headers
+
+
+def header_values(headers, name):
+    return [value for key, value in headers if key.lower() == name]
+
+
+def request_key(target, headers):
+    """
+    Ключ запроса для consistent_hash (см. load_balancer.HASH_KEY) или None.
+    """
+    path, _, query = target.decode("latin-1").partition("?")
+
+    def header(name):
+        values = header_values(headers, name.lower().encode("latin-1"))
+        return values[0].decode("latin-1") if values else None
+
+    return load_balancer.HASH_KEY.extract(path, query, header)
+
+
+def connection_options(headers):
+    options = set()
+    for value in header_values(headers, b"connection"):
+        options.update(token.strip().lower() for token in value.split(b","))
+    return options
+
+
+def message_framing(headers):
+    """
+    Как определяется конец тела: ("chunked", None), ("length", n)
+    или (None, None) — в заголовках нет ни того, ни другого.
+    """
+    encodings = b",".join(header_values(headers, b"transfer-encoding")).lower()
+    if encodings:
+        if encodings.rsplit(b",", 1)[-1].strip() != b"chunked":
+            raise ValueError("неподдерживаемый Transfer-Encoding")
+        return "chunked", None
+    lengths = set(header_values(headers, b"content-length"))
+    if not lengths:
+        return None, None
+    length = lengths.pop()
+    if lengths or not length.isdigit():
+        raise ValueError("неверный Content-Length")
+    return "length", int(length)
+
+
+def forward_headers(headers, skip):
+    """
+    Заголовки для пересылки без hop-by-hop и без перечисленных в skip.
+    """
+    skip = HOP_BY_HOP | skip
+    return b"".join(name + b": " + value + b"\r\n"
+                    for name, value in headers if name.lower() not in skip)
+
+
+# ==================== Передача тела потоком ====================
+
+async def read_some(reader, size, timeout):
+    try:
+        data = await asyncio.wait_for(reader.read(size), timeout)
+    except (OSError, asyncio.TimeoutError) as error:
+        raise ReadFailed(repr(error)) from error
+    return data
+
+
+async def read_line(reader, timeout):
+    try:
+        return await asyncio.wait_for(reader.readuntil(b"\r\n"), timeout)
+    except (OSError, EOFError, asyncio.LimitOverrunError, asyncio.TimeoutError) as error:
+        raise ReadFailed(repr(error)) from error
+
+
+async def copy_exactly(reader, writer, length, timeout):
+    while length:
+        chunk = await read_some(reader, min(length, CHUNK_SIZE), timeout)
+        if not chunk:
+            raise ReadFailed("соединение закрыто посреди тела")
+        length -= len(chunk)
+        writer.write(chunk)
+        await writer.drain()
+
+
+async def copy_body(reader, writer, framing, length, timeout):
+    """
+    Пересылает тело из reader в writer кусками, не разбирая его.
+    framing=None — до закрытия соединения. Ошибки чтения — ReadFailed,
+    ошибки записи (ConnectionError) пробрасываются как есть.
+    """
+    if framing == "length":
+        await copy_exactly(reader, writer, length, timeout)
+    elif framing == "chunked":
+        while True:
+            line = await read_line(reader, timeout)
+            writer.write(line)
+            try:
+                size = int(line.split(b";", 1)[0], 16)
+            except ValueError:
+                raise ReadFailed("неверный размер куска")
+            if size == 0:
+                # Необязательные trailer-заголовки и пустая строка в конце.
+                while line != b"\r\n":
+                    line = await read_line(reader, timeout)
+                    writer.write(line)
+                await writer.drain()
+                return
+            await copy_exactly(reader, writer, size + 2, timeout)
+    else:
+        while True:
+            chunk = await read_some(reader, CHUNK_SIZE, timeout)
+            if not chunk:
+                return
+            writer.write(chunk)
+            await writer.drain()
+
+
+# ==================== Соединения с инстансами ====================
+
+class Backend:
+    """
+    Простаивающие keep-alive соединения и счётчики одного инстанса.
+    """
+
+    def __init__(self, ip, port):
+        self.ip = ip
+        self.port = port
+        self.idle = deque()
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+
+    async def connect(self):
+        """
+        Возвращает (reader, writer, взято ли соединение из пула).
+        """
+        while self.idle:
+            reader, writer = self.idle.pop()
+            # Инстанс мог закрыть простаивающее соединение — такое не используем.
+            if not reader.at_eof() and not writer.is_closing():
+                return reader, writer, True
+            writer.close()
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.ip, self.port, limit=MAX_HEADER_BYTES), CONNECT_TIMEOUT)
+        except (OSError, asyncio.TimeoutError) as error:
+            raise UpstreamFailed(f"{self.ip}:{self.port}: {error!r}") from error
+        return reader, writer, False
+
+    def release(self, reader, writer):
+        if len(self.idle) < POOL_SIZE and not writer.is_closing():
+            self.idle.append((reader, writer))
+        else:
+            writer.close()
+
+
+# (ip, порт) -> Backend; создаётся при первом запросе к инстансу.
+backends = {}
+
+
+def get_backend(instance):
+    key = (instance["ip"], instance["port"])
+    backend = backends.get(key)
+    if backend is None:
+        backend = backends[key] = Backend(*key)
+    return backend
+
+
+def stats():
+    return {
+        f"{backend.ip}:{backend.port}": {
+            "in_flight": backend.in_flight,
+            "requests": backend.requests,
+            "errors": backend.errors,
+            "rejected": backend.rejected,
+            "idle_connections": len(backend.idle),
+        }
+        for backend in backends.values()
+    }
+
+
+# ==================== Проксирование ====================
+
+async def exchange(backend, request_head, framing, length, client_reader):
+    """
+    Отправляет запрос инстансу (тело — потоком от клиента) и читает заголовок ответа.
+    Возвращает (reader, writer, строка статуса, заголовки, код).
+    Исключения: UpstreamFailed — инстанс не ответил; ReadFailed — клиент не дослал тело.
+    """
+    has_body = framing == "chunked" or bool(length)
+    # Простаивающее соединение могло закрыться у инстанса как раз сейчас. Запрос без тела
+    # можно повторить на новом соединении; с телом — нельзя, тело у клиента уже прочитано.
+    for attempt in range(2):
+        reader, writer, reused = await backend.connect()
+        try:
+            writer.write(request_head)
+            if has_body:
+                await copy_body(client_reader, writer, framing, length, CLIENT_TIMEOUT)
+            await writer.drain()
+            while True:
+                head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), READ_TIMEOUT)
+                status_line, headers = parse_head(head)
+                version, status, _ = (status_line + b" ").split(b" ", 2)
+                if not version.startswith(b"HTTP/1.") or len(status) != 3:
+                    raise ValueError("неверная строка статуса")
+                code = int(status)
+                # Промежуточные ответы 1xx клиенту не передаём — ждём окончательный.
+                if code >= 200:
+                    return reader, writer, status_line, headers, code
+        except ReadFailed:
+            writer.close()
+            raise
+        except (OSError, EOFError, asyncio.LimitOverrunError, asyncio.TimeoutError, ValueError) as error:
+            writer.close()
+            stale = isinstance(error, asyncio.IncompleteReadError) and not error.partial
+            if reused and not has_body and attempt == 0 and (stale or isinstance(error, ConnectionError)):
+                continue
+            raise UpstreamFailed(f"{backend.ip}:{backend.port}: {error!r}") from error
+
+
+async def reply_error(writer, status, reason, message, keep_alive):
+    writer.write(error_response(status, reason, message, keep_alive))
+    await writer.drain()
+    return keep_alive
+
+
+async def proxy_request(reader, writer, client):
+    """
+    Обслуживает один запрос клиента. Возвращает True, если соединение с клиентом остаётся открытым.
+    """
+    try:
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), CLIENT_TIMEOUT)
+    except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+        return False
+    except asyncio.LimitOverrunError:
+        return await reply_error(writer, 431, "REQUEST HEADER FIELDS TOO LARGE", "Слишком большие заголовки", False)
+    try:
+        request_line, headers = parse_head(head)
+        method, target, version = request_line.split(b" ")
+        if not version.startswith(b"HTTP/1."):
+            raise ValueError("неверная версия")
+        framing, length = message_framing(headers)
+    except ValueError:
+        return await reply_error(writer, 400, "BAD REQUEST", "Неверный запрос", False)
+
+    options = connection_options(headers)
+    if version == b"HTTP/1.1":
+        keep_alive = b"close" not in options
+    else:
+        keep_alive = b"keep-alive" in options
+    # Если инстансу запрос не отправлен, непрочитанное тело запроса оставляет соединение
+    # в неизвестном состоянии — такое соединение закрываем.
+    has_body = framing == "chunked" or bool(length)
+
+    # Запоминаем стратегию: если её сменят, пока идёт запрос, release уйдёт туда же, где был acquire.
+    strategy = load_balancer.strategy
+    key = None
+    if strategy.uses_key:
+        key = request_key(target, headers)
+    instance = strategy.acquire(key=key)
+    if instance is None:
+        return await reply_error(writer, 503, "SERVICE UNAVAILABLE", "Нет доступных инстансов",
+                                 keep_alive and not has_body)
+    backend = get_backend(instance)
+    series = load_balancer.metrics.start(instance)
+    if backend.in_flight >= MAX_IN_FLIGHT:
+        load_balancer.metrics.finish(series, None, "busy")
+        strategy.release(instance)
+        backend.rejected += 1
+        return await reply_error(writer, 503, "SERVICE UNAVAILABLE", "Инстанс перегружен",
+                                 keep_alive and not has_body)
+
+    started = time.perf_counter()
+    failed = False
+    try:
+        keep_alive, failed = await forward(backend, reader, writer, client, method, request_line,
+                                           headers, options, framing, length, keep_alive)
+        return keep_alive
+    except UpstreamFailed:
+        failed = True
+        # Инстанс не ответил. Одна ошибка его не выключает — её учитывает пассивная проверка.
+        return await reply_error(writer, 503, "SERVICE UNAVAILABLE", "Инстанс недоступен",
+                                 keep_alive and not has_body)
+    finally:
+        # Итог запроса — стратегии (время ответа для peak_ewma) и пассивной проверке.
+        latency = time.perf_counter() - started
+        load_balancer.metrics.finish(series, latency, "error" if failed else "ok")
+        strategy.release(instance, latency, failed)
+        load_balancer.health.record(instance, latency, failed)
+
+
+async def forward(backend, reader, writer, client, method, request_line, headers, options,
+                  framing, length, keep_alive):
+    """
+    Пересылает запрос инстансу backend и ответ — клиенту.
+    Возвращает (остаётся ли соединение с клиентом открытым, сбой ли это инстанса: ответ 5xx
+    или обрыв посреди ответа).
+    Исключение UpstreamFailed — инстанс не ответил, ответ клиенту ещё не начат.
+    """
+    has_body = framing == "chunked" or bool(length)
+
+    # Клиент с "Expect: 100-continue" ждёт разрешения отправить тело — даём его сами,
+    # инстансу заголовок Expect не передаём.
+    if has_body and b"100-continue" in (value.lower() for value in header_values(headers, b"expect")):
+        writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+    request_head = (request_line.rsplit(b" ", 1)[0] + b" HTTP/1.1\r\n"
+                    + forward_headers(headers, options | {b"expect"})
+                    + b"X-Forwarded-For: " + client + b"\r\nConnection: keep-alive\r\n\r\n")
+
+    backend.in_flight += 1
+    backend.requests += 1
+    try:
+        try:
+            upstream_reader, upstream_writer, status_line, response_headers, code = await exchange(
+                backend, request_head, framing, length, reader)
+        except UpstreamFailed:
+            backend.errors += 1
+            raise
+
+        if method == b"HEAD" or code in (204, 304):
+            framing, length = "length", 0
+        else:
+            try:
+                framing, length = message_framing(response_headers)
+            except ValueError:
+                backend.errors += 1
+                upstream_writer.close()
+                return await reply_error(writer, 502, "BAD GATEWAY", "Неверный ответ инстанса", False), True
+        response_options = connection_options(response_headers)
+        upstream_keep_alive = (status_line.startswith(b"HTTP/1.1") and b"close" not in response_options
+                               and framing is not None)
+        # Тело "до закрытия соединения" клиенту можно передать только так же.
+        keep_alive = keep_alive and framing is not None
+
+        writer.write(b"HTTP/1.1 " + status_line.split(b" ", 1)[1] + b"\r\n"
+                     + forward_headers(response_headers, response_options)
+                     + (b"Connection: keep-alive\r\n\r\n" if keep_alive else b"Connection: close\r\n\r\n"))
+        try:
+            await copy_body(upstream_reader, writer, framing, length, READ_TIMEOUT)
+            await writer.drain()
+        except ReadFailed:
+            # Инстанс оборвал ответ на середине — клиенту остаётся только закрытое соединение.
+            backend.errors += 1
+            upstream_writer.close()
+            return False, True
+        except ConnectionError:
+            upstream_writer.close()
+            raise
+        if upstream_keep_alive:
+            backend.release(upstream_reader, upstream_writer)
+        else:
+            upstream_writer.close()
+        return keep_alive, code >= 500
+    finally:
+        backend.in_flight -= 1
+
+
+async def handle_client(reader, writer):
+    peer = writer.get_extra_info("peername")
+    client = peer[0].encode("ascii") if peer else b"unknown"
+    try:
+        while await proxy_request(reader, writer, client):
+            pass
+    except (ConnectionError, ReadFailed):
+        # Клиент закрыл соединение или не дослал тело запроса.
+        pass
+    finally:
+        writer.close()
+
+
+# ==================== Запуск ====================
+
+async def serve(host, port):
+    server = await asyncio.start_server(handle_client, host, port, limit=MAX_HEADER_BYTES, backlog=4096)
+    print(f"Прокси: http://{host}:{port}")
+    await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Балансировщик: асинхронный обратный прокси")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--admin-port", type=int, default=0,
+                        help="порт веб-интерфейса управления пулом (0 — не запускать)")
+    args = parser.parse_args()
+    if args.admin_port:
+        threading.Thread(
+            target=load_balancer.app.run,
+            kwargs={"host": args.host, "port": args.admin_port, "threaded": True},
+            daemon=True,
+        ).start()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+# Проверка супервизора (supervisor.py): пул процессов app_instance.py следует за нагрузкой.
+#
+# Балансировщик (Flask /process с пулом соединений) запускается с LB_SUPERVISE=1 и сам
+# поднимает инстансы (задержка ответа --latency мс). Нагрузка меняется ступенями:
+#   низкая   2 соединения    — пул на минимуме;
+#   высокая  --connections   — пул растёт до максимума; посреди ступени один процесс
+#                              пула убивается — супервизор должен его заменить;
+#   низкая   2 соединения    — через down_delay пул выводит лишние инстансы и возвращается
+#                              к минимуму.
+# Раз в 0.2 с читается /supervisor; печатается размер пула по секундам.
+#
+# --check: пул на минимуме при низкой нагрузке, доходит до максимума при высокой и
+# возвращается к минимуму после спада; упавший процесс заменён; все ответы клиентам — 200
+# (выводимый инстанс дорабатывает начатые запросы, запросы к упавшему повторяются).
+#
+# Запуск:
+#   python bench_autoscale.py
+#   python bench_autoscale.py --check
+#   python bench_autoscale.py --connections 48 --high 15
+
+# argparse — разбор аргументов командной строки.
+import argparse
+
+# json — ответ /supervisor.
+import json
+
+# os, signal, sys — остановка процесса пула, код возврата проверки.
+import os
+import signal
+import sys
+
+# threading — опрос /supervisor во время нагрузки.
+import threading
+
+# time — отметки времени.
+import time
+
+# urllib.request — запросы к /supervisor.
+import urllib.request
+
+from bench_proxy import run_load, start_balancer, stop
+
+
+def settings(args):
+    return {
+        "LB_SUPERVISE": "1",
+        "LB_SUPERVISE_MIN": str(args.min),
+        "LB_SUPERVISE_MAX": str(args.max),
+        "LB_SUPERVISE_TARGET_IN_FLIGHT": "3",
+        "LB_SUPERVISE_INTERVAL": "0.5",
+        "LB_SUPERVISE_DOWN_DELAY": str(args.down_delay),
+        "LB_SUPERVISE_ARGS": f"--latency {args.latency:g}",
+        "LB_STRATEGY": "least_outstanding",
+        "LB_SLOW_START": "1",
+        # Убитый процесс разом роняет все свои запросы в полёте; их повторы не должны упереться
+        # в бюджет повторов (он рассчитан на редкие сбои, а не на потерю инстанса).
+        "LB_RETRY_BUDGET_PERCENT": "100",
+    }
+
+
+def supervisor_stats(port):
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/supervisor", timeout=5) as response:
+        return json.loads(response.read())
+
+
+class Watcher:
+    """
+    Опрашивает /supervisor в фоне: [(секунда от начала, ступень, процессов running)].
+    """
+
+    def __init__(self, port):
+        self.port = port
+        self.phase = None
+        self.samples = []
+        self.last = None
+        self.started = time.monotonic()
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stop.wait(0.2):
+            self.last = supervisor_stats(self.port)
+            self.samples.append((time.monotonic() - self.started, self.phase, self.last["running"]))
+
+    def close(self):
+        self.stop.set()
+        self.thread.join()
+
+    def sizes(self, phase, tail=None):
+        """
+        Размеры пула на ступени (tail — только последние tail секунд ступени).
+        """
+        points = [(t, size) for t, p, size in self.samples if p == phase]
+        if tail is not None and points:
+            points = [(t, size) for t, size in points if t >= points[-1][0] - tail]
+        return [size for _, size in points]
+
+
+def crash_one(watcher, delay):
+    # Убивает один процесс пула (SIGKILL — без вывода из пула) через delay секунд.
+    time.sleep(delay)
+    running = [i for i in watcher.last["instances"] if i["state"] == "running"]
+    if running:
+        os.kill(running[-1]["pid"], signal.SIGKILL)
+
+
+def run(args):
+    port, balancer = start_balancer("pooled", [], settings(args))
+    statuses = {}
+    phases = [("low", 2, args.low), ("high", args.connections, args.high), ("down", 2, args.down)]
+    watcher = None
+    try:
+        # Ждём, пока супервизор поднимет минимум инстансов
+        deadline = time.monotonic() + 30
+        while supervisor_stats(port)["running"] < args.min and time.monotonic() < deadline:
+            time.sleep(0.1)
+        watcher = Watcher(port)
+        for phase, connections, duration in phases:
+            watcher.phase = phase
+            crash = None
+            if phase == "high":
+                crash = threading.Thread(target=crash_one, args=(watcher, duration * 0.6), daemon=True)
+                crash.start()
+            rps, p50, p99, part = run_load(port, "/process", connections, duration, args.procs)
+            if crash is not None:
+                crash.join()
+            for status, count in part.items():
+                statuses[status] = statuses.get(status, 0) + count
+            sizes = watcher.sizes(phase)
+            print(f"{phase:<5} {connections:3} соед. {duration:4.0f} с | {rps:6.0f} зап/с | p50 {p50 * 1000:7.2f} мс"
+                  f" | p99 {p99 * 1000:7.2f} мс | пул {min(sizes, default=0)}..{max(sizes, default=0)} | {part}")
+        watcher.close()
+        final = supervisor_stats(port)
+    finally:
+        if watcher is not None:
+            watcher.stop.set()
+        stop([balancer])
+
+    timeline = {}
+    for t, _, size in watcher.samples:
+        timeline[int(t)] = size
+    print("пул по секундам:", " ".join(str(timeline[second]) for second in sorted(timeline)))
+    print(f"перезапусков {final['restarts']}, ростов {final['scale_ups']}, выводов {final['scale_downs']}")
+    return watcher, final, statuses
+
+
+def check(args):
+    watcher, final, statuses = run(args)
+    failures = []
+
+    def report(name, problem):
+        print(f"{name}: {'OK' if problem is None else problem}")
+        if problem is not None:
+            failures.append(problem)
+
+    low = watcher.sizes("low")
+    report(f"1) низкая нагрузка — пул на минимуме ({args.min})",
+           None if low and max(low) == args.min else f"pul {sorted(set(low))}")
+
+    high = watcher.sizes("high")
+    report(f"2) высокая нагрузка — пул вырос до максимума ({args.max})",
+           None if high and max(high) == args.max else f"pul {sorted(set(high))}")
+
+    report("3) убитый процесс заменён", None if final["restarts"] >= 1 else f"perezapuskov {final['restarts']}")
+
+    tail = watcher.sizes("down", tail=1.0)
+    report(f"4) после спада пул вернулся к минимуму ({args.min})",
+           None if tail and set(tail) == {args.min} and final["running"] == args.min
+           else f"pul v kontse {sorted(set(tail))}, running {final['running']}")
+
+    total = sum(statuses.values())
+    report(f"5) ни одного неуспешного ответа ({total} запросов)",
+           None if statuses.get(200, 0) == total and total else f"otvety {statuses}")
+
+    print("OK" if not failures else f"ошибок: {len(failures)}")
+    return not failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Супервизор пула: размер пула следует за нагрузкой")
+    parser.add_argument("--check", action="store_true", help="проверить поведение пула (код выхода 0 — всё в порядке)")
+    parser.add_argument("--min", type=int, default=1)
+    parser.add_argument("--max", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=50, help="задержка ответа инстанса, мс")
+    parser.add_argument("--connections", type=int, default=32, help="соединений на высокой ступени")
+    parser.add_argument("--low", type=float, default=5, help="длительность первой низкой ступени, с")
+    parser.add_argument("--high", type=float, default=10, help="длительность высокой ступени, с")
+    parser.add_argument("--down", type=float, default=10, help="длительность ступени после спада, с")
+    parser.add_argument("--down-delay", type=float, default=3, help="LB_SUPERVISE_DOWN_DELAY, с")
+    parser.add_argument("--procs", type=int, default=2)
+    args = parser.parse_args()
+    if args.check:
+        sys.exit(0 if check(args) else 1)
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+# Бенчмарк и проверка кэша ответов балансировщика (cache.py).
+#
+# 1) Нагрузка: балансировщик (Flask /process с пулом соединений) перед --backends
+#    локальными app_instance.py с задержкой --latency мс. Клиенты запрашивают
+#    /process?item=N, где N распределён по Ципфу (s = --zipf) среди --keys ключей:
+#    несколько ключей очень популярны, у остальных — длинный хвост. Сравниваются кэш
+#    выключенный и включённый: запросы в секунду, p50/p99, сколько запросов дошло
+#    до инстансов (по /metrics балансировщика) и во сколько раз их стало меньше.
+# 2) --check: семантика ResponseCache на подставных часах — срок свежести, LRU по числу
+#    записей и по байтам, объединение одновременных промахов, Cache-Control ответа,
+#    stale-while-revalidate с одним фоновым обновлением; и сквозная проверка через
+#    балансировщик — заголовки X-Cache, обход кэша и счётчики в /metrics.
+#
+# Запуск:
+#   python bench_cache.py
+#   python bench_cache.py --keys 10000 --zipf 1.1 --duration 10
+#   python bench_cache.py --check
+
+# argparse — разбор аргументов командной строки.
+import argparse
+
+# bisect, itertools, random — ключи по закону Ципфа.
+import bisect
+import itertools
+import random
+
+# sys — код возврата проверки.
+import sys
+
+# threading — одновременные промахи по одному ключу.
+import threading
+
+# time — ожидание фонового обновления.
+import time
+
+# urllib.request — запросы к балансировщику в сквозной проверке и чтение /metrics.
+import urllib.request
+
+# namedtuple — подставной ответ инстанса.
+from collections import namedtuple
+
+from bench_health import report, wait_until
+from bench_proxy import run_load, start_backends, start_balancer, stop
+from cache import COALESCED, HIT, MISS, STALE, ResponseCache
+
+
+Reply = namedtuple("Reply", "status payload failed cache_control size")
+
+# Без повторов и исключения инстансов: меряем только кэш.
+COMMON = {
+    "LB_RETRIES": "0",
+    "LB_SLOW_START": "0",
+    "LB_EJECT_CONSECUTIVE": "1000000",
+    "LB_EJECT_ERROR_RATE": "2",
+    "LB_EJECT_LATENCY_FACTOR": "1000000",
+}
+
+
+class Clock:
+    """
+    Подставные часы: время двигает сама проверка.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Loader:
+    """
+    Подставной запрос к инстансу: считает вызовы, отвечает reply(номер вызова).
+    """
+
+    def __init__(self, cache_control="", status=200, size=10):
+        self.calls = 0
+        self.cache_control = cache_control
+        self.status = status
+        self.size = size
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            self.calls += 1
+            number = self.calls
+        return Reply(self.status, number, self.status >= 500, self.cache_control, self.size)
+
+
+def zipf_paths(keys, s, count, seed=1):
+    """
+    count путей /process?item=N, N по закону Ципфа с показателем s среди keys ключей.
+    """
+    weights = itertools.accumulate(1 / rank ** s for rank in range(1, keys + 1))
+    cumulative = list(weights)
+    rng = random.Random(seed)
+    return [f"/process?item={bisect.bisect_left(cumulative, rng.random() * cumulative[-1])}"
+            for _ in range(count)]
+
+
+def scrape(port):
+    """
+    Из /metrics балансировщика: {имя метрики с метками: значение}.
+    """
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+        text = response.read().decode("utf-8")
+    values = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, _, value = line.rpartition(" ")
+            values[name] = float(value)
+    return values
+
+
+def upstream_requests(values):
+    return sum(value for name, value in values.items() if name.startswith("lb_upstream_requests_total"))
+
+
+# ==================== Нагрузка ====================
+
+def benchmark(args):
+    paths = zipf_paths(args.keys, args.zipf, 50_000)
+    print(f"{args.backends} инстанса по {args.latency:g} мс; {args.keys} ключей по Ципфу (s = {args.zipf:g}),"
+          f" различных в потоке {len(set(paths))}; {args.connections} соединений, {args.duration:g} с")
+    backends = start_backends(args.backends, ["--latency", str(args.latency)])
+    results = {}
+    try:
+        for name, enabled in (("без кэша", "0"), ("с кэшем", "1")):
+            env = dict(COMMON, LB_CACHE=enabled, LB_CACHE_TTL=str(args.ttl))
+            port, balancer = start_balancer("pooled", [p for p, _ in backends], env)
+            try:
+                rps, p50, p99, statuses = run_load(port, paths, args.connections, args.duration, args.procs)
+                values = scrape(port)
+            finally:
+                stop([balancer])
+            total = sum(statuses.values())
+            upstream = upstream_requests(values)
+            results[name] = upstream / max(1, total)
+            line = (f"{name:<9} {rps:7.0f} зап/с | p50 {p50 * 1000:7.2f} мс | p99 {p99 * 1000:7.2f} мс"
+                    f" | до инстансов {upstream:7.0f} из {total} ({results[name]:.1%})")
+            if enabled == "1":
+                served = sum(values.get(f'lb_cache_requests_total{{result="{result}"}}', 0)
+                             for result in ("hit", "stale", "coalesced"))
+                line += f" | из кэша {served / max(1, total):.1%}, записей {values.get('lb_cache_entries', 0):.0f}"
+            print(line)
+    finally:
+        stop([process for _, process in backends])
+    if results["с кэшем"]:
+        print(f"запросов к инстансам на один запрос клиента меньше в {results['без кэша'] / results['с кэшем']:.1f} раза")
+
+
+# ==================== Проверка ====================
+
+def check_semantics(failures):
+    clock = Clock()
+    cache = ResponseCache(ttl=5, stale=10, clock=clock)
+    load = Loader()
+    first = cache.lookup("a", load)
+    second = cache.lookup("a", load)
+    clock.now += 4.9
+    third = cache.lookup("a", load)
+    problem = None
+    if (first[1], second[1], third[1]) != (MISS, HIT, HIT) or load.calls != 1:
+        problem = f"itogi {first[1]}, {second[1]}, {third[1]}, zaprosov {load.calls}"
+    report(failures, "1) свежая запись отдаётся из кэша без запроса к инстансу", problem)
+
+    # Срок вышел, но окно stale-while-revalidate ещё идёт: старый ответ сразу, обновление — одно, в фоне.
+    gate = threading.Event()
+    slow = Loader()
+
+    def blocked():
+        gate.wait(5)
+        return slow()
+
+    clock.now += 1
+    outcomes = [cache.lookup("a", blocked) for _ in range(5)]
+    stale_served = all(reply.payload == 1 and outcome == STALE for reply, outcome in outcomes)
+    gate.set()
+    refreshed = wait_until(lambda: cache.lookup("a", load)[1] == HIT, 3)
+    problem = None
+    if not stale_served or slow.calls != 1 or refreshed is None or cache.lookup("a", load)[0].payload != 1:
+        problem = f"stale {[o for _, o in outcomes]}, fonovykh zaprosov {slow.calls}"
+    report(failures, "2) устаревшая запись отдаётся сразу, в фоне ровно одно обновление", problem)
+
+    # За окном stale запись не отдаётся.
+    clock.now += 16
+    reply, outcome = cache.lookup("a", load)
+    problem = None if outcome == MISS and reply.payload == 2 else f"{outcome}, otvet {reply.payload}"
+    report(failures, "3) после окна stale-while-revalidate — промах и запрос к инстансу", problem)
+
+    # Ошибка при обновлении не вытесняет ещё пригодную запись.
+    clock.now += 6
+    broken = Loader(status=500)
+    cache.lookup("a", broken)
+    wait_until(lambda: cache.stats()["pending"] == 0, 3)
+    reply, outcome = cache.lookup("a", load)
+    problem = None if outcome == STALE and reply.payload == 2 and broken.calls == 1 else f"{outcome}, {reply.payload}"
+    report(failures, "4) ответ 5xx при обновлении не заменяет запись", problem)
+
+    # Одновременные промахи по одному ключу — один запрос к инстансу.
+    cache = ResponseCache(clock=clock)
+    gate = threading.Event()
+    slow = Loader()
+    results = []
+
+    def worker():
+        results.append(cache.lookup("b", blocked)[1])
+
+    threads = [threading.Thread(target=worker) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: cache.stats()["pending"] == 1, 3)
+    time.sleep(0.2)
+    gate.set()
+    for thread in threads:
+        thread.join()
+    problem = None
+    if slow.calls != 1 or sorted(results) != sorted([MISS] + [COALESCED] * 15):
+        problem = f"zaprosov k instansu {slow.calls}, itogi {sorted(results)}"
+    report(failures, "5) 16 одновременных промахов по одному ключу — один запрос к инстансу", problem)
+
+    # LRU: по числу записей и по суммарному размеру.
+    cache = ResponseCache(max_entries=3, clock=clock)
+    for key in "abc":
+        cache.lookup(key, Loader())
+    cache.lookup("a", Loader())
+    cache.lookup("d", Loader())
+    by_count = [key for key in "abcd" if key in cache]
+    cache = ResponseCache(max_bytes=100, clock=clock)
+    for key in "abc":
+        cache.lookup(key, Loader(size=40))
+    by_bytes = [key for key in "abc" if key in cache]
+    stats = cache.stats()
+    problem = None
+    if by_count != ["a", "c", "d"] or by_bytes != ["b", "c"] or stats["bytes"] != 80:
+        problem = f"po chislu ostalis {by_count}, po razmeru {by_bytes}, {stats}"
+    report(failures, "6) LRU: вытесняются давно не использованные записи (по числу и по байтам)", problem)
+
+    # Cache-Control ответа инстанса.
+    cache = ResponseCache(ttl=5, stale=10, clock=clock)
+    expected = {
+        "no-store": None,
+        "private, max-age=60": None,
+        "no-cache": None,
+        "max-age=0": (0.0, 10),
+        "max-age=30": (30.0, 10),
+        "max-age=30, s-maxage=7": (7.0, 10),
+        "max-age=30, stale-while-revalidate=2": (30.0, 2.0),
+        "max-age=30, must-revalidate": (30.0, 0.0),
+        "": (5, 10),
+    }
+    wrong = [f"{value!r}: {cache.freshness(Reply(200, None, False, value, 1))}"
+             for value, policy in expected.items()
+             if cache.freshness(Reply(200, None, False, value, 1)) != policy]
+    if cache.freshness(Reply(404, None, False, "max-age=30", 1)) is not None:
+        wrong.append("404 kehshiruetsya")
+    no_store = Loader("no-store")
+    cache.lookup("c", no_store)
+    cache.lookup("c", no_store)
+    if no_store.calls != 2:
+        wrong.append(f"no-store: zaprosov {no_store.calls}")
+    report(failures, "7) Cache-Control ответа: no-store, private, max-age, s-maxage, swr", wrong[0] if wrong else None)
+
+
+def check_balancer(failures):
+    backends = start_backends(1, ["--cache-control", "max-age=30"])
+    port, balancer = start_balancer("pooled", [p for p, _ in backends], dict(COMMON, LB_CACHE="1"))
+
+    def get(path, headers=None):
+        request = urllib.request.Request(f"http://127.0.0.1:{port}{path}", headers=headers or {})
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.headers.get("X-Cache"), response.headers.get("Cache-Control")
+
+    try:
+        seen = [get("/process?item=1"), get("/process?item=1"), get("/process?item=2"),
+                get("/process?item=1", {"Accept": "text/plain"}),
+                get("/process?item=1", {"Cache-Control": "no-store"}),
+                get("/process?item=1", {"Authorization": "Bearer x"}),
+                get("/process?item=1", {"Cache-Control": "no-cache"}),
+                get("/process?item=1")]
+        values = scrape(port)
+    finally:
+        stop([balancer] + [process for _, process in backends])
+    expected = ["MISS", "HIT", "MISS", "MISS", "BYPASS", "BYPASS", "MISS", "HIT"]
+    problem = None
+    if [outcome for outcome, _ in seen] != expected or seen[1][1] != "max-age=30":
+        problem = f"X-Cache {[outcome for outcome, _ in seen]}, ozhidalos {expected}"
+    elif upstream_requests(values) != 6 or values.get('lb_cache_requests_total{result="hit"}') != 2:
+        hits = values.get('lb_cache_requests_total{result="hit"}')
+        problem = f"v /metrics: do instansov {upstream_requests(values):.0f}, hit {hits}"
+    report(failures, "8) через балансировщик: X-Cache, ключ с параметрами и Accept, обход кэша, /metrics", problem)
+
+
+def check():
+    failures = []
+    check_semantics(failures)
+    check_balancer(failures)
+    print("OK" if not failures else f"ошибок: {len(failures)}")
+    return not failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Кэш ответов балансировщика: нагрузка на инстансы при ключах по Ципфу")
+    parser.add_argument("--check", action="store_true", help="проверить семантику кэша (код выхода 0 — всё в порядке)")
+    parser.add_argument("--backends", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=5, help="задержка ответа инстанса, мс")
+    parser.add_argument("--keys", type=int, default=10000)
+    parser.add_argument("--zipf", type=float, default=1.1, help="показатель распределения Ципфа")
+    parser.add_argument("--ttl", type=float, default=5, help="срок свежести записей, с")
+    parser.add_argument("--connections", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--procs", type=int, default=2)
+    args = parser.parse_args()
+    if args.check:
+        sys.exit(0 if check() else 1)
+    benchmark(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+# Проверка и бенчмарк стратегии consistent_hash (strategies.py).
+#
+# 1) Переезд ключей: 100 000 ключей на 10 инстансах; добавляем 11-й — переехать должны
+#    около 1/11 ключей, и только на новый инстанс; удаляем один — переезжают только его ключи.
+# 2) Перекос: сколько ключей у самого загруженного инстанса относительно среднего
+#    (для разного числа виртуальных узлов).
+# 3) Стоимость выбора (acquire + release с ключом) при 10, 100 и 1000 инстансах
+#    и стоимость перестройки кольца.
+# 4) --check: то же, что 1-2, с проверкой порогов, и сквозная проверка через балансировщик:
+#    три app_instance.py, запросы с заголовком X-Hash-Key, затем /add_instance и /remove_instance.
+#
+# Запуск:
+#   python bench_hashing.py
+#   python bench_hashing.py --check
+
+# argparse — разбор аргументов командной строки.
+import argparse
+
+# os — настройки балансировщика для сквозной проверки.
+import os
+
+# sys — код возврата проверки.
+import sys
+
+# time — замер стоимости.
+import time
+
+from strategies import ConsistentHash
+
+
+KEYS = [f"user-{i}" for i in range(100_000)]
+
+
+def make_instances(count, start=0):
+    return [{"id": i, "ip": "10.0.0.1", "port": 7000 + i, "active": True} for i in range(start, start + count)]
+
+
+def assignment(strategy, keys):
+    return {key: strategy.lookup(key)["port"] for key in keys}
+
+
+def movement(count=10, vnodes=160):
+    """
+    Возвращает (доля ключей, переехавших при добавлении, все ли — на новый инстанс,
+    доля переехавших при удалении, все ли — с удалённого).
+    """
+    strategy = ConsistentHash(vnodes=vnodes)
+    instances = make_instances(count)
+    strategy.update(instances)
+    before = assignment(strategy, KEYS)
+
+    added = make_instances(1, count)[0]
+    strategy.update(instances + [added])
+    after_add = assignment(strategy, KEYS)
+    moved = [key for key in KEYS if before[key] != after_add[key]]
+    to_new = all(after_add[key] == added["port"] for key in moved)
+
+    removed = instances[count // 2]
+    strategy.update([i for i in instances if i is not removed])
+    after_remove = assignment(strategy, KEYS)
+    moved_out = [key for key in KEYS if before[key] != after_remove[key]]
+    from_removed = all(before[key] == removed["port"] for key in moved_out)
+    return len(moved) / len(KEYS), to_new, len(moved_out) / len(KEYS), from_removed
+
+
+def skew(count=10, vnodes=160):
+    """
+    Ключей у самого загруженного инстанса / среднее.
+    """
+    strategy = ConsistentHash(vnodes=vnodes)
+    strategy.update(make_instances(count))
+    loads = {}
+    for port in assignment(strategy, KEYS).values():
+        loads[port] = loads.get(port, 0) + 1
+    return max(loads.values()) / (len(KEYS) / count)
+
+
+def pick_cost(count, rounds=100_000):
+    strategy = ConsistentHash()
+    instances = make_instances(count)
+    started = time.perf_counter()
+    strategy.update(instances)
+    build = time.perf_counter() - started
+    # Инстанс выключен проверкой: точки остальных уже посчитаны, кольцо только пересобирается.
+    started = time.perf_counter()
+    strategy.update(instances[1:])
+    rebuild = time.perf_counter() - started
+    acquire, release = strategy.acquire, strategy.release
+    keys = KEYS[:rounds]
+    started = time.perf_counter()
+    for key in keys:
+        release(acquire(key=key))
+    return (time.perf_counter() - started) / len(keys) * 1e9, build, rebuild
+
+
+def report():
+    print("переезд ключей: 10 инстансов, 100 000 ключей")
+    added, to_new, removed, from_removed = movement()
+    print(f"  +1 инстанс: переехало {added:6.2%} (1/11 = {1 / 11:.2%}), все на новый: {to_new}")
+    print(f"  -1 инстанс: переехало {removed:6.2%} (1/10 = {1 / 10:.2%}), только его ключи: {from_removed}")
+
+    print("\nперекос (максимум / среднее), 10 инстансов:")
+    for vnodes in (40, 160, 640):
+        print(f"  {vnodes:>4} виртуальных узлов: {skew(10, vnodes):.3f}")
+
+    print("\nстоимость выбора (acquire + release с ключом), построения и перестройки кольца:")
+    for count in (10, 100, 1000):
+        cost, build, rebuild = pick_cost(count)
+        print(f"  {count:>5} инстансов: {cost:6.0f} нс, построение {build * 1000:7.2f} мс,"
+              f" перестройка {rebuild * 1000:7.2f} мс")
+
+
+# ==================== Проверка ====================
+
+def check_end_to_end(problems):
+    """
+    Сквозная проверка: балансировщик (Flask test client) перед настоящими app_instance.py.
+    """
+    from bench_proxy import start_backends, stop
+
+    os.environ.setdefault("LB_STRATEGY", "consistent_hash")
+    import load_balancer
+
+    backends = start_backends(4)
+    try:
+        ports = [port for port, _ in backends]
+        initial = load_balancer.registry.replace([{"ip": "127.0.0.1", "port": p} for p in ports[:3]])
+        client = load_balancer.app.test_client()
+        response = client.post("/strategy", json={"name": "consistent_hash"})
+        if response.status_code != 200:
+            problems.append(f"strategiya ne vybrana: {response.status_code}")
+            return
+
+        keys = [f"user-{i}" for i in range(300)]
+
+        def route():
+            answer = {}
+            for key in keys:
+                response = client.get("/process", headers={"X-Hash-Key": key})
+                if response.status_code != 200:
+                    problems.append(f"otvet {response.status_code} dlya {key}")
+                    return {}
+                answer[key] = response.get_json()["message"].rsplit(" ", 1)[1]
+            return answer
+
+        first = route()
+        again = route()
+        if first != again:
+            problems.append("odin klyuch popal na raznye instansy")
+
+        client.post("/add_instance", json={"ip": "127.0.0.1", "port": ports[3]})
+        added = route()
+        moved = [key for key in keys if first[key] != added.get(key)]
+        print(f"  /add_instance: переехало {len(moved)} из {len(keys)} ключей")
+        if not 0.1 <= len(moved) / len(keys) <= 0.4:
+            problems.append(f"pri dobavlenii pereekhalo {len(moved)} klyuchey iz {len(keys)}")
+        if any(added[key] != str(ports[3]) for key in moved):
+            problems.append("pri dobavlenii klyuchi pereekhali ne na novyy instans")
+
+        client.post("/remove_instance", json={"id": initial[0]["id"]})
+        removed = route()
+        moved = [key for key in keys if added[key] != removed.get(key)]
+        print(f"  /remove_instance: переехало {len(moved)} из {len(keys)} ключей")
+        if any(added[key] != str(ports[0]) for key in moved):
+            problems.append("pri udalenii pereekhali klyuchi ostavshikhsya instansov")
+        if any(removed[key] == str(ports[0]) for key in keys):
+            problems.append("klyuchi ostalis na udalyonnom instanse")
+    finally:
+        stop([process for _, process in backends])
+
+
+def check():
+    problems = []
+
+    added, to_new, removed, from_removed = movement()
+    print(f"  +1 инстанс из 10: переехало {added:.2%}, -1: {removed:.2%}")
+    if not 0.06 <= added <= 0.12 or not to_new:
+        problems.append(f"pri dobavlenii pereekhalo {added:.2%}, vse na novyy: {to_new}")
+    if not 0.07 <= removed <= 0.13 or not from_removed:
+        problems.append(f"pri udalenii pereekhalo {removed:.2%}, tolko ego klyuchi: {from_removed}")
+
+    ratio = skew()
+    print(f"  перекос при 160 виртуальных узлах: {ratio:.3f}")
+    if ratio > 1.25:
+        problems.append(f"perekos {ratio:.3f}")
+
+    cost_small, _, _ = pick_cost(10, 20_000)
+    cost_large, _, _ = pick_cost(1000, 20_000)
+    print(f"  выбор: {cost_small:.0f} нс при 10 инстансах, {cost_large:.0f} нс при 1000")
+    if cost_large > 3 * cost_small:
+        problems.append(f"vybor dorozhaet s chislom instansov: {cost_small:.0f} -> {cost_large:.0f} ns")
+
+    check_end_to_end(problems)
+
+    for problem in problems:
+        print("ОШИБКА:", problem)
+    print("OK" if not problems else f"ошибок: {len(problems)}")
+    return not problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="consistent_hash: переезд ключей, перекос и стоимость выбора")
+    parser.add_argument("--check", action="store_true", help="проверить пороги и сквозной сценарий")
+    args = parser.parse_args()
+    if args.check:
+        sys.exit(0 if check() else 1)
+    report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+# Проверка активной и пассивной проверки состояния инстансов (health.py) на локальных
+# "подставных" инстансах, которые по сценарию отказывают и поправляются.
+#
+# Подставной инстанс — маленький HTTP-сервер в этом же процессе с маршрутами /health
+# и /process, режим которого меняется на ходу:
+#   ok      всё отвечает 200;
+#   down    /health и /process отвечают 500;
+#   hang    /health и /process не отвечают дольше таймаута;
+#   broken  /health — 200, а /process — 500 (заметно только по настоящим запросам);
+#   flaky   /health — 200, /process — 500 на двух запросах из трёх;
+#   slow    /health — 200, /process отвечает через 50 мс.
+#
+# Сценарии (балансировщик — load_balancer.py с короткими интервалами, запросы — через /process):
+#   1) 100 инстансов, 20 зависли: все 20 выключены за пару интервалов, остальные работают;
+#   2) одна неудачная проверка инстанс не выключает, fall подряд — выключают; пока инстанс
+#      лежит, проверки идут всё реже; после починки он возвращается через rise проверок;
+#   3) вернувшийся инстанс сначала получает малую долю запросов (плавный старт);
+#   4) /process отвечает 500 — инстанс исключается по ошибкам подряд, через время
+#      исключения возвращается, а при повторе исключается вдвое дольше;
+#   5) доля ошибок и задержка: flaky и slow исключаются по итогам окна, здоровые — нет;
+#   6) если сломаны все, исключается не больше max_eject_percent процентов.
+#
+# Код выхода 0 — все сценарии прошли, 1 — есть расхождения.
+#
+# Запуск:
+#   python bench_health.py --check
+
+# argparse — разбор аргументов командной строки.
+import argparse
+
+# itertools — счётчик запросов режима flaky.
+import itertools
+
+# os, sys — настройки балансировщика через переменные окружения, код выхода.
+import os
+import sys
+
+# threading — серверы подставных инстансов.
+import threading
+
+# time — ожидание и замер времени.
+import time
+
+# http.server — подставные инстансы.
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Короткие интервалы, чтобы сценарии шли секунды, а не минуты.
+SETTINGS = {
+    "LB_HEALTH_INTERVAL": "0.2",
+    "LB_HEALTH_TIMEOUT": "0.3",
+    "LB_HEALTH_RISE": "2",
+    "LB_HEALTH_FALL": "2",
+    "LB_HEALTH_MAX_BACKOFF": "1.6",
+    "LB_HEALTH_WORKERS": "32",
+    "LB_EJECT_CONSECUTIVE": "5",
+    "LB_EJECT_ERROR_RATE": "0.5",
+    "LB_EJECT_LATENCY_FACTOR": "3",
+    "LB_EJECT_MIN_REQUESTS": "10",
+    "LB_EJECT_WINDOW": "2",
+    "LB_EJECT_TIME": "1",
+    "LB_EJECT_MAX_PERCENT": "50",
+    "LB_SLOW_START": "2",
+    # Повторы и выключатели (resilience.py) скрыли бы сбои, которые должна увидеть пассивная проверка.
+    "LB_RETRIES": "0",
+    "LB_BREAKER_FAILURES": "1000000",
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        if self.path == "/health":
+            server.probes += 1
+        mode = server.mode
+        status = 200
+        if mode == "hang":
+            time.sleep(1.0)
+        elif mode == "down":
+            status = 500
+        elif self.path == "/process":
+            if mode == "broken":
+                status = 500
+            elif mode == "flaky" and next(server.counter) % 3:
+                status = 500
+            elif mode == "slow":
+                time.sleep(0.05)
+        body = b'{"message": "Processed by instance on port %d"}' % server.server_address[1]
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Зависший ответ, который балансировщик уже бросил по таймауту, — не ошибка сценария.
+        pass
+
+
+class StandIn:
+    """
+    Подставной инстанс на свободном порту.
+    """
+
+    def __init__(self, mode="ok"):
+        self.server = Server(("127.0.0.1", 0), Handler)
+        self.server.mode = mode
+        self.server.probes = 0
+        self.server.counter = itertools.count()
+        self.port = self.server.server_address[1]
+        # Инстанс в реестре балансировщика (задаёт Scenario).
+        self.registry = None
+        self.id = None
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def instance(self):
+        # Словарь инстанса в реестре — копия из последнего снимка.
+        return self.registry.get(self.id)
+
+    @property
+    def mode(self):
+        return self.server.mode
+
+    @mode.setter
+    def mode(self, mode):
+        self.server.mode = mode
+
+    @property
+    def probes(self):
+        return self.server.probes
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def wait_until(predicate, timeout):
+    """
+    Ждёт, пока predicate() станет истинным. Возвращает прошедшие секунды или None.
+    """
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        if predicate():
+            return time.monotonic() - started
+        time.sleep(0.01)
+    return None
+
+
+class Scenario:
+    def __init__(self, lb, count, mode="ok"):
+        self.lb = lb
+        self.stand_ins = [StandIn(mode) for _ in range(count)]
+        registered = lb.registry.replace([{"ip": "127.0.0.1", "port": s.port} for s in self.stand_ins])
+        for stand_in, instance in zip(self.stand_ins, registered):
+            stand_in.registry, stand_in.id = lb.registry, instance["id"]
+        self.client = lb.app.test_client()
+        # Проверка подхватывает новый список при следующем пробуждении.
+        ports = {f"127.0.0.1:{stand_in.port}" for stand_in in self.stand_ins}
+        wait_until(lambda: {c["instance"] for c in lb.health.stats()} == ports, 2)
+
+    def traffic(self, requests):
+        return [self.client.get("/process").status_code for _ in range(requests)]
+
+    def until_ejected(self, stand_in, limit):
+        """
+        Запросы по одному, пока stand_in не выключат (не больше limit). Возвращает коды ответов.
+        """
+        statuses = []
+        while stand_in.instance["active"] and len(statuses) < limit:
+            statuses += self.traffic(1)
+        return statuses
+
+    def close(self):
+        for stand_in in self.stand_ins:
+            stand_in.close()
+
+
+def check_stats(lb, stand_in):
+    return next(c for c in lb.health.stats() if c["instance"] == f"127.0.0.1:{stand_in.port}")
+
+
+def report(failures, name, problem):
+    print(f"{name}: {'OK' if problem is None else problem}")
+    if problem is not None:
+        failures.append(problem)
+
+
+def check():
+    os.environ.update(SETTINGS)
+    import load_balancer as lb
+
+    failures = []
+    interval = float(SETTINGS["LB_HEALTH_INTERVAL"])
+
+    # 1) Параллельные проверки: 100 инстансов, 20 зависших.
+    scenario = Scenario(lb, 100)
+    hung = scenario.stand_ins[:20]
+    for stand_in in hung:
+        stand_in.mode = "hang"
+    elapsed = wait_until(lambda: not any(s.instance["active"] for s in hung), 5)
+    problem = None
+    if elapsed is None:
+        problem = f"zavisshie ne vyklyucheny: {sum(s.instance['active'] for s in hung)} iz 20 aktivny"
+    elif not all(s.instance["active"] for s in scenario.stand_ins[20:]):
+        problem = "vyklyucheny rabochie instansy"
+    report(failures, f"1) 100 инстансов, 20 зависших выключены за "
+                     f"{elapsed if elapsed is None else round(elapsed, 2)} с "
+                     f"(последовательно — больше {20 * 0.3 * 2:.0f} с)", problem)
+    scenario.close()
+
+    # 2) rise/fall и backoff.
+    scenario = Scenario(lb, 3)
+    target = scenario.stand_ins[0]
+    problem = None
+    wait_until(lambda: target.probes >= 2, 3)
+    target.mode = "down"
+    before = target.probes
+    wait_until(lambda: target.probes > before, 3)
+    target.mode = "ok"
+    time.sleep(3 * interval)
+    if not target.instance["active"]:
+        problem = "odna neudachnaya proverka vyklyuchila instans"
+    target.mode = "down"
+    if problem is None and wait_until(lambda: not target.instance["active"], 3) is None:
+        problem = "instans ne vyklyuchen posle fall proverok"
+    if problem is None:
+        before = target.probes
+        time.sleep(4)
+        probes = target.probes - before
+        # С постоянным интервалом было бы ~20 проверок; с удвоением (0.4, 0.8, 1.6, 1.6...) — ~5.
+        if probes > 8:
+            problem = f"za 4 s lezhachego instansa {probes} proverok — backoff ne rabotaet"
+    if problem is None:
+        target.mode = "ok"
+        elapsed = wait_until(lambda: target.instance["active"], 5)
+        if elapsed is None:
+            problem = "instans ne vernulsya posle pochinki"
+    report(failures, "2) rise/fall: одна ошибка не выключает, fall — выключает, "
+                     "backoff, возврат после rise", problem)
+
+    # 3) Плавный старт вернувшегося инстанса.
+    picks = [lb.strategy.acquire() for _ in range(400)]
+    for instance in picks:
+        lb.strategy.release(instance)
+    early = sum(instance["id"] == target.id for instance in picks) / len(picks)
+    time.sleep(float(SETTINGS["LB_SLOW_START"]) + 0.2)
+    picks = [lb.strategy.acquire() for _ in range(400)]
+    for instance in picks:
+        lb.strategy.release(instance)
+    late = sum(instance["id"] == target.id for instance in picks) / len(picks)
+    problem = None
+    if not early < 0.15 or not late > 0.25:
+        problem = f"dolya srazu posle vozvrata {early:.0%}, posle razgona {late:.0%} (spravedlivaya 33%)"
+    report(failures, f"3) плавный старт: сразу {early:.0%}, через {SETTINGS['LB_SLOW_START']} с {late:.0%}",
+           problem)
+    scenario.close()
+
+    # 4) Пассивное исключение по ошибкам подряд.
+    scenario = Scenario(lb, 3)
+    broken = scenario.stand_ins[0]
+    broken.mode = "broken"
+    statuses = scenario.until_ejected(broken, 100)
+    consecutive = int(SETTINGS["LB_EJECT_CONSECUTIVE"])
+    problem = None
+    if broken.instance["active"]:
+        problem = "instans s oshibkami ne isklyuchen"
+    elif statuses.count(500) != consecutive:
+        problem = f"do isklyucheniya {statuses.count(500)} oshibok (ozhidalos {consecutive})"
+    if problem is None:
+        # Проверки /health проходят, но инстанс остаётся исключённым до конца срока.
+        back = wait_until(lambda: broken.instance["active"], 3)
+        if back is None:
+            problem = "instans ne vernulsya posle sroka isklyucheniya"
+        elif back < 0.8:
+            problem = f"instans vernulsya slishkom rano: {back:.2f} s"
+    if problem is None:
+        # Вернулся всё ещё сломанным (и на плавном старте) — второе исключение вдвое дольше.
+        scenario.until_ejected(broken, 500)
+        stats = check_stats(lb, broken)
+        if stats["ejections"] != 2 or stats["ejected_for"] < 1.5:
+            problem = f"povtornoe isklyuchenie: {stats['ejections']} raz na {stats['ejected_for']} s (ozhidalos 2 s)"
+    report(failures, "4) 500 на /process: исключение после 5 ошибок подряд, возврат, "
+                     "повторное исключение дольше", problem)
+    scenario.close()
+
+    # 5) Доля ошибок и задержка по итогам окна.
+    scenario = Scenario(lb, 5)
+    flaky, slow = scenario.stand_ins[0], scenario.stand_ins[1]
+    flaky.mode, slow.mode = "flaky", "slow"
+    # Исключение длится секунду — запоминаем, кто хоть раз был выключен.
+    seen = set()
+    deadline = time.monotonic() + 8
+    while time.monotonic() < deadline and not {flaky.port, slow.port} <= seen:
+        scenario.traffic(1)
+        seen.update(s.port for s in scenario.stand_ins if not s.instance["active"])
+    problem = None
+    if not {flaky.port, slow.port} <= seen:
+        problem = f"flaky isklyuchen: {flaky.port in seen}, slow isklyuchen: {slow.port in seen}"
+    elif seen - {flaky.port, slow.port}:
+        problem = "isklyucheny zdorovye instansy"
+    report(failures, "5) 500 на 2/3 запросов и задержка 50 мс — исключены по итогам окна", problem)
+    scenario.close()
+
+    # 6) Ограничение: все сломаны — исключена не больше половины.
+    # Исключение длится секунду, а 80 запросов идут дольше: первый исключённый успевает
+    # вернуться, поэтому считаем, сколько было исключено одновременно в худший момент.
+    scenario = Scenario(lb, 4, "broken")
+    ejected = 0
+    for _ in range(80):
+        scenario.traffic(1)
+        ejected = max(ejected, sum(not s.instance["active"] for s in scenario.stand_ins))
+    problem = None if ejected == 2 else f"isklyucheno {ejected} iz 4 odnovremenno (predel 50%)"
+    report(failures, f"6) все 4 отвечают 500 — исключено одновременно не больше {ejected} (предел 50%)", problem)
+    scenario.close()
+
+    return not failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка состояния инстансов: сценарии отказов и починки")
+    parser.add_argument("--check", action="store_true", help="прогнать сценарии (код выхода 0 — всё в порядке)")
+    args = parser.parse_args()
+    if not args.check:
+        parser.print_help()
+        return
+    sys.exit(0 if check() else 1)
+
+
+if __name__ == "__main__":
+    main()
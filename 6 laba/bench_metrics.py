@@ -0,0 +1,201 @@
+# Микробенчмарк и проверка метрик балансировщика (metrics.py).
+#
+# 1) Стоимость учёта одного запроса на пути запроса: start() + finish() —
+#    в одном потоке и когда 8 потоков пишут в одни и те же серии.
+# 2) Стоимость выдачи /metrics и сводки для веб-интерфейса при 10 и 100 инстансах.
+# 3) --check: стоимость учёта меньше --limit микросекунд; после 8 потоков x 20 000 запросов
+#    счётчики точны, в полёте 0; выдача — корректный текстовый формат Prometheus
+#    (корзины гистограммы не убывают, +Inf = _count); квантили по гистограмме попадают
+#    в ту же корзину, что и точные.
+#
+# Запуск:
+#   python bench_metrics.py
+#   python bench_metrics.py --check
+
+# argparse — разбор аргументов командной строки.
+import argparse
+
+# random — задержки для гистограммы.
+import random
+
+# re — разбор строк выдачи.
+import re
+
+# sys — код возврата проверки.
+import sys
+
+# threading — запись из нескольких потоков.
+import threading
+
+# time — замер стоимости.
+import time
+
+from metrics import LATENCY_BUCKETS, Metrics
+
+
+LINE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})? (\S+)$')
+
+
+def make_instances(count):
+    return [{"id": i, "ip": "10.0.0.1", "port": 7000 + i, "active": True} for i in range(count)]
+
+
+def record_cost(metrics, instances, rounds):
+    """
+    Нс на запрос (start + finish) в одном потоке.
+    """
+    latencies = [random.lognormvariate(-5, 1) for _ in range(1024)]
+    start, finish = metrics.start, metrics.finish
+    count = len(instances)
+    began = time.perf_counter()
+    for i in range(rounds):
+        series = start(instances[i % count])
+        finish(series, latencies[i & 1023], "ok")
+    return (time.perf_counter() - began) / rounds * 1e9
+
+
+def empty_cost(instances, rounds):
+    # Тот же цикл без метрик — его вычитаем.
+    latencies = [0.001] * 1024
+    count = len(instances)
+    began = time.perf_counter()
+    for i in range(rounds):
+        instances[i % count]
+        latencies[i & 1023]
+    return (time.perf_counter() - began) / rounds * 1e9
+
+
+def threaded(metrics, instances, threads, rounds):
+    """
+    threads потоков по rounds запросов. Возвращает нс на запрос (по общему времени).
+    """
+    def worker(seed):
+        rng = random.Random(seed)
+        for i in range(rounds):
+            series = metrics.start(instances[i % len(instances)])
+            finish_outcome = "error" if i % 10 == 0 else "ok"
+            metrics.finish(series, rng.lognormvariate(-5, 1), finish_outcome)
+
+    workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+    began = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return (time.perf_counter() - began) / (threads * rounds) * 1e9
+
+
+def read_cost(count, rounds=200):
+    metrics = Metrics()
+    instances = make_instances(count)
+    record_cost(metrics, instances, count * 100)
+    began = time.perf_counter()
+    for _ in range(rounds):
+        metrics.exposition(instances)
+    exposition = (time.perf_counter() - began) / rounds * 1000
+    began = time.perf_counter()
+    for _ in range(rounds):
+        metrics.summary()
+    summary = (time.perf_counter() - began) / rounds * 1000
+    return exposition, summary
+
+
+def parse(text):
+    """
+    Строки выдачи -> [(имя, метки, значение)]. ValueError — строка не в формате.
+    """
+    samples = []
+    for line in text.splitlines():
+        if line.startswith("#"):
+            if not re.match(r"^# (HELP|TYPE) \S+ .+$", line):
+                raise ValueError(line)
+            continue
+        match = LINE.match(line)
+        if match is None:
+            raise ValueError(line)
+        labels = dict(re.findall(r'(\w+)="([^"]*)"', match.group(2) or ""))
+        samples.append((match.group(1), labels, float(match.group(3))))
+    return samples
+
+
+def report():
+    instances = make_instances(10)
+    rounds = 200_000
+    base = empty_cost(instances, rounds)
+    single = min(record_cost(Metrics(), instances, rounds) for _ in range(3)) - base
+    print(f"учёт запроса (start + finish), 1 поток:  {single:6.0f} нс")
+    many = threaded(Metrics(), instances, 8, rounds // 8)
+    print(f"учёт запроса, 8 потоков в те же серии:   {many:6.0f} нс")
+    for count in (10, 100):
+        exposition, summary = read_cost(count)
+        print(f"{count:>4} инстансов: /metrics {exposition:6.2f} мс, сводка для веб-интерфейса {summary:6.2f} мс")
+
+
+def check(limit):
+    failures = []
+    instances = make_instances(10)
+
+    base = empty_cost(instances, 100_000)
+    cost = min(record_cost(Metrics(), instances, 100_000) for _ in range(3)) - base
+    print(f"  учёт запроса: {cost:.0f} нс (предел {limit * 1000:.0f} нс)")
+    if cost > limit * 1000:
+        failures.append(f"uchyot zaprosa {cost:.0f} ns")
+
+    metrics = Metrics()
+    threads, rounds = 8, 20_000
+    threaded(metrics, instances, threads, rounds)
+    samples = parse(metrics.exposition(instances))
+    values = {}
+    for name, labels, value in samples:
+        values.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+    total = sum(v for k, v in values["lb_upstream_requests_total"].items())
+    errors = sum(v for k, v in values["lb_upstream_requests_total"].items() if ("outcome", "error") in k)
+    print(f"  {threads} потоков x {rounds}: учтено {total:.0f} запросов, ошибок {errors:.0f}")
+    if total != threads * rounds or errors != threads * rounds // 10:
+        failures.append(f"poteryany zaprosy: {total:.0f}/{threads * rounds}, oshibok {errors:.0f}")
+    if any(values["lb_upstream_in_flight"].values()):
+        failures.append("v polyote ne 0")
+
+    for instance in instances:
+        label = f"{instance['ip']}:{instance['port']}"
+        buckets = [value for name, labels, value in samples
+                   if name == "lb_upstream_latency_seconds_bucket" and labels["instance"] == label]
+        count = values["lb_upstream_latency_seconds_count"][(("instance", label),)]
+        if any(b > a for b, a in zip(buckets, buckets[1:])) or buckets[-1] != count:
+            failures.append(f"gistogramma {label}: {buckets}, count {count}")
+            break
+
+    # Квантили по гистограмме — в той же корзине, что и точные.
+    rng = random.Random(1)
+    latencies = [rng.lognormvariate(-5, 1) for _ in range(50_000)]
+    metrics = Metrics()
+    for latency in latencies:
+        metrics.finish(metrics.start(instances[0]), latency, "ok")
+    latencies.sort()
+    row = metrics.summary()[0]
+    for q, estimate in ((0.5, row["p50_ms"]), (0.99, row["p99_ms"])):
+        exact = latencies[int(q * len(latencies))]
+        bucket = next((b for b in LATENCY_BUCKETS if exact <= b), None)
+        low = max((b for b in LATENCY_BUCKETS if b < exact), default=0.0)
+        print(f"  p{q * 100:g}: точно {exact * 1000:.2f} мс, по гистограмме {estimate:.2f} мс")
+        if bucket is None or not low * 1000 <= estimate <= bucket * 1000:
+            failures.append(f"p{q * 100:g}: {estimate} ms, tochno {exact * 1000:.2f} ms")
+
+    for failure in failures:
+        print("ОШИБКА:", failure)
+    print("OK" if not failures else f"ошибок: {len(failures)}")
+    return not failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Метрики балансировщика: стоимость учёта и выдачи")
+    parser.add_argument("--check", action="store_true", help="проверить пороги (код выхода 0 — всё в порядке)")
+    parser.add_argument("--limit", type=float, default=3.0, help="предел стоимости учёта запроса, мкс")
+    args = parser.parse_args()
+    if args.check:
+        sys.exit(0 if check(args.limit) else 1)
+    report()
+
+
+if __name__ == "__main__":
+    main()
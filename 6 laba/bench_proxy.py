@@ -0,0 +1,251 @@
+# Бенчмарк балансировщика: балансировщик перед несколькими локальными app_instance.py.
+#
+# Режимы:
+#   legacy  прежний способ — requests.get(url) на каждый запрос, без Session и таймаута
+#           (новое TCP-соединение на каждый проксируемый вызов);
+#   pooled  upstream.UpstreamPool — постоянные соединения к каждому инстансу,
+#           таймауты и лимит запросов в полёте;
+#   async   async_proxy.py — обратный прокси на asyncio: любой путь и метод,
+#           тела потоком без разбора JSON, код ответа и заголовки инстанса сохраняются.
+#
+# Для каждого режима печатаются запросы в секунду, p50/p99 задержки и число ошибок.
+# Генератор нагрузки — asyncio-клиенты с keep-alive в нескольких процессах.
+#
+# Запуск:
+#   python bench_proxy.py
+#   python bench_proxy.py --backends 3 --connections 32 --duration 10
+#   python bench_proxy.py --modes async --connections 2000
+
+# argparse — разбор аргументов командной строки.
+import argparse
+
+# asyncio — клиенты-соединения генератора нагрузки.
+import asyncio
+
+# multiprocessing — несколько процессов-генераторов.
+import multiprocessing
+
+# random — с какого места списка путей начинает соединение.
+import random
+
+# os, socket, subprocess, sys — запуск процессов на свободных портах.
+import os
+import socket
+import subprocess
+import sys
+
+# time — замер времени.
+import time
+
+
+HOST = "127.0.0.1"
+HERE = os.path.dirname(os.path.abspath(__file__))
+MODES = ("legacy", "pooled", "async")
+
+
+# ==================== Процессы ====================
+
+def free_port():
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+def wait_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Процесс на порту {port} завершился при старте")
+        try:
+            socket.create_connection((HOST, port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError(f"Порт {port} так и не открылся")
+
+
+def start_process(args, port, env=None):
+    process = subprocess.Popen(
+        [sys.executable] + args, cwd=HERE, env=dict(os.environ, **(env or {})),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    wait_port(port, process)
+    return process
+
+
+def start_backends(count, extra_args=()):
+    """
+    Запускает count процессов app_instance.py. Возвращает список (порт, процесс).
+    """
+    backends = []
+    for _ in range(count):
+        port = free_port()
+        backends.append((port, start_process(["app_instance.py", str(port), *extra_args], port)))
+    return backends
+
+
+def stop(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait()
+
+
+def start_balancer(mode, backend_ports, env=None):
+    port = free_port()
+    args = [os.path.abspath(__file__), "--serve", mode, str(port)] + [str(p) for p in backend_ports]
+    return port, start_process(args, port, env)
+
+
+class LegacyUpstream:
+    """
+    Прежний способ проксирования (для сравнения): requests.get без Session и без таймаута.
+    """
+
+    def request(self, ip, port, method, path, body=None, headers=None, timeout=None):
+        import requests
+        from upstream import UpstreamError
+
+        try:
+            response = requests.request(method, f"http://{ip}:{port}{path}", data=body, timeout=timeout)
+        except requests.RequestException as error:
+            raise UpstreamError(str(error)) from error
+        response.data = response.content
+        return response
+
+    def discard(self, ip, port):
+        pass
+
+
+def serve_balancer(mode, port, backend_ports):
+    sys.path.insert(0, HERE)
+    import load_balancer
+
+    # Без портов инстансов пул составляет сам балансировщик (LB_SUPERVISE=1)
+    if backend_ports:
+        load_balancer.registry.replace([{"ip": HOST, "port": p} for p in backend_ports])
+    if mode == "async":
+        import async_proxy
+
+        asyncio.run(async_proxy.serve(HOST, port))
+        return
+    if mode == "legacy":
+        load_balancer.upstream = LegacyUpstream()
+    load_balancer.check_hash_key()
+    load_balancer.app.run(host=HOST, port=port, threaded=True)
+
+
+# ==================== Генератор нагрузки ====================
+
+async def read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ")[1])
+    length, keep_alive = 0, not lines[0].startswith("HTTP/1.0")
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        name = name.strip().lower()
+        if name == "content-length":
+            length = int(value)
+        elif name == "connection":
+            keep_alive = value.strip().lower() != "close"
+    await reader.readexactly(length)
+    return status, keep_alive
+
+
+async def connection(port, path, deadline, latencies, statuses):
+    # path — один путь или список путей: соединение идёт по списку по кругу с случайного места
+    paths = [path] if isinstance(path, str) else path
+    requests = [f"GET {p} HTTP/1.1\r\nHost: {HOST}\r\n\r\n".encode("ascii") for p in paths]
+    position = random.randrange(len(requests))
+    while time.perf_counter() < deadline:
+        try:
+            reader, writer = await asyncio.open_connection(HOST, port)
+        except OSError:
+            statuses["connect"] = statuses.get("connect", 0) + 1
+            await asyncio.sleep(0.01)
+            continue
+        try:
+            keep_alive = True
+            while keep_alive and time.perf_counter() < deadline:
+                started = time.perf_counter()
+                writer.write(requests[position])
+                position = (position + 1) % len(requests)
+                status, keep_alive = await read_response(reader)
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+        except (ConnectionError, asyncio.IncompleteReadError):
+            statuses["reset"] = statuses.get("reset", 0) + 1
+        finally:
+            writer.close()
+
+
+async def load(port, path, connections, duration):
+    latencies, statuses = [], {}
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(connection(port, path, deadline, latencies, statuses)
+                           for _ in range(connections)))
+    return latencies, statuses
+
+
+def load_worker(task):
+    return asyncio.run(load(*task))
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return float("nan")
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run_load(port, path="/process", connections=32, duration=5.0, procs=2):
+    """
+    Нагрузка на порт: возвращает (запросов в секунду, p50, p99, {код ответа: число}).
+    path — один путь или список путей (каждое соединение обходит его по кругу).
+    """
+    per_proc = max(1, connections // procs)
+    started = time.perf_counter()
+    with multiprocessing.Pool(procs) as pool:
+        results = pool.map(load_worker, [(port, path, per_proc, duration)] * procs)
+    elapsed = time.perf_counter() - started
+    latencies = sorted(x for part, _ in results for x in part)
+    statuses = {}
+    for _, part in results:
+        for status, count in part.items():
+            statuses[status] = statuses.get(status, 0) + count
+    return len(latencies) / elapsed, percentile(latencies, 0.5), percentile(latencies, 0.99), statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Балансировщик: прежнее проксирование, пул соединений и asyncio-прокси")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--backends", type=int, default=3)
+    parser.add_argument("--connections", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--procs", type=int, default=2)
+    parser.add_argument("--serve", nargs="+", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve_balancer(args.serve[0], int(args.serve[1]), [int(p) for p in args.serve[2:]])
+        return
+
+    backends = start_backends(args.backends)
+    try:
+        print(f"{args.backends} инстанса, {args.connections} соединений, {args.duration:.0f} с")
+        for mode in args.modes:
+            port, balancer = start_balancer(mode, [p for p, _ in backends])
+            try:
+                rps, p50, p99, statuses = run_load(port, "/process", args.connections, args.duration, args.procs)
+            finally:
+                stop([balancer])
+            errors = sum(count for status, count in statuses.items() if status != 200)
+            print(f"{mode:<7} {rps:8.0f} зап/с | p50 {p50 * 1000:7.2f} мс | p99 {p99 * 1000:7.2f} мс"
+                  f" | ошибок {errors} {statuses if errors else ''}")
+    finally:
+        stop([process for _, process in backends])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+# Нагрузочная проверка реестра инстансов (registry.py): изменения состава пула
+# одновременно с потоком запросов.
+#
+# Одновременно в течение --duration секунд:
+#   * --clients потоков шлют /process;
+#   * два потока добавляют инстансы (/add_instance) и удаляют их по id (/remove_instance),
+#     в том числе повторно удаляют уже удалённые;
+#   * поток переключает подставные инстансы между ok и down — проверка здоровья (с очень
+#     коротким интервалом) всё время включает и выключает их;
+#   * поток меняет стратегию балансировки (/strategy);
+#   * поток читает снимки реестра и проверяет, что каждый снимок целостен, а версии не убывают.
+#
+# После остановки проверяется:
+#   * ни одного исключения в обработчиках (они пробрасываются в потоки клиентов) и в потоках;
+#   * состав реестра = начальные + добавленные - удалённые (ни одно изменение не потеряно),
+#     каждое удаление по id удалило именно тот инстанс, повторное — отвечает 404;
+#   * стратегия и проверка здоровья видят ровно активные инстансы последнего снимка,
+#     запросов в полёте не осталось.
+# И отдельно — стоимость чтения активных инстансов: снимок против прежней фильтрации списка.
+#
+# Запуск:
+#   python bench_registry.py --check
+#   python bench_registry.py --check --clients 16 --duration 10
+
+# argparse — разбор аргументов командной строки.
+import argparse
+
+# os, sys — настройки балансировщика через переменные окружения, код выхода.
+import os
+import sys
+
+# random — случайные изменения пула.
+import random
+
+# threading — одновременные потоки сценария.
+import threading
+
+# time — длительность сценария и замер стоимости.
+import time
+
+# Counter — сравнение составов пула (один адрес может быть в пуле дважды).
+from collections import Counter
+
+from bench_health import StandIn, report, wait_until
+
+
+SETTINGS = {
+    "LB_HEALTH_INTERVAL": "0.05",
+    "LB_HEALTH_TIMEOUT": "0.3",
+    "LB_HEALTH_RISE": "1",
+    "LB_HEALTH_FALL": "1",
+    "LB_HEALTH_MAX_BACKOFF": "0.1",
+    "LB_SLOW_START": "0.5",
+    "LB_STRATEGY": "least_outstanding",
+    # Подставные инстансы постоянно падают и поднимаются — выключатели разомкнули бы все,
+    # и запросы перестали бы доходить до пула, который меняется.
+    "LB_BREAKER_FAILURES": "1000000",
+    # Здоровье меняет только активная проверка (исключение по ошибкам длилось бы дольше сценария).
+    "LB_EJECT_CONSECUTIVE": "1000000",
+    "LB_EJECT_ERROR_RATE": "2",
+}
+
+
+class Churn:
+    """
+    Общее состояние сценария: что добавлено и удалено, ошибки потоков.
+    """
+
+    def __init__(self, lb, stand_ins):
+        self.lb = lb
+        self.stand_ins = stand_ins
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        self.alive = {}
+        self.removed = {}
+        self.statuses = Counter()
+        self.errors = []
+        self.problems = []
+        self.adds = self.removes = self.repeated = self.snapshots = 0
+
+    def run(self, target, *args):
+        def body():
+            try:
+                while not self.stop.is_set():
+                    target(*args)
+            except Exception as error:
+                self.errors.append(f"{target.__name__}: {error!r}")
+        thread = threading.Thread(target=body, daemon=True)
+        thread.start()
+        return thread
+
+    def client(self, client):
+        status = client.get("/process").status_code
+        with self.lock:
+            self.statuses[status] += 1
+
+    def membership(self, client, rng):
+        if rng.random() < 0.5 or len(self.alive) < 3:
+            port = rng.choice(self.stand_ins).port
+            response = client.post("/add_instance", json={"ip": "127.0.0.1", "port": port})
+            with self.lock:
+                self.alive[response.get_json()["id"]] = port
+                self.adds += 1
+        elif rng.random() < 0.2 and self.removed:
+            with self.lock:
+                instance_id = rng.choice(list(self.removed))
+            response = client.post("/remove_instance", json={"id": instance_id})
+            if response.status_code != 404:
+                self.problems.append(f"povtornoe udalenie {instance_id}: {response.status_code}")
+            with self.lock:
+                self.repeated += 1
+        else:
+            with self.lock:
+                if not self.alive:
+                    return
+                instance_id = rng.choice(list(self.alive))
+                port = self.alive.pop(instance_id)
+            response = client.post("/remove_instance", json={"id": instance_id})
+            message = (response.get_json() or {}).get("message", "")
+            if response.status_code != 200 or not message.endswith(f":{port} удалён"):
+                self.problems.append(f"udalenie {instance_id} ({port}): {response.status_code} {message}")
+            with self.lock:
+                self.removed[instance_id] = port
+                self.removes += 1
+        time.sleep(0.002)
+
+    def flap(self, rng):
+        stand_in = rng.choice(self.stand_ins)
+        stand_in.mode = "down" if stand_in.mode == "ok" else "ok"
+        time.sleep(0.05)
+
+    def switch(self, client, rng):
+        client.post("/strategy", json={"name": rng.choice(["least_outstanding", "p2c", "peak_ewma",
+                                                           "round_robin", "consistent_hash"])})
+        time.sleep(0.05)
+
+    def read(self):
+        previous = 0
+        for _ in range(1000):
+            snapshot = self.lb.registry.snapshot
+            ids = [instance["id"] for instance in snapshot.instances]
+            if snapshot.version < previous:
+                self.problems.append(f"versiya snimka umenshilas: {previous} -> {snapshot.version}")
+            if len(set(ids)) != len(ids) or set(ids) != set(snapshot.by_id):
+                self.problems.append(f"snimok {snapshot.version}: id ne sovpadayut")
+            if any(snapshot.by_id.get(instance["id"]) is not instance or not instance["active"]
+                   for instance in snapshot.active):
+                self.problems.append(f"snimok {snapshot.version}: aktivnye ne iz snimka")
+            previous = snapshot.version
+        self.snapshots += 1000
+        time.sleep(0.001)
+
+
+def read_cost(count=100, rounds=200_000):
+    """
+    Чтение активных инстансов на запрос: прежняя фильтрация списка и снимок реестра, нс.
+    """
+    from registry import Registry
+
+    instances = [{"ip": "10.0.0.1", "port": 7000 + i, "active": i % 10 != 0} for i in range(count)]
+    registry = Registry(instances)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        [i for i in instances if i["active"]]
+    filtered = (time.perf_counter() - started) / rounds * 1e9
+    started = time.perf_counter()
+    for _ in range(rounds):
+        registry.snapshot.active
+    snapshot = (time.perf_counter() - started) / rounds * 1e9
+    return filtered, snapshot
+
+
+def check(clients, duration):
+    os.environ.update(SETTINGS)
+    import load_balancer as lb
+
+    # Исключение в обработчике не превращается в ответ 500, а пробрасывается в поток клиента.
+    lb.app.config["PROPAGATE_EXCEPTIONS"] = True
+    failures = []
+    stand_ins = [StandIn() for _ in range(8)]
+    initial = lb.registry.replace([{"ip": "127.0.0.1", "port": s.port} for s in stand_ins[:4]])
+    churn = Churn(lb, stand_ins)
+    churn.alive = {instance["id"]: instance["port"] for instance in initial}
+
+    threads = [churn.run(churn.client, lb.app.test_client()) for _ in range(clients)]
+    threads += [churn.run(churn.membership, lb.app.test_client(), random.Random(seed)) for seed in (1, 2)]
+    threads += [churn.run(churn.flap, random.Random(3)),
+                churn.run(churn.switch, lb.app.test_client(), random.Random(4)),
+                churn.run(churn.read)]
+    time.sleep(duration)
+    churn.stop.set()
+    for thread in threads:
+        thread.join()
+    for stand_in in stand_ins:
+        stand_in.mode = "ok"
+
+    total = sum(churn.statuses.values())
+    print(f"  {total} запросов ({dict(churn.statuses)}), добавлено {churn.adds}, удалено {churn.removes}, "
+          f"повторных удалений {churn.repeated}, прочитано снимков {churn.snapshots}, "
+          f"версия {lb.registry.snapshot.version}")
+    problem = None
+    if churn.errors or not churn.statuses[200]:
+        problem = f"oshibki potokov {churn.errors[:3]}, otvetov 200: {churn.statuses[200]}"
+    report(failures, "1) запросы во время изменений пула: без исключений в обработчиках и потоках", problem)
+
+    problem = churn.problems[0] if churn.problems else None
+    report(failures, "2) снимки целостны, версии не убывают, удаление по id — точное, повторное — 404", problem)
+
+    snapshot = lb.registry.snapshot
+    expected = Counter(churn.alive.values())
+    actual = Counter(instance["port"] for instance in snapshot.instances)
+    problem = None
+    if set(churn.alive) != set(snapshot.by_id) or expected != actual:
+        problem = f"v reestre {sorted(actual.items())}, ozhidalos {sorted(expected.items())}"
+    report(failures, f"3) ни одно изменение не потеряно: в реестре {len(snapshot.instances)} инстансов", problem)
+
+    def agreed():
+        snapshot = lb.registry.snapshot
+        active = Counter(f"{i['ip']}:{i['port']}" for i in snapshot.active)
+        everyone = Counter(f"{i['ip']}:{i['port']}" for i in snapshot.instances)
+        stats = lb.strategy.stats()
+        return (len(snapshot.active) == len(snapshot.instances)
+                and Counter(s["instance"] for s in stats) == active
+                and Counter(c["instance"] for c in lb.health.stats()) == everyone
+                and not any(s["outstanding"] for s in stats))
+
+    problem = None
+    if wait_until(agreed, 3) is None:
+        problem = (f"strategiya {[s['instance'] for s in lb.strategy.stats()]}, "
+                   f"reestr {[i['port'] for i in lb.registry.snapshot.active]}")
+    report(failures, "4) стратегия и проверка здоровья видят последний снимок, запросов в полёте нет", problem)
+
+    filtered, snapshot_cost = read_cost()
+    print(f"  активные из 100 инстансов на каждый запрос: фильтрация списка {filtered:.0f} нс, "
+          f"снимок {snapshot_cost:.0f} нс")
+
+    lb.health.close()
+    for stand_in in stand_ins:
+        stand_in.close()
+    return not failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Реестр инстансов: изменения пула под нагрузкой")
+    parser.add_argument("--check", action="store_true", help="прогнать сценарий (код выхода 0 — всё в порядке)")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+    if not args.check:
+        parser.print_help()
+        return
+    sys.exit(0 if check(args.clients, args.duration) else 1)
+
+
+if __name__ == "__main__":
+    main()
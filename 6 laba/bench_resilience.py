@@ -0,0 +1,264 @@
+# Бенчмарк повторов, хеджирования и выключателей балансировщика (resilience.py).
+#
+# Перед балансировщиком (Flask /process с пулом соединений) — пять локальных app_instance.py:
+#   fast x2  задержка 2 мс;
+#   flaky    задержка 2 мс, 20% ответов — 500;
+#   tail     задержка 2 мс, 5% ответов дольше на 250 мс;
+#   broken   все ответы /process — 500 (а /health отвечает, активная проверка его не выключит).
+# Пассивное исключение (health.py) выключено, чтобы мерить только механизмы на пути запроса.
+#
+# Конфигурации:
+#   plain      без повторов и выключателей (как раньше: сбой — сразу 503 клиенту);
+#   retries    до 2 повторов на других инстансах в пределах бюджета;
+#   breakers   повторы + выключатели (сломанный инстанс перестаёт получать запросы);
+#   hedging    повторы + выключатели + хеджирование по p95.
+# Для каждой печатаются запросы в секунду, p50/p99 и доля успешных ответов.
+#
+# --check: детерминированная проверка без инстансов — выключатель на подставных часах
+# (closed -> open -> half_open -> closed или снова open), пределы RetryBudget, перцентиль
+# LatencyWindow и то, что повтор в load_balancer.forward не уходит инстансу из tried.
+#
+# Запуск:
+#   python bench_resilience.py
+#   python bench_resilience.py --connections 16 --duration 10 --configs plain hedging
+#   python bench_resilience.py --check
+
+# argparse — разбор аргументов командной строки.
+import argparse
+
+# os, sys — настройки балансировщика через переменные окружения, код выхода проверки.
+import os
+import sys
+
+from bench_cache import Clock
+from bench_health import report
+from bench_proxy import free_port, run_load, start_balancer, start_process, stop
+from resilience import CircuitBreakers, LatencyWindow, RetryBudget
+from strategies import make_strategy
+
+
+BACKENDS = {
+    "fast": ["--latency", "2"],
+    "fast2": ["--latency", "2"],
+    "flaky": ["--latency", "2", "--error-rate", "0.2"],
+    "tail": ["--latency", "2", "--slow-rate", "0.05", "--slow-latency", "250"],
+    "broken": ["--error-rate", "1"],
+}
+
+# Пассивное исключение не срабатывает, плавного старта нет.
+COMMON = {
+    "LB_EJECT_CONSECUTIVE": "1000000",
+    "LB_EJECT_ERROR_RATE": "2",
+    "LB_EJECT_LATENCY_FACTOR": "1000000",
+    "LB_SLOW_START": "0",
+}
+
+NO_BREAKERS = {"LB_BREAKER_FAILURES": "1000000"}
+
+CONFIGS = {
+    "plain": dict(NO_BREAKERS, LB_RETRIES="0"),
+    "retries": dict(NO_BREAKERS, LB_RETRIES="2"),
+    "breakers": {"LB_RETRIES": "2"},
+    "hedging": {"LB_RETRIES": "2", "LB_HEDGE": "1"},
+}
+
+
+# ==================== Проверка ====================
+
+def check_breakers(failures):
+    clock = Clock()
+    breakers = CircuitBreakers(failures=3, open_time=5.0, half_open_requests=2, clock=clock)
+    instance = {"ip": "127.0.0.1", "port": 1}
+    state = lambda: breakers.stats()["127.0.0.1:1"]["state"]
+    wrong = []
+
+    def expect(label, got, expected):
+        if got != expected:
+            wrong.append(f"{label}: {got} != {expected}")
+
+    # Сбои подряд: успех обнуляет счётчик, третий сбой подряд размыкает выключатель.
+    for failed in (True, True, False, True, True):
+        breakers.allow(instance)
+        breakers.record(instance, failed)
+    expect("2 sboya posle uspekha", state(), "closed")
+    breakers.allow(instance)
+    breakers.record(instance, True)
+    expect("3 sboya podryad", (state(), breakers.allow(instance)), ("open", False))
+    clock.now += 4.9
+    expect("do open_time", breakers.allow(instance), False)
+    # Через open_time — half_open и ровно half_open_requests пробных запросов.
+    clock.now += 0.1
+    expect("probnye zaprosy", [breakers.allow(instance) for _ in range(3)], [True, True, False])
+    expect("half_open", state(), "half_open")
+    # Запрос, который так и не ушёл (None), освобождает место пробного, состояние не меняет.
+    breakers.record(instance, None)
+    expect("record(None)", (state(), breakers.allow(instance)), ("half_open", True))
+    # Успех пробного запроса замыкает выключатель.
+    breakers.record(instance, False)
+    expect("uspekh v half_open", (state(), breakers.allow(instance)), ("closed", True))
+    breakers.record(instance, False)
+
+    # Сбой пробного запроса снова размыкает — на полный open_time от момента сбоя.
+    for _ in range(3):
+        breakers.allow(instance)
+        breakers.record(instance, True)
+    clock.now += 5
+    breakers.allow(instance)
+    clock.now += 1
+    breakers.record(instance, True)
+    clock.now += 4.9
+    expect("sboj v half_open", (state(), breakers.allow(instance)), ("open", False))
+    clock.now += 0.1
+    expect("snova half_open", breakers.allow(instance), True)
+    expect("opens", breakers.stats()["127.0.0.1:1"]["opens"], 3)
+    # Выключатели инстансов независимы, discard забывает выключатель.
+    expect("drugoj instans", breakers.allow({"ip": "127.0.0.1", "port": 2}), True)
+    breakers.discard("127.0.0.1", 1)
+    expect("discard", breakers.allow(instance), True)
+    report(failures, "1) выключатель: closed -> open -> half_open -> closed / open на подставных часах",
+           "; ".join(wrong) or None)
+
+
+def check_budget(failures):
+    wrong = []
+    budget = RetryBudget(percent=20.0, min_concurrency=3)
+    # 10 запросов в работе: 20% — 2, но не меньше min_concurrency = 3.
+    for _ in range(10):
+        budget.start()
+    got = [budget.acquire() for _ in range(4)]
+    if got != [True, True, True, False] or budget.exhausted != 1:
+        wrong.append(f"10 v rabote: {got}, exhausted {budget.exhausted}")
+    budget.release()
+    if not budget.acquire():
+        wrong.append("release ne vernul mesto")
+    # 50 запросов в работе — 10 повторов одновременно.
+    for _ in range(40):
+        budget.start()
+    got = sum(budget.acquire() for _ in range(10))
+    if got != 7:
+        wrong.append(f"50 v rabote: eshchyo {got} povtorov vmesto 7")
+    for _ in range(10):
+        budget.release()
+    for _ in range(50):
+        budget.finish()
+    if budget.stats() != {"active": 0, "retries": 0, "exhausted": 4}:
+        wrong.append(f"stats: {budget.stats()}")
+    report(failures, "2) бюджет повторов: max(min_concurrency, percent% запросов в работе)", "; ".join(wrong) or None)
+
+
+def check_latency(failures):
+    wrong = []
+    window = LatencyWindow(size=100, percentile=95.0, min_samples=20, refresh=10)
+    for i in range(1, 20):
+        window.add(i / 1000)
+    if window.value() is not None:
+        wrong.append(f"menshe min_samples: {window.value()}")
+    window.add(20 / 1000)
+    # 20 замеров 1..20 мс: 95-й перцентиль — элемент с индексом 19.
+    if window.value() != 0.02:
+        wrong.append(f"20 zamerov: {window.value()}")
+    # Между пересчётами значение не меняется.
+    for i in range(21, 30):
+        window.add(i / 1000)
+    if window.value() != 0.02:
+        wrong.append(f"do refresh: {window.value()}")
+    for i in range(30, 101):
+        window.add(i / 1000)
+    if window.value() != 0.096:
+        wrong.append(f"100 zamerov: {window.value()}")
+    # Окно хранит только size последних замеров.
+    for _ in range(100):
+        window.add(1.0)
+    if window.value() != 1.0:
+        wrong.append(f"okno ne sdvinulos: {window.value()}")
+    report(failures, "3) перцентиль задержки: min_samples, refresh, последние size замеров", "; ".join(wrong) or None)
+
+
+def check_retries(failures):
+    os.environ.update(COMMON)
+    import load_balancer as lb
+
+    wrong = []
+    saved = lb.attempt, lb.breakers, lb.retry_budget, lb.RETRIES, lb.HEDGE
+    instances = [{"id": i, "ip": "127.0.0.1", "port": 1 + i, "active": True} for i in range(5)]
+    sent = []
+
+    def attempt(current, instance, timeout, path="/process"):
+        # Каждый запрос — сбой: forward повторяет, пока есть повторы и инстансы.
+        sent.append(instance["id"])
+        current.release(instance, 0.001, True)
+        lb.breakers.record(instance, True)
+        return lb.Reply(503, {}, True, "", 0)
+
+    lb.attempt, lb.HEDGE = attempt, False
+    lb.retry_budget = RetryBudget(min_concurrency=10)
+    try:
+        for name, key in (("round_robin", None), ("least_outstanding", None), ("consistent_hash", "user-7")):
+            for retries, expected in ((2, 3), (10, 5)):
+                lb.breakers = CircuitBreakers(failures=1000, clock=Clock())
+                lb.RETRIES = retries
+                current = make_strategy(name, slow_start=0)
+                current.update(instances)
+                sent.clear()
+                lb.forward(current, key)
+                if len(sent) != expected or len(set(sent)) != len(sent):
+                    wrong.append(f"{name}, {retries} povtorov: {sent}")
+        # Инстанс с разомкнутым выключателем не получает ни первый запрос, ни повтор.
+        lb.breakers = CircuitBreakers(failures=1, clock=Clock())
+        lb.breakers.allow(instances[0])
+        lb.breakers.record(instances[0], True)
+        lb.RETRIES = 10
+        current = make_strategy("round_robin", slow_start=0)
+        current.update(instances)
+        sent.clear()
+        lb.forward(current)
+        if sorted(sent) != [1, 2, 3, 4]:
+            wrong.append(f"razomknutyj vyklyuchatel: {sent}")
+    finally:
+        lb.attempt, lb.breakers, lb.retry_budget, lb.RETRIES, lb.HEDGE = saved
+    report(failures, "4) повторы уходят только инстансам, которых ещё нет в tried", "; ".join(wrong) or None)
+
+
+def check():
+    failures = []
+    check_breakers(failures)
+    check_budget(failures)
+    check_latency(failures)
+    check_retries(failures)
+    print("OK" if not failures else f"ошибок: {len(failures)}")
+    return not failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Повторы, хеджирование и выключатели: p99 и доля успешных ответов")
+    parser.add_argument("--check", action="store_true", help="проверить выключатели, бюджет, перцентиль и повторы"
+                                                             " (код выхода 0 — всё в порядке)")
+    parser.add_argument("--configs", nargs="+", choices=list(CONFIGS), default=list(CONFIGS))
+    parser.add_argument("--connections", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--procs", type=int, default=2)
+    args = parser.parse_args()
+    if args.check:
+        sys.exit(0 if check() else 1)
+
+    backends = []
+    for extra_args in BACKENDS.values():
+        port = free_port()
+        backends.append((port, start_process(["app_instance.py", str(port), *extra_args], port)))
+    try:
+        print(f"инстансы: {', '.join(BACKENDS)}; {args.connections} соединений, {args.duration:.0f} с")
+        for name in args.configs:
+            port, balancer = start_balancer("pooled", [p for p, _ in backends], dict(COMMON, **CONFIGS[name]))
+            try:
+                rps, p50, p99, statuses = run_load(port, "/process", args.connections, args.duration, args.procs)
+            finally:
+                stop([balancer])
+            total = sum(statuses.values())
+            print(f"{name:<9} {rps:7.0f} зап/с | p50 {p50 * 1000:7.2f} мс | p99 {p99 * 1000:7.2f} мс"
+                  f" | успешных {statuses.get(200, 0) / max(1, total):7.2%} {statuses}")
+    finally:
+        stop([process for _, process in backends])
+
+
+if __name__ == "__main__":
+    main()
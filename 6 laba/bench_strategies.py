@@ -0,0 +1,140 @@
+# Бенчмарк стратегий балансировки (strategies.py) на модели, без сети.
+#
+# 1) Симуляция с дискретными событиями: запросы приходят пуассоновским потоком,
+#    стратегия выбирает инстанс, у каждого инстанса --workers обработчиков и очередь FIFO,
+#    время обработки — экспоненциальное со своим средним (--latencies, мс).
+#    По умолчанию один инстанс из пяти в 5 раз медленнее остальных. Стратегия работает
+#    с модельными часами, так что peak_ewma видит ровно те задержки, что и клиенты.
+#    Печатаются p50/p99/p99.9 времени ответа и доля запросов, доставшихся медленному инстансу.
+#    Вес для weighted — пропорционален производительности инстанса (workers / latency).
+#
+# 2) Стоимость одного выбора (acquire + release) при 10, 100 и 1000 инстансах —
+#    должна не зависеть от их числа.
+#
+# Запуск:
+#   python bench_strategies.py
+#   python bench_strategies.py --latencies 10 10 10 10 50 --load 0.7 --requests 200000
+
+# argparse — разбор аргументов командной строки.
+import argparse
+
+# heapq — очередь событий симуляции.
+import heapq
+
+# random — моменты прихода запросов и время обработки.
+import random
+
+# time — замер стоимости выбора.
+import time
+
+# deque — очередь запросов у инстанса.
+from collections import deque
+
+from strategies import STRATEGIES
+
+
+ARRIVAL, DONE = 0, 1
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def simulate(name, latencies, workers, rate, requests, seed):
+    """
+    Возвращает (отсортированные времена ответа, число запросов на каждый инстанс).
+    """
+    now = [0.0]
+    strategy = STRATEGIES[name](clock=lambda: now[0])
+    capacities = [workers / latency for latency in latencies]
+    instances = [
+        {"id": i, "ip": "sim", "port": i, "active": True, "weight": max(1, round(capacity / min(capacities)))}
+        for i, capacity in enumerate(capacities)
+    ]
+    strategy.update(instances)
+
+    arrivals = random.Random(seed)
+    service = random.Random(seed + 1)
+    busy = [0] * len(instances)
+    queues = [deque() for _ in instances]
+    picks = [0] * len(instances)
+    results = []
+    events = [(arrivals.expovariate(rate), 0, ARRIVAL, 0, 0.0)]
+    sent, order = 1, 1
+
+    while events:
+        moment, _, kind, index, started = heapq.heappop(events)
+        now[0] = moment
+        if kind == ARRIVAL:
+            index = strategy.acquire()["port"]
+            picks[index] += 1
+            if busy[index] < workers:
+                busy[index] += 1
+                heapq.heappush(events, (moment + service.expovariate(1 / latencies[index]), order,
+                                        DONE, index, moment))
+                order += 1
+            else:
+                queues[index].append(moment)
+            if sent < requests:
+                heapq.heappush(events, (moment + arrivals.expovariate(rate), order, ARRIVAL, 0, 0.0))
+                order += 1
+                sent += 1
+        else:
+            latency = moment - started
+            results.append(latency)
+            strategy.release(instances[index], latency)
+            if queues[index]:
+                heapq.heappush(events, (moment + service.expovariate(1 / latencies[index]), order,
+                                        DONE, index, queues[index].popleft()))
+                order += 1
+            else:
+                busy[index] -= 1
+    results.sort()
+    return results, picks
+
+
+def pick_cost(name, count, rounds):
+    strategy = STRATEGIES[name]()
+    strategy.update([{"id": i, "ip": "10.0.0.1", "port": i, "active": True, "weight": 1 + i % 3}
+                     for i in range(count)])
+    acquire, release = strategy.acquire, strategy.release
+    started = time.perf_counter()
+    for _ in range(rounds):
+        release(acquire(), 0.001)
+    return (time.perf_counter() - started) / rounds * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Стратегии балансировки: хвост задержек и стоимость выбора")
+    parser.add_argument("--strategies", nargs="+", choices=list(STRATEGIES), default=list(STRATEGIES))
+    parser.add_argument("--latencies", type=float, nargs="+", default=[10, 10, 10, 10, 50],
+                        help="среднее время обработки на каждом инстансе, мс")
+    parser.add_argument("--workers", type=int, default=4, help="обработчиков на инстанс")
+    parser.add_argument("--load", type=float, default=0.7, help="нагрузка — доля общей производительности")
+    parser.add_argument("--requests", type=int, default=200_000)
+    parser.add_argument("--rounds", type=int, default=200_000, help="выборов в замере стоимости")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    latencies = [latency / 1000 for latency in args.latencies]
+    capacity = sum(args.workers / latency for latency in latencies)
+    rate = args.load * capacity
+    slowest = latencies.index(max(latencies))
+    print(f"инстансы {args.latencies} мс, по {args.workers} обработчика; "
+          f"{rate:.0f} зап/с = {args.load:.0%} производительности")
+    for name in args.strategies:
+        results, picks = simulate(name, latencies, args.workers, rate, args.requests, args.seed)
+        print(f"{name:<18} p50 {percentile(results, 0.5) * 1000:8.1f} мс | "
+              f"p99 {percentile(results, 0.99) * 1000:9.1f} мс | "
+              f"p99.9 {percentile(results, 0.999) * 1000:9.1f} мс | "
+              f"медленному {picks[slowest] / sum(picks):6.1%}")
+
+    print("\nстоимость выбора (acquire + release), нс:")
+    counts = (10, 100, 1000)
+    print(f"{'':<18}" + "".join(f"{count:>10}" for count in counts))
+    for name in args.strategies:
+        print(f"{name:<18}" + "".join(f"{pick_cost(name, count, args.rounds):10.0f}" for count in counts))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+# Модуль cache — кэш ответов балансировщика для идемпотентных GET-запросов.
+#
+#   * ключ — метод, путь с параметрами и значения выбранных заголовков (как Vary);
+#   * срок свежести — из Cache-Control ответа инстанса (s-maxage, затем max-age), а если
+#     его нет — ttl из настроек; no-store, private и no-cache в ответе — не кэшируем;
+#   * после срока свежести запись ещё stale секунд (stale-while-revalidate из ответа или
+#     из настроек) отдаётся как есть, а в фоне один запрос к инстансу её обновляет;
+#   * одновременные промахи по одному ключу объединяются: к инстансу идёт один запрос,
+#     остальные ждут его ответа;
+#   * размер ограничен числом записей и суммарным размером тел; при переполнении
+#     вытесняются давно не использованные записи (LRU).
+#
+# Что делать с самим запросом (no-store, no-cache, Authorization) решает балансировщик:
+# lookup(..., refresh=True) — принудительно сходить к инстансу и обновить запись.
+
+# threading — блокировка кэша и ожидание объединённых промахов.
+import threading
+
+# time — часы сроков свежести.
+import time
+
+# OrderedDict — порядок использования записей для LRU.
+from collections import OrderedDict
+
+# ThreadPoolExecutor — фоновое обновление устаревших записей.
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Итоги lookup.
+HIT, MISS, STALE, COALESCED = "hit", "miss", "stale", "coalesced"
+
+
+def parse_cache_control(value):
+    """
+    Заголовок Cache-Control -> {директива: значение или None}.
+    """
+    directives = {}
+    for part in (value or "").split(","):
+        name, _, argument = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip().strip('"') or None
+    return directives
+
+
+def _seconds(value):
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class _Entry:
+    """
+    Запись кэша: ответ, до какого момента он свежий и до какого его можно отдавать устаревшим.
+    """
+
+    __slots__ = ("reply", "size", "expires", "stale_until")
+
+    def __init__(self, reply, size, expires, stale_until):
+        self.reply = reply
+        self.size = size
+        self.expires = expires
+        self.stale_until = stale_until
+
+
+class _Pending:
+    """
+    Запрос к инстансу, который уже идёт по этому ключу: остальные ждут его ответа.
+    """
+
+    __slots__ = ("event", "reply")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.reply = None
+
+
+class ResponseCache:
+    """
+    Кэш ответов. Ответ (reply) — любой объект с полями status, failed, cache_control и size.
+    """
+
+    def __init__(self, ttl=5.0, stale=10.0, max_entries=10000, max_bytes=64 * 1024 * 1024,
+                 wait_timeout=5.0, workers=4, clock=time.monotonic):
+        self.ttl = ttl
+        self.stale = stale
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.wait_timeout = wait_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._bytes = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cache-refresh")
+
+    # ---------- Чтение ----------
+
+    def lookup(self, key, load, refresh=False):
+        """
+        Ответ по ключу: из кэша или через load() (без аргументов, возвращает ответ или None).
+        Возвращает (ответ, итог): hit, stale, miss или coalesced.
+        """
+        with self._lock:
+            entry = None if refresh else self._entries.get(key)
+            if entry is not None:
+                now = self.clock()
+                if now < entry.expires:
+                    self._entries.move_to_end(key)
+                    return entry.reply, HIT
+                if now < entry.stale_until:
+                    self._entries.move_to_end(key)
+                    if key not in self._pending:
+                        # Устаревшую запись отдаём сразу, а обновляем в фоне (один запрос на ключ).
+                        self._pending[key] = _Pending()
+                        self._executor.submit(self._load, key, load)
+                    return entry.reply, STALE
+            pending = self._pending.get(key)
+            if pending is None:
+                self._pending[key] = _Pending()
+        if pending is not None:
+            # Такой же запрос уже идёт к инстансу — ждём его ответа.
+            if pending.event.wait(self.wait_timeout) and pending.reply is not None:
+                return pending.reply, COALESCED
+            return load(), MISS
+        return self._load(key, load), MISS
+
+    def _load(self, key, load):
+        reply = None
+        try:
+            reply = load()
+            return reply
+        finally:
+            with self._lock:
+                if reply is not None:
+                    self._store(key, reply)
+                pending = self._pending.pop(key)
+            pending.reply = reply
+            pending.event.set()
+
+    # ---------- Запись ----------
+
+    def freshness(self, reply):
+        """
+        (секунд свежести, секунд stale-while-revalidate) или None — ответ не кэшируется.
+        """
+        if reply.failed or reply.status != 200:
+            return None
+        directives = parse_cache_control(reply.cache_control)
+        if "no-store" in directives or "private" in directives or "no-cache" in directives:
+            return None
+        ttl = _seconds(directives.get("s-maxage"))
+        if ttl is None:
+            ttl = _seconds(directives.get("max-age"))
+        if ttl is None:
+            ttl = self.ttl
+        stale = _seconds(directives.get("stale-while-revalidate"))
+        if stale is None:
+            stale = self.stale
+        if "must-revalidate" in directives or "proxy-revalidate" in directives:
+            stale = 0.0
+        if ttl <= 0 and stale <= 0:
+            return None
+        return ttl, stale
+
+    def _store(self, key, reply):
+        # Вызывается под self._lock.
+        policy = self.freshness(reply)
+        old = self._entries.get(key)
+        if policy is None:
+            # Ответ с ошибкой не вытесняет ещё пригодную запись, а запрет кэширования — убирает её.
+            if old is not None and not reply.failed:
+                self._remove(key)
+            return
+        if reply.size > self.max_bytes:
+            return
+        if old is not None:
+            self._remove(key)
+        ttl, stale = policy
+        now = self.clock()
+        self._entries[key] = _Entry(reply, reply.size, now + ttl, now + ttl + stale)
+        self._bytes += reply.size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def __contains__(self, key):
+        # Есть ли запись (порядок LRU не меняется).
+        with self._lock:
+            return key in self._entries
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "pending": len(self._pending)}
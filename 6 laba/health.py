@@ -0,0 +1,272 @@
+# Модуль health — проверка состояния инстансов балансировщика.
+#
+# Активная проверка (probe):
+#   * инстансы опрашиваются параллельно (пул потоков), у каждого своё расписание,
+#     сдвинутое случайным образом (jitter) — нет залпов по всем инстансам сразу;
+#   * пороги rise/fall: инстанс становится недоступным после fall неудачных проверок подряд
+#     и возвращается после rise удачных — одна случайная ошибка ничего не меняет;
+#   * недоступный инстанс опрашивается всё реже: интервал удваивается после каждой
+#     неудачи (не больше max_backoff), пока он не ответит.
+#
+# Пассивная проверка (outlier detection) — по настоящим запросам (record):
+#   * consecutive_errors ошибок подряд — инстанс сразу исключается;
+#   * раз в window секунд: доля ошибок не меньше error_rate (при min_requests запросах)
+#     или средняя задержка в latency_factor раз выше медианы по инстансам — исключается;
+#   * исключение длится eject_time x (номер исключения подряд), потом инстанс возвращается;
+#   * одновременно исключается не больше max_eject_percent процентов инстансов.
+#
+# Инстанс доступен (instance["active"]), если он прошёл активную проверку и не исключён.
+# Флаг меняется через set_active балансировщика; после возвращения инстанса стратегия
+# сама плавно наращивает его долю запросов (slow start, см. strategies.py).
+
+# random — случайный сдвиг расписания проверок.
+import random
+
+# statistics — медиана задержек по инстансам.
+import statistics
+
+# threading — поток расписания и блокировка состояния.
+import threading
+
+# time — часы.
+import time
+
+# ThreadPoolExecutor — параллельные проверки.
+from concurrent.futures import ThreadPoolExecutor
+
+
+class _Check:
+    """
+    Состояние проверки одного инстанса.
+    """
+
+    __slots__ = ("instance", "healthy", "successes", "failures", "next_probe", "probing", "probes",
+                 "ejected_until", "ejections", "consecutive_errors",
+                 "window_requests", "window_errors", "window_latency")
+
+    def __init__(self, instance, next_probe):
+        self.instance = instance
+        self.healthy = instance["active"]
+        self.successes = 0
+        self.failures = 0
+        self.next_probe = next_probe
+        self.probing = False
+        self.probes = 0
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self.consecutive_errors = 0
+        self.window_requests = 0
+        self.window_errors = 0
+        self.window_latency = 0.0
+
+
+class HealthChecker:
+    """
+    Активная и пассивная проверка инстансов.
+    get_instances() — текущий список инстансов (у каждого постоянный instance["id"]),
+    probe(instance) — True, если инстанс жив,
+    set_active(instance, flag) — сообщить балансировщику итоговое состояние.
+    """
+
+    def __init__(self, get_instances, probe, set_active, interval=5.0, rise=2, fall=3,
+                 max_backoff=60.0, jitter=0.2, workers=32, consecutive_errors=5, error_rate=0.5,
+                 min_requests=20, latency_factor=3.0, window=10.0, eject_time=30.0,
+                 max_eject_percent=50, clock=time.monotonic):
+        self.get_instances = get_instances
+        self.probe = probe
+        self.set_active = set_active
+        self.interval = interval
+        self.rise = rise
+        self.fall = fall
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.consecutive_errors = consecutive_errors
+        self.error_rate = error_rate
+        self.min_requests = min_requests
+        self.latency_factor = latency_factor
+        self.window = window
+        self.eject_time = eject_time
+        self.max_eject_percent = max_eject_percent
+        self.clock = clock
+        self._checks = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._random = random.Random()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="health-probe")
+        self._next_analysis = clock() + window
+        self._instances = None
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    # ---------- Расписание ----------
+
+    def _spread(self, delay):
+        return delay * self._random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _sync(self, now):
+        # Новые инстансы получают первую проверку в случайный момент интервала,
+        # удалённые — забываются. Список (снимок реестра) не менялся — делать нечего.
+        instances = self.get_instances()
+        if instances is self._instances:
+            return
+        self._instances = instances
+        current = {instance["id"]: instance for instance in instances}
+        for key in list(self._checks):
+            if key not in current:
+                del self._checks[key]
+        for key, instance in current.items():
+            check = self._checks.get(key)
+            if check is None:
+                self._checks[key] = _Check(instance, now + self._random.uniform(0, self.interval))
+            else:
+                # Словарь инстанса в новом снимке — новая копия, id тот же.
+                check.instance = instance
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._lock:
+                now = self.clock()
+                self._sync(now)
+                wake_at = self._next_analysis
+                for check in self._checks.values():
+                    if check.ejected_until and now >= check.ejected_until:
+                        # Срок исключения вышел — инстанс возвращается (если жив по проверкам).
+                        check.ejected_until = 0.0
+                        self._apply(check)
+                    if check.ejected_until:
+                        wake_at = min(wake_at, check.ejected_until)
+                    if check.probing:
+                        continue
+                    if now >= check.next_probe:
+                        check.probing = True
+                        try:
+                            self._executor.submit(self._probe, check)
+                        except RuntimeError:
+                            # Пул проверок уже остановлен — программа завершается.
+                            return
+                    else:
+                        wake_at = min(wake_at, check.next_probe)
+                if now >= self._next_analysis:
+                    self._analyze(now)
+                    self._next_analysis = now + self.window
+                    wake_at = min(wake_at, self._next_analysis)
+            self._wake.wait(max(0.005, wake_at - self.clock()))
+            self._wake.clear()
+
+    def _probe(self, check):
+        try:
+            ok = self.probe(check.instance)
+        except Exception:
+            ok = False
+        with self._lock:
+            check.probing = False
+            check.probes += 1
+            if ok:
+                check.successes += 1
+                check.failures = 0
+                if not check.healthy and check.successes >= self.rise:
+                    check.healthy = True
+            else:
+                check.failures += 1
+                check.successes = 0
+                if check.healthy and check.failures >= self.fall:
+                    check.healthy = False
+            if check.healthy or check.successes:
+                delay = self.interval
+            else:
+                # Недоступный инстанс: интервал удваивается с каждой неудачей сверх порога fall.
+                extra = max(0, check.failures - self.fall)
+                delay = min(self.max_backoff, self.interval * 2 ** min(extra, 30))
+            check.next_probe = self.clock() + self._spread(delay)
+            self._apply(check)
+        self._wake.set()
+
+    def _apply(self, check):
+        # Вызывается под self._lock.
+        self.set_active(check.instance, check.healthy and not check.ejected_until)
+
+    # ---------- Пассивная проверка ----------
+
+    def record(self, instance, latency, failed):
+        """
+        Итог настоящего запроса к инстансу: время ответа (секунды) и был ли сбой.
+        """
+        with self._lock:
+            check = self._checks.get(instance["id"])
+            if check is None:
+                # Инстанс только что добавлен, расписание его ещё не видело (или уже удалён —
+                # тогда его уберёт ближайшая сверка со списком).
+                check = self._checks[instance["id"]] = _Check(
+                    instance, self.clock() + self._random.uniform(0, self.interval))
+                self._instances = None
+            if check.ejected_until:
+                return
+            check.window_requests += 1
+            check.window_latency += latency
+            if not failed:
+                check.consecutive_errors = 0
+                return
+            check.window_errors += 1
+            check.consecutive_errors += 1
+            # Ошибка — повод проверить инстанс, не дожидаясь расписания.
+            if not check.probing:
+                check.next_probe = min(check.next_probe, self.clock())
+            if check.consecutive_errors >= self.consecutive_errors:
+                self._eject(check, self.clock())
+        self._wake.set()
+
+    def _eject(self, check, now):
+        # Вызывается под self._lock.
+        ejected = sum(1 for other in self._checks.values() if other.ejected_until)
+        if (ejected + 1) * 100 > self.max_eject_percent * len(self._checks):
+            return
+        check.ejections += 1
+        check.ejected_until = now + self.eject_time * min(check.ejections, 10)
+        check.consecutive_errors = 0
+        self._apply(check)
+
+    def _analyze(self, now):
+        # Вызывается под self._lock раз в window секунд.
+        measured = [check for check in self._checks.values()
+                    if not check.ejected_until and check.window_requests >= self.min_requests]
+        median = None
+        if len(measured) >= 3:
+            median = statistics.median(check.window_latency / check.window_requests for check in measured)
+        for check in measured:
+            if check.window_errors >= self.error_rate * check.window_requests:
+                self._eject(check, now)
+            elif median and check.window_latency / check.window_requests > self.latency_factor * median:
+                self._eject(check, now)
+        for check in self._checks.values():
+            if (check.ejections and not check.ejected_until and not check.window_errors
+                    and check.window_requests >= self.min_requests):
+                # Окно настоящих запросов без ошибок — следующее исключение будет короче.
+                check.ejections -= 1
+            check.window_requests = check.window_errors = 0
+            check.window_latency = 0.0
+
+    def stats(self):
+        with self._lock:
+            now = self.clock()
+            return [
+                {
+                    "instance": f"{check.instance['ip']}:{check.instance['port']}",
+                    "healthy": check.healthy,
+                    "ejected_for": round(check.ejected_until - now, 3) if check.ejected_until else 0,
+                    "ejections": check.ejections,
+                    "probes": check.probes,
+                    "next_probe_in": round(max(0.0, check.next_probe - now), 3),
+                }
+                for check in self._checks.values()
+            ]
@@ -1,61 +1,426 @@
 # Flask — микрофреймворк для веб-приложений.
-from flask import Flask, jsonify, request, render_template_string, redirect, url_for
+from flask import Flask, Response, jsonify, request, render_template_string, redirect, url_for
 
-# Requests — библиотека для отправки HTTP-запросов к инстансам.
-import requests
+# JSON — разбор ответа инстанса.
+import json
 
-# Threading — для фонового потока проверки состояния инстансов.
-import threading
+# OS — чтение настроек из переменных окружения.
+import os
 
-# Time — для паузы между проверками здоровья.
+# Time — время ответа инстанса.
 import time
 
+# atexit, signal, sys, shlex — остановка процессов пула при выходе (в том числе по SIGTERM),
+# аргументы для app_instance.py.
+import atexit
+import signal
+import sys
+import shlex
+
+# namedtuple — ответ инстанса (код, тело, сбой, Cache-Control, размер).
+from collections import namedtuple
+
+# urllib3 — таймаут отдельного запроса к инстансу (остаток общего срока).
+import urllib3
+
+# Пул потоков для хеджирующих запросов: ждём первый из двух ответов.
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Активная (параллельные проверки /health) и пассивная (по настоящим запросам) проверка инстансов.
+from health import HealthChecker
+
+# Реестр инстансов: неизменяемые снимки (copy-on-write) и постоянные id (см. registry.py).
+from registry import Registry
+
+# Счётчики, запросы в полёте и гистограммы задержек по инстансам (см. metrics.py).
+from metrics import Metrics
+
+# Пул постоянных соединений к инстансам с таймаутами и лимитом запросов (см. upstream.py).
+from upstream import UpstreamBusy, UpstreamError, UpstreamPool
+
+# Стратегии выбора инстанса: round_robin, weighted, least_outstanding, p2c, peak_ewma,
+# consistent_hash (и откуда брать ключ запроса для неё).
+from strategies import STRATEGIES, RequestKey, make_strategy
+
+# Бюджет повторов, перцентиль задержки для хеджирования, выключатели инстансов.
+from resilience import CircuitBreakers, LatencyWindow, RetryBudget
+
+# Кэш ответов для GET-запросов: TTL, LRU, объединение промахов, stale-while-revalidate.
+from cache import ResponseCache, parse_cache_control
+
+# Локальный пул процессов app_instance.py: запуск, перезапуск, масштабирование, вывод из пула.
+from supervisor import Supervisor
+
 
 # ==================== Создание приложения ====================
 
 # Создаём объект приложения Flask.
 app = Flask(__name__)
 
-# Список всех инстансов (серверов).
-# Каждый элемент — это словарь с адресом, портом и флагом активности.
-instances = [
+# Инстансы (серверы) при запуске.
+# Каждый элемент — это словарь с адресом, портом и флагом активности
+# (и необязательным весом "weight" для стратегии weighted).
+# В реестре каждый получит постоянный id.
+INITIAL_INSTANCES = [
     {"ip": "127.0.0.1", "port": 5001, "active": True},
     {"ip": "127.0.0.1", "port": 5002, "active": True},
     {"ip": "127.0.0.1", "port": 5003, "active": True}
 ]
 
-# Глобальный индекс для реализации стратегии Round Robin.
-index = 0
+# Супервизор (1 — включён): балансировщик сам запускает app_instance.py и масштабирует их число
+# (см. раздел "Пул процессов" ниже). Тогда INITIAL_INSTANCES не используются.
+SUPERVISE = os.environ.get("LB_SUPERVISE", "0") == "1"
+
+# Плавный старт: за сколько секунд вернувшийся в пул инстанс выходит на полную долю запросов.
+SLOW_START = float(os.environ.get("LB_SLOW_START", "30"))
+
+# Стратегия выбора инстанса (см. strategies.py). Меняется на лету через /strategy.
+strategy = make_strategy(os.environ.get("LB_STRATEGY", "round_robin"), slow_start=SLOW_START)
+
+# Ключ запроса для consistent_hash: "header:<имя>", "query:<параметр>" или "path:<номер сегмента>".
+# Запросы с одним ключом попадают на один инстанс (его локальный кэш остаётся "тёплым").
+# "path:N" — только для async_proxy.py, который пересылает любой путь: у Flask-маршрута путь
+# всегда /process, поэтому Flask-режим с таким ключом не запускается (check_hash_key).
+HASH_KEY = RequestKey(os.environ.get("LB_HASH_KEY", "header:X-Hash-Key"))
+
+
+def check_hash_key():
+    """
+    Проверка перед запуском Flask-приложения. ValueError — ключ по сегменту пути: здесь он
+    был бы у всех запросов одинаковым (path:1) или пустым (path:2 и дальше).
+    """
+    if HASH_KEY.kind == "path":
+        raise ValueError(f"LB_HASH_KEY={HASH_KEY.spec}: ключ по пути работает только в async_proxy.py, "
+                         "у Flask-маршрута путь всегда /process")
+
+
+# ==================== Соединения с инстансами ====================
+
+# Размер пула постоянных соединений к каждому инстансу.
+POOL_SIZE = int(os.environ.get("LB_POOL_SIZE", "10"))
+# Сколько запросов одновременно можно отправить одному инстансу; остальные сразу получают 503.
+MAX_IN_FLIGHT = int(os.environ.get("LB_MAX_IN_FLIGHT", "100"))
+# Таймауты (в секундах) на установку соединения и на ожидание ответа.
+CONNECT_TIMEOUT = float(os.environ.get("LB_CONNECT_TIMEOUT", "0.5"))
+READ_TIMEOUT = float(os.environ.get("LB_READ_TIMEOUT", "5"))
+
+# Метрики запросов к инстансам (/metrics и панель в веб-интерфейсе).
+metrics = Metrics()
+
+# Общий клиент: свой пул keep-alive соединений на каждый инстанс.
+upstream = UpstreamPool(
+    pool_size=POOL_SIZE,
+    max_in_flight=MAX_IN_FLIGHT,
+    connect_timeout=CONNECT_TIMEOUT,
+    read_timeout=READ_TIMEOUT,
+)
 
 
 # ==================== Проверка состояния (Health Check) ====================
 
-def health_check():
+# Активная проверка: интервал и таймаут (секунды), пороги rise/fall (проверок подряд),
+# предел интервала для недоступного инстанса и число параллельных проверок.
+HEALTH_INTERVAL = float(os.environ.get("LB_HEALTH_INTERVAL", "5"))
+HEALTH_TIMEOUT = float(os.environ.get("LB_HEALTH_TIMEOUT", "1"))
+HEALTH_RISE = int(os.environ.get("LB_HEALTH_RISE", "2"))
+HEALTH_FALL = int(os.environ.get("LB_HEALTH_FALL", "3"))
+HEALTH_MAX_BACKOFF = float(os.environ.get("LB_HEALTH_MAX_BACKOFF", "60"))
+HEALTH_WORKERS = int(os.environ.get("LB_HEALTH_WORKERS", "32"))
+
+# Пассивная проверка: ошибок подряд до исключения; доля ошибок и во сколько раз задержка
+# выше медианной (за окно EJECT_WINDOW секунд, не меньше EJECT_MIN_REQUESTS запросов);
+# длительность исключения и сколько процентов инстансов можно исключить одновременно.
+EJECT_CONSECUTIVE = int(os.environ.get("LB_EJECT_CONSECUTIVE", "5"))
+EJECT_ERROR_RATE = float(os.environ.get("LB_EJECT_ERROR_RATE", "0.5"))
+EJECT_LATENCY_FACTOR = float(os.environ.get("LB_EJECT_LATENCY_FACTOR", "3"))
+EJECT_MIN_REQUESTS = int(os.environ.get("LB_EJECT_MIN_REQUESTS", "20"))
+EJECT_WINDOW = float(os.environ.get("LB_EJECT_WINDOW", "10"))
+EJECT_TIME = float(os.environ.get("LB_EJECT_TIME", "30"))
+EJECT_MAX_PERCENT = int(os.environ.get("LB_EJECT_MAX_PERCENT", "50"))
+
+
+def probe(instance):
     """
-    Фоновая функция, которая каждые 5 секунд проверяет,
-    доступны ли инстансы по маршруту /health.
-    Если запрос проходит — активен, иначе помечается как недоступный.
+    Одна проверка инстанса: GET /health через общий пул соединений.
+    Возвращает True, если инстанс жив.
     """
-    while True:
-        for instance in instances:
-            # Формируем адрес проверки, например http://127.0.0.1:5001/health
-            url = f"http://{instance['ip']}:{instance['port']}/health"
+    try:
+        response = upstream.request(instance["ip"], instance["port"], "GET", "/health",
+                                    timeout=HEALTH_TIMEOUT)
+    except UpstreamBusy:
+        # Инстанс занят запросами — но он жив.
+        return True
+    except UpstreamError:
+        # Если ответ не получен — сервер недоступен.
+        return False
+    return response.status < 500
 
-            try:
-                # Пытаемся получить ответ за 1 секунду.
-                requests.get(url, timeout=1)
-                instance["active"] = True
-            except requests.RequestException:
-                # Если ответ не получен — сервер недоступен.
-                instance["active"] = False
 
-        # Пауза 5 секунд между циклами проверки.
-        time.sleep(5)
+# ==================== Выбор инстанса ====================
+
+def publish(snapshot):
+    """
+    Передаёт стратегии активные инстансы нового снимка реестра.
+    Вызывается при каждом изменении пула, а не на каждый запрос.
+    """
+    strategy.update(snapshot.active, snapshot.version)
+
+
+def set_active(instance, active):
+    """
+    Меняет флаг активности инстанса (новый снимок — только если флаг изменился).
+    """
+    registry.set_active(instance["id"], active)
+
+
+# Реестр инстансов. Обработчики читают registry.snapshot без блокировок;
+# изменения публикуют новый снимок целиком.
+registry = Registry(() if SUPERVISE else INITIAL_INSTANCES, on_change=publish)
+
+# Запускаем фоновую проверку состояния инстансов (поток расписания и пул потоков проверок;
+# все потоки — daemon, они завершатся вместе с программой).
+health = HealthChecker(
+    lambda: registry.snapshot.instances, probe, set_active,
+    interval=HEALTH_INTERVAL,
+    rise=HEALTH_RISE,
+    fall=HEALTH_FALL,
+    max_backoff=HEALTH_MAX_BACKOFF,
+    workers=HEALTH_WORKERS,
+    consecutive_errors=EJECT_CONSECUTIVE,
+    error_rate=EJECT_ERROR_RATE,
+    min_requests=EJECT_MIN_REQUESTS,
+    latency_factor=EJECT_LATENCY_FACTOR,
+    window=EJECT_WINDOW,
+    eject_time=EJECT_TIME,
+    max_eject_percent=EJECT_MAX_PERCENT,
+)
+health.start()
+
+
+# ==================== Повторы, хеджирование, выключатели ====================
+
+# Сколько раз повторить запрос на другом инстансе после сбоя (ошибка соединения,
+# таймаут, ответ 5xx) и общий срок запроса клиента со всеми повторами (секунды).
+RETRIES = int(os.environ.get("LB_RETRIES", "2"))
+REQUEST_TIMEOUT = float(os.environ.get("LB_REQUEST_TIMEOUT", str(READ_TIMEOUT)))
+# Бюджет: одновременных повторов не больше процента от запросов в работе (но не меньше минимума).
+RETRY_BUDGET_PERCENT = float(os.environ.get("LB_RETRY_BUDGET_PERCENT", "20"))
+RETRY_MIN_CONCURRENCY = int(os.environ.get("LB_RETRY_MIN_CONCURRENCY", "3"))
+
+# Хеджирование (1 — включено): если инстанс не ответил за HEDGE_PERCENTILE-й перцентиль
+# задержки последних запросов, такой же запрос уходит второму инстансу, берётся первый ответ.
+HEDGE = os.environ.get("LB_HEDGE", "0") == "1"
+HEDGE_PERCENTILE = float(os.environ.get("LB_HEDGE_PERCENTILE", "95"))
+HEDGE_WORKERS = int(os.environ.get("LB_HEDGE_WORKERS", "128"))
+
+# Выключатель инстанса: сбоев подряд до размыкания, сколько секунд разомкнут,
+# сколько пробных запросов пропускает после этого.
+BREAKER_FAILURES = int(os.environ.get("LB_BREAKER_FAILURES", "5"))
+BREAKER_OPEN_TIME = float(os.environ.get("LB_BREAKER_OPEN_TIME", "5"))
+BREAKER_HALF_OPEN = int(os.environ.get("LB_BREAKER_HALF_OPEN", "1"))
+
+retry_budget = RetryBudget(percent=RETRY_BUDGET_PERCENT, min_concurrency=RETRY_MIN_CONCURRENCY)
+latencies = LatencyWindow(percentile=HEDGE_PERCENTILE)
+breakers = CircuitBreakers(failures=BREAKER_FAILURES, open_time=BREAKER_OPEN_TIME,
+                           half_open_requests=BREAKER_HALF_OPEN)
+hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge") if HEDGE else None
+
+# Ответ инстанса: код, тело (JSON), сбой (нет ответа или 5xx), заголовок Cache-Control
+# и размер тела в байтах (для ограничения кэша).
+Reply = namedtuple("Reply", "status payload failed cache_control size")
+
+
+def choose(current, tried, key=None):
+    """
+    Выбирает инстанс, которого ещё нет в tried (множество id инстансов) и чей выключатель
+    пропускает запрос, и добавляет его в tried. None — таких инстансов нет.
+    """
+    while True:
+        instance = current.acquire(tried, key)
+        if instance is None:
+            return None
+        tried.add(instance["id"])
+        if breakers.allow(instance):
+            return instance
+        # Выключатель разомкнут — запрос к инстансу не ушёл, пробуем следующий.
+        current.release(instance)
+
 
+def attempt(current, instance, timeout, path="/process"):
+    """
+    Один запрос к выбранному инстансу. Возвращает Reply.
+    Итог сообщается стратегии, пассивной проверке и выключателю.
+    """
+    series = metrics.start(instance)
+    started = time.perf_counter()
+    failed = busy = False
+    try:
+        # Запрос по постоянному соединению из пула. Ответ 5xx — тоже сбой инстанса
+        response = upstream.request(instance["ip"], instance["port"], "GET", path,
+                                    timeout=urllib3.Timeout(connect=min(CONNECT_TIMEOUT, timeout), read=timeout))
+        failed = response.status >= 500
+        return Reply(response.status, json.loads(response.data), failed,
+                     response.headers.get("Cache-Control", ""), len(response.data))
+    except UpstreamBusy:
+        # У инстанса уже слишком много запросов в полёте — он жив, просто перегружен
+        busy = True
+        return Reply(503, {"error": "Инстанс перегружен"}, True, "", 0)
+    except (UpstreamError, ValueError):
+        # Сервер не ответил (или ответил не JSON). Одна ошибка инстанс не выключает:
+        # её учитывает пассивная проверка, а несколько подряд — исключают инстанс из пула
+        failed = True
+        return Reply(503, {"error": "Инстанс недоступен"}, True, "", 0)
+    finally:
+        # Время ответа — для peak_ewma и хеджирования; запрос, который не ушёл, не считается
+        latency = None if busy else time.perf_counter() - started
+        metrics.finish(series, latency, "busy" if busy else "error" if failed else "ok")
+        current.release(instance, latency, failed)
+        breakers.record(instance, None if busy else failed)
+        if not busy:
+            health.record(instance, latency, failed)
+            if not failed:
+                latencies.add(latency)
+
+
+def hedged(current, instance, tried, timeout, key=None, path="/process"):
+    """
+    Запрос с хеджированием: если ответа нет дольше перцентиля задержки, второй такой же
+    запрос уходит другому инстансу. Возвращается первый успешный ответ; проигравший
+    запрос доходит в фоне и сам сообщает свой итог.
+    """
+    delay = latencies.value()
+    if delay is None or delay >= timeout:
+        return attempt(current, instance, timeout, path)
+    started = time.perf_counter()
+    pending = {hedge_pool.submit(attempt, current, instance, timeout, path)}
+    done, _ = wait(pending, timeout=delay)
+    if not done and retry_budget.acquire():
+        backup = choose(current, tried, key)
+        if backup is None:
+            retry_budget.release()
+        else:
+            metrics.count("hedge")
+            future = hedge_pool.submit(attempt, current, backup, timeout - (time.perf_counter() - started), path)
+            future.add_done_callback(lambda _: retry_budget.release())
+            pending.add(future)
+    result = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            result = future.result()
+            if not result.failed:
+                return result
+    return result
+
+
+def forward(current, key=None, path="/process"):
+    """
+    Запрос к пулу: выбор инстанса, повторы после сбоя на других инстансах (в пределах
+    бюджета повторов) и хеджирование. Возвращает Reply или None — нет доступных инстансов.
+    Контекст запроса Flask не нужен: кэш вызывает forward и из фонового потока.
+    """
+    deadline = time.perf_counter() + REQUEST_TIMEOUT
+    tried = set()
+    result = None
 
-# Запускаем поток, который будет постоянно проверять состояние инстансов.
-# daemon=True означает, что поток завершится, когда закроется основная программа.
-threading.Thread(target=health_check, daemon=True).start()
+    retry_budget.start()
+    try:
+        for number in range(RETRIES + 1):
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            if number:
+                if not retry_budget.acquire():
+                    metrics.count("retry_budget_exhausted")
+                    break
+                metrics.count("retry")
+            try:
+                instance = choose(current, tried, key)
+                if instance is None:
+                    break
+                if HEDGE:
+                    result = hedged(current, instance, tried, timeout, key, path)
+                else:
+                    result = attempt(current, instance, timeout, path)
+            finally:
+                if number:
+                    retry_budget.release()
+            if not result.failed:
+                break
+    finally:
+        retry_budget.finish()
+    return result
+
+
+# ==================== Кэш ответов ====================
+
+# Кэш ответов /process (1 — включён). Ключ — метод, путь с параметрами и значения
+# заголовков из CACHE_VARY (через запятую). Срок свежести и stale-while-revalidate берутся
+# из Cache-Control ответа инстанса, а если их там нет — CACHE_TTL и CACHE_STALE секунд.
+# Размер ограничен числом записей и суммарным размером тел (LRU).
+CACHE = os.environ.get("LB_CACHE", "0") == "1"
+CACHE_TTL = float(os.environ.get("LB_CACHE_TTL", "5"))
+CACHE_STALE = float(os.environ.get("LB_CACHE_STALE", "10"))
+CACHE_MAX_ENTRIES = int(os.environ.get("LB_CACHE_MAX_ENTRIES", "10000"))
+CACHE_MAX_BYTES = int(os.environ.get("LB_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_VARY = tuple(name.strip() for name in os.environ.get("LB_CACHE_VARY", "Accept").split(",") if name.strip())
+
+cache = ResponseCache(ttl=CACHE_TTL, stale=CACHE_STALE, max_entries=CACHE_MAX_ENTRIES,
+                      max_bytes=CACHE_MAX_BYTES, wait_timeout=REQUEST_TIMEOUT) if CACHE else None
+
+
+# ==================== Пул процессов ====================
+
+# Границы пула; запросов в полёте на инстанс, на которые рассчитан пул; задержка (мс, 0 — не
+# учитывать), выше которой добавляется инстанс; как часто решать и сколько секунд нагрузка
+# должна оставаться низкой до уменьшения пула; сколько ждать окончания запросов при выводе
+# инстанса; аргументы для app_instance.py (например, "--latency 20").
+SUPERVISE_MIN = int(os.environ.get("LB_SUPERVISE_MIN", "1"))
+SUPERVISE_MAX = int(os.environ.get("LB_SUPERVISE_MAX", "4"))
+SUPERVISE_TARGET_IN_FLIGHT = float(os.environ.get("LB_SUPERVISE_TARGET_IN_FLIGHT", "4"))
+SUPERVISE_TARGET_LATENCY = float(os.environ.get("LB_SUPERVISE_TARGET_LATENCY", "0"))
+SUPERVISE_INTERVAL = float(os.environ.get("LB_SUPERVISE_INTERVAL", "1"))
+SUPERVISE_DOWN_DELAY = float(os.environ.get("LB_SUPERVISE_DOWN_DELAY", "10"))
+SUPERVISE_DRAIN_TIMEOUT = float(os.environ.get("LB_SUPERVISE_DRAIN_TIMEOUT", str(REQUEST_TIMEOUT)))
+SUPERVISE_ARGS = shlex.split(os.environ.get("LB_SUPERVISE_ARGS", ""))
+
+
+def forget(removed):
+    """
+    Инстанс удалён из реестра: закрываем соединения и забываем его выключатель и метрики,
+    если других записей с тем же адресом не осталось.
+    """
+    if not any(i["ip"] == removed["ip"] and i["port"] == removed["port"]
+               for i in registry.snapshot.instances):
+        upstream.discard(removed["ip"], removed["port"])
+        breakers.discard(removed["ip"], removed["port"])
+        metrics.discard(removed["ip"], removed["port"])
+
+
+supervisor = None
+if SUPERVISE:
+    supervisor = Supervisor(
+        registry,
+        in_flight=lambda instance: metrics.in_flight(instance["ip"], instance["port"]),
+        latency=latencies.value,
+        on_remove=forget,
+        args=SUPERVISE_ARGS,
+        min_instances=SUPERVISE_MIN,
+        max_instances=SUPERVISE_MAX,
+        target_in_flight=SUPERVISE_TARGET_IN_FLIGHT,
+        target_latency=SUPERVISE_TARGET_LATENCY / 1000,
+        interval=SUPERVISE_INTERVAL,
+        down_delay=SUPERVISE_DOWN_DELAY,
+        drain_timeout=SUPERVISE_DRAIN_TIMEOUT,
+    )
+    supervisor.start()
+    # Процессы пула не должны пережить балансировщик: по SIGTERM выходим штатно,
+    # чтобы сработал atexit (обработчик сигнала ставится только из главного потока)
+    atexit.register(supervisor.close)
+    try:
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    except ValueError:
+        pass
 
 
 # ==================== Маршруты (Endpoints) ====================
@@ -65,40 +430,99 @@ def get_health():
     """
     Возвращает список всех инстансов и их текущее состояние.
     """
-    return jsonify(instances)
+    return jsonify(list(registry.snapshot.instances))
+
+
+@app.route('/health/checks')
+def get_health_checks():
+    """
+    Подробности проверки: результат активных проверок, исключение по настоящим запросам,
+    число проверок и когда следующая.
+    """
+    return jsonify(health.stats())
 
 
 @app.route('/process')
 def process():
     """
     Основной маршрут балансировщика.
-    При получении запроса выбирает следующий активный инстанс
-    по алгоритму Round Robin и перенаправляет запрос на него.
+    При получении запроса выбирает активный инстанс по текущей стратегии
+    и перенаправляет запрос на него. После сбоя запрос повторяется на другом
+    инстансе (в пределах бюджета повторов), медленный ответ может быть подстрахован
+    запросом к другому инстансу (хеджирование). Если включён кэш ответов, ответ
+    может прийти из него (заголовок X-Cache: HIT, STALE, COALESCED, MISS или BYPASS).
     """
-    global index  # используем глобальный индекс
-
-    # Выбираем только активные инстансы (которые отвечают на /health)
-    active_instances = [i for i in instances if i["active"]]
-
-    # Если нет ни одного активного сервера — возвращаем ошибку 503
-    if not active_instances:
+    # Запоминаем стратегию: если её сменят, пока идёт запрос, release уйдёт туда же, где был acquire
+    current = strategy
+    key = None
+    query = request.query_string.decode("latin-1")
+    if current.uses_key:
+        key = HASH_KEY.extract(request.path, query, request.headers.get)
+    # Параметры запроса уходят инстансу как есть (и входят в ключ кэша)
+    path = "/process?" + query if query else "/process"
+
+    outcome = None
+    if cache is None:
+        result = forward(current, key, path)
+    else:
+        directives = parse_cache_control(request.headers.get("Cache-Control"))
+        if "no-store" in directives or "Authorization" in request.headers:
+            # Ответ для конкретного клиента (или клиент просит его не хранить) — мимо кэша
+            outcome = "bypass"
+            result = forward(current, key, path)
+        else:
+            # no-cache и max-age=0 — клиенту нужен свежий ответ: идём к инстансу и обновляем запись
+            refresh = "no-cache" in directives or directives.get("max-age") == "0"
+            cache_key = ("GET", path) + tuple(request.headers.get(name, "") for name in CACHE_VARY)
+            result, outcome = cache.lookup(cache_key, lambda: forward(current, key, path), refresh)
+        metrics.cache(outcome)
+
+    # Если нет ни одного доступного сервера — возвращаем ошибку 503
+    if result is None:
+        metrics.response(503)
         return jsonify({"error": "Нет доступных инстансов"}), 503
+    metrics.response(result.status)
+    response = jsonify(result.payload)
+    response.status_code = result.status
+    if outcome is not None:
+        response.headers["X-Cache"] = outcome.upper()
+    if result.cache_control:
+        response.headers["Cache-Control"] = result.cache_control
+    return response
+
+
+@app.route('/metrics')
+def get_metrics():
+    """
+    Метрики в текстовом формате Prometheus: запросы, ошибки, запросы в полёте
+    и гистограммы задержек по инстансам.
+    """
+    return Response(metrics.exposition(registry.snapshot.instances, cache.stats() if cache else None),
+                    content_type="text/plain; version=0.0.4; charset=utf-8")
+
 
-    # Выбираем следующий инстанс по очереди
-    instance = active_instances[index % len(active_instances)]
-    index += 1  # увеличиваем индекс для следующего запроса
+@app.route('/resilience')
+def get_resilience():
+    """
+    Состояние выключателей инстансов, бюджета повторов и текущая задержка хеджирования.
+    """
+    delay = latencies.value()
+    return jsonify({
+        "breakers": breakers.stats(),
+        "retry_budget": retry_budget.stats(),
+        "hedge": HEDGE,
+        "hedge_delay_ms": round(delay * 1000, 3) if delay is not None else None,
+    })
 
-    # Формируем URL для выбранного инстанса, например: http://127.0.0.1:5001/process
-    url = f"http://{instance['ip']}:{instance['port']}/process"
 
-    try:
-        # Перенаправляем запрос на выбранный сервер и возвращаем его ответ
-        response = requests.get(url)
-        return jsonify(response.json())
-    except requests.RequestException:
-        # Если сервер не ответил — помечаем его недоступным
-        instance["active"] = False
-        return jsonify({"error": "Инстанс недоступен"}), 503
+@app.route('/supervisor')
+def get_supervisor():
+    """
+    Пул процессов: границы, нагрузка, нужное число инстансов, процессы и их состояние.
+    """
+    if supervisor is None:
+        return jsonify({"error": "Супервизор выключен (включается LB_SUPERVISE=1)"}), 404
+    return jsonify(supervisor.stats())
 
 
 @app.route('/add_instance', methods=['POST'])
@@ -114,20 +538,17 @@ def add_instance():
     else:
         data = request.form
 
-    # Извлекаем IP и порт
+    # Извлекаем IP, порт и вес (для стратегии weighted; по умолчанию 1)
     ip = data.get("ip")
     port = int(data.get("port"))
+    weight = max(1, int(data.get("weight") or 1))
 
-    # Добавляем в список инстансов
-    instances.append({
-        "ip": ip,
-        "port": port,
-        "active": True
-    })
+    # Добавляем в реестр (новый снимок получит и стратегия)
+    instance = registry.add(ip, port, weight)
 
-    # Если запрос из API — возвращаем JSON-ответ
+    # Если запрос из API — возвращаем JSON-ответ с постоянным id инстанса
     if request.is_json:
-        return jsonify({"message": "Инстанс добавлен"}), 201
+        return jsonify({"message": "Инстанс добавлен", "id": instance["id"]}), 201
     # Если из формы — перенаправляем обратно на главную страницу
     return redirect(url_for('index_page'))
 
@@ -135,19 +556,28 @@ def add_instance():
 @app.route('/remove_instance', methods=['POST'])
 def remove_instance():
     """
-    Удаление инстанса из пула по индексу.
+    Удаление инстанса из пула по id.
     Работает как через API, так и через веб-интерфейс.
+    Для старых клиентов JSON-запрос может передать "index" — номер в текущем списке /health.
     """
     # Определяем источник данных (JSON или HTML-форма)
-    if request.is_json:
-        data = request.get_json()
-        idx = int(data.get("index", -1))
-    else:
-        idx = int(request.form.get("index", -1))
-
-    # Проверяем, что индекс корректен
-    if 0 <= idx < len(instances):
-        removed = instances.pop(idx)
+    data = request.get_json() if request.is_json else request.form
+    try:
+        if data.get("id") is not None:
+            instance_id = int(data.get("id"))
+        else:
+            # Номер в списке переводим в id по одному и тому же снимку
+            snapshot = registry.snapshot
+            idx = int(data.get("index", -1))
+            instance_id = snapshot.instances[idx]["id"] if 0 <= idx < len(snapshot.instances) else None
+    except (TypeError, ValueError):
+        instance_id = None
+
+    # Удаляем по id: соседние добавления и удаления этот инстанс не "сдвинут"
+    removed = registry.remove(instance_id) if instance_id is not None else None
+    if removed is not None:
+        # Закрываем соединения, если других записей с тем же адресом не осталось
+        forget(removed)
 
         if request.is_json:
             # Ответ для API
@@ -157,12 +587,45 @@ def remove_instance():
         # Ответ для HTML-формы — возвращаемся на главную страницу
         return redirect(url_for('index_page'))
 
-    # Если индекс неправильный
+    # Если такого инстанса нет (или его уже удалили)
     if request.is_json:
-        return jsonify({"error": "Неверный индекс"}), 400
+        return jsonify({"error": "Инстанс не найден"}), 404
     return redirect(url_for('index_page'))
 
 
+@app.route('/strategy', methods=['GET', 'POST'])
+def select_strategy():
+    """
+    GET — текущая стратегия и то, что она знает об инстансах.
+    POST — смена стратегии на лету (JSON {"name": ...} или HTML-форма).
+    """
+    global strategy
+
+    if request.method == 'POST':
+        data = request.get_json() if request.is_json else request.form
+        try:
+            new_strategy = make_strategy(data.get("name"), slow_start=SLOW_START)
+        except ValueError as error:
+            if request.is_json:
+                return jsonify({"error": str(error), "available": list(STRATEGIES)}), 400
+            return redirect(url_for('index_page'))
+        snapshot = registry.snapshot
+        new_strategy.update(snapshot.active, snapshot.version)
+        strategy = new_strategy
+        # Снимок мог смениться, пока стратегия менялась: сообщаем новой стратегии последний
+        # (устаревший по версии она пропустит)
+        snapshot = registry.snapshot
+        new_strategy.update(snapshot.active, snapshot.version)
+        if not request.is_json:
+            return redirect(url_for('index_page'))
+
+    return jsonify({
+        "strategy": strategy.name,
+        "available": list(STRATEGIES),
+        "instances": strategy.stats()
+    })
+
+
 # ==================== HTML-шаблон (Web UI) ====================
 
 HTML_TEMPLATE = """
@@ -195,6 +658,9 @@ HTML_TEMPLATE = """
     .links {
       margin-top: 25px;
     }
+    table { border-collapse: collapse; }
+    th, td { padding: 4px 12px; border-bottom: 1px solid #ddd; text-align: right; }
+    th:first-child, td:first-child { text-align: left; }
   </style>
 </head>
 <body>
@@ -202,10 +668,10 @@ HTML_TEMPLATE = """
   <ul>
     {% for inst in instances %}
       <li>
-        {{ loop.index0 }} — {{ inst.ip }}:{{ inst.port }}
+        id {{ inst.id }} — {{ inst.ip }}:{{ inst.port }} (вес {{ inst.weight or 1 }})
         — [{{ 'Доступен' if inst.active else 'Недоступен' }}]
         <form action="/remove_instance" method="post">
-          <input type="hidden" name="index" value="{{ loop.index0 }}">
+          <input type="hidden" name="id" value="{{ inst.id }}">
           <button type="submit">Удалить</button>
         </form>
       </li>
@@ -216,11 +682,59 @@ HTML_TEMPLATE = """
   <form action="/add_instance" method="post">
     IP: <input name="ip" value="127.0.0.1" required>
     Порт: <input name="port" value="5004" required>
+    Вес: <input name="weight" value="1" size="3">
     <button type="submit">Добавить</button>
   </form>
 
+  <h2>Стратегия балансировки</h2>
+  <form action="/strategy" method="post">
+    <select name="name">
+      {% for name in strategies %}
+        <option value="{{ name }}" {{ 'selected' if name == current_strategy }}>{{ name }}</option>
+      {% endfor %}
+    </select>
+    <button type="submit">Выбрать</button>
+  </form>
+
+  <h2>Метрики</h2>
+  {% if metrics %}
+    <table>
+      <tr>
+        <th>Инстанс</th><th>Запросов</th><th>Запр/с</th><th>Ошибок</th><th>Перегружен</th>
+        <th>В полёте</th><th>p50, мс</th><th>p99, мс</th>
+      </tr>
+      {% for row in metrics %}
+        <tr>
+          <td>{{ row.instance }}</td>
+          <td>{{ row.requests }}</td>
+          <td>{{ row.rate }}</td>
+          <td>{{ '%.1f' % (row.error_rate * 100) }}%</td>
+          <td>{{ row.busy }}</td>
+          <td>{{ row.in_flight }}</td>
+          <td>{{ row.p50_ms if row.p50_ms is not none else '—' }}</td>
+          <td>{{ row.p99_ms if row.p99_ms is not none else '—' }}</td>
+        </tr>
+      {% endfor %}
+    </table>
+  {% else %}
+    <p>Запросов ещё не было.</p>
+  {% endif %}
+  {% if cache %}
+    <p>
+      Кэш ответов: {{ cache.entries }} записей ({{ (cache.bytes / 1024) | round(1) }} КБ),
+      попаданий {{ cache.hit }}, устаревших {{ cache.stale }}, объединённых {{ cache.coalesced }},
+      промахов {{ cache.miss }}, мимо кэша {{ cache.bypass }}
+      (без запроса к инстансу — {{ '%.1f' % (cache.hit_rate * 100) }}%).
+    </p>
+  {% endif %}
+
   <div class="links">
     <a class="link-btn" href="/health" target="_blank">Проверить состояние</a>
+    <a class="link-btn" href="/resilience" target="_blank">Выключатели и повторы</a>
+    <a class="link-btn" href="/metrics" target="_blank">Метрики (Prometheus)</a>
+    {% if supervised %}
+      <a class="link-btn" href="/supervisor" target="_blank">Пул процессов</a>
+    {% endif %}
     <a class="link-btn" href="/process" target="_blank">Отправить тестовый запрос</a>
   </div>
 </body>
@@ -232,14 +746,19 @@ HTML_TEMPLATE = """
 def index_page():
     """
     Главная страница балансировщика (Web UI).
-    Отображает список всех инстансов и предоставляет форму управления.
+    Отображает список всех инстансов, сводку метрик и предоставляет форму управления.
     """
-    return render_template_string(HTML_TEMPLATE, instances=instances)
+    return render_template_string(HTML_TEMPLATE, instances=registry.snapshot.instances,
+                                  metrics=metrics.summary(),
+                                  cache=dict(cache.stats(), **metrics.cache_summary()) if cache else None,
+                                  supervised=supervisor is not None,
+                                  strategies=list(STRATEGIES), current_strategy=strategy.name)
 
 
 # ==================== Точка входа в программу ====================
 
 if __name__ == '__main__':
+    check_hash_key()
     # Запускаем Flask-приложение на порту 8000.
     # В продакшене следовало бы использовать uWSGI или Gunicorn, но здесь — режим отладки.
     app.run(port=8000)
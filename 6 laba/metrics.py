@@ -0,0 +1,287 @@
+# Модуль metrics — метрики балансировщика и их выдача в текстовом формате Prometheus.
+#
+# На каждый инстанс (по адресу ip:port):
+#   lb_upstream_requests_total{instance, outcome}   запросы к инстансу: ok, error (сбой
+#                                                    или ответ 5xx), busy (не отправлен —
+#                                                    у инстанса лимит запросов в полёте);
+#   lb_upstream_in_flight{instance}                  запросов в полёте сейчас;
+#   lb_upstream_latency_seconds{instance}            гистограмма времени ответа
+#                                                    с фиксированными границами корзин.
+# Общие: lb_requests_total{code} — ответы клиентам по кодам, счётчики событий
+# (повторы, хеджирующие запросы, исчерпанный бюджет повторов), lb_instance_up{instance},
+# кэш ответов: lb_cache_requests_total{result} (hit, stale, coalesced, miss, bypass),
+# lb_cache_entries и lb_cache_bytes.
+#
+# Стоимость на пути запроса: start() и finish() — поиск серии в словаре, одна короткая
+# блокировка серии и поиск корзины делением пополам по 14 границам (около микросекунды).
+# Строки для /metrics собираются только при чтении.
+
+# bisect — номер корзины гистограммы.
+import bisect
+
+# threading — блокировки серий и общих счётчиков.
+import threading
+
+# time — скорость запросов для панели в веб-интерфейсе.
+import time
+
+
+# Границы корзин гистограммы задержки (секунды): от 0.5 мс до 10 с, примерно 1-2.5-5.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+OUTCOMES = ("ok", "error", "busy")
+
+# Итоги обращения к кэшу ответов (bypass — запрос кэш не использует).
+CACHE_RESULTS = ("hit", "stale", "coalesced", "miss", "bypass")
+
+# Счётчики событий: имя в count() -> (метрика, описание).
+EVENTS = {
+    "retry": ("lb_retries_total", "Повторы запросов на другом инстансе."),
+    "hedge": ("lb_hedges_total", "Хеджирующие (запасные) запросы."),
+    "retry_budget_exhausted": ("lb_retry_budget_exhausted_total", "Повторы, не отправленные из-за бюджета."),
+}
+
+
+class _Series:
+    """
+    Метрики одного инстанса.
+    """
+
+    __slots__ = ("lock", "in_flight", "outcomes", "buckets", "latency_sum", "latency_count",
+                 "rate_mark", "rate")
+
+    def __init__(self, size):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.outcomes = dict.fromkeys(OUTCOMES, 0)
+        # Последняя корзина — всё, что дольше последней границы (+Inf).
+        self.buckets = [0] * (size + 1)
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        # (момент, запросов к этому моменту) — для скорости запросов на панели.
+        self.rate_mark = None
+        self.rate = 0.0
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """
+    Метрики балансировщика. Все методы потокобезопасны.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS, clock=time.monotonic):
+        self.bounds = tuple(buckets)
+        self.clock = clock
+        self._series = {}
+        self._lock = threading.Lock()
+        self._responses = {}
+        self._events = dict.fromkeys(EVENTS, 0)
+        self._cache = dict.fromkeys(CACHE_RESULTS, 0)
+
+    def _get(self, instance):
+        key = (instance["ip"], instance["port"])
+        series = self._series.get(key)
+        if series is None:
+            with self._lock:
+                series = self._series.get(key)
+                if series is None:
+                    series = self._series[key] = _Series(len(self.bounds))
+        return series
+
+    # ---------- Путь запроса ----------
+
+    def start(self, instance):
+        """
+        Запрос к инстансу начат. Возвращает серию для finish().
+        """
+        series = self._get(instance)
+        with series.lock:
+            series.in_flight += 1
+        return series
+
+    def finish(self, series, latency, outcome):
+        """
+        Запрос завершён: latency — секунды (None — запрос не ушёл), outcome — ok, error или busy.
+        """
+        index = bisect.bisect_left(self.bounds, latency) if latency is not None else None
+        with series.lock:
+            series.in_flight -= 1
+            series.outcomes[outcome] += 1
+            if index is not None:
+                series.buckets[index] += 1
+                series.latency_sum += latency
+                series.latency_count += 1
+
+    def response(self, status):
+        """
+        Ответ клиенту с кодом status.
+        """
+        with self._lock:
+            self._responses[status] = self._responses.get(status, 0) + 1
+
+    def count(self, event):
+        with self._lock:
+            self._events[event] += 1
+
+    def cache(self, result):
+        """
+        Итог обращения к кэшу ответов.
+        """
+        with self._lock:
+            self._cache[result] += 1
+
+    def in_flight(self, ip, port):
+        """
+        Запросов к инстансу в полёте сейчас (0 — если к нему ещё не ходили).
+        """
+        series = self._series.get((ip, port))
+        return series.in_flight if series is not None else 0
+
+    def discard(self, ip, port):
+        """
+        Забывает метрики удалённого инстанса.
+        """
+        with self._lock:
+            self._series.pop((ip, port), None)
+
+    # ---------- Чтение ----------
+
+    def _copy(self):
+        # Согласованные копии серий (каждая — под своей блокировкой).
+        with self._lock:
+            items = list(self._series.items())
+            responses = dict(self._responses)
+            events = dict(self._events)
+            events.update(("cache_" + result, count) for result, count in self._cache.items())
+        copies = []
+        for (ip, port), series in sorted(items):
+            with series.lock:
+                copies.append((f"{ip}:{port}", series, series.in_flight, dict(series.outcomes),
+                               list(series.buckets), series.latency_sum, series.latency_count))
+        return copies, responses, events
+
+    def exposition(self, instances=(), cache=None):
+        """
+        Все метрики в текстовом формате Prometheus (version 0.0.4).
+        instances — снимок инстансов для lb_instance_up, cache — размер кэша ответов
+        ({"entries", "bytes"}) или None, если кэш выключен.
+        """
+        copies, responses, events = self._copy()
+        lines = [
+            "# HELP lb_requests_total Ответы клиентам по кодам.",
+            "# TYPE lb_requests_total counter",
+        ]
+        for status in sorted(responses):
+            lines.append(f'lb_requests_total{{code="{status}"}} {responses[status]}')
+        for event, (name, text) in EVENTS.items():
+            lines += [f"# HELP {name} {text}", f"# TYPE {name} counter", f"{name} {events[event]}"]
+
+        if cache is not None:
+            lines += ["# HELP lb_cache_requests_total Обращения к кэшу ответов по итогу.",
+                      "# TYPE lb_cache_requests_total counter"]
+            for result in CACHE_RESULTS:
+                lines.append(f'lb_cache_requests_total{{result="{result}"}} {events["cache_" + result]}')
+            lines += ["# HELP lb_cache_entries Записей в кэше ответов.",
+                      "# TYPE lb_cache_entries gauge",
+                      f"lb_cache_entries {cache['entries']}",
+                      "# HELP lb_cache_bytes Суммарный размер тел в кэше ответов.",
+                      "# TYPE lb_cache_bytes gauge",
+                      f"lb_cache_bytes {cache['bytes']}"]
+
+        lines += ["# HELP lb_instance_up Инстанс получает запросы (1) или нет (0).",
+                  "# TYPE lb_instance_up gauge"]
+        for instance in instances:
+            label = _escape(f"{instance['ip']}:{instance['port']}")
+            lines.append(f'lb_instance_up{{instance="{label}",id="{instance["id"]}"}} {int(instance["active"])}')
+
+        lines += ["# HELP lb_upstream_requests_total Запросы к инстансам по итогу.",
+                  "# TYPE lb_upstream_requests_total counter"]
+        for label, _, _, outcomes, _, _, _ in copies:
+            for outcome in OUTCOMES:
+                lines.append(f'lb_upstream_requests_total{{instance="{_escape(label)}",outcome="{outcome}"}}'
+                             f' {outcomes[outcome]}')
+
+        lines += ["# HELP lb_upstream_in_flight Запросов к инстансу в полёте.",
+                  "# TYPE lb_upstream_in_flight gauge"]
+        for label, _, in_flight, _, _, _, _ in copies:
+            lines.append(f'lb_upstream_in_flight{{instance="{_escape(label)}"}} {in_flight}')
+
+        lines += ["# HELP lb_upstream_latency_seconds Время ответа инстанса.",
+                  "# TYPE lb_upstream_latency_seconds histogram"]
+        for label, _, _, _, buckets, latency_sum, latency_count in copies:
+            label = _escape(label)
+            total = 0
+            for bound, count in zip(self.bounds + (float("inf"),), buckets):
+                total += count
+                lines.append(f'lb_upstream_latency_seconds_bucket{{instance="{label}",le="{_number(bound)}"}}'
+                             f' {total}')
+            lines.append(f'lb_upstream_latency_seconds_sum{{instance="{label}"}} {_number(latency_sum)}')
+            lines.append(f'lb_upstream_latency_seconds_count{{instance="{label}"}} {latency_count}')
+        return "\n".join(lines) + "\n"
+
+    def quantile(self, buckets, q):
+        """
+        Оценка квантиля по гистограмме (линейно внутри корзины), секунды; None — нет замеров.
+        """
+        total = sum(buckets)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(buckets):
+            if count and seen + count >= rank:
+                if index == len(self.bounds):
+                    return self.bounds[-1]
+                low = self.bounds[index - 1] if index else 0.0
+                return low + (self.bounds[index] - low) * (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+    def cache_summary(self):
+        """
+        Обращения к кэшу по итогу и доля ответов без запроса к инстансу (hit, stale, coalesced).
+        """
+        with self._lock:
+            counts = dict(self._cache)
+        served = counts["hit"] + counts["stale"] + counts["coalesced"]
+        total = served + counts["miss"]
+        return dict(counts, hit_rate=round(served / total, 4) if total else 0.0)
+
+    def summary(self):
+        """
+        Сводка по инстансам для веб-интерфейса: запросы, скорость (с прошлого чтения,
+        не чаще раза в секунду), доля ошибок, в полёте, p50 и p99 (мс).
+        """
+        copies, _, _ = self._copy()
+        now = self.clock()
+        rows = []
+        for label, series, in_flight, outcomes, buckets, _, _ in copies:
+            requests = sum(outcomes.values())
+            with series.lock:
+                mark = series.rate_mark
+                if mark is None or now - mark[0] >= 1.0:
+                    if mark is not None:
+                        series.rate = (requests - mark[1]) / (now - mark[0])
+                    series.rate_mark = (now, requests)
+                rate = series.rate
+            p50, p99 = self.quantile(buckets, 0.5), self.quantile(buckets, 0.99)
+            rows.append({
+                "instance": label,
+                "requests": requests,
+                "rate": round(rate, 1),
+                "error_rate": round(outcomes["error"] / requests, 4) if requests else 0.0,
+                "busy": outcomes["busy"],
+                "in_flight": in_flight,
+                "p50_ms": round(p50 * 1000, 2) if p50 is not None else None,
+                "p99_ms": round(p99 * 1000, 2) if p99 is not None else None,
+            })
+        return rows
@@ -0,0 +1,114 @@
+# Модуль registry — реестр инстансов балансировщика.
+#
+# Раньше инстансы лежали в общем изменяемом списке: его меняли поток проверки здоровья
+# и обработчики /add_instance и /remove_instance (удаление — по номеру в списке, который
+# мог сдвинуться из-за соседнего запроса), а читали обработчики запросов — без синхронизации.
+#
+# Теперь:
+#   * у каждого инстанса постоянный id — номер, который выдаётся при добавлении
+#     и больше никогда не используется повторно;
+#   * инстанс — словарь {"id", "ip", "port", "active", "weight"}, который после публикации
+#     не меняется: любое изменение (добавление, удаление, флаг active) создаёт новую копию
+#     словаря и новый снимок реестра (copy-on-write);
+#   * снимок (Snapshot) неизменяем: кортеж всех инстансов, кортеж активных и словарь по id.
+#     Он публикуется одним присваиванием ссылки registry.snapshot, поэтому читатели берут его
+#     без блокировки и без выделения памяти и видят либо старый, либо новый снимок целиком;
+#   * писатели выстраиваются в очередь на одной блокировке; новый снимок передаётся
+#     в on_change(snapshot) (балансировщик отдаёт активные инстансы стратегии) под той же
+#     блокировкой — подписчик получает снимки строго по порядку версий.
+
+# itertools — источник постоянных id.
+import itertools
+
+# threading — блокировка писателей.
+import threading
+
+
+class Snapshot:
+    """
+    Неизменяемый снимок реестра: version растёт с каждым изменением.
+    """
+
+    __slots__ = ("version", "instances", "active", "by_id")
+
+    def __init__(self, version, instances):
+        self.version = version
+        self.instances = instances
+        self.active = tuple(instance for instance in instances if instance["active"])
+        self.by_id = {instance["id"]: instance for instance in instances}
+
+
+class Registry:
+    """
+    Реестр инстансов со снимками copy-on-write. Читать — registry.snapshot,
+    менять — add, remove, set_active, replace.
+    """
+
+    def __init__(self, instances=(), on_change=None):
+        self.on_change = on_change
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.snapshot = Snapshot(0, ())
+        if instances:
+            self.replace(instances)
+
+    def _make(self, ip, port, weight=1, active=True):
+        return {"id": next(self._ids), "ip": ip, "port": int(port), "active": active,
+                "weight": max(1, int(weight))}
+
+    def _publish(self, instances):
+        # Вызывается под self._lock.
+        snapshot = Snapshot(self.snapshot.version + 1, tuple(instances))
+        self.snapshot = snapshot
+        if self.on_change is not None:
+            self.on_change(snapshot)
+        return snapshot
+
+    def get(self, instance_id):
+        return self.snapshot.by_id.get(instance_id)
+
+    def add(self, ip, port, weight=1):
+        """
+        Добавляет инстанс и возвращает его словарь (с новым id).
+        """
+        with self._lock:
+            instance = self._make(ip, port, weight)
+            self._publish(self.snapshot.instances + (instance,))
+            return instance
+
+    def remove(self, instance_id):
+        """
+        Удаляет инстанс по id. Возвращает удалённый словарь или None, если такого нет.
+        """
+        with self._lock:
+            removed = self.snapshot.by_id.get(instance_id)
+            if removed is None:
+                return None
+            self._publish(instance for instance in self.snapshot.instances if instance is not removed)
+            return removed
+
+    def set_active(self, instance_id, active):
+        """
+        Меняет флаг активности. Новый снимок публикуется, только если флаг изменился
+        (и инстанс ещё в реестре). Возвращает True, если снимок изменился.
+        """
+        with self._lock:
+            current = self.snapshot.by_id.get(instance_id)
+            if current is None or current["active"] == active:
+                return False
+            changed = dict(current, active=active)
+            self._publish(changed if instance is current else instance
+                          for instance in self.snapshot.instances)
+            return True
+
+    def replace(self, instances):
+        """
+        Заменяет весь список (словари с ip, port и необязательными active и weight).
+        Каждый инстанс получает новый id. Возвращает новые словари.
+        """
+        with self._lock:
+            made = [self._make(instance["ip"], instance["port"], instance.get("weight", 1),
+                               instance.get("active", True))
+                    for instance in instances]
+            self._publish(made)
+            return made
@@ -0,0 +1,193 @@
+# Модуль resilience — повторы, хеджирование и автоматические выключатели для запросов
+# балансировщика к инстансам.
+#
+#   RetryBudget      бюджет повторов (как retry budget в Envoy): одновременно идущих повторов
+#                    не больше percent процентов от запросов в работе (и не меньше
+#                    min_concurrency). Когда падают все инстансы сразу, повторы не умножают
+#                    нагрузку — лишние запросы сразу получают ошибку.
+#   LatencyWindow    задержки последних size успешных запросов и их перцентиль — после
+#                    этой задержки отправляется запасной (хеджирующий) запрос.
+#   CircuitBreakers  выключатель на каждый инстанс (closed -> open -> half_open):
+#                    после failures сбоев подряд инстанс open_time секунд не получает
+#                    запросов, затем пропускается half_open_requests пробных запросов —
+#                    успех замыкает выключатель, сбой снова размыкает.
+#
+# Выключатель срабатывает сразу, на пути запроса; пассивная проверка (health.py)
+# решает дольше и исключает инстанс из стратегии целиком.
+
+# threading — блокировки (методы вызываются из потоков обработки запросов).
+import threading
+
+# time — часы выключателей.
+import time
+
+
+class RetryBudget:
+    """
+    Сколько повторов (и хеджирующих запросов) может идти одновременно.
+    """
+
+    def __init__(self, percent=20.0, min_concurrency=3):
+        self.percent = percent
+        self.min_concurrency = min_concurrency
+        self._lock = threading.Lock()
+        self._active = 0
+        self._retries = 0
+        self.exhausted = 0
+
+    def start(self):
+        """
+        Запрос клиента принят в работу.
+        """
+        with self._lock:
+            self._active += 1
+
+    def finish(self):
+        with self._lock:
+            self._active -= 1
+
+    def acquire(self):
+        """
+        Можно ли отправить ещё один повтор. True — место занято, его вернёт release().
+        """
+        with self._lock:
+            limit = max(self.min_concurrency, self._active * self.percent / 100)
+            if self._retries + 1 > limit:
+                self.exhausted += 1
+                return False
+            self._retries += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._retries -= 1
+
+    def stats(self):
+        with self._lock:
+            return {"active": self._active, "retries": self._retries, "exhausted": self.exhausted}
+
+
+class LatencyWindow:
+    """
+    Задержки последних size запросов. value() — их перцентиль (секунды) или None,
+    пока замеров меньше min_samples. Перцентиль пересчитывается раз в refresh замеров,
+    а не на каждый запрос.
+    """
+
+    def __init__(self, size=1000, percentile=95.0, min_samples=100, refresh=50):
+        self.size = size
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.refresh = refresh
+        self._lock = threading.Lock()
+        self._samples = []
+        self._next = 0
+        self._added = 0
+        self._value = None
+
+    def add(self, latency):
+        with self._lock:
+            if len(self._samples) < self.size:
+                self._samples.append(latency)
+            else:
+                self._samples[self._next] = latency
+                self._next = (self._next + 1) % self.size
+            self._added += 1
+            if len(self._samples) >= self.min_samples and self._added % self.refresh == 0:
+                ordered = sorted(self._samples)
+                index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+                self._value = ordered[index]
+
+    def value(self):
+        return self._value
+
+
+class _Breaker:
+    """
+    Выключатель одного инстанса.
+    """
+
+    __slots__ = ("state", "failures", "opened_until", "trials", "opens")
+
+    def __init__(self):
+        self.state = CircuitBreakers.CLOSED
+        self.failures = 0
+        self.opened_until = 0.0
+        self.trials = 0
+        self.opens = 0
+
+
+class CircuitBreakers:
+    """
+    Выключатели всех инстансов (по адресу ip:port, создаются при первом обращении).
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failures=5, open_time=5.0, half_open_requests=1, clock=time.monotonic):
+        self.failures = failures
+        self.open_time = open_time
+        self.half_open_requests = half_open_requests
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def _get(self, instance):
+        # Вызывается под self._lock.
+        key = (instance["ip"], instance["port"])
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = self._breakers[key] = _Breaker()
+        return breaker
+
+    def allow(self, instance):
+        """
+        Можно ли отправить запрос инстансу. Если да — итог надо сообщить в record().
+        """
+        with self._lock:
+            breaker = self._get(instance)
+            if breaker.state == self.CLOSED:
+                return True
+            if breaker.state == self.OPEN:
+                if self.clock() < breaker.opened_until:
+                    return False
+                breaker.state = self.HALF_OPEN
+                breaker.trials = 0
+            if breaker.trials >= self.half_open_requests:
+                return False
+            breaker.trials += 1
+            return True
+
+    def record(self, instance, failed):
+        """
+        Итог запроса, пропущенного allow(): failed — сбой или нет, None — запрос так и
+        не ушёл к инстансу (ничего о нём не говорит).
+        """
+        with self._lock:
+            breaker = self._get(instance)
+            if breaker.state == self.HALF_OPEN:
+                breaker.trials = max(0, breaker.trials - 1)
+            if failed is None:
+                return
+            if not failed:
+                breaker.failures = 0
+                if breaker.state == self.HALF_OPEN:
+                    breaker.state = self.CLOSED
+                return
+            breaker.failures += 1
+            if breaker.state == self.HALF_OPEN or (breaker.state == self.CLOSED
+                                                   and breaker.failures >= self.failures):
+                breaker.state = self.OPEN
+                breaker.opened_until = self.clock() + self.open_time
+                breaker.opens += 1
+
+    def discard(self, ip, port):
+        with self._lock:
+            self._breakers.pop((ip, port), None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                f"{ip}:{port}": {"state": breaker.state, "failures": breaker.failures, "opens": breaker.opens}
+                for (ip, port), breaker in self._breakers.items()
+            }
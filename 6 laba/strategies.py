@@ -0,0 +1,500 @@
+# Модуль strategies — стратегии выбора инстанса для балансировщика.
+#
+# Все стратегии устроены одинаково:
+#   update(instances, version)           новый список активных инстансов (снимок реестра
+#                                        после проверки здоровья, добавления или удаления;
+#                                        снимок старее уже полученного пропускается);
+#   acquire(exclude, key)                выбрать инстанс под новый запрос (или None) —
+#                                        выбор и учёт "запроса в полёте" атомарны;
+#                                        exclude — id инстансов (instance["id"]), которые уже пробовали
+#                                        (повтор после сбоя уходит на другой инстанс),
+#                                        key — ключ запроса для consistent_hash;
+#   release(instance, latency, failed)   запрос завершён: время ответа в секундах и был ли сбой.
+#
+# Список активных инстансов готовится один раз в update, а не на каждый запрос,
+# и каждый выбор стоит O(1). Все методы потокобезопасны (одна короткая блокировка).
+#
+# Стратегии:
+#   round_robin        по кругу;
+#   weighted           по кругу с весами (instance["weight"], по умолчанию 1):
+#                      "гладкое" расписание, как в nginx, строится заранее в update;
+#   least_outstanding  инстанс с наименьшим числом запросов в полёте
+#                      (корзины по числу запросов — выбор за O(1));
+#   p2c                два случайных инстанса, из них — с меньшим числом запросов в полёте;
+#   peak_ewma          два случайных инстанса, из них — с меньшей оценкой
+#                      "задержка x (запросов в полёте + 1)". Задержка — EWMA, которая
+#                      сразу подскакивает до пика и плавно затухает (как в Finagle/Linkerd).
+#   consistent_hash    запросы с одним ключом (пользователь, ключ кэша) — на один и тот же
+#                      инстанс: кольцо хешей с виртуальными узлами. При добавлении или удалении
+#                      инстанса переезжает около 1/N ключей. Откуда брать ключ — RequestKey.
+#
+# Плавный старт (slow_start секунд, 0 — выключен): инстанс, который вернулся в пул или
+# только что добавлен, сначала получает малую долю своих запросов (от MIN_SHARE), и доля
+# линейно растёт до полной — холодный инстанс не заваливают сразу.
+#
+# Медленный инстанс в round_robin получает ту же долю запросов, что и быстрые, и держит
+# хвост задержек. Стратегии с учётом запросов в полёте и задержки сами уводят от него трафик.
+
+# bisect — поиск точки на кольце consistent_hash.
+import bisect
+
+# hashlib — стабильный хеш ключей и виртуальных узлов (встроенный hash() меняется
+# от запуска к запуску, а ключ должен попадать на тот же инстанс и после перезапуска).
+import hashlib
+
+# math — экспонента затухания EWMA.
+import math
+
+# random — случайные пары в p2c и peak_ewma.
+import random
+
+# threading — блокировка состояния стратегии.
+import threading
+
+# parse_qsl — ключ из параметра запроса.
+from urllib.parse import parse_qsl
+
+# time — часы для затухания EWMA.
+import time
+
+# OrderedDict — корзины least_outstanding: первый элемент берётся за O(1)
+# (у обычного dict после многих удалений из начала поиск первого элемента дорожает).
+from collections import OrderedDict
+
+
+# С какой доли запросов начинается плавный старт.
+MIN_SHARE = 0.1
+
+class _State:
+    """
+    Что стратегия знает об одном инстансе.
+    """
+
+    __slots__ = ("instance", "active", "outstanding", "ewma", "stamp", "since")
+
+    def __init__(self, instance, now, since=None):
+        self.instance = instance
+        self.active = True
+        self.outstanding = 0
+        self.ewma = 0.0
+        self.stamp = now
+        # Когда инстанс (снова) стал активным — для плавного старта; None — старт завершён.
+        self.since = since
+
+
+class Strategy:
+    """
+    Общая часть стратегий: состояния инстансов, блокировка и учёт запросов в полёте.
+    Наследники переопределяют _rebuild, _pick и, если нужно, _started / _finished.
+    """
+
+    name = None
+    # Нужен ли стратегии ключ запроса (если нет — его и не вычисляют).
+    uses_key = False
+
+    def __init__(self, clock=time.monotonic, seed=None, slow_start=0.0):
+        self.clock = clock
+        self.slow_start = slow_start
+        self._random = random.Random(seed)
+        self._updated = False
+        self._lock = threading.Lock()
+        # id инстанса -> _State. Инстанс может уйти из активных, пока к нему
+        # идут запросы, — его состояние живёт до последнего release.
+        self._states = {}
+        self._active = ()
+        self._version = 0
+
+    def update(self, instances, version=None):
+        with self._lock:
+            if version is not None:
+                if version < self._version:
+                    return
+                self._version = version
+            now = self.clock()
+            states = {}
+            for instance in instances:
+                state = self._states.get(instance["id"])
+                if state is None:
+                    # Инстансы из самого первого списка плавно не разгоняются — разгонять не от чего.
+                    state = _State(instance, now, now if self._updated and self.slow_start else None)
+                # Словарь инстанса в новом снимке — новая копия (copy-on-write), id тот же.
+                state.instance = instance
+                state.active = True
+                states[instance["id"]] = state
+            for key, state in self._states.items():
+                if key not in states and state.outstanding:
+                    state.active = False
+                    states[key] = state
+            self._states = states
+            self._active = tuple(states[instance["id"]] for instance in instances)
+            self._updated = True
+            self._rebuild()
+
+    def acquire(self, exclude=(), key=None):
+        """
+        Выбирает инстанс и засчитывает ему запрос в полёте. None — активных инстансов нет
+        (или все они в exclude — множестве id инстансов).
+        key — ключ запроса (строка) для стратегий с uses_key.
+        """
+        with self._lock:
+            if not self._active:
+                return None
+            state = self._pick() if key is None else self._pick_key(key)
+            if state.since is not None:
+                state = self._slow_start(state)
+            if exclude and state.instance["id"] in exclude:
+                state = self._fallback(exclude, key)
+                if state is None:
+                    return None
+            self._started(state)
+            state.outstanding += 1
+            return state.instance
+
+    def _slow_start(self, state):
+        share = (self.clock() - state.since) / self.slow_start
+        if share >= 1:
+            state.since = None
+            return state
+        if len(self._active) == 1 or self._random.random() < max(share, MIN_SHARE):
+            return state
+        # Запрос уходит другому инстансу: сначала по стратегии, а если она снова выбрала
+        # этот же (least_outstanding так и сделает) — случайному другому.
+        other = self._pick()
+        if other is state:
+            index = self._random.randrange(len(self._active) - 1)
+            other = self._active[index]
+            if other is state:
+                other = self._active[-1]
+        return other
+
+    def release(self, instance, latency=None, failed=False):
+        with self._lock:
+            state = self._states.get(instance["id"])
+            if state is None:
+                return
+            self._finished(state, latency, failed)
+            state.outstanding -= 1
+            if not state.active and not state.outstanding:
+                del self._states[instance["id"]]
+
+    def stats(self):
+        with self._lock:
+            now = self.clock()
+            return [
+                {
+                    "instance": f"{state.instance['ip']}:{state.instance['port']}",
+                    "outstanding": state.outstanding,
+                    "latency_ms": round(self._latency(state, now) * 1000, 3),
+                }
+                for state in self._active
+            ]
+
+    # Точки расширения (вызываются под блокировкой).
+
+    def _rebuild(self):
+        pass
+
+    def _pick(self):
+        raise NotImplementedError
+
+    def _pick_key(self, key):
+        return self._pick()
+
+    def _fallback(self, exclude, key):
+        # Повтор: стратегия выбрала уже испробованный инстанс — берём наименее
+        # загруженный из остальных (перебор только на пути повтора).
+        others = [other for other in self._active if other.instance["id"] not in exclude]
+        if not others:
+            return None
+        return min(others, key=lambda other: other.outstanding)
+
+    def _started(self, state):
+        pass
+
+    def _finished(self, state, latency, failed):
+        pass
+
+    def _latency(self, state, now):
+        return state.ewma
+
+
+class RoundRobin(Strategy):
+    """
+    По кругу.
+    """
+
+    name = "round_robin"
+
+    def _rebuild(self):
+        self._next = 0
+
+    def _pick(self):
+        state = self._active[self._next % len(self._active)]
+        self._next += 1
+        return state
+
+
+class WeightedRoundRobin(Strategy):
+    """
+    По кругу с весами: инстанс с весом 3 получает втрое больше запросов, чем с весом 1.
+    """
+
+    name = "weighted"
+
+    def _rebuild(self):
+        # "Гладкий" взвешенный круг (nginx): тяжёлые инстансы чередуются с лёгкими, а не идут
+        # подряд. Расписание длиной в сумму весов строится здесь, выбор — просто по индексу.
+        weights = [max(1, int(state.instance.get("weight", 1))) for state in self._active]
+        current = [0] * len(weights)
+        total = sum(weights)
+        self._schedule = []
+        for _ in range(total):
+            for i, weight in enumerate(weights):
+                current[i] += weight
+            best = max(range(len(current)), key=current.__getitem__)
+            current[best] -= total
+            self._schedule.append(self._active[best])
+        self._next = 0
+
+    def _pick(self):
+        state = self._schedule[self._next % len(self._schedule)]
+        self._next += 1
+        return state
+
+
+class LeastOutstanding(Strategy):
+    """
+    Инстанс с наименьшим числом запросов в полёте.
+    Инстансы разложены по корзинам "число запросов -> инстансы"; число меняется на 1,
+    поэтому номер наименьшей непустой корзины поддерживается за O(1).
+    При равенстве инстансы чередуются: выбранный уходит в конец своей новой корзины.
+    """
+
+    name = "least_outstanding"
+
+    def _rebuild(self):
+        self._buckets = {}
+        for state in self._active:
+            self._buckets.setdefault(state.outstanding, OrderedDict())[id(state)] = state
+        self._min = min(self._buckets) if self._buckets else 0
+
+    def _move(self, state, old, new):
+        bucket = self._buckets[old]
+        del bucket[id(state)]
+        if not bucket:
+            del self._buckets[old]
+        self._buckets.setdefault(new, OrderedDict())[id(state)] = state
+
+    def _pick(self):
+        return next(iter(self._buckets[self._min].values()))
+
+    def _started(self, state):
+        if state.active:
+            self._move(state, state.outstanding, state.outstanding + 1)
+            if self._min not in self._buckets:
+                self._min += 1
+
+    def _finished(self, state, latency, failed):
+        if state.active:
+            self._move(state, state.outstanding, state.outstanding - 1)
+            self._min = min(self._min, state.outstanding - 1)
+
+
+class PowerOfTwoChoices(Strategy):
+    """
+    Два случайных инстанса — из них тот, что дешевле (_cost).
+    Почти так же хорошо, как "наименьший из всех", но без общей очереди и без стада:
+    разные запросы не набрасываются одновременно на один и тот же "лучший" инстанс.
+    """
+
+    name = "p2c"
+
+    def _pick(self):
+        count = len(self._active)
+        if count == 1:
+            return self._active[0]
+        i = self._random.randrange(count)
+        j = self._random.randrange(count - 1)
+        if j >= i:
+            j += 1
+        first, second = self._active[i], self._active[j]
+        now = self.clock()
+        return first if self._cost(first, now) <= self._cost(second, now) else second
+
+    def _cost(self, state, now):
+        return state.outstanding
+
+
+class PeakEwma(PowerOfTwoChoices):
+    """
+    p2c по оценке "задержка x (запросов в полёте + 1)".
+    Задержка — EWMA с пиком: медленный ответ сразу поднимает оценку до себя, быстрые
+    опускают её постепенно (постоянная времени decay секунд). Пока инстанс простаивает,
+    оценка затухает к нулю — так инстанс, который был медленным, снова получает запросы
+    и может показать, что поправился. Сбой считается ответом за failure_penalty секунд.
+    """
+
+    name = "peak_ewma"
+
+    def __init__(self, clock=time.monotonic, seed=None, slow_start=0.0, decay=10.0, failure_penalty=1.0):
+        super().__init__(clock, seed, slow_start)
+        self.decay = decay
+        self.failure_penalty = failure_penalty
+
+    def _latency(self, state, now):
+        return state.ewma * math.exp(-(now - state.stamp) / self.decay)
+
+    def _cost(self, state, now):
+        # Ещё не измеренный инстанс (оценка 0) сравнивается по числу запросов в полёте.
+        return (self._latency(state, now) * (state.outstanding + 1), state.outstanding)
+
+    def _finished(self, state, latency, failed):
+        if failed:
+            latency = self.failure_penalty
+        if latency is None:
+            return
+        now = self.clock()
+        estimate = self._latency(state, now)
+        if latency > estimate:
+            state.ewma = latency
+        else:
+            weight = math.exp(-(now - state.stamp) / self.decay)
+            state.ewma = state.ewma * weight + latency * (1 - weight)
+        state.stamp = now
+
+
+def _hash(data):
+    return int.from_bytes(hashlib.blake2b(data.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class ConsistentHash(RoundRobin):
+    """
+    Кольцо хешей: у каждого инстанса vnodes точек на кольце (умножить на вес), ключ
+    достаётся инстансу первой точки по часовой стрелке от хеша ключа.
+    Точки инстанса зависят только от его адреса, поэтому при добавлении инстанса к нему
+    переезжают ключи только с его новых участков кольца (около 1/N), а при удалении —
+    только его собственные ключи. Запросы без ключа идут по кругу.
+    Повтор после сбоя уходит на следующий по кольцу инстанс — тоже один и тот же для ключа.
+    """
+
+    name = "consistent_hash"
+    uses_key = True
+
+    def __init__(self, clock=time.monotonic, seed=None, slow_start=0.0, vnodes=160):
+        # Плавный старт отключён: он уводил бы ключи нового инстанса на случайные другие,
+        # а ключ должен всё время попадать на один инстанс.
+        super().__init__(clock, seed, 0.0)
+        self.vnodes = vnodes
+        # (ip, port, вес) -> точки инстанса; считаются один раз, а не при каждом update.
+        self._points = {}
+        self._hashes = []
+        self._owners = []
+
+    def _instance_points(self, instance):
+        weight = max(1, int(instance.get("weight", 1)))
+        address = (instance["ip"], instance["port"], weight)
+        points = self._points.get(address)
+        if points is None:
+            points = self._points[address] = [
+                _hash(f"{instance['ip']}:{instance['port']}#{i}") for i in range(self.vnodes * weight)
+            ]
+        return address, points
+
+    def _rebuild(self):
+        super()._rebuild()
+        ring = []
+        used = set()
+        for index, state in enumerate(self._active):
+            address, points = self._instance_points(state.instance)
+            used.add(address)
+            ring.extend((point, index) for point in points)
+        # Точки ушедших инстансов больше не нужны.
+        for address in list(self._points):
+            if address not in used:
+                del self._points[address]
+        ring.sort()
+        self._hashes = [point for point, _ in ring]
+        self._owners = [self._active[index] for _, index in ring]
+
+    def _locate(self, key):
+        return bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+
+    def _pick_key(self, key):
+        return self._owners[self._locate(key)]
+
+    def _fallback(self, exclude, key):
+        if key is None:
+            return super()._fallback(exclude, key)
+        # Идём по кольцу дальше, до первого инстанса, которого нет в exclude.
+        start = self._locate(key)
+        for step in range(len(self._owners)):
+            state = self._owners[(start + step) % len(self._owners)]
+            if state.instance["id"] not in exclude:
+                return state
+        return None
+
+    def lookup(self, key):
+        """
+        Какой инстанс достанется ключу (без учёта запроса в полёте) — для проверок.
+        """
+        with self._lock:
+            if not self._active:
+                return None
+            return self._pick_key(key).instance
+
+
+class RequestKey:
+    """
+    Откуда брать ключ запроса для consistent_hash. spec:
+      "header:X-User-Id"  значение заголовка;
+      "query:user"        значение параметра запроса (?user=...);
+      "path:2"            сегмент пути по номеру с 1 (/users/42/orders -> "42") — только
+                          в async_proxy.py: Flask-маршрут видит один путь /process
+                          (load_balancer.check_hash_key не даёт запустить его с таким ключом).
+    ValueError — неверный spec.
+    """
+
+    KINDS = ("header", "query", "path")
+
+    def __init__(self, spec):
+        kind, _, name = spec.partition(":")
+        if kind not in self.KINDS or not name:
+            raise ValueError(f"Неверный источник ключа: {spec}")
+        if kind == "path":
+            if not name.isdigit() or int(name) < 1:
+                raise ValueError(f"Неверный номер сегмента пути: {name}")
+            name = int(name)
+        self.spec = spec
+        self.kind = kind
+        self.name = name
+
+    def extract(self, path, query, header):
+        """
+        Ключ запроса или None. path — путь без параметров, query — строка параметров,
+        header(name) — значение заголовка (или None).
+        """
+        if self.kind == "header":
+            return header(self.name) or None
+        if self.kind == "query":
+            for name, value in parse_qsl(query):
+                if name == self.name:
+                    return value or None
+            return None
+        segments = [segment for segment in path.split("/") if segment]
+        return segments[self.name - 1] if len(segments) >= self.name else None
+
+
+STRATEGIES = {
+    strategy.name: strategy
+    for strategy in (RoundRobin, WeightedRoundRobin, LeastOutstanding, PowerOfTwoChoices, PeakEwma,
+                     ConsistentHash)
+}
+
+
+def make_strategy(name, **kwargs):
+    """
+    Создаёт стратегию по имени. ValueError — неизвестное имя.
+    """
+    if name not in STRATEGIES:
+        raise ValueError(f"Неизвестная стратегия: {name}")
+    return STRATEGIES[name](**kwargs)
@@ -0,0 +1,277 @@
+# Модуль supervisor — локальный пул процессов app_instance.py под управлением балансировщика.
+#
+# Раньше каждый app_instance.py запускали вручную с номером порта и регистрировали через
+# /add_instance. Супервизор делает это сам:
+#   * запускает процессы на свободных портах и добавляет инстанс в реестр только после того,
+#     как он ответил на /health;
+#   * упавший процесс убирает из реестра и запускает замену (после нескольких падений
+#     подряд — с растущей паузой, чтобы не крутить перезапуски);
+#   * масштабирует пул между min_instances и max_instances по нагрузке: раз в sample_interval
+#     снимает число запросов в полёте к своим инстансам, раз в interval считает среднее
+#     и нужное число инстансов = ceil(среднее / target_in_flight); если задержка выше
+#     target_latency, добавляет ещё один. Рост — сразу, уменьшение — только если меньшее
+#     число держится down_delay секунд (берётся наибольшая рекомендация за это время);
+#   * лишний инстанс сначала убирается из реестра (новые запросы на него не идут), потом
+#     супервизор ждёт, пока закончатся запросы в полёте (не дольше drain_timeout),
+#     и только затем останавливает процесс.
+# Инстансы, добавленные вручную через /add_instance, супервизор не трогает и не считает.
+
+# math — округление нужного числа инстансов вверх.
+import math
+
+# os, socket, subprocess, sys — запуск процессов на свободных портах.
+import os
+import socket
+import subprocess
+import sys
+
+# threading — поток супервизора и потоки вывода из пула.
+import threading
+
+# time — часы.
+import time
+
+# urllib.request — проверка, что запущенный инстанс отвечает на /health.
+import urllib.request
+
+# deque — рекомендации за последние down_delay секунд.
+from collections import deque
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port(host):
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+class _Member:
+    """
+    Процесс пула: running — получает запросы, draining — выводится из пула.
+    """
+
+    __slots__ = ("instance", "process", "started", "state")
+
+    def __init__(self, instance, process, started):
+        self.instance = instance
+        self.process = process
+        self.started = started
+        self.state = "running"
+
+
+class Supervisor:
+    """
+    Пул процессов app_instance.py.
+    registry — реестр балансировщика (add, remove, snapshot),
+    in_flight(instance) — запросов к инстансу в полёте,
+    latency() — недавняя задержка ответов в секундах (или None),
+    on_remove(instance) — инстанс убран из реестра (закрыть соединения, забыть метрики).
+    """
+
+    def __init__(self, registry, in_flight, latency=None, on_remove=None, args=(), host="127.0.0.1",
+                 min_instances=1, max_instances=4, target_in_flight=4.0, target_latency=0.0,
+                 interval=1.0, sample_interval=0.1, down_delay=10.0, drain_timeout=30.0,
+                 drain_grace=0.5, ready_timeout=15.0, restart_backoff=1.0, max_restart_backoff=30.0,
+                 clock=time.monotonic):
+        self.registry = registry
+        self.in_flight = in_flight
+        self.latency = latency
+        self.on_remove = on_remove
+        self.command = [sys.executable, os.path.join(HERE, "app_instance.py")]
+        self.args = list(args)
+        self.host = host
+        self.min_instances = max(0, min_instances)
+        self.max_instances = max(self.min_instances, max_instances)
+        self.target_in_flight = target_in_flight
+        self.target_latency = target_latency
+        self.interval = interval
+        self.sample_interval = sample_interval
+        self.down_delay = down_delay
+        self.drain_timeout = drain_timeout
+        self.drain_grace = drain_grace
+        self.ready_timeout = ready_timeout
+        self.restart_backoff = restart_backoff
+        self.max_restart_backoff = max_restart_backoff
+        self.clock = clock
+        self._members = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._samples = []
+        self._recommendations = deque()
+        self._load = 0.0
+        self._desired = self.min_instances
+        self._crashes = 0
+        self._next_spawn = 0.0
+        self.restarts = self.scale_ups = self.scale_downs = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """
+        Останавливает супервизор и все его процессы (без вывода из пула).
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            members = list(self._members.values())
+            self._members.clear()
+        for member in members:
+            self._terminate(member.process)
+
+    # ---------- Процессы ----------
+
+    def _spawn(self):
+        # Запускает процесс и ждёт ответа на /health. Возвращает _Member или None.
+        port = free_port(self.host)
+        process = subprocess.Popen(self.command + [str(port)] + self.args, cwd=HERE,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = self.clock() + self.ready_timeout
+        while self.clock() < deadline and not self._stop.is_set():
+            if process.poll() is not None:
+                break
+            try:
+                with urllib.request.urlopen(f"http://{self.host}:{port}/health", timeout=0.5):
+                    instance = self.registry.add(self.host, port)
+                    return _Member(instance, process, self.clock())
+            except OSError:
+                time.sleep(0.05)
+        self._terminate(process)
+        return None
+
+    def _terminate(self, process):
+        if process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+    def _forget(self, member):
+        if self.on_remove is not None:
+            self.on_remove(member.instance)
+
+    def _drain(self, member):
+        # Убираем из реестра — новые запросы на инстанс не идут; ждём, пока закончатся начатые.
+        # Метрики инстанса (по ним видно запросы в полёте) забываем только после остановки.
+        self.registry.remove(member.instance["id"])
+        started = self.clock()
+        deadline = started + self.drain_timeout
+        while self.clock() < deadline and not self._stop.is_set():
+            if self.clock() - started >= self.drain_grace and not self.in_flight(member.instance):
+                break
+            time.sleep(0.05)
+        self._terminate(member.process)
+        self._forget(member)
+        with self._lock:
+            self._members.pop(member.instance["id"], None)
+
+    # ---------- Масштабирование ----------
+
+    def _running(self):
+        # Потоки вывода удаляют процессы из словаря — читаем его под блокировкой.
+        with self._lock:
+            return [m for m in self._members.values() if m.state == "running"]
+
+    def _reap(self, now):
+        # Упавшие процессы и инстансы, удалённые из реестра вручную.
+        snapshot = self.registry.snapshot
+        for member in self._running():
+            if member.process.poll() is not None:
+                self.registry.remove(member.instance["id"])
+                self._forget(member)
+                with self._lock:
+                    del self._members[member.instance["id"]]
+                self.restarts += 1
+                # Процесс прожил меньше минуты — похоже на цикл падений: пауза растёт
+                self._crashes = self._crashes + 1 if now - member.started < 60 else 1
+                delay = min(self.max_restart_backoff, self.restart_backoff * 2 ** (self._crashes - 1))
+                self._next_spawn = now + delay
+            elif member.instance["id"] not in snapshot.by_id:
+                member.state = "draining"
+                threading.Thread(target=self._drain, args=(member,), daemon=True).start()
+
+    def _recommend(self, now, running):
+        load = sum(self._samples) / len(self._samples) if self._samples else 0.0
+        self._samples = []
+        self._load = load
+        desired = math.ceil(load / self.target_in_flight) if self.target_in_flight > 0 else running
+        if self.target_latency and load and self.latency is not None:
+            latency = self.latency()
+            if latency is not None and latency > self.target_latency:
+                desired = max(desired, running + 1)
+        desired = min(self.max_instances, max(self.min_instances, desired))
+        # Уменьшение — по наибольшей рекомендации за down_delay секунд (нагрузка "дребезжит")
+        self._recommendations.append((now, desired))
+        while self._recommendations[0][0] < now - self.down_delay:
+            self._recommendations.popleft()
+        return max(value for _, value in self._recommendations)
+
+    def _scale(self, now, desired):
+        running = self._running()
+        if len(running) > desired:
+            # Выводим инстансы с наименьшим числом запросов в полёте (при равенстве — новые)
+            running.sort(key=lambda m: (self.in_flight(m.instance), -m.started))
+            for member in running[:len(running) - desired]:
+                member.state = "draining"
+                self.scale_downs += 1
+                threading.Thread(target=self._drain, args=(member,), daemon=True).start()
+            return
+        missing = desired - len(running)
+        if missing <= 0 or now < self._next_spawn:
+            return
+        for number in range(missing):
+            member = self._spawn()
+            if member is None:
+                self._crashes += 1
+                self._next_spawn = self.clock() + min(self.max_restart_backoff,
+                                                      self.restart_backoff * 2 ** (self._crashes - 1))
+                return
+            with self._lock:
+                self._members[member.instance["id"]] = member
+            # Запуск сверх минимума — рост пула; до минимума — первый запуск или замена упавшего
+            if len(running) + number >= self.min_instances:
+                self.scale_ups += 1
+
+    def _run(self):
+        next_decision = self.clock()
+        while not self._stop.is_set():
+            now = self.clock()
+            self._reap(now)
+            running = self._running()
+            self._samples.append(sum(self.in_flight(m.instance) for m in running))
+            if now >= next_decision:
+                self._desired = self._recommend(now, len(running))
+                next_decision = now + self.interval
+            # Меньше минимума (запуск, падение) — добираем сразу, не дожидаясь решения
+            self._scale(now, max(self._desired, self.min_instances))
+            self._stop.wait(self.sample_interval)
+
+    def stats(self):
+        now = self.clock()
+        with self._lock:
+            members = list(self._members.values())
+        return {
+            "min_instances": self.min_instances,
+            "max_instances": self.max_instances,
+            "target_in_flight": self.target_in_flight,
+            "in_flight": round(self._load, 2),
+            "desired": self._desired,
+            "running": sum(1 for m in members if m.state == "running"),
+            "restarts": self.restarts,
+            "scale_ups": self.scale_ups,
+            "scale_downs": self.scale_downs,
+            "instances": [{
+                "id": m.instance["id"],
+                "instance": f"{m.instance['ip']}:{m.instance['port']}",
+                "pid": m.process.pid,
+                "state": m.state,
+                "uptime": round(now - m.started, 1),
+            } for m in members],
+        }
@@ -0,0 +1,126 @@
+# Модуль upstream — клиент балансировщика к инстансам (upstream-серверам).
+#
+# Раньше на каждый запрос вызывался requests.get(url): новое TCP-соединение на каждый
+# проксируемый вызов и никакого таймаута — медленный инстанс мог навсегда занять поток.
+#
+# Теперь у каждого инстанса свой пул постоянных соединений (urllib3.HTTPConnectionPool,
+# HTTP keep-alive), а на каждый вызов действуют:
+#   * таймаут на установку соединения и таймаут на чтение ответа;
+#   * лимит одновременных запросов к инстансу (max_in_flight): сверх лимита запрос
+#     сразу получает отказ (UpstreamBusy), а не копится в очереди к перегруженному серверу.
+
+# threading — блокировка словаря пулов и семафоры "запросов в полёте".
+import threading
+
+# urllib3 — пулы соединений (используется и внутри requests).
+import urllib3
+
+
+class UpstreamError(Exception):
+    """
+    Инстанс не ответил: ошибка соединения или таймаут.
+    """
+
+
+class UpstreamBusy(UpstreamError):
+    """
+    У инстанса уже max_in_flight запросов в полёте — новый не отправляем.
+    """
+
+
+class _Upstream:
+    """
+    Пул соединений и счётчик запросов в полёте для одного инстанса.
+    """
+
+    def __init__(self, ip, port, pool_size, max_in_flight, timeout):
+        self.pool = urllib3.HTTPConnectionPool(
+            ip, port,
+            maxsize=pool_size,
+            # block=False: если все соединения заняты, открываем временное сверх пула
+            # (лишнее закроется после ответа). Общее число запросов ограничивает семафор.
+            block=False,
+            timeout=timeout,
+            retries=False,
+        )
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        # Счётчики меняются из разных потоков — под своей блокировкой.
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+
+
+class UpstreamPool:
+    """
+    Пулы постоянных соединений ко всем инстансам (создаются при первом обращении).
+    """
+
+    def __init__(self, pool_size=10, max_in_flight=100, connect_timeout=0.5, read_timeout=5.0):
+        self.pool_size = pool_size
+        self.max_in_flight = max_in_flight
+        self.timeout = urllib3.Timeout(connect=connect_timeout, read=read_timeout)
+        self._upstreams = {}
+        self._lock = threading.Lock()
+
+    def _get(self, ip, port):
+        key = (ip, port)
+        upstream = self._upstreams.get(key)
+        if upstream is None:
+            with self._lock:
+                upstream = self._upstreams.get(key)
+                if upstream is None:
+                    upstream = _Upstream(ip, port, self.pool_size, self.max_in_flight, self.timeout)
+                    self._upstreams[key] = upstream
+        return upstream
+
+    def request(self, ip, port, method, path, body=None, headers=None, timeout=None):
+        """
+        Выполняет запрос к инстансу и возвращает ответ urllib3 (тело уже прочитано: .data).
+        timeout — свой таймаут (секунды или urllib3.Timeout) вместо общего.
+        Исключения: UpstreamBusy — лимит запросов в полёте, UpstreamError — сбой или таймаут.
+        """
+        upstream = self._get(ip, port)
+        if not upstream.slots.acquire(blocking=False):
+            with upstream.lock:
+                upstream.rejected += 1
+            raise UpstreamBusy(f"{ip}:{port}")
+        with upstream.lock:
+            upstream.in_flight += 1
+            upstream.requests += 1
+        try:
+            return upstream.pool.urlopen(
+                method, path, body=body, headers=headers,
+                timeout=timeout if timeout is not None else self.timeout,
+                retries=False, redirect=False,
+            )
+        except urllib3.exceptions.HTTPError as error:
+            with upstream.lock:
+                upstream.errors += 1
+            raise UpstreamError(f"{ip}:{port}: {error}") from error
+        finally:
+            with upstream.lock:
+                upstream.in_flight -= 1
+            upstream.slots.release()
+
+    def discard(self, ip, port):
+        """
+        Закрывает соединения инстанса (после удаления его из пула балансировщика).
+        """
+        with self._lock:
+            upstream = self._upstreams.pop((ip, port), None)
+        if upstream is not None:
+            upstream.pool.close()
+
+    def stats(self):
+        return {
+            f"{ip}:{port}": {
+                "in_flight": upstream.in_flight,
+                "requests": upstream.requests,
+                "errors": upstream.errors,
+                "rejected": upstream.rejected,
+                "idle_connections": upstream.pool.pool.qsize() if upstream.pool.pool else 0,
+            }
+            for (ip, port), upstream in list(self._upstreams.items())
+        }
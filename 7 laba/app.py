@@ -1,8 +1,8 @@
-# Подключаем стандартную библиотеку json — она нужна для чтения и записи данных в формате JSON.
-import json
+# Подключаем base64 — курсор постраничной выборки /scan передаётся в URL в base64.
+import base64
 
-# Подключаем библиотеку os — она позволяет работать с файлами и проверять, существуют ли они.
-import os
+# binascii.Error — ошибка разбора base64 (неправильный курсор).
+import binascii
 
 # Импортируем классы Flask, request, jsonify:
 # Flask — основной класс для создания веб-приложения.
@@ -10,53 +10,38 @@ import os
 # jsonify — превращает Python-объекты в правильный JSON-ответ для клиента.
 from flask import Flask, request, jsonify
 
-# Импортируем Limiter — модуль, который ограничивает количество запросов (rate limiting).
-from flask_limiter import Limiter
-
-# Функция get_remote_address — определяет IP-адрес пользователя, чтобы лимитер мог считать запросы по IP.
-from flask_limiter.util import get_remote_address
+# Общее ядро сервиса (настройки, хранилище, операции) — то же, что у async_server.py.
+import kv_service
+from kv_service import data, storage, commit, read_ttl, read_keys
+from kv_service import MAX_BATCH_KEYS, ORDERED_INDEX, SCAN_DEFAULT_LIMIT
+from kv_service import limiter, rate_limited, DEFAULT_LIMIT
 
 # Создаём объект приложения Flask.
 # __name__ — имя текущего файла, Flask использует его для правильной работы.
 app = Flask(__name__)
 
 
-# === Инициализация лимитера (ограничителя запросов) ===
-# Создаём объект Limiter и передаём:
-# key_func — функция, по которой определяется "ключ" лимита (например IP-адрес клиента).
-# app — приложение, к которому подключается ограничитель.
-# default_limits — общее ограничение для всех маршрутов (например, 100 запросов в сутки).
-limiter = Limiter(
-    key_func=get_remote_address,
-    app=app,
-    default_limits=["100 per day"]  # ограничение по умолчанию
-)
-
-
-# Имя файла, в котором будут храниться данные словаря.
-DATA_FILE = "data.json"
-
-
-# === Загрузка данных из файла при старте приложения ===
-# Проверяем, существует ли файл data.json.
-if os.path.exists(DATA_FILE):
-    # Если да — открываем файл на чтение ("r") с кодировкой UTF-8.
-    with open(DATA_FILE, "r", encoding="utf-8") as f:
-        # Загружаем JSON-данные из файла в словарь data.
-        data = json.load(f)
-else:
-    # Если файла нет — создаём пустой словарь.
-    data = {}
+# === Лимитер (ограничитель запросов) ===
+# Настройки и сам лимитер — в kv_service.py (общие с async_server.py).
+# Маршрут с декоратором @limiter.limit(...) получает свой лимит вместо общего DEFAULT_LIMIT.
+# Лимиты считаются отдельно для каждого маршрута и каждого IP-адреса клиента.
 
 
-# === Функция сохранения данных в файл ===
-def save_data():
-    # Открываем файл на запись ("w") с перезаписью содержимого.
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        # json.dump — записывает Python-объект в JSON-файл.
-        # indent=4 — форматирует JSON красиво и с отступами.
-        # ensure_ascii=False — сохраняет русские буквы нормально, не \uXXXX.
-        json.dump(data, f, indent=4, ensure_ascii=False)
+@app.before_request
+def check_rate_limit():
+    # Проверяем лимит до вызова обработчика; None — запрос пропускается дальше.
+    view = app.view_functions.get(request.endpoint)
+    if view is None:
+        return None
+    limit = getattr(view, "rate_limit", DEFAULT_LIMIT)
+    limited = rate_limited(request.endpoint, request.remote_addr or "127.0.0.1", limit)
+    if limited is None:
+        return None
+    body, retry_after = limited
+    response = jsonify(body)
+    response.status_code = 429
+    response.headers["Retry-After"] = str(retry_after)
+    return response
 
 
 # ======================= ROUTES (маршруты API) ======================= #
@@ -67,58 +52,138 @@ def save_data():
 def set_value():
     # Получаем JSON, который прислал клиент.
     # request.get_json() превращает JSON-тело запроса в Python-словарь.
-    req = request.get_json()
-
-    # Проверяем, что пользователь отправил JSON и что там есть ключи "key" и "value".
-    if not req or "key" not in req or "value" not in req:
-        # Возвращаем ошибку 400 (неправильный запрос).
-        return jsonify({"error": "Nuzhno peredat JSON s polyami 'key' i 'value'"}), 400
-
-    # Извлекаем ключ и значение из JSON.
-    key = req["key"]
-    value = req["value"]
-
-    # Сохраняем значение в словарь data.
-    data[key] = value
-
-    # Сохраняем обновлённый словарь в файл.
-    save_data()
-
-    # Возвращаем успешный ответ.
-    return jsonify({"status": "ok", "message": f"Kluch '{key}' sohranen"})
+    body, status = kv_service.set_value(request.get_json())
+    return jsonify(body), status
 
 
 # === Маршрут GET /get/<key> — возвращает значение по ключу ===
 @app.route("/get/<key>", methods=["GET"])
 def get_value(key):
-    # Если ключ есть в словаре — возвращаем его значение.
-    if key in data:
-        return jsonify({"key": key, "value": data[key]})
-    # Если ключа нет — возвращаем ошибку.
-    return jsonify({"error": "Kluch ne nayden"}), 404
+    body, status = kv_service.get_value(key, request.args.get("max_staleness"))
+    return jsonify(body), status
 
 
 # === Маршрут DELETE /delete/<key> — удаляет ключ из хранилища ===
 @app.route("/delete/<key>", methods=["DELETE"])
 @limiter.limit("10 per minute")  # отдельный лимит на удаление
 def delete_value(key):
-    # Проверяем, есть ли такой ключ.
-    if key in data:
-        # Удаляем ключ.
-        del data[key]
-        # Сохраняем обновлённый словарь.
-        save_data()
-        # Возвращаем успешный ответ.
-        return jsonify({"status": "ok", "message": f"Kluch '{key}' udalen"})
-    # Если ключа нет — отправляем ошибку.
-    return jsonify({"error": "Kluch ne nayden"}), 404
+    body, status = kv_service.delete_value(key)
+    return jsonify(body), status
 
 
 # === Маршрут GET /exists/<key> — проверяет существование ключа ===
 @app.route("/exists/<key>", methods=["GET"])
 def exists(key):
-    # Возвращаем True или False в зависимости от того, есть ли ключ в словаре.
-    return jsonify({"exists": key in data})
+    body, status = kv_service.exists(key, request.args.get("max_staleness"))
+    return jsonify(body), status
+
+
+# ======================= BULK-маршруты ======================= #
+# Каждый bulk-запрос — это один вызов для лимитера (одна единица лимита),
+# а не N отдельных, как при цикле по /set или /get.
+
+# === Маршрут POST /mget — возвращает значения сразу нескольких ключей ===
+@app.route("/mget", methods=["POST"])
+def mget():
+    error = kv_service.stale_error(request.args.get("max_staleness"))
+    if error:
+        return jsonify(error[0]), error[1]
+
+    keys = read_keys(request.get_json(silent=True))
+    if keys is None:
+        return jsonify({"error": f"Nuzhno peredat JSON s polem 'keys' (spisok do {MAX_BATCH_KEYS} strok)"}), 400
+
+    # Читаем под блокировками затронутых шардов, чтобы ответ был согласованным срезом данных.
+    values, missing = data.get_many(keys)
+    return jsonify({"values": values, "missing": missing})
+
+
+# === Маршрут POST /mset — сохраняет сразу несколько пар ключ-значение ===
+@app.route("/mset", methods=["POST"])
+@limiter.limit("10 per minute")  # вся пачка считается одним запросом
+def mset():
+    error = kv_service.read_only_error()
+    if error:
+        return jsonify(error[0]), error[1]
+
+    req = request.get_json(silent=True)
+    items = req.get("items") if isinstance(req, dict) else None
+    if not isinstance(items, dict) or not items or len(items) > MAX_BATCH_KEYS:
+        return jsonify({"error": f"Nuzhno peredat JSON s polem 'items' (slovar do {MAX_BATCH_KEYS} klyuchej)"}), 400
+
+    ttl, bad_ttl = read_ttl(req)
+    if bad_ttl:
+        return jsonify({"error": "Pole 'ttl' dolzhno byt polozhitelnym chislom sekund"}), 400
+
+    # Применяем всю пачку атомарно: под блокировками затронутых шардов и одной записью журнала.
+    commit(data.set_many(items, ttl))
+    return jsonify({"status": "ok", "count": len(items)})
+
+
+# === Маршрут POST /mdelete — удаляет сразу несколько ключей ===
+@app.route("/mdelete", methods=["POST"])
+@limiter.limit("10 per minute")  # вся пачка считается одним запросом
+def mdelete():
+    error = kv_service.read_only_error()
+    if error:
+        return jsonify(error[0]), error[1]
+
+    keys = read_keys(request.get_json(silent=True))
+    if keys is None:
+        return jsonify({"error": f"Nuzhno peredat JSON s polem 'keys' (spisok do {MAX_BATCH_KEYS} strok)"}), 400
+
+    # Если удалять нечего — в журнал ничего не пишется и seq будет None.
+    deleted, missing, seq = data.delete_many(keys)
+    if seq is not None:
+        commit(seq)
+    return jsonify({"status": "ok", "deleted": deleted, "missing": missing})
+
+
+# === Маршрут GET /scan — постраничная выборка ключей по префиксу или диапазону ===
+# Параметры: prefix, start (включительно), end (не включительно), limit, cursor.
+# Ответ содержит cursor для следующей страницы (null — страниц больше нет).
+@app.route("/scan", methods=["GET"])
+def scan():
+    if not ORDERED_INDEX:
+        return jsonify({"error": "Uporyadochennyj indeks vyklyuchen (KV_ORDERED_INDEX=0)"}), 400
+    error = kv_service.stale_error(request.args.get("max_staleness"))
+    if error:
+        return jsonify(error[0]), error[1]
+
+    try:
+        limit = int(request.args.get("limit", SCAN_DEFAULT_LIMIT))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= MAX_BATCH_KEYS:
+        return jsonify({"error": f"Parametr 'limit' dolzhen byt ot 1 do {MAX_BATCH_KEYS}"}), 400
+
+    # Курсор — последний ключ предыдущей страницы, закодированный в base64.
+    after = None
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            after = base64.b64decode(cursor.encode("ascii"), altchars=b"-_", validate=True).decode("utf-8")
+        except (binascii.Error, UnicodeError, ValueError):
+            return jsonify({"error": "Nevernyj cursor"}), 400
+
+    items, last = data.scan(
+        prefix=request.args.get("prefix") or None,
+        start=request.args.get("start"),
+        end=request.args.get("end"),
+        after=after,
+        limit=limit,
+    )
+    next_cursor = base64.urlsafe_b64encode(last.encode("utf-8")).decode("ascii") if last is not None else None
+    return jsonify({"items": [{"key": k, "value": v} for k, v in items], "cursor": next_cursor})
+
+
+# === Маршрут GET /stats — счётчики движка хранения ===
+@app.route("/stats", methods=["GET"])
+def stats():
+    # Число ключей, память, вытеснения и истечения, число фиксаций на диск,
+    # размеры пачек и задержка фиксации, заполненность лимитера и состояние репликации.
+    return jsonify({"store": data.stats(), "storage": storage.stats(), "limiter": limiter.stats(),
+                    "replication": kv_service.replication_stats()})
 
 
 # ======================= Запуск приложения ======================= #
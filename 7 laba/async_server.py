@@ -0,0 +1,343 @@
+# Вторая точка входа key-value сервиса: сервер на asyncio без Flask.
+#
+# Обслуживает те же маршруты /set, /get/<key>, /delete/<key>, /exists/<key> и /stats
+# с тем же хранилищем и теми же ответами (операции берутся из kv_service.py),
+# в том числе в роли реплики (KV_ROLE=follower, см. replication.py).
+# Отличия от app.py:
+#   * одно событийное ядро вместо потока на запрос — тысячи соединений не стоят потоков;
+#   * HTTP/1.1 keep-alive и конвейер (pipelining): клиент может отправить несколько
+#     запросов подряд, не дожидаясь ответов; ответы идут в том же порядке;
+#   * необязательный строковый протокол для внутренних клиентов (--line-port):
+#
+#       SET <key> <json>        -> OK
+#       GET <key>               -> VALUE <json> | NOT_FOUND
+#       DEL <key>               -> OK | NOT_FOUND
+#       EXISTS <key>            -> 1 | 0
+#       (ошибка)                -> ERR <сообщение>
+#       (превышен лимит)        -> ERR Slishkom mnogo zaprosov: <лимит>
+#
+#     Одна команда — одна строка, ключ без пробелов; конвейер работает так же.
+#
+# Чтения выполняются прямо в цикле событий (это доли микросекунды под блокировкой шарда),
+# а мутации — в пуле потоков: запись в журнал и ожидание fsync не должны стопорить цикл.
+# Лимиты запросов — те же, что у app.py (kv_service.limiter): по маршруту и IP-адресу клиента,
+# запись (/set, /delete и SET, DEL) — WRITE_LIMIT, остальное — DEFAULT_LIMIT; превышение —
+# 429 с Retry-After. Ошибка внутри операции даёт 500 (или ERR), соединение остаётся открытым,
+# и запросы конвейера за ним получают свои ответы.
+#
+# Запуск:
+#   python async_server.py
+#   python async_server.py --port 5000 --line-port 5001
+
+# argparse — разбор аргументов командной строки.
+import argparse
+
+# asyncio — цикл событий, TCP-сервер и потоки.
+import asyncio
+
+# json — тела запросов и ответов.
+import json
+
+# os — настройки из переменных окружения.
+import os
+
+# traceback — печать неожиданных ошибок операций (ответ клиенту — 500).
+import traceback
+
+# ThreadPoolExecutor — пул потоков для мутаций (журнал и fsync блокируют).
+from concurrent.futures import ThreadPoolExecutor
+
+# unquote — ключ в пути URL приходит в percent-кодировке; parse_qs — параметры запроса.
+from urllib.parse import parse_qs, unquote
+
+# Общее ядро сервиса: настройки KV_*, хранилище и операции (то же, что у app.py).
+import kv_service
+
+
+# Сколько потоков выполняют мутации. В режиме group они же и наполняют общую пачку фиксации.
+WORKERS = int(os.environ.get("KV_ASYNC_WORKERS", "32"))
+
+# Предельный размер заголовков и тела одного HTTP-запроса.
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = int(os.environ.get("KV_MAX_BODY_BYTES", str(16 * 1024 * 1024)))
+
+REASONS = {200: "OK", 400: "BAD REQUEST", 403: "FORBIDDEN", 404: "NOT FOUND",
+           405: "METHOD NOT ALLOWED", 413: "REQUEST ENTITY TOO LARGE", 429: "TOO MANY REQUESTS",
+           500: "INTERNAL SERVER ERROR", 503: "SERVICE UNAVAILABLE"}
+
+# Маршрут -> (HTTP-метод, операция, мутация ли это, лимит запросов).
+# Ключ лимита — имя операции, как имя обработчика (endpoint) в app.py.
+ROUTES = {
+    "get": ("GET", kv_service.get_value, False, kv_service.DEFAULT_LIMIT),
+    "exists": ("GET", kv_service.exists, False, kv_service.DEFAULT_LIMIT),
+    "delete": ("DELETE", kv_service.delete_value, True, kv_service.WRITE_LIMIT),
+}
+
+INTERNAL_ERROR = {"error": "Vnutrennyaya oshibka servera"}
+
+executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="kv-mutation")
+
+
+class BadRequest(Exception):
+    """
+    Запрос нельзя разобрать — отвечаем 400 и закрываем соединение.
+    """
+
+
+class TooManyRequests(Exception):
+    """
+    Превышен лимит запросов — отвечаем 429 с Retry-After, соединение остаётся открытым.
+    """
+
+    def __init__(self, body, retry_after):
+        super().__init__(body["error"])
+        self.body = body
+        self.retry_after = retry_after
+
+
+def check_limit(endpoint, address, limit):
+    limited = kv_service.rate_limited(endpoint, address, limit)
+    if limited is not None:
+        raise TooManyRequests(*limited)
+
+
+def encode_body(body):
+    return json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def http_response(body, status, keep_alive, headers=None):
+    payload = encode_body(body) + b"\n"
+    extra = "".join(f"{name}: {value}\r\n" for name, value in (headers or {}).items())
+    head = (f"HTTP/1.1 {status} {REASONS.get(status, 'UNKNOWN')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"{extra}"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode("ascii") + payload
+
+
+async def run_mutation(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, func, *args)
+
+
+# ======================= HTTP ======================= #
+
+async def read_request(reader):
+    """
+    Читает один HTTP-запрос: (метод, путь, тело, keep-alive) или None, если клиент закрыл соединение.
+    """
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as exc:
+        if not exc.partial.strip():
+            return None
+        raise BadRequest("Nepolnyj zapros")
+    except asyncio.LimitOverrunError:
+        raise BadRequest("Slishkom bolshie zagolovki")
+
+    lines = head.decode("latin-1").split("\r\n")
+    parts = lines[0].split(" ")
+    if len(parts) != 3 or not parts[2].startswith("HTTP/1."):
+        raise BadRequest("Nevernaya stroka zaprosa")
+    method, target, version = parts
+
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, sep, value = line.partition(":")
+            if not sep:
+                raise BadRequest("Nevernyj zagolovok")
+            headers[name.strip().lower()] = value.strip()
+
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        raise BadRequest("Transfer-Encoding: chunked ne podderzhivaetsya")
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError:
+        raise BadRequest("Nevernyj Content-Length")
+    if length < 0 or length > MAX_BODY_BYTES:
+        raise BadRequest("Nevernyj Content-Length")
+    body = await reader.readexactly(length) if length else b""
+
+    # HTTP/1.1 держит соединение по умолчанию, HTTP/1.0 — только по просьбе клиента.
+    connection = headers.get("connection", "").lower()
+    if version == "HTTP/1.0":
+        keep_alive = connection == "keep-alive"
+    else:
+        keep_alive = connection != "close"
+    return method, target, body, keep_alive
+
+
+async def dispatch(method, target, body, address):
+    """
+    Выполняет запрос и возвращает (тело ответа, HTTP-код).
+    Превышение лимита — исключение TooManyRequests.
+    """
+    path, _, query = target.partition("?")
+    if path == "/set":
+        if method != "POST":
+            return {"error": "Metod ne razreshen"}, 405
+        check_limit("set_value", address, kv_service.WRITE_LIMIT)
+        try:
+            req = json.loads(body) if body else None
+        except ValueError:
+            return {"error": "Telo zaprosa ne JSON"}, 400
+        return await run_mutation(kv_service.set_value, req)
+
+    if path == "/stats":
+        if method != "GET":
+            return {"error": "Metod ne razreshen"}, 405
+        check_limit("stats", address, kv_service.DEFAULT_LIMIT)
+        return {"store": kv_service.data.stats(), "storage": kv_service.storage.stats(),
+                "limiter": kv_service.limiter.stats(), "replication": kv_service.replication_stats()}, 200
+
+    # /get/<key>, /exists/<key>, /delete/<key>
+    name, _, key = path.partition("/")[2].partition("/")
+    route = ROUTES.get(name)
+    if route is None or not key or "/" in key:
+        return {"error": "Ne najdeno"}, 404
+    expected, func, mutation, limit = route
+    if method != expected:
+        return {"error": "Metod ne razreshen"}, 405
+    check_limit(func.__name__, address, limit)
+    key = unquote(key)
+    if mutation:
+        return await run_mutation(func, key)
+    # Чтение на реплике: параметр max_staleness сужает допустимое устаревание.
+    max_staleness = parse_qs(query).get("max_staleness", [None])[0] if query else None
+    return func(key, max_staleness)
+
+
+async def handle_http(reader, writer):
+    address = (writer.get_extra_info("peername") or ("127.0.0.1",))[0]
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+            except BadRequest as exc:
+                writer.write(http_response({"error": str(exc)}, 400, False))
+                break
+            if request is None:
+                break
+            method, target, body, keep_alive = request
+
+            headers = None
+            try:
+                result, status = await dispatch(method, target, body, address)
+            except TooManyRequests as exc:
+                result, status, headers = exc.body, 429, {"Retry-After": exc.retry_after}
+            except Exception:
+                # Ошибка одной операции не должна обрывать соединение и конвейер за ней.
+                traceback.print_exc()
+                result, status = INTERNAL_ERROR, 500
+            writer.write(http_response(result, status, keep_alive, headers))
+            if not keep_alive:
+                break
+            # Следующий запрос конвейера читаем сразу, не дожидаясь, пока клиент заберёт ответ;
+            # drain притормаживает только если клиент не успевает читать.
+            await writer.drain()
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+# ======================= Строковый протокол ======================= #
+
+# Команда -> (имя операции для ключа лимита, лимит), как у маршрутов HTTP.
+LINE_LIMITS = {
+    "SET": ("set_value", kv_service.WRITE_LIMIT),
+    "DEL": ("delete_value", kv_service.WRITE_LIMIT),
+    "GET": ("get_value", kv_service.DEFAULT_LIMIT),
+    "EXISTS": ("exists", kv_service.DEFAULT_LIMIT),
+}
+
+
+async def line_command(line, address):
+    command, _, rest = line.partition(" ")
+    command = command.upper()
+    if command in LINE_LIMITS:
+        limited = kv_service.rate_limited(LINE_LIMITS[command][0], address, LINE_LIMITS[command][1])
+        if limited is not None:
+            return b"ERR " + limited[0]["error"].encode("utf-8")
+    if command == "SET":
+        key, _, raw = rest.partition(" ")
+        if not key or not raw:
+            return b"ERR SET <key> <json>"
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            return b"ERR znachenie ne JSON"
+        body, status = await run_mutation(kv_service.set_value, {"key": key, "value": value})
+        return b"OK" if status == 200 else b"ERR " + body["error"].encode("utf-8")
+    if command not in ("GET", "EXISTS", "DEL"):
+        return b"ERR neizvestnaya komanda"
+    if not rest or " " in rest:
+        return b"ERR ozhidaetsya odin kluch"
+    if command != "DEL":
+        error = kv_service.stale_error()
+        if error:
+            return b"ERR " + error[0]["error"].encode("utf-8")
+    if command == "GET":
+        value = kv_service.data.get(rest, kv_service.MISSING)
+        return b"NOT_FOUND" if value is kv_service.MISSING else b"VALUE " + encode_body(value)
+    if command == "EXISTS":
+        return b"1" if rest in kv_service.data else b"0"
+    # DEL
+    body, status = await run_mutation(kv_service.delete_value, rest)
+    if status == 403:
+        return b"ERR " + body["error"].encode("utf-8")
+    return b"OK" if status == 200 else b"NOT_FOUND"
+
+
+async def handle_lines(reader, writer):
+    address = (writer.get_extra_info("peername") or ("127.0.0.1",))[0]
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            line = line.decode("utf-8", errors="replace").strip()
+            if not line:
+                continue
+            try:
+                reply = await line_command(line, address)
+            except Exception:
+                traceback.print_exc()
+                reply = b"ERR vnutrennyaya oshibka servera"
+            writer.write(reply + b"\n")
+            await writer.drain()
+    except (ConnectionError, ValueError):
+        # ValueError — строка длиннее лимита буфера asyncio.
+        pass
+    finally:
+        writer.close()
+
+
+# ======================= Запуск ======================= #
+
+async def serve(host, port, line_port=None):
+    servers = [await asyncio.start_server(handle_http, host, port, limit=MAX_HEADER_BYTES)]
+    print(f"HTTP: http://{host}:{port}")
+    if line_port:
+        servers.append(await asyncio.start_server(handle_lines, host, line_port, limit=MAX_BODY_BYTES))
+        print(f"Strokovyj protokol: {host}:{line_port}")
+    await asyncio.gather(*(server.serve_forever() for server in servers))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="KV-сервис на asyncio (keep-alive, конвейер запросов)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--line-port", type=int, default=0, help="порт строкового протокола (0 — выключен)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.line_port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# Бенчмарк bulk-API: сколько ключей в секунду обрабатывают /mget, /mset, /mdelete
+# по сравнению с циклом из одиночных /get, /set, /delete.
+#
+# Запросы идут через тестовый клиент Flask (без сети), так что разница — это именно
+# стоимость маршрутизации, кодирования JSON и записи в журнал на каждый запрос.
+# Лимитер на время замера отключается.
+#
+# Запуск:
+#   python bench_bulk.py
+#   python bench_bulk.py --keys 5000 --batch 500 --fsync-mode group
+
+# argparse — разбор аргументов командной строки.
+import argparse
+
+# os, shutil, sys, tempfile — временный каталог для данных сервиса.
+import os
+import shutil
+import sys
+import tempfile
+
+# time — замер времени.
+import time
+
+
+def rate(count, started):
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-API против одиночных запросов")
+    parser.add_argument("--keys", type=int, default=2000, help="сколько ключей обработать")
+    parser.add_argument("--batch", type=int, default=200, help="ключей в одном bulk-запросе")
+    parser.add_argument("--fsync-mode", default="always")
+    args = parser.parse_args()
+
+    # Настраиваем сервис до импорта app: данные — во временном каталоге.
+    directory = tempfile.mkdtemp()
+    os.environ["KV_DATA_DIR"] = directory
+    os.environ["KV_FSYNC_MODE"] = args.fsync_mode
+    os.environ["KV_MAX_BATCH_KEYS"] = str(max(args.batch, 1000))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app
+
+    app.limiter.enabled = False
+    client = app.app.test_client()
+    keys = [f"user:{i}" for i in range(args.keys)]
+    chunks = [keys[i:i + args.batch] for i in range(0, len(keys), args.batch)]
+
+    results = []
+
+    started = time.perf_counter()
+    for key in keys:
+        client.post("/set", json={"key": key, "value": key})
+    results.append(("set (по одному)", rate(len(keys), started)))
+
+    started = time.perf_counter()
+    for chunk in chunks:
+        client.post("/mset", json={"items": {key: key for key in chunk}})
+    results.append((f"mset (по {args.batch})", rate(len(keys), started)))
+
+    started = time.perf_counter()
+    for key in keys:
+        client.get(f"/get/{key}")
+    results.append(("get (по одному)", rate(len(keys), started)))
+
+    started = time.perf_counter()
+    for chunk in chunks:
+        client.post("/mget", json={"keys": chunk})
+    results.append((f"mget (по {args.batch})", rate(len(keys), started)))
+
+    started = time.perf_counter()
+    for key in keys:
+        client.delete(f"/delete/{key}")
+    results.append(("delete (по одному)", rate(len(keys), started)))
+
+    # Возвращаем ключи на место, чтобы mdelete было что удалять.
+    for chunk in chunks:
+        client.post("/mset", json={"items": {key: key for key in chunk}})
+    started = time.perf_counter()
+    for chunk in chunks:
+        client.post("/mdelete", json={"keys": chunk})
+    results.append((f"mdelete (по {args.batch})", rate(len(keys), started)))
+
+    app.storage.close()
+    shutil.rmtree(directory, ignore_errors=True)
+    for name, value in results:
+        print(f"{name:<20} {value:12.0f} ключей/с")
+
+
+if __name__ == "__main__":
+    main()
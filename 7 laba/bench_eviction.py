@@ -0,0 +1,108 @@
+# Проверка и бенчмарк TTL и вытеснения в sharded_store.ShardedStore.
+#
+# 1) Ограничение памяти: для каждой политики (lru, lfu, random) пишем в хранилище
+#    в 10 раз больше данных, чем позволяет лимит, с "популярными" ключами (распределение Ципфа).
+#    Проверяем, что оценка занятой памяти не превышает лимит, и печатаем долю попаданий.
+# 2) Сроки жизни: ключ с TTL виден до истечения и не виден сразу после; ключи, к которым
+#    никто не обращается, фоновый уборщик удаляет не позже чем через пару интервалов.
+#
+# Запуск:
+#   python bench_eviction.py
+#   python bench_eviction.py --memory 2000000 --ops 500000
+
+# argparse — разбор аргументов командной строки.
+import argparse
+
+# random — ключи с распределением Ципфа.
+import random
+
+# sys — код выхода.
+import sys
+
+# time — ожидание истечения TTL.
+import time
+
+from sharded_store import EVICTION_POLICIES, ShardedStore, entry_size
+
+
+def zipf_keys(count, universe, seed=1):
+    """
+    count номеров ключей из [0, universe) с распределением Ципфа (s = 1).
+    """
+    rnd = random.Random(seed)
+    weights = [1 / (i + 1) for i in range(universe)]
+    return rnd.choices(range(universe), weights=weights, k=count)
+
+
+def check_memory(policy, memory, ops, universe):
+    store = ShardedStore(16, max_memory=memory, policy=policy)
+    hits = 0
+    peak = 0
+    for i in zipf_keys(ops, universe):
+        key = f"key:{i}"
+        if store.get(key) is not None:
+            hits += 1
+        else:
+            store.set(key, "x" * 100)
+        peak = max(peak, store.stats()["memory_used"]) if i % 64 == 0 else peak
+    stats = store.stats()
+    peak = max(peak, stats["memory_used"])
+    # Допуск — одна запись на шард: вытеснение идёт сразу после вставки.
+    slack = 16 * entry_size("key:0000000", "x" * 100)
+    ok = peak <= stats["memory_limit"] + slack
+    print(f"{policy:<7} лимит {stats['memory_limit']:>10} Б  пик {peak:>10} Б  ключей {stats['keys']:>7}"
+          f"  вытеснено {stats['evictions']:>8}  попаданий {hits / ops:6.1%}  {'OK' if ok else 'FAIL'}")
+    return ok
+
+
+def check_expiry(ttl, interval):
+    store = ShardedStore(16)
+    store.start_sweeper(interval=interval, limit=1000)
+    started = time.time()
+    store.set("visible", 1, ttl=ttl)
+    for i in range(1000):
+        store.set(f"idle:{i}", i, ttl=ttl)
+    store.set("forever", 1)
+
+    ok = True
+    # До истечения ключ виден.
+    if store.get("visible") != 1:
+        ok = False
+        print("FAIL: ключ пропал до истечения TTL")
+
+    time.sleep(max(0.0, started + ttl - time.time()) + 0.01)
+    # Сразу после истечения ключ уже не виден (ленивая проверка при чтении).
+    if store.get("visible") is not None:
+        ok = False
+        print("FAIL: ключ виден после истечения TTL")
+
+    # Ключи без обращений удаляет уборщик — ждём не дольше пары интервалов.
+    deadline = started + ttl + 2 * interval + 0.05
+    while time.time() < deadline and store.stats()["keys_with_ttl"]:
+        time.sleep(interval / 10)
+    left = store.stats()["keys_with_ttl"]
+    swept_after = time.time() - started - ttl
+    store.stop_sweeper()
+    if left or store.get("forever") != 1:
+        ok = False
+    print(f"TTL {ttl} с: уборщик удалил ключи через {swept_after * 1000:.0f} мс после истечения,"
+          f" осталось {left}, expirations={store.stats()['expirations']}  {'OK' if ok else 'FAIL'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TTL и вытеснение в ShardedStore")
+    parser.add_argument("--memory", type=int, default=1_000_000, help="лимит памяти, байт")
+    parser.add_argument("--ops", type=int, default=200_000)
+    parser.add_argument("--universe", type=int, default=50_000, help="сколько разных ключей")
+    parser.add_argument("--ttl", type=float, default=0.3)
+    parser.add_argument("--sweep-interval", type=float, default=0.05)
+    args = parser.parse_args()
+
+    ok = all([check_memory(policy, args.memory, args.ops, args.universe) for policy in EVICTION_POLICIES])
+    ok = check_expiry(args.ttl, args.sweep_interval) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
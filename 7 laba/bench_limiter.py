@@ -0,0 +1,95 @@
+# Микробенчмарк ограничителя запросов: стоимость одной проверки и память на ключ.
+#
+# Сравниваются:
+#   * RateLimiter (rate_limiter.py) — GCRA, TAT в array("d") фиксированного размера;
+#   * библиотека limits с MemoryStorage — то, на чём работал flask_limiter
+#     (если она установлена; иначе эта строка пропускается).
+# Для каждого числа различных клиентов печатаются наносекунды на проверку и
+# прирост памяти (tracemalloc) после того, как все клиенты сделали по запросу.
+# Если клиентов больше --capacity, в замер GCRA входит и вытеснение ключей.
+#
+# Запуск:
+#   python bench_limiter.py
+#   python bench_limiter.py --clients 1000 100000 --requests 500000
+
+# argparse — разбор аргументов командной строки.
+import argparse
+
+# random — порядок обращений клиентов.
+import random
+
+# time — замер времени.
+import time
+
+# tracemalloc — память, занятая состоянием лимитера.
+import tracemalloc
+
+from rate_limiter import RateLimiter, parse_limit
+
+try:
+    from limits import parse as parse_item
+    from limits.storage import MemoryStorage
+    from limits.strategies import FixedWindowRateLimiter
+except ImportError:
+    MemoryStorage = None
+
+
+LIMIT = "100 per day"
+
+
+def make_ours(capacity):
+    limiter = RateLimiter(capacity)
+    limit = parse_limit(LIMIT)
+    return lambda key: limiter.hit(key, limit)
+
+
+def make_limits(capacity):
+    strategy = FixedWindowRateLimiter(MemoryStorage())
+    item = parse_item(LIMIT)
+    return lambda key: strategy.hit(item, key)
+
+
+def measure(make, keys, requests, capacity):
+    # Память: каждый клиент делает по одному запросу.
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    hit = make(capacity)
+    for key in keys:
+        hit(key)
+    memory = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    # Время: случайные клиенты из того же набора (без tracemalloc).
+    hit = make(capacity)
+    for key in keys:
+        hit(key)
+    order = [keys[i] for i in random.Random(1).choices(range(len(keys)), k=requests)]
+    started = time.perf_counter()
+    for key in order:
+        hit(key)
+    elapsed = time.perf_counter() - started
+    return elapsed / requests * 1e9, memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Накладные расходы лимитера на запрос")
+    parser.add_argument("--clients", type=int, nargs="+", default=[100, 10_000, 100_000])
+    parser.add_argument("--requests", type=int, default=300_000)
+    parser.add_argument("--capacity", type=int, default=65536)
+    args = parser.parse_args()
+
+    variants = [("GCRA, array", make_ours)]
+    if MemoryStorage is not None:
+        variants.append(("limits, MemoryStorage", make_limits))
+
+    print(f"лимит {LIMIT!r}, таблица GCRA на {args.capacity} ключей")
+    for clients in args.clients:
+        keys = [f"hit|10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(clients)]
+        for name, make in variants:
+            ns, memory = measure(make, keys, args.requests, args.capacity)
+            print(f"{clients:>8} клиентов | {name:<22} {ns:8.0f} нс/запрос | "
+                  f"память {memory / 1e6:7.2f} МБ ({memory / clients:6.0f} Б/клиент)")
+
+
+if __name__ == "__main__":
+    main()
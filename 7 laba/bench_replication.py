@@ -0,0 +1,249 @@
+# Репликация ведущий/реплика на нескольких локальных процессах (async_server.py).
+#
+# Режим --check — проверка (код выхода 0 — всё в порядке, 1 — расхождение):
+#   1) ведущий + реплика: запись через ReplicatedClient, реплика догоняет ведущего;
+#   2) реплику останавливают, на ведущем пишут и удаляют ключи, реплику запускают
+#      снова с тем же каталогом — она догоняет по журналу, без полного снимка;
+#   3) реплику останавливают, на ведущем пишут больше, чем помещается в буфер
+#      репликации (KV_REPL_BACKLOG), — после запуска реплика получает полный снимок;
+#   4) реплика отклоняет запись (403), а без ведущего дольше max_staleness
+#      отвечает на чтение 503.
+#
+# Без --check — бенчмарк: сколько чтений в секунду выдерживают 1, 2 и 4 реплики
+# (и один ведущий для сравнения). Чтения распределяются по репликам поровну.
+# На машине с одним ядром процессы делят его, и роста не будет — смотрите nproc.
+#
+# Запуск:
+#   python bench_replication.py --check
+#   python bench_replication.py --followers 1 2 4 --duration 5
+
+# argparse — разбор аргументов командной строки.
+import argparse
+
+# asyncio — заполнение ведущего через bench_server.fill.
+import asyncio
+
+# json — ответы /stats.
+import json
+
+# multiprocessing — несколько процессов-генераторов нагрузки.
+import multiprocessing
+
+# os, shutil, sys, tempfile — каталоги данных узлов.
+import os
+import shutil
+import sys
+import tempfile
+
+# time — ожидание, пока реплика догонит ведущего.
+import time
+
+# urlopen — опрос /stats.
+from urllib.request import urlopen
+
+from bench_server import HOST, fill, free_port, load_worker, percentile, start_server
+from replication import ReplicatedClient
+
+
+class Node:
+    """
+    Процесс async_server.py: ведущий (repl_port) или реплика (leader — порт репликации ведущего).
+    """
+
+    def __init__(self, directory, repl_port=None, leader=None, backlog=None):
+        self.directory = directory
+        self.port = free_port()
+        self.env = {"KV_MAX_STALENESS": "1.0"}
+        if leader is not None:
+            self.env.update(KV_ROLE="follower", KV_LEADER=f"{HOST}:{leader}")
+        else:
+            self.env["KV_REPL_PORT"] = str(repl_port)
+        if backlog is not None:
+            self.env["KV_REPL_BACKLOG"] = str(backlog)
+        self.process = None
+
+    @property
+    def url(self):
+        return f"http://{HOST}:{self.port}"
+
+    def start(self):
+        self.process = start_server("async", self.port, self.directory, "interval", self.env)
+        return self
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+
+    def stats(self):
+        with urlopen(self.url + "/stats", timeout=5) as response:
+            return json.loads(response.read())
+
+
+def wait_caught_up(leader, follower, timeout=30):
+    seq = leader.stats()["storage"]["seq"]
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        replication = follower.stats()["replication"]
+        # staleness появляется после первого PING — до него реплика чтения не обслуживает.
+        if replication["applied_seq"] >= seq and replication["staleness"] is not None:
+            return replication
+        time.sleep(0.05)
+    raise RuntimeError(f"Replika ne dognala vedushchego: {follower.stats()['replication']}")
+
+
+def same_data(follower, expected):
+    reader = ReplicatedClient(follower.url)
+    for key, value in expected.items():
+        status, body = reader.get(key)
+        if value is None:
+            if status != 404:
+                return f"{key}: ozhidalos 404, poluchen {status} {body}"
+        elif status != 200 or body["value"] != value:
+            return f"{key}: ozhidalos {value!r}, poluchen {status} {body}"
+    return None
+
+
+# ======================= Проверка ======================= #
+
+def check():
+    root = tempfile.mkdtemp()
+    repl_port = free_port()
+    leader = Node(os.path.join(root, "leader"), repl_port=repl_port, backlog=200)
+    follower = Node(os.path.join(root, "follower"), leader=repl_port)
+    failures = []
+    try:
+        leader.start()
+        follower.start()
+        client = ReplicatedClient(leader.url, [follower.url], max_staleness=1.0)
+        expected = {}
+
+        # 1) Запись через клиент, реплика догоняет.
+        for i in range(150):
+            client.set(f"user:{i}", {"n": i})
+            expected[f"user:{i}"] = {"n": i}
+        wait_caught_up(leader, follower)
+        problem = same_data(follower, expected)
+        print(f"1) реплика догнала ведущего: {'OK' if problem is None else problem}")
+        if problem:
+            failures.append(problem)
+
+        # 2) Перезапуск реплики: догоняет по журналу.
+        follower.stop()
+        for i in range(150, 250):
+            client.set(f"user:{i}", [i])
+            expected[f"user:{i}"] = [i]
+        for i in range(0, 50):
+            client.delete(f"user:{i}")
+            expected[f"user:{i}"] = None
+        follower.start()
+        replication = wait_caught_up(leader, follower)
+        problem = same_data(follower, expected)
+        if problem is None and replication["full_syncs"]:
+            problem = "ozhidalos dogonyat po zhurnalu, a byl polnyj snimok"
+        print(f"2) перезапуск реплики, догон по журналу: {'OK' if problem is None else problem}")
+        if problem:
+            failures.append(problem)
+
+        # 3) Реплика отстала больше буфера: полный снимок.
+        follower.stop()
+        for i in range(250, 700):
+            client.set(f"user:{i}", f"v{i}")
+            expected[f"user:{i}"] = f"v{i}"
+        follower.start()
+        replication = wait_caught_up(leader, follower)
+        problem = same_data(follower, expected)
+        if problem is None and replication["full_syncs"] != 1:
+            problem = f"ozhidalsya odin polnyj snimok, bylo {replication['full_syncs']}"
+        print(f"3) отставание больше буфера, полный снимок: {'OK' if problem is None else problem}")
+        if problem:
+            failures.append(problem)
+
+        # ...и после полного снимка перезапуск снова догоняет по журналу.
+        follower.stop()
+        client.set("after:full", 1)
+        expected["after:full"] = 1
+        follower.start()
+        wait_caught_up(leader, follower)
+        problem = same_data(follower, expected)
+        print(f"   перезапуск после полного снимка: {'OK' if problem is None else problem}")
+        if problem:
+            failures.append(problem)
+
+        # 4) Только чтение и ограничение устаревания.
+        writer = ReplicatedClient(follower.url)
+        status, _ = writer.set("x", 1)
+        leader.stop()
+        time.sleep(1.5)
+        stale, _ = ReplicatedClient(follower.url).get("user:300")
+        fresh, _ = ReplicatedClient(follower.url, max_staleness=60).get("user:300")
+        problem = None
+        if (status, stale, fresh) != (403, 503, 200):
+            problem = f"zapis {status} (nuzhno 403), chtenie {stale} (503), s max_staleness=60 {fresh} (200)"
+        print(f"4) реплика: запись 403, устаревшее чтение 503: {'OK' if problem is None else problem}")
+        if problem:
+            failures.append(problem)
+    finally:
+        follower.stop()
+        leader.stop()
+        shutil.rmtree(root, ignore_errors=True)
+    return not failures
+
+
+# ======================= Бенчмарк ======================= #
+
+def bench(followers, args):
+    root = tempfile.mkdtemp()
+    repl_port = free_port()
+    leader = Node(os.path.join(root, "leader"), repl_port=repl_port)
+    replicas = [Node(os.path.join(root, f"follower{i}"), leader=repl_port) for i in range(followers)]
+    try:
+        leader.start()
+        for replica in replicas:
+            replica.start()
+        keys = [f"user:{i}" for i in range(args.keys)]
+        asyncio.run(fill("async", leader.port, keys))
+        for replica in replicas:
+            wait_caught_up(leader, replica)
+
+        # Соединения делятся поровну между репликами (без реплик — все к ведущему).
+        ports = [replica.port for replica in replicas] or [leader.port]
+        per_task = max(1, args.connections // (args.procs * len(ports)))
+        tasks = [("async", port, per_task, 1, args.duration, keys, 0.0, seed * 100 + i)
+                 for seed in range(args.procs) for i, port in enumerate(ports)]
+        started = time.perf_counter()
+        with multiprocessing.Pool(len(tasks)) as pool:
+            results = pool.map(load_worker, tasks)
+        elapsed = time.perf_counter() - started
+        latencies = sorted(x for part, _ in results for x in part)
+        return len(latencies) / elapsed, percentile(latencies, 0.5), percentile(latencies, 0.99)
+    finally:
+        for replica in replicas:
+            replica.stop()
+        leader.stop()
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Репликация: проверка догона и чтения с реплик")
+    parser.add_argument("--check", action="store_true", help="проверка догона после перезапуска")
+    parser.add_argument("--followers", type=int, nargs="+", default=[0, 1, 2, 4])
+    parser.add_argument("--connections", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--keys", type=int, default=1000)
+    parser.add_argument("--procs", type=int, default=2, help="процессов-генераторов нагрузки")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if check() else 1)
+
+    print(f"чтение (get/exists), {args.connections} соединений, {args.duration:.0f} с, ядер: {os.cpu_count()}")
+    for followers in args.followers:
+        rps, p50, p99 = bench(followers, args)
+        name = "только ведущий" if followers == 0 else f"{followers} реплик(и)"
+        print(f"{name:<16} {rps:10.0f} зап/с | p50 {p50 * 1000:7.2f} мс | p99 {p99 * 1000:7.2f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# Бенчмарк выборок по префиксу и диапазону (ShardedStore.scan) на 1M ключей.
+#
+# Ключи вида user:<id>:item:<n>. Сравниваются:
+#   * scan по упорядоченному индексу — страница из --limit ключей;
+#   * "наивный" способ без индекса — пройти весь словарь, отфильтровать и отсортировать.
+# Также печатаются время построения индекса и стоимость вставки/удаления с индексом.
+#
+# Запуск:
+#   python bench_scan.py
+#   python bench_scan.py --keys 200000 --limit 50
+
+# argparse — разбор аргументов командной строки.
+import argparse
+
+# random — случайные префиксы.
+import random
+
+# time — замер времени.
+import time
+
+from sharded_store import ShardedStore
+
+
+def make_data(keys, items_per_user):
+    return {f"user:{u:07d}:item:{i:04d}": i
+            for u in range(keys // items_per_user)
+            for i in range(items_per_user)}
+
+
+def timed(func, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - started) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк /scan на упорядоченном индексе")
+    parser.add_argument("--keys", type=int, default=1_000_000)
+    parser.add_argument("--items-per-user", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    data = make_data(args.keys, args.items_per_user)
+    users = args.keys // args.items_per_user
+    rnd = random.Random(1)
+
+    started = time.perf_counter()
+    store = ShardedStore(16, ordered=True)
+    store.load(data)
+    print(f"загрузка {len(data)} ключей с построением индекса: {time.perf_counter() - started:.2f} с")
+
+    prefixes = [f"user:{rnd.randrange(users):07d}:" for _ in range(args.repeat)]
+    it = iter(prefixes * 2)
+
+    scan_time, (items, _) = timed(lambda: store.scan(prefix=next(it), limit=args.limit), args.repeat)
+    print(f"scan по префиксу (страница {args.limit}):       {scan_time * 1e6:10.1f} мкс, найдено {len(items)}")
+
+    # Обход всех страниц одного большого диапазона.
+    low = f"user:{users // 2:07d}:"
+    high = f"user:{users // 2 + 20:07d}:"
+    started = time.perf_counter()
+    after, pages, total = None, 0, 0
+    while True:
+        items, after = store.scan(start=low, end=high, after=after, limit=args.limit)
+        pages += 1
+        total += len(items)
+        if after is None:
+            break
+    elapsed = time.perf_counter() - started
+    print(f"диапазон из {total} ключей, {pages} страниц:      {elapsed / pages * 1e6:10.1f} мкс на страницу")
+
+    naive_repeat = max(1, args.repeat // 100)
+    it = iter(prefixes)
+
+    def naive():
+        prefix = next(it)
+        return sorted(k for k in data if k.startswith(prefix))[:args.limit]
+
+    naive_time, found = timed(naive, naive_repeat)
+    print(f"без индекса (полный проход + сортировка):   {naive_time * 1e6:10.1f} мкс, найдено {len(found)}")
+    print(f"ускорение: {naive_time / scan_time:.0f}x")
+
+    # Цена поддержки индекса на запись: новые ключи и их удаление.
+    plain = ShardedStore(16)
+    plain.load(data)
+    new_keys = [f"user:{rnd.randrange(users):07d}:item:new{i}" for i in range(20_000)]
+    for name, target in (("без индекса", plain), ("с индексом", store)):
+        started = time.perf_counter()
+        for key in new_keys:
+            target.set(key, 1)
+        for key in new_keys:
+            target.delete(key)
+        elapsed = time.perf_counter() - started
+        print(f"set+delete нового ключа {name:<12}      {elapsed / len(new_keys) * 1e6:10.1f} мкс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+# Генератор нагрузки: p50/p99 задержки и запросов в секунду для разных режимов сервиса.
+#
+# Режимы (каждый — отдельный процесс сервера со своим временным каталогом данных;
+# лимитер запросов во всех режимах отключён):
+#   flask     app.py на встроенном многопоточном сервере Flask;
+#   async     async_server.py, HTTP keep-alive, один запрос в полёте на соединение;
+#   pipeline  async_server.py, HTTP с конвейером: --depth запросов в полёте на соединение;
+#   line      async_server.py, строковый протокол с тем же конвейером.
+#
+# Нагрузка: сначала в сервер записываются --keys ключей, затем --duration секунд
+# идёт смесь запросов: доля --write-ratio — set, остальное поровну get и exists.
+# Клиенты работают в --procs процессах, чтобы сам генератор не стал узким местом.
+#
+# Запуск:
+#   python bench_server.py
+#   python bench_server.py --modes flask async --connections 100 --duration 10
+#   python bench_server.py --fsync-mode group --write-ratio 0.5
+
+# argparse — разбор аргументов командной строки.
+import argparse
+
+# asyncio — клиенты-соединения.
+import asyncio
+
+# json — тела запросов.
+import json
+
+# multiprocessing — несколько процессов-генераторов.
+import multiprocessing
+
+# os, shutil, socket, subprocess, sys, tempfile — запуск сервера на свободном порту.
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+
+# random — выбор ключей и операций.
+import random
+
+# time — замер времени.
+import time
+
+
+HOST = "127.0.0.1"
+MODES = ("flask", "async", "pipeline", "line")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+# ======================= Сервер в дочернем процессе ======================= #
+
+def serve(mode, port):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    if mode == "flask":
+        import app
+
+        app.limiter.enabled = False
+        app.app.run(host=HOST, port=port, threaded=True)
+    else:
+        import async_server
+
+        async_server.kv_service.limiter.enabled = False
+        asyncio.run(async_server.serve(HOST, port, port + 1 if mode == "line" else None))
+
+
+def start_server(mode, port, directory, fsync_mode, extra_env=None):
+    env = dict(os.environ, KV_DATA_DIR=directory, KV_FSYNC_MODE=fsync_mode, **(extra_env or {}))
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve", mode, str(port)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    # Строковый протокол поднимается вторым — ждём его порт.
+    wait_port = port + 1 if mode == "line" else port
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((HOST, wait_port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError(f"Сервер {mode} не запустился")
+
+
+# ======================= Клиенты ======================= #
+
+def http_request(op, key):
+    if op == "set":
+        body = json.dumps({"key": key, "value": {"id": key, "n": 1}}).encode("utf-8")
+        return (f"POST /set HTTP/1.1\r\nHost: {HOST}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n").encode("ascii") + body
+    return f"GET /{op}/{key} HTTP/1.1\r\nHost: {HOST}\r\n\r\n".encode("ascii")
+
+
+def line_request(op, key):
+    if op == "set":
+        return f'SET {key} {{"id":"{key}","n":1}}\n'.encode("ascii")
+    return f"{op.upper()} {key}\n".encode("ascii")
+
+
+async def read_http_response(reader):
+    """
+    Читает один ответ; возвращает (код, держит ли сервер соединение).
+    """
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ")[1])
+    length, keep_alive = 0, True
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        name = name.strip().lower()
+        if name == "content-length":
+            length = int(value)
+        elif name == "connection":
+            keep_alive = value.strip().lower() != "close"
+    if lines[0].startswith("HTTP/1.0"):
+        keep_alive = False
+    await reader.readexactly(length)
+    return status, keep_alive
+
+
+async def read_line_response(reader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Сервер закрыл соединение")
+    return (500 if line.startswith(b"ERR") else 200), True
+
+
+async def connection(mode, port, depth, deadline, keys, write_ratio, rnd, latencies, errors):
+    """
+    Одно соединение держит depth запросов в полёте, пока не выйдет время.
+    """
+    encode = line_request if mode == "line" else http_request
+    read_response = read_line_response if mode == "line" else read_http_response
+    target_port = port + 1 if mode == "line" else port
+
+    def next_request():
+        key = keys[rnd.randrange(len(keys))]
+        r = rnd.random()
+        op = "set" if r < write_ratio else ("get" if r < (1 + write_ratio) / 2 else "exists")
+        return encode(op, key)
+
+    while time.perf_counter() < deadline:
+        reader, writer = await asyncio.open_connection(HOST, target_port)
+        sent = []
+        try:
+            for _ in range(depth):
+                writer.write(next_request())
+                sent.append(time.perf_counter())
+            keep_alive = True
+            while sent and keep_alive:
+                status, keep_alive = await read_response(reader)
+                now = time.perf_counter()
+                latencies.append(now - sent.pop(0))
+                if status >= 500:
+                    errors[0] += 1
+                if keep_alive and now < deadline:
+                    writer.write(next_request())
+                    sent.append(time.perf_counter())
+            # Сервер закрыл соединение — запросы, оставшиеся в полёте, считаем ошибками.
+            errors[0] += len(sent)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            errors[0] += len(sent)
+        finally:
+            writer.close()
+
+
+async def load(mode, port, connections, depth, duration, keys, write_ratio, seed):
+    latencies, errors = [], [0]
+    deadline = time.perf_counter() + duration
+    rnd = random.Random(seed)
+    await asyncio.gather(*(
+        connection(mode, port, depth, deadline, keys, write_ratio, random.Random(rnd.random()),
+                   latencies, errors)
+        for _ in range(connections)
+    ))
+    return latencies, errors[0]
+
+
+def load_worker(task):
+    return asyncio.run(load(*task))
+
+
+async def fill(mode, port, keys):
+    """
+    Записывает все ключи перед замером — по одному запросу, в одном соединении.
+    """
+    encode = line_request if mode == "line" else http_request
+    read_response = read_line_response if mode == "line" else read_http_response
+    target_port = port + 1 if mode == "line" else port
+    reader, writer = await asyncio.open_connection(HOST, target_port)
+    for key in keys:
+        writer.write(encode("set", key))
+        _, keep_alive = await read_response(reader)
+        if not keep_alive:
+            writer.close()
+            reader, writer = await asyncio.open_connection(HOST, target_port)
+    writer.close()
+
+
+# ======================= Отчёт ======================= #
+
+def percentile(ordered, q):
+    if not ordered:
+        return float("nan")
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run_mode(mode, args):
+    directory = tempfile.mkdtemp()
+    port = free_port()
+    if mode == "line":
+        # Строковый протокол слушает соседний порт.
+        while True:
+            try:
+                with socket.socket() as s:
+                    s.bind((HOST, port + 1))
+                break
+            except OSError:
+                port = free_port()
+    process = start_server(mode, port, directory, args.fsync_mode)
+    try:
+        keys = [f"user:{i}" for i in range(args.keys)]
+        asyncio.run(fill(mode, port, keys))
+
+        depth = args.depth if mode in ("pipeline", "line") else 1
+        per_proc = max(1, args.connections // args.procs)
+        tasks = [(mode, port, per_proc, depth, args.duration, keys, args.write_ratio, seed)
+                 for seed in range(args.procs)]
+        started = time.perf_counter()
+        with multiprocessing.Pool(args.procs) as pool:
+            results = pool.map(load_worker, tasks)
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(x for part, _ in results for x in part)
+        errors = sum(e for _, e in results)
+        return len(latencies) / elapsed, percentile(latencies, 0.5), percentile(latencies, 0.99), errors
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="p50/p99 и RPS: Flask против asyncio-сервера")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--connections", type=int, default=64, help="соединений всего")
+    parser.add_argument("--depth", type=int, default=16, help="запросов в полёте (pipeline, line)")
+    parser.add_argument("--duration", type=float, default=5.0, help="секунд на режим")
+    parser.add_argument("--keys", type=int, default=1000)
+    parser.add_argument("--write-ratio", type=float, default=0.1)
+    parser.add_argument("--procs", type=int, default=2, help="процессов-генераторов нагрузки")
+    parser.add_argument("--fsync-mode", default="interval")
+    parser.add_argument("--serve", nargs=2, metavar=("MODE", "PORT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve[0], int(args.serve[1]))
+        return
+
+    print(f"{args.connections} соединений, {args.duration:.0f} с, запись {args.write_ratio:.0%}, "
+          f"fsync={args.fsync_mode}")
+    for mode in args.modes:
+        rps, p50, p99, errors = run_mode(mode, args)
+        print(f"{mode:<9} {rps:10.0f} зап/с | p50 {p50 * 1000:8.2f} мс | p99 {p99 * 1000:8.2f} мс"
+              f" | ошибок {errors}")
+
+
+if __name__ == "__main__":
+    main()
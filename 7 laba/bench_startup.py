@@ -0,0 +1,114 @@
+# Бенчмарк хранения на диске: размер файла, время старта и пиковая память (RSS)
+# для старого data.json (json.load всего файла) и двоичного снимка (mmap + ленивые значения).
+#
+# Каждый замер старта идёт в отдельном процессе: загрузка данных + первый ответ на get.
+# Файлы к этому моменту уже в кэше ОС, так что это "тёплый" старт без чтения с диска.
+#
+# Запуск:
+#   python bench_startup.py
+#   python bench_startup.py --sizes 100000 1000000
+
+# argparse — разбор аргументов командной строки.
+import argparse
+
+# json — старый формат.
+import json
+
+# os, shutil, subprocess, sys, tempfile — дочерние процессы и временный каталог.
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+# time — замер времени.
+import time
+
+from binary_snapshot import write_dict_snapshot
+from sharded_store import ShardedStore
+from storage import LogStorage
+
+
+def make_data(n):
+    return {f"user:{i:08d}": {"name": f"user {i}", "age": i % 90, "tags": ["a", "b"]} for i in range(n)}
+
+
+def peak_rss_mb():
+    # В Linux VmHWM из /proc — пик RSS именно этого процесса (ru_maxrss после fork+exec
+    # может достаться от родителя, а в родителе лежат сгенерированные данные).
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return float("nan")
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(mode, path, key):
+    """
+    Выполняется в дочернем процессе: загружает данные и отвечает на один get.
+    """
+    started = time.perf_counter()
+    if mode == "json":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        value = data.get(key)
+    else:
+        store = ShardedStore(16, ordered=True)
+        store.load_from(LogStorage(path))
+        value = store.get(key)
+    elapsed = time.perf_counter() - started
+    assert value is not None
+    print(f"{elapsed} {peak_rss_mb()}")
+
+
+def run_child(mode, path, key):
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), "--child", mode, path, key],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    elapsed, rss = output.split()
+    return float(elapsed), float(rss)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Размер файла, время старта и RSS")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--child", nargs=3, metavar=("MODE", "PATH", "KEY"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    for n in args.sizes:
+        directory = tempfile.mkdtemp()
+        try:
+            data = make_data(n)
+            json_path = os.path.join(directory, "data.json")
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=4, ensure_ascii=False)
+            data_dir = os.path.join(directory, "kvdata")
+            os.makedirs(data_dir)
+            write_dict_snapshot(LogStorage(data_dir).snapshot_file(0), 0, data, {})
+            kvb_size = sum(os.path.getsize(os.path.join(data_dir, name)) for name in os.listdir(data_dir))
+            key = f"user:{n // 2:08d}"
+            del data
+
+            json_time, json_rss = run_child("json", json_path, key)
+            kvb_time, kvb_rss = run_child("binary", data_dir, key)
+            print(f"{n:>9} ключей | файл: json {os.path.getsize(json_path) / 1e6:8.1f} МБ, "
+                  f"kvb {kvb_size / 1e6:8.1f} МБ | старт: json {json_time * 1000:8.1f} мс, "
+                  f"kvb {kvb_time * 1000:8.1f} мс | RSS: json {json_rss:7.1f} МБ, kvb {kvb_rss:7.1f} МБ")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# Бенчмарк задержки записи: старый путь (полная перезапись data.json с indent=4)
+# против журнала мутаций из storage.py. С флагом --threads дополнительно
+# меряет пропускную способность при одновременной записи из нескольких потоков
+# (здесь видно, как режим group собирает мутации в пачки).
+#
+# Запуск:
+#   python bench_storage.py                      # 10k, 100k и 1M ключей
+#   python bench_storage.py --sizes 10000 --writes 200
+#   python bench_storage.py --sizes 10000 --threads 64
+
+# argparse — разбор аргументов командной строки.
+import argparse
+
+# json — для старого пути сохранения.
+import json
+
+# os, tempfile — временный каталог для файлов бенчмарка.
+import os
+import tempfile
+
+# statistics — медиана задержек.
+import statistics
+
+# threading — одновременная запись из нескольких потоков.
+import threading
+
+# time — замер времени.
+import time
+
+from sharded_store import ShardedStore
+from storage import FSYNC_MODES, LogStorage
+
+
+def make_data(n):
+    """
+    Создаёт словарь из n ключей со строковыми значениями.
+    """
+    return {f"key:{i}": f"value-{i}" for i in range(n)}
+
+
+def bench_full_rewrite(directory, data, writes):
+    """
+    Старый путь: каждая запись перезаписывает весь файл (как save_data() до журнала).
+    """
+    path = os.path.join(directory, "data.json")
+    latencies = []
+    for i in range(writes):
+        start = time.perf_counter()
+        data[f"new:{i}"] = i
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4, ensure_ascii=False)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench_log(directory, data, writes, fsync_mode):
+    """
+    Новый путь: каждая запись — одна строка в журнале.
+    Снимок существующих данных делается заранее и в замер не входит.
+    """
+    storage = LogStorage(os.path.join(directory, fsync_mode), fsync_mode=fsync_mode,
+                         snapshot_every=10 ** 12)
+    storage.load()
+    store = ShardedStore(journal=storage)
+    store.load(data)
+    storage.snapshot(store, wait=True)
+
+    latencies = []
+    for i in range(writes):
+        start = time.perf_counter()
+        storage.wait(store.set(f"new:{i}", i))
+        latencies.append(time.perf_counter() - start)
+    storage.close()
+    return latencies
+
+
+def bench_burst(directory, fsync_mode, threads, writes_per_thread):
+    """
+    Одновременная запись из threads потоков: возвращает (записей в секунду, счётчики фиксаций).
+    """
+    storage = LogStorage(os.path.join(directory, f"burst-{fsync_mode}"), fsync_mode=fsync_mode,
+                         snapshot_every=10 ** 12)
+    storage.load()
+
+    def worker(t):
+        for i in range(writes_per_thread):
+            storage.wait(storage.append("set", f"t{t}:{i}", i))
+
+    workers = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    storage.close()
+    return threads * writes_per_thread / elapsed, storage.stats()
+
+
+def report(name, n, latencies):
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{name:<22} {n:>9} ключей  медиана {statistics.median(latencies) * 1000:10.3f} мс"
+          f"  p99 {p99 * 1000:10.3f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Задержка записи: data.json vs журнал")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--writes", type=int, default=100,
+                        help="сколько записей замерять для журнала")
+    parser.add_argument("--rewrite-writes", type=int, default=5,
+                        help="сколько записей замерять для полной перезаписи (она медленная)")
+    parser.add_argument("--fsync-modes", nargs="+", default=list(FSYNC_MODES),
+                        choices=FSYNC_MODES)
+    parser.add_argument("--threads", type=int, default=0,
+                        help="если > 0 — ещё и запись из стольких потоков одновременно")
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            report("full rewrite", n, bench_full_rewrite(directory, make_data(n), args.rewrite_writes))
+            for mode in args.fsync_modes:
+                report(f"log, fsync={mode}", n, bench_log(directory, make_data(n), args.writes, mode))
+        print()
+
+    if args.threads:
+        with tempfile.TemporaryDirectory() as directory:
+            for mode in args.fsync_modes:
+                rate, stats = bench_burst(directory, mode, args.threads, args.writes)
+                print(f"burst, fsync={mode:<9} {args.threads} потоков  {rate:10.0f} записей/с"
+                      f"  фиксаций {stats['commits']:6}  средняя пачка {stats['avg_batch']:6.1f}"
+                      f"  задержка фиксации {stats['avg_commit_latency_ms']:.3f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+# Стресс-тест и бенчмарк хранилища sharded_store.ShardedStore.
+#
+# Стресс-тест (--stress): несколько потоков одновременно пишут, удаляют и читают ключи,
+# а ещё один поток всё это время делает снимки. Проверяется, что:
+#   * ни один поток не упал (например, с "dictionary changed size during iteration");
+#   * каждый снимок согласован: пары ключей, которые всегда меняются вместе (set_many /
+#     delete_many), в снимке либо обе отсутствуют, либо имеют одинаковое значение;
+#   * после всех операций журнал + снимок на диске восстанавливаются ровно в то же состояние.
+#
+# Бенчмарк (по умолчанию): пропускная способность смеси чтений и записей на 1–16 потоках
+# для одного шарда (одна общая блокировка) и для N шардов.
+#
+# Запуск:
+#   python bench_store.py
+#   python bench_store.py --stress --seconds 5
+
+# argparse — разбор аргументов командной строки.
+import argparse
+
+# random — случайные ключи и операции.
+import random
+
+# shutil, sys, tempfile — код выхода и временный каталог для журнала.
+import shutil
+import sys
+import tempfile
+
+# threading, time — потоки и замер времени.
+import threading
+import time
+
+from sharded_store import ShardedStore
+from storage import FSYNC_BATCH, LogStorage
+
+
+def run_threads(threads, target):
+    """
+    Запускает target(номер потока) в threads потоках и собирает исключения.
+    """
+    errors = []
+
+    def wrapper(t):
+        try:
+            target(t)
+        except Exception as error:  # в стресс-тесте важна любая ошибка
+            errors.append(error)
+
+    workers = [threading.Thread(target=wrapper, args=(t,)) for t in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return errors
+
+
+def stress(threads, seconds, pairs):
+    directory = tempfile.mkdtemp()
+    storage = LogStorage(directory, fsync_mode=FSYNC_BATCH, snapshot_every=500)
+    store = ShardedStore(journal=storage)
+    store.load_from(storage)
+
+    stop = time.monotonic() + seconds
+    torn = []
+    snapshots = [0]
+
+    def writer(t):
+        rnd = random.Random(t)
+        counter = 0
+        while time.monotonic() < stop:
+            j = rnd.randrange(pairs)
+            action = rnd.random()
+            if action < 0.5:
+                counter += 1
+                value = f"{t}:{counter}"
+                store.set_many({f"a:{j}": value, f"b:{j}": value})
+            elif action < 0.7:
+                store.delete_many([f"a:{j}", f"b:{j}"])
+            elif action < 0.85:
+                store.set(f"single:{rnd.randrange(pairs)}", counter)
+            else:
+                store.delete(f"single:{rnd.randrange(pairs)}")
+            storage.maybe_snapshot(store)
+
+    def reader(t):
+        rnd = random.Random(1000 + t)
+        while time.monotonic() < stop:
+            j = rnd.randrange(pairs)
+            values, missing = store.get_many([f"a:{j}", f"b:{j}"])
+            if len(missing) == 1 or len(set(values.values())) > 1:
+                torn.append(("get_many", j, values))
+            store.get(f"single:{j}")
+
+    def snapshotter(_):
+        while time.monotonic() < stop:
+            snapshot = store.snapshot().to_dict()
+            snapshots[0] += 1
+            for j in range(pairs):
+                if snapshot.get(f"a:{j}") != snapshot.get(f"b:{j}"):
+                    torn.append(("snapshot", j))
+
+    def worker(t):
+        if t == 0:
+            snapshotter(t)
+        elif t % 3 == 0:
+            reader(t)
+        else:
+            writer(t)
+
+    errors = run_threads(threads + 1, worker)
+    expected = store.snapshot().to_dict()
+    storage.close()
+
+    restored_store = ShardedStore()
+    restored_store.load_from(LogStorage(directory))
+    restored = restored_store.snapshot().to_dict()
+    if restored_store.base is not None:
+        restored_store.base.close()
+    shutil.rmtree(directory, ignore_errors=True)
+    ok = not errors and not torn and restored == expected
+    print(f"потоков: {threads}, снимков: {snapshots[0]}, ключей в конце: {len(expected)}, "
+          f"записей журнала: {storage.seq}")
+    print(f"ошибок в потоках: {len(errors)}, несогласованных чтений/снимков: {len(torn)}, "
+          f"восстановление с диска {'совпало' if restored == expected else 'НЕ совпало'}")
+    for error in errors[:5]:
+        print("  ", repr(error))
+    print("OK" if ok else "FAIL")
+    return ok
+
+
+def throughput(shards, threads, seconds, keys):
+    store = ShardedStore(shards)
+    store.load({f"key:{i}": i for i in range(keys)})
+    stop = time.monotonic() + seconds
+    counts = [0] * threads
+
+    def worker(t):
+        rnd = random.Random(t)
+        done = 0
+        while time.monotonic() < stop:
+            for _ in range(100):
+                key = f"key:{rnd.randrange(keys)}"
+                if rnd.random() < 0.2:
+                    store.set(key, done)
+                else:
+                    store.get(key)
+            done += 100
+        counts[t] = done
+
+    errors = run_threads(threads, worker)
+    if errors:
+        raise errors[0]
+    return sum(counts) / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Стресс-тест и бенчмарк ShardedStore")
+    parser.add_argument("--stress", action="store_true", help="запустить стресс-тест")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--shards", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--keys", type=int, default=100_000)
+    args = parser.parse_args()
+
+    if args.stress:
+        sys.exit(0 if stress(max(args.threads), args.seconds, pairs=200) else 1)
+
+    for threads in args.threads:
+        single = throughput(1, threads, args.seconds, args.keys)
+        sharded = throughput(args.shards, threads, args.seconds, args.keys)
+        print(f"{threads:>2} потоков   1 шард: {single:12.0f} оп/с   "
+              f"{args.shards} шардов: {sharded:12.0f} оп/с")
+
+
+if __name__ == "__main__":
+    main()
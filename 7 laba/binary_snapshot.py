@@ -0,0 +1,145 @@
+# Модуль binary_snapshot — компактный двоичный формат снимка для key-value сервиса.
+#
+# Устройство файла (все числа little-endian):
+#
+#   заголовок   MAGIC, версия, seq, число записей, смещения и длины блоков ниже
+#   записи      для каждого ключа: u32 длина значения + значение (JSON в UTF-8)
+#   индекс      u64 смещение каждой записи от начала файла
+#   ключи       JSON-массив ключей, отсортированный по возрастанию
+#   сроки       JSON-объект {ключ: unix-время истечения} для ключей с TTL
+#
+# Файл открывается через mmap: при старте читаются только заголовок, индекс смещений
+# и список ключей, а значения декодируются лениво — при первом обращении к ключу.
+# Поиск ключа — двоичный поиск по отсортированному списку (bisect), без словаря на все ключи.
+
+# array — индекс смещений читается из файла одним куском.
+from array import array
+
+# bisect — двоичный поиск ключа.
+from bisect import bisect_left
+
+# json — значения, список ключей и сроки жизни хранятся как JSON.
+import json
+
+# mmap — отображение файла в память.
+import mmap
+
+# os — fsync и переименование.
+import os
+
+# struct — заголовок и длины записей.
+import struct
+
+# sys — порядок байт платформы (индекс хранится в little-endian).
+import sys
+
+
+MAGIC = b"KVB1"
+VERSION = 1
+
+# Заголовок: magic, версия, seq, число записей,
+# смещение индекса, смещение и длина блока ключей, смещение и длина блока сроков.
+HEADER = struct.Struct("<4sIQQQQQQQ")
+LENGTH = struct.Struct("<I")
+
+
+def encode_value(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def write_snapshot(path, seq, entries, expires):
+    """
+    Пишет снимок в path (через временный файл и os.replace).
+    entries — пары (ключ, значение в виде JSON-байтов), отсортированные по ключу.
+    """
+    tmp_path = path + ".tmp"
+    keys = []
+    offsets = array("Q")
+    with open(tmp_path, "wb") as f:
+        f.write(b"\0" * HEADER.size)
+        position = HEADER.size
+        for key, raw in entries:
+            keys.append(key)
+            offsets.append(position)
+            f.write(LENGTH.pack(len(raw)))
+            f.write(raw)
+            position += LENGTH.size + len(raw)
+
+        index_offset = position
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        f.write(offsets.tobytes())
+        position += len(offsets) * offsets.itemsize
+
+        keys_block = json.dumps(keys, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        expires_block = json.dumps(expires, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        keys_offset = position
+        f.write(keys_block)
+        expires_offset = keys_offset + len(keys_block)
+        f.write(expires_block)
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, seq, len(keys), index_offset,
+                            keys_offset, len(keys_block), expires_offset, len(expires_block)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_dict_snapshot(path, seq, data, expires):
+    """
+    Пишет снимок из обычного словаря (конвертер из data.json, миграция при старте).
+    """
+    write_snapshot(path, seq, ((key, encode_value(data[key])) for key in sorted(data)), expires)
+
+
+class BinarySnapshot:
+    """
+    Снимок, открытый через mmap. Значения читаются и декодируются по требованию.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, self.seq, self.count, index_offset,
+         keys_offset, keys_length, expires_offset, expires_length) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Ne snimok KVB: {path}")
+
+        self.offsets = array("Q")
+        self.offsets.frombytes(self._mm[index_offset:index_offset + self.count * 8])
+        if sys.byteorder != "little":
+            self.offsets.byteswap()
+        # Отсортированный список ключей — json.loads одного массива работает на C и быстро.
+        self.keys = json.loads(self._mm[keys_offset:keys_offset + keys_length])
+        self.expires = json.loads(self._mm[expires_offset:expires_offset + expires_length])
+
+    def __len__(self):
+        return self.count
+
+    def find(self, key):
+        """
+        Номер записи с ключом key или -1.
+        """
+        i = bisect_left(self.keys, key)
+        if i < self.count and self.keys[i] == key:
+            return i
+        return -1
+
+    def raw(self, i):
+        """
+        Значение записи i в виде JSON-байтов (без декодирования).
+        """
+        offset = self.offsets[i]
+        (length,) = LENGTH.unpack_from(self._mm, offset)
+        start = offset + LENGTH.size
+        return self._mm[start:start + length]
+
+    def value(self, i):
+        return json.loads(self.raw(i))
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
@@ -0,0 +1,59 @@
+# Одноразовый конвертер: data.json -> двоичный снимок для движка хранения (storage.py).
+#
+# Запуск:
+#   python convert_data.py                       # data.json -> kvdata/snapshot-0...0.kvb
+#   python convert_data.py --input old.json --data-dir kvdata
+#
+# app.py и сам переносит data.json при первом запуске, но на большом файле удобнее
+# сделать это заранее и отдельно — сервис потом стартует сразу с двоичного снимка.
+
+# argparse — разбор аргументов командной строки.
+import argparse
+
+# json — чтение исходного файла.
+import json
+
+# os, sys — проверка каталога и код выхода.
+import os
+import sys
+
+from binary_snapshot import write_dict_snapshot
+from storage import LogStorage
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Конвертация data.json в двоичный снимок")
+    parser.add_argument("--input", default="data.json")
+    parser.add_argument("--data-dir", default=os.environ.get("KV_DATA_DIR", "kvdata"))
+    parser.add_argument("--force", action="store_true",
+                        help="удалить журнал и снимки, которые уже есть в каталоге, и писать заново")
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    if os.listdir(args.data_dir) and not args.force:
+        print(f"Каталог {args.data_dir} не пуст — там уже есть данные. Используйте --force.")
+        sys.exit(1)
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    storage = LogStorage(args.data_dir)
+    if args.force:
+        # LogStorage.load берёт самый новый снимок и доигрывает сегменты журнала: если их
+        # оставить, snapshot-0 молча проигнорируется. Удаляем их (и старый snapshot.json).
+        old = [path for _, path in storage._snapshots() + storage._segments()]
+        if os.path.exists(storage.json_snapshot_path):
+            old.append(storage.json_snapshot_path)
+        for path in old:
+            os.remove(path)
+        if old:
+            print(f"Удалено старых файлов журнала и снимков: {len(old)}")
+
+    path = storage.snapshot_file(0)
+    write_dict_snapshot(path, 0, data, {})
+    print(f"{len(data)} ключей: {args.input} ({os.path.getsize(args.input)} Б) -> "
+          f"{path} ({os.path.getsize(path)} Б)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+# Модуль kv_service — общее ядро key-value сервиса для обеих точек входа:
+# app.py (Flask, поток на запрос) и async_server.py (asyncio, конвейер запросов).
+#
+# Здесь читаются настройки KV_*, поднимаются движок хранения, хранилище в памяти
+# и репликация, а также живёт логика операций set/get/delete/exists. Каждая операция
+# возвращает пару (тело ответа, HTTP-код), а как её отправить клиенту — решает точка входа.
+
+# Подключаем модуль atexit — чтобы при остановке сервера сбросить журнал на диск.
+import atexit
+
+# Подключаем библиотеку os — она позволяет читать настройки из переменных окружения.
+import os
+
+# Подключаем модуль json — чтобы приводить нестроковые ключи к строке, как при сохранении в JSON.
+import json
+
+# Движок хранения: журнал мутаций + фоновые снимки (см. storage.py).
+from storage import LogStorage
+
+# Потокобезопасное хранилище в памяти, разбитое на шарды (см. sharded_store.py).
+from sharded_store import ShardedStore
+
+# Репликация ведущий/реплика (см. replication.py).
+from replication import Follower, start_leader
+
+# Встроенный ограничитель количества запросов (rate limiting) на GCRA, см. rate_limiter.py.
+from rate_limiter import RateLimiter, parse_limit
+
+
+# Имя старого файла, в котором раньше целиком хранился словарь.
+# Теперь он читается только один раз — при первом запуске с новым движком хранения.
+DATA_FILE = "data.json"
+
+# Каталог для журнала (wal-*.log) и снимков (snapshot.json).
+DATA_DIR = os.environ.get("KV_DATA_DIR", "kvdata")
+
+# Режим сброса журнала на диск: always (после каждой записи), batch (раз в N записей),
+# interval (раз в KV_FSYNC_INTERVAL секунд) или group (групповая фиксация).
+FSYNC_MODE = os.environ.get("KV_FSYNC_MODE", "always")
+FSYNC_BATCH = int(os.environ.get("KV_FSYNC_BATCH", "64"))
+FSYNC_INTERVAL = float(os.environ.get("KV_FSYNC_INTERVAL", "1.0"))
+
+# Настройки групповой фиксации: мутации, пришедшие за KV_GROUP_WINDOW_MS миллисекунд
+# (но не больше KV_GROUP_MAX_OPS штук), пишутся на диск одной операцией.
+GROUP_WINDOW_MS = float(os.environ.get("KV_GROUP_WINDOW_MS", "2"))
+GROUP_MAX_OPS = int(os.environ.get("KV_GROUP_MAX_OPS", "256"))
+
+# Максимальное число ключей в одном запросе /mget, /mset, /mdelete.
+MAX_BATCH_KEYS = int(os.environ.get("KV_MAX_BATCH_KEYS", "1000"))
+
+# Через сколько записей в журнале делать новый снимок.
+SNAPSHOT_EVERY = int(os.environ.get("KV_SNAPSHOT_EVERY", "100000"))
+
+# Число шардов хранилища в памяти: у каждого шарда своя блокировка.
+SHARDS = int(os.environ.get("KV_SHARDS", "16"))
+
+# Примерный лимит памяти под данные в байтах (0 — без лимита) и политика вытеснения
+# при его превышении: lru, lfu или random.
+MAX_MEMORY = int(os.environ.get("KV_MAX_MEMORY", "0"))
+EVICTION_POLICY = os.environ.get("KV_EVICTION_POLICY", "lru")
+
+# Вести ли упорядоченный индекс ключей для /scan (1 — да, 0 — нет).
+ORDERED_INDEX = os.environ.get("KV_ORDERED_INDEX", "1") == "1"
+
+# Размер страницы /scan по умолчанию.
+SCAN_DEFAULT_LIMIT = 100
+
+# Как часто фоновый уборщик удаляет истёкшие ключи и сколько ключей за раз (на шард).
+SWEEP_INTERVAL = float(os.environ.get("KV_SWEEP_INTERVAL", "0.1"))
+SWEEP_LIMIT = int(os.environ.get("KV_SWEEP_LIMIT", "100"))
+
+# Роль узла: leader — принимает запись (и, если задан KV_REPL_PORT, раздаёт поток
+# журнала репликам); follower — реплика KV_LEADER (host:port репликации ведущего),
+# обслуживает только чтение.
+ROLE_LEADER = "leader"
+ROLE_FOLLOWER = "follower"
+ROLE = os.environ.get("KV_ROLE", ROLE_LEADER)
+REPL_HOST = os.environ.get("KV_REPL_HOST", "127.0.0.1")
+REPL_PORT = int(os.environ.get("KV_REPL_PORT", "0"))
+LEADER = os.environ.get("KV_LEADER", "127.0.0.1:6000")
+# Сколько последних записей журнала ведущий держит в памяти для догоняющих реплик
+# (отставшие сильнее получают полный снимок) и как часто шлёт им PING.
+REPL_BACKLOG = int(os.environ.get("KV_REPL_BACKLOG", "100000"))
+REPL_HEARTBEAT = float(os.environ.get("KV_REPL_HEARTBEAT", "0.1"))
+# Допустимое устаревание чтений на реплике в секундах (запрос может сузить его
+# параметром max_staleness). Отставшая реплика отвечает 503.
+MAX_STALENESS = float(os.environ.get("KV_MAX_STALENESS", "1.0"))
+
+# Лимиты запросов (общие для app.py и async_server.py): по умолчанию — DEFAULT_LIMIT
+# на каждый маршрут и IP-адрес клиента, для записи (/set, /delete, /mset, /mdelete) — WRITE_LIMIT.
+DEFAULT_LIMIT = parse_limit("100 per day")  # ограничение по умолчанию
+WRITE_LIMIT = parse_limit("10 per minute")  # отдельное ограничение для записи
+
+# Включён ли лимитер (0 — выключен, например для нагрузочных тестов).
+RATELIMIT_ENABLED = os.environ.get("KV_RATELIMIT_ENABLED", "1") == "1"
+
+# Сколько пар (маршрут, IP) помнит лимитер; простаивающие пары вытесняются.
+RATELIMIT_CAPACITY = int(os.environ.get("KV_RATELIMIT_CAPACITY", "65536"))
+
+# Файл, в котором лимитер сохраняет состояние между перезапусками ("" — не сохранять),
+# и как часто (в секундах) его перезаписывать.
+RATELIMIT_FILE = os.environ.get("KV_RATELIMIT_FILE", "")
+RATELIMIT_SAVE_INTERVAL = float(os.environ.get("KV_RATELIMIT_SAVE_INTERVAL", "30"))
+
+if ROLE not in (ROLE_LEADER, ROLE_FOLLOWER):
+    raise ValueError(f"Neizvestnaya rol uzla: {ROLE}")
+
+
+# === Загрузка данных при старте приложения ===
+# Движок сам восстановит словарь: последний снимок + записи журнала после него.
+storage = LogStorage(
+    DATA_DIR,
+    fsync_mode=FSYNC_MODE,
+    fsync_batch=FSYNC_BATCH,
+    fsync_interval=FSYNC_INTERVAL,
+    group_window=GROUP_WINDOW_MS / 1000,
+    group_max_ops=GROUP_MAX_OPS,
+    snapshot_every=SNAPSHOT_EVERY,
+    legacy_file=DATA_FILE,
+)
+# Все ключи живут в хранилище data, разбитом на шарды. Каждая мутация пишется в журнал
+# под блокировкой своего шарда, так что порядок в журнале совпадает с порядком в памяти.
+# Реплика хранит все ключи ведущего (его вытеснения приходят к ней как delete),
+# поэтому своего лимита памяти у неё нет.
+data = ShardedStore(SHARDS, journal=storage, max_memory=MAX_MEMORY if ROLE == ROLE_LEADER else 0,
+                    policy=EVICTION_POLICY, ordered=ORDERED_INDEX)
+data.load_from(storage)
+# Истёкшие ключи удаляются при обращении, а остальные — понемногу в фоне.
+data.start_sweeper(SWEEP_INTERVAL, SWEEP_LIMIT)
+# При завершении процесса сбрасываем на диск всё, что ещё не попало туда через fsync.
+atexit.register(storage.close)
+
+# Репликация: у реплики — поток, догоняющий ведущего с номера последней своей записи;
+# у ведущего — сервер, раздающий журнал (или None, если KV_REPL_PORT не задан).
+replication = None
+if ROLE == ROLE_FOLLOWER:
+    replication = Follower(data, storage, LEADER, MAX_STALENESS)
+    replication.start()
+    atexit.register(replication.close)
+elif REPL_PORT:
+    replication = start_leader(data, storage, REPL_HOST, REPL_PORT, REPL_BACKLOG, REPL_HEARTBEAT)
+    atexit.register(replication.close)
+
+# Лимитер запросов; состояние сохраняется при остановке процесса.
+limiter = RateLimiter(RATELIMIT_CAPACITY, path=RATELIMIT_FILE or None,
+                      save_interval=RATELIMIT_SAVE_INTERVAL)
+limiter.enabled = RATELIMIT_ENABLED
+atexit.register(limiter.close)
+
+# Маркер "ключа нет" — отличается от любого значения, в том числе от None (null в JSON).
+MISSING = object()
+
+
+# === Завершение мутации ===
+def commit(seq):
+    # Ждём фиксации уже без блокировок — пока мы ждём, другие запросы попадают в ту же пачку
+    # (имеет значение в режиме group; в остальных режимах возвращается сразу).
+    storage.wait(seq)
+    # Если журнал вырос — в фоне пишем новый снимок и удаляем старые сегменты.
+    storage.maybe_snapshot(data)
+
+
+# === Проверка срока жизни (TTL) из запроса ===
+def read_ttl(req):
+    # TTL необязателен; если передан — положительное число секунд.
+    # Возвращает (ttl, ошибка): ошибка — True, если значение неправильное.
+    ttl = req.get("ttl")
+    if ttl is None:
+        return None, False
+    if isinstance(ttl, bool) or not isinstance(ttl, (int, float)) or ttl <= 0:
+        return None, True
+    return ttl, False
+
+
+# === Ключ из тела /set ===
+def read_key(key):
+    # Ключи хранятся строками. Число, true/false и null приводим к строке так же, как
+    # json.dump приводит ключи словаря (1 -> "1", null -> "null"): раньше такие ключи
+    # становились строками при сохранении data.json. Списки и объекты — ошибка (None).
+    if isinstance(key, str):
+        return key
+    if key is None or isinstance(key, (bool, int, float)):
+        return json.dumps(key)
+    return None
+
+
+# === Проверка тела bulk-запроса ===
+def read_keys(req):
+    # Ожидаем JSON вида {"keys": ["a", "b", ...]} — список строк не длиннее MAX_BATCH_KEYS.
+    keys = req.get("keys") if isinstance(req, dict) else None
+    if not isinstance(keys, list) or not all(isinstance(k, str) for k in keys):
+        return None
+    if len(keys) > MAX_BATCH_KEYS:
+        return None
+    return keys
+
+
+# === Ограничения реплики ===
+def read_only_error():
+    # Реплика не принимает запись: клиент должен идти к ведущему.
+    if ROLE != ROLE_FOLLOWER:
+        return None
+    return {"error": "Replika tolko dlya chteniya, pishite vedushchemu", "leader": LEADER}, 403
+
+
+def stale_error(max_staleness=None):
+    # Если это реплика и она отстала от ведущего больше допустимого — ошибка 503,
+    # иначе None. max_staleness — строка из параметра запроса (секунды) или None.
+    if ROLE != ROLE_FOLLOWER:
+        return None
+    try:
+        limit = float(max_staleness) if max_staleness is not None else None
+    except ValueError:
+        return {"error": "Parametr 'max_staleness' dolzhen byt chislom sekund"}, 400
+    if replication.fresh_enough(limit):
+        return None
+    return {"error": "Replika otstala ot vedushchego", "staleness": replication.staleness()}, 503
+
+
+def replication_stats():
+    if replication is None:
+        return {"role": ROLE}
+    return replication.stats()
+
+
+# === Проверка лимита запросов ===
+def rate_limited(endpoint, address, limit=DEFAULT_LIMIT):
+    # None — запрос пропускается; иначе (тело ответа 429, через сколько секунд повторить).
+    # Ключ лимита — маршрут и IP-адрес клиента.
+    if not limiter.enabled:
+        return None
+    allowed, retry_after = limiter.hit(f"{endpoint}|{address}", limit)
+    if allowed:
+        return None
+    return {"error": f"Slishkom mnogo zaprosov: {limit.text}"}, int(retry_after) + 1
+
+
+# ======================= Операции сервиса ======================= #
+# Общие для Flask и asyncio: на входе — уже разобранные данные запроса,
+# на выходе — (словарь для JSON-ответа, HTTP-код).
+
+# === set: сохраняет ключ и значение ===
+def set_value(req):
+    error = read_only_error()
+    if error:
+        return error
+
+    # Проверяем, что пользователь отправил JSON и что там есть ключи "key" и "value".
+    if not isinstance(req, dict) or "key" not in req or "value" not in req:
+        # Возвращаем ошибку 400 (неправильный запрос).
+        return {"error": "Nuzhno peredat JSON s polyami 'key' i 'value'"}, 400
+
+    # Извлекаем ключ, значение и необязательный срок жизни (в секундах) из JSON.
+    key = read_key(req["key"])
+    if key is None:
+        return {"error": "Pole 'key' dolzhno byt strokoj, chislom, true/false ili null"}, 400
+    value = req["value"]
+    ttl, bad_ttl = read_ttl(req)
+    if bad_ttl:
+        return {"error": "Pole 'ttl' dolzhno byt polozhitelnym chislom sekund"}, 400
+
+    # Сохраняем значение в хранилище (заодно мутация пишется в журнал) и ждём фиксации.
+    commit(data.set(key, value, ttl))
+
+    # Возвращаем успешный ответ.
+    return {"status": "ok", "message": f"Kluch '{key}' sohranen"}, 200
+
+
+# === get: возвращает значение по ключу ===
+def get_value(key, max_staleness=None):
+    error = stale_error(max_staleness)
+    if error:
+        return error
+
+    # Если ключ есть в хранилище — возвращаем его значение.
+    # Берём значение одним вызовом: между проверкой и чтением ключ могли бы удалить.
+    value = data.get(key, MISSING)
+    if value is not MISSING:
+        return {"key": key, "value": value}, 200
+    # Если ключа нет — возвращаем ошибку.
+    return {"error": "Kluch ne nayden"}, 404
+
+
+# === delete: удаляет ключ из хранилища ===
+def delete_value(key):
+    error = read_only_error()
+    if error:
+        return error
+
+    # Удаляем ключ (заодно удаление пишется в журнал).
+    found, seq = data.delete(key)
+    if not found:
+        # Если ключа нет — отправляем ошибку.
+        return {"error": "Kluch ne nayden"}, 404
+
+    # Отвечаем только после того, как удаление оказалось на диске.
+    commit(seq)
+    # Возвращаем успешный ответ.
+    return {"status": "ok", "message": f"Kluch '{key}' udalen"}, 200
+
+
+# === exists: проверяет существование ключа ===
+def exists(key, max_staleness=None):
+    error = stale_error(max_staleness)
+    if error:
+        return error
+
+    # True или False в зависимости от того, есть ли ключ в хранилище.
+    return {"exists": key in data}, 200
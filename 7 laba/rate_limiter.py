@@ -0,0 +1,250 @@
+# Модуль rate_limiter — встроенный ограничитель частоты запросов (вместо flask_limiter).
+#
+# Алгоритм GCRA (generic cell rate algorithm) — это token bucket, записанный одним числом:
+# для каждого ключа хранится только TAT (theoretical arrival time) — момент, когда
+# "ведро" снова станет полным. Лимит "N per период" даёт интервал T = период / N:
+#
+#   tat = max(TAT, now) + T
+#   если tat - now > период  -> запрос отклоняется (ведро пусто),
+#   иначе                       TAT = tat, запрос пропускается.
+#
+# Так разрешается всплеск до N запросов, а дальше — не чаще одного раза в T.
+#
+# Хранение:
+#   * TAT всех ключей лежат в одном array("d") фиксированного размера (capacity),
+#     ключу соответствует номер ячейки — никаких объектов-счётчиков на каждый ключ;
+#   * ключ с TAT <= now "простаивает": его ведро уже полное, и удаление ключа ничего
+#     не меняет в поведении. Такие ячейки освобождаются, когда таблица заполнена;
+#   * если простаивающих ключей мало, вытесняются ключи с самым ранним TAT —
+#     они ближе всего к полному ведру (ограничение для них немного ослабнет).
+#
+# Состояние можно сохранять в файл (path): перезапуск сервиса не обнуляет лимиты.
+# Время — unix-время (time.time), чтобы TAT оставались верными и после перезапуска.
+
+# array — таблица TAT.
+from array import array
+
+# heapq — выбор ключей с самым ранним TAT при вытеснении.
+import heapq
+
+# json — список ключей в файле состояния.
+import json
+
+# os — запись файла через временный и os.replace.
+import os
+
+# re — разбор строк лимитов вида "10 per minute".
+import re
+
+# struct — заголовок файла состояния.
+import struct
+
+# threading — блокировка таблицы и поток периодического сохранения.
+import threading
+
+# time — текущее время.
+import time
+
+
+# Длительность периодов в секундах.
+PERIODS = {
+    "second": 1,
+    "minute": 60,
+    "hour": 3600,
+    "day": 86400,
+}
+
+LIMIT_RE = re.compile(r"^\s*(\d+)\s*(?:per|/)\s*(?:(\d+)\s+)?(second|minute|hour|day)s?\s*$")
+
+# Файл состояния: magic, версия, число ключей, длина блока ключей; затем TAT и ключи.
+MAGIC = b"KVRL"
+VERSION = 1
+HEADER = struct.Struct("<4sIQQ")
+
+
+class Limit:
+    """
+    Разобранный лимит: count запросов за period секунд.
+    """
+
+    __slots__ = ("text", "count", "period", "interval")
+
+    def __init__(self, text, count, period):
+        if count < 1 or period <= 0:
+            raise ValueError(f"Nevernyj limit: {text!r}")
+        self.text = text
+        self.count = count
+        self.period = period
+        self.interval = period / count
+
+    def __repr__(self):
+        return f"Limit({self.text!r})"
+
+
+def parse_limit(text):
+    """
+    "100 per day", "10 per minute", "5/second", "20 per 10 minutes" -> Limit.
+    """
+    match = LIMIT_RE.match(text)
+    if not match:
+        raise ValueError(f"Nevernyj limit: {text!r}")
+    count, multiplier, unit = match.groups()
+    return Limit(text.strip(), int(count), int(multiplier or 1) * PERIODS[unit])
+
+
+class RateLimiter:
+    """
+    Таблица GCRA на capacity ключей. Ключ — произвольная строка
+    (например, "маршрут|IP"); лимит передаётся при каждом вызове hit().
+    """
+
+    def __init__(self, capacity=65536, path=None, save_interval=30.0):
+        self.capacity = capacity
+        self.path = path
+        self.enabled = True
+        self.lock = threading.Lock()
+        self._slots = {}
+        self._keys = [None] * capacity
+        self._tat = array("d", bytes(8 * capacity))
+        # Ячейки выдаются по порядку (_used), освобождённые — из стека _free.
+        self._used = 0
+        self._free = array("L")
+        self._evicted = 0
+        self._rejected = 0
+        self._stop = threading.Event()
+        self._saver = None
+        if path:
+            self.load()
+            if save_interval > 0:
+                self._saver = threading.Thread(target=self._save_loop, args=(save_interval,), daemon=True)
+                self._saver.start()
+
+    def __len__(self):
+        return len(self._slots)
+
+    # === Декоратор для обработчиков ===
+    @staticmethod
+    def limit(text):
+        """
+        Помечает обработчик своим лимитом вместо лимита по умолчанию.
+        Сам лимит проверяет точка входа (см. app.py, before_request).
+        """
+        parsed = parse_limit(text)
+
+        def decorator(func):
+            func.rate_limit = parsed
+            return func
+
+        return decorator
+
+    # === Проверка ===
+    def hit(self, key, limit, now=None):
+        """
+        Учитывает один запрос ключа key. Возвращает (разрешён ли, через сколько секунд повторить).
+        """
+        if now is None:
+            now = time.time()
+        with self.lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._allocate(now)
+                self._slots[key] = slot
+                self._keys[slot] = key
+                tat = now
+            else:
+                tat = self._tat[slot]
+                if tat < now:
+                    tat = now
+            tat += limit.interval
+            if tat - now > limit.period:
+                self._rejected += 1
+                return False, tat - now - limit.period
+            self._tat[slot] = tat
+            return True, 0.0
+
+    def _allocate(self, now):
+        if self._used < self.capacity:
+            self._used += 1
+            return self._used - 1
+        if not self._free:
+            self._evict(now)
+        return self._free.pop()
+
+    def _evict(self, now):
+        # Сначала освобождаем все простаивающие ключи (их ведро уже полное).
+        tats, keys, slots = self._tat, self._keys, self._slots
+        idle = [i for i in range(self.capacity) if tats[i] <= now]
+        # Освобождаем с запасом, чтобы следующая очистка случилась нескоро.
+        need = max(1, self.capacity // 16) - len(idle)
+        if need > 0:
+            busy = (i for i in range(self.capacity) if tats[i] > now)
+            idle.extend(heapq.nsmallest(need, busy, key=tats.__getitem__))
+        for i in idle:
+            del slots[keys[i]]
+            keys[i] = None
+            tats[i] = 0.0
+        self._free.extend(idle)
+        self._evicted += len(idle)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "keys": len(self._slots),
+                "capacity": self.capacity,
+                "evicted": self._evicted,
+                "rejected": self._rejected,
+            }
+
+    # === Сохранение состояния ===
+    def save(self):
+        """
+        Пишет в файл ключи, ведро которых ещё не полное (остальные ничего не ограничивают).
+        """
+        if not self.path:
+            return
+        now = time.time()
+        with self.lock:
+            keys = [key for key, slot in self._slots.items() if self._tat[slot] > now]
+            tats = array("d", (self._tat[self._slots[key]] for key in keys))
+        keys_block = json.dumps(keys, ensure_ascii=False).encode("utf-8")
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(keys), len(keys_block)))
+            f.write(tats.tobytes())
+            f.write(keys_block)
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        """
+        Восстанавливает состояние из файла; истёкшие за время простоя ключи пропускаются.
+        """
+        try:
+            with open(self.path, "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return
+        magic, version, count, keys_length = HEADER.unpack_from(raw, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Ne fajl sostoyaniya limitera: {self.path}")
+        tats = array("d")
+        tats.frombytes(raw[HEADER.size:HEADER.size + 8 * count])
+        keys = json.loads(raw[HEADER.size + 8 * count:HEADER.size + 8 * count + keys_length])
+        now = time.time()
+        with self.lock:
+            for key, tat in zip(keys, tats):
+                if tat <= now or key in self._slots or self._used == self.capacity:
+                    continue
+                slot = self._allocate(now)
+                self._slots[key] = slot
+                self._keys[slot] = key
+                self._tat[slot] = tat
+
+    def _save_loop(self, interval):
+        while not self._stop.wait(interval):
+            self.save()
+
+    def close(self):
+        self._stop.set()
+        if self._saver is not None:
+            self._saver.join()
+        self.save()
@@ -0,0 +1,368 @@
+# Модуль replication — репликация ведущий/реплика (leader/follower) для key-value сервиса.
+#
+# Ведущий принимает записи как обычно, а каждую строку журнала (storage.encode_record,
+# с контрольной суммой) дополнительно кладёт в кольцевой буфер ReplicationBacklog.
+# Реплики подключаются к ведущему по TCP (ReplicationServer) и получают поток этих строк.
+#
+# Протокол (строки, разделённые "\n"):
+#
+#   реплика -> ведущий   SYNC <seq>                 "у меня применено всё до seq включительно"
+#   ведущий -> реплика   <crc32> <json>             запись журнала, как в wal-*.log
+#                        PING <seq>                 "у ведущего последняя запись — seq"
+#                        FULL <seq>                 полная синхронизация (если seq реплики
+#                        EXPIRES <json>             уже вытеснен из буфера или реплика
+#                        <json ключа>\t<json значения>   "впереди" ведущего): снимок
+#                        ...                        всего хранилища на момент seq,
+#                        END                        затем обычный поток записей
+#
+# Реплика (Follower) применяет записи к своему хранилищу и пишет их в свой журнал с теми же
+# seq. Поэтому после перезапуска она восстанавливается из своих файлов и просит у ведущего
+# только то, что пропустила.
+#
+# Ограничение устаревания: ведущий присылает PING после каждой пачки и раз в heartbeat
+# секунд. Реплика помнит, когда она последний раз совпадала с ведущим (caught_up_at).
+# Если это было дольше max_staleness секунд назад, чтения отклоняются,
+# и клиент (ReplicatedClient) идёт к ведущему.
+#
+# Репликация асинхронная: ведущий отвечает клиенту, не дожидаясь реплик.
+
+# json — ключи, значения и сроки жизни при полной синхронизации.
+import json
+
+# socket, socketserver — TCP-соединения реплик.
+import socket
+import socketserver
+
+# threading — поток реплики и блокировки буфера.
+import threading
+
+# time — отметки "когда реплика совпадала с ведущим".
+import time
+
+# urllib — HTTP-клиент для ReplicatedClient.
+from urllib.error import HTTPError, URLError
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+from storage import decode_record
+
+
+class ReplicationBacklog:
+    """
+    Последние capacity строк журнала ведущего (по seq, без пропусков).
+    """
+
+    def __init__(self, first_seq, capacity=100_000):
+        self.capacity = capacity
+        # Номер записи в self._lines[0] и номер последней опубликованной записи.
+        self._first = first_seq
+        self.seq = first_seq - 1
+        self._lines = []
+        self._cond = threading.Condition()
+
+    def publish(self, seq, line):
+        with self._cond:
+            self._lines.append(line)
+            self.seq = seq
+            # Отрезаем старое пачками, чтобы не сдвигать список на каждой записи.
+            if len(self._lines) >= 2 * self.capacity:
+                del self._lines[:self.capacity]
+                self._first += self.capacity
+            self._cond.notify_all()
+
+    def covers(self, seq):
+        """
+        Можно ли продолжить поток реплике, у которой применено всё до seq.
+        """
+        with self._cond:
+            return self._first - 1 <= seq <= self.seq
+
+    def read_after(self, seq, timeout):
+        """
+        Строки с номерами больше seq (ждёт до timeout секунд, если их пока нет).
+        Возвращает (строки, последний seq ведущего); строки None — seq уже вытеснен из буфера.
+        """
+        with self._cond:
+            if seq >= self.seq:
+                self._cond.wait(timeout)
+            if seq < self._first - 1:
+                return None, self.seq
+            return self._lines[seq + 1 - self._first:], self.seq
+
+
+# ======================= Ведущий ======================= #
+
+class ReplicationServer:
+    """
+    TCP-сервер ведущего: по потоку на каждую реплику.
+    """
+
+    def __init__(self, store, storage, backlog, host="127.0.0.1", port=0, heartbeat=0.1):
+        self.store = store
+        self.storage = storage
+        self.backlog = backlog
+        self.heartbeat = heartbeat
+        self.followers = 0
+        self.full_syncs = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                server.serve_follower(self.rfile, self.wfile)
+
+        class Server(socketserver.ThreadingTCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        self._server = Server((host, port), Handler)
+        self.address = self._server.server_address
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def serve_follower(self, rfile, wfile):
+        line = rfile.readline().split()
+        if len(line) != 2 or line[0] != b"SYNC":
+            return
+        seq = int(line[1])
+        with self._lock:
+            self.followers += 1
+        try:
+            if not self.backlog.covers(seq):
+                seq = self._send_full(wfile)
+            while True:
+                lines, leader_seq = self.backlog.read_after(seq, self.heartbeat)
+                if lines is None:
+                    # Реплика отстала больше, чем на буфер: она переподключится и получит FULL.
+                    return
+                if lines:
+                    wfile.write(b"".join(lines))
+                    seq += len(lines)
+                wfile.write(b"PING %d\n" % leader_seq)
+                wfile.flush()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            with self._lock:
+                self.followers -= 1
+
+    def _send_full(self, wfile):
+        # Согласованный срез: номер последней записи читается, пока заблокированы все шарды,
+        # а мутации пишутся в журнал под блокировкой шарда — срез ровно до этого номера.
+        snapshot = self.store.snapshot(on_frozen=lambda: self.storage.seq)
+        seq = snapshot.token
+        wfile.write(b"FULL %d\n" % seq)
+        wfile.write(b"EXPIRES " + json.dumps(snapshot.expires_dict()).encode("utf-8") + b"\n")
+        for key, raw in snapshot.entries():
+            wfile.write(json.dumps(key, ensure_ascii=False).encode("utf-8") + b"\t" + raw + b"\n")
+        wfile.write(b"END\n")
+        with self._lock:
+            self.full_syncs += 1
+        return seq
+
+    def stats(self):
+        return {
+            "role": "leader",
+            "seq": self.backlog.seq,
+            "followers": self.followers,
+            "full_syncs": self.full_syncs,
+        }
+
+
+def start_leader(store, storage, host, port, backlog_size=100_000, heartbeat=0.1):
+    """
+    Подключает буфер к журналу и запускает сервер репликации.
+    """
+    backlog = ReplicationBacklog(storage.seq + 1, backlog_size)
+    storage.replication = backlog
+    server = ReplicationServer(store, storage, backlog, host, port, heartbeat)
+    server.start()
+    return server
+
+
+# ======================= Реплика ======================= #
+
+class ResyncNeeded(Exception):
+    """
+    Поток записей разошёлся с репликой (пропуск seq) — нужно переподключиться.
+    """
+
+
+class Follower:
+    """
+    Поток реплики: подключается к ведущему, применяет его записи, переподключается при обрыве.
+    """
+
+    def __init__(self, store, storage, leader, max_staleness=1.0, retry=0.5):
+        host, _, port = leader.rpartition(":")
+        self.address = (host or "127.0.0.1", int(port))
+        self.store = store
+        self.storage = storage
+        self.max_staleness = max_staleness
+        self.retry = retry
+        self.applied = storage.seq
+        self.leader_seq = None
+        self.connected = False
+        self.full_syncs = 0
+        self.caught_up_at = None
+        self._stop = threading.Event()
+        self._sock = None
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._sock is not None:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join()
+
+    def staleness(self):
+        """
+        Сколько секунд назад реплика последний раз совпадала с ведущим (None — ни разу).
+        """
+        if self.caught_up_at is None:
+            return None
+        return time.monotonic() - self.caught_up_at
+
+    def fresh_enough(self, max_staleness=None):
+        limit = self.max_staleness if max_staleness is None else max_staleness
+        staleness = self.staleness()
+        return staleness is not None and staleness <= limit
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                # Ведущий присылает PING не реже раза в heartbeat, так что долгая тишина —
+                # это обрыв связи: по таймауту переподключаемся.
+                self._sock = socket.create_connection(self.address, timeout=5)
+                with self._sock, self._sock.makefile("rb") as stream:
+                    self._sock.sendall(b"SYNC %d\n" % self.applied)
+                    self.connected = True
+                    self._follow(stream)
+            except (OSError, ValueError, ResyncNeeded):
+                pass
+            finally:
+                self.connected = False
+            self._stop.wait(self.retry)
+
+    def _follow(self, stream):
+        for line in stream:
+            if line.startswith(b"PING "):
+                self.leader_seq = int(line[5:])
+                if self.applied >= self.leader_seq:
+                    self.caught_up_at = time.monotonic()
+                # Снимок реплики пишется по тем же правилам, что у ведущего.
+                self.storage.maybe_snapshot(self.store)
+            elif line.startswith(b"FULL "):
+                self._full_sync(int(line[5:]), stream)
+            else:
+                record = decode_record(line)
+                if record is None:
+                    raise ResyncNeeded("povrezhdena zapis")
+                seq = record["seq"]
+                if seq <= self.applied:
+                    continue
+                if seq != self.applied + 1:
+                    raise ResyncNeeded(f"propusk: {self.applied} -> {seq}")
+                self.store.apply(record)
+                self.applied = seq
+
+    def _full_sync(self, seq, stream):
+        header = stream.readline()
+        if not header.startswith(b"EXPIRES "):
+            raise ResyncNeeded("ozhidalsya EXPIRES")
+        expires = json.loads(header[8:])
+
+        def entries():
+            for line in stream:
+                if line == b"END\n":
+                    return
+                key, _, raw = line.rstrip(b"\n").partition(b"\t")
+                yield json.loads(key), raw
+            raise ResyncNeeded("oborvana polnaya sinhronizaciya")
+
+        base = self.storage.reset(seq, entries(), expires)
+        self.store.reset({}, base.expires, base)
+        self.applied = seq
+        self.full_syncs += 1
+
+    def stats(self):
+        return {
+            "role": "follower",
+            "leader": f"{self.address[0]}:{self.address[1]}",
+            "connected": self.connected,
+            "applied_seq": self.applied,
+            "leader_seq": self.leader_seq,
+            "staleness": self.staleness(),
+            "max_staleness": self.max_staleness,
+            "full_syncs": self.full_syncs,
+        }
+
+
+# ======================= Клиент ======================= #
+
+class ReplicatedClient:
+    """
+    HTTP-клиент с разделением чтения и записи: запись — ведущему,
+    чтение (get, exists) — репликам по кругу с ограничением устаревания.
+    Если реплика недоступна или отстала (503), чтение повторяется на ведущем.
+    """
+
+    def __init__(self, leader_url, follower_urls=(), max_staleness=None, timeout=5.0):
+        self.leader_url = leader_url.rstrip("/")
+        self.follower_urls = [url.rstrip("/") for url in follower_urls]
+        self.max_staleness = max_staleness
+        self.timeout = timeout
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def _request(self, url, method="GET", body=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        request = Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                return response.status, json.loads(response.read())
+        except HTTPError as error:
+            return error.code, json.loads(error.read() or b"null")
+
+    def _read(self, path):
+        if self.max_staleness is not None:
+            path += f"?max_staleness={self.max_staleness}"
+        if self.follower_urls:
+            with self._lock:
+                url = self.follower_urls[self._next % len(self.follower_urls)]
+                self._next += 1
+            try:
+                status, body = self._request(url + path)
+                if status != 503:
+                    return status, body
+            except (URLError, OSError):
+                pass
+        return self._request(self.leader_url + path)
+
+    def get(self, key):
+        return self._read(f"/get/{quote(key, safe='')}")
+
+    def exists(self, key):
+        return self._read(f"/exists/{quote(key, safe='')}")
+
+    def set(self, key, value, ttl=None):
+        body = {"key": key, "value": value}
+        if ttl is not None:
+            body["ttl"] = ttl
+        return self._request(self.leader_url + "/set", "POST", body)
+
+    def delete(self, key):
+        return self._request(self.leader_url + f"/delete/{quote(key, safe='')}", "DELETE")
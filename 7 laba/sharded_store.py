@@ -0,0 +1,642 @@
+# Модуль sharded_store — потокобезопасное хранилище в памяти для app.py.
+#
+# Пространство ключей делится на N шардов по хэшу ключа. У каждого шарда свой словарь
+# и своя блокировка, поэтому запросы к ключам из разных шардов друг друга не ждут.
+# Если хранилищу передан журнал (storage.LogStorage), мутация пишется в журнал под той же
+# блокировкой шарда — так порядок записей в журнале совпадает с порядком изменений в памяти.
+#
+# Дополнительно хранилище умеет:
+#   * TTL — срок жизни ключа. Истёкшие ключи удаляются лениво (при обращении)
+#     и понемногу фоновым потоком-"уборщиком" (sweeper);
+#   * ограничение памяти — при превышении лимита из шарда вытесняются ключи
+#     по выбранной политике: lru, lfu или random;
+#   * упорядоченный индекс ключей (sorted_index.SortedKeyIndex) для scan() —
+#     выборки по префиксу и диапазону постранично;
+#   * ленивую загрузку: ключи из двоичного снимка (binary_snapshot.BinarySnapshot, self.base)
+#     не копируются в шарды при старте, а подгружаются при первом обращении.
+
+# heapq — куча сроков истечения для уборщика и слияние ключей при записи снимка.
+import heapq
+
+# random — выбор кандидатов на вытеснение (lfu, random).
+import random
+
+# sys — оценка размера ключей и значений в памяти.
+import sys
+
+# threading — блокировки шардов и фоновый уборщик.
+import threading
+
+# time — сроки жизни ключей хранятся как unix-время.
+import time
+
+# OrderedDict — для политики lru (порядок ключей = порядок последнего обращения).
+from collections import OrderedDict
+
+# contextmanager — для блокировки всех шардов сразу (frozen).
+from contextlib import contextmanager
+
+from binary_snapshot import encode_value
+from sorted_index import SortedKeyIndex, prefix_end
+
+
+# Политики вытеснения при превышении лимита памяти.
+EVICT_LRU = "lru"        # самый давно использованный ключ
+EVICT_LFU = "lfu"        # самый редко используемый из случайной выборки (как в Redis)
+EVICT_RANDOM = "random"  # случайный ключ
+EVICTION_POLICIES = (EVICT_LRU, EVICT_LFU, EVICT_RANDOM)
+
+# Сколько ключей смотреть при выборе кандидата для lfu.
+LFU_SAMPLES = 5
+
+# Примерные накладные расходы на одну запись словаря (ячейка хэш-таблицы, служебные поля).
+ENTRY_OVERHEAD = 100
+
+
+def entry_size(key, value):
+    """
+    Примерный размер пары ключ-значение в памяти (в байтах).
+    Для списков и словарей учитываются вложенные элементы.
+    """
+    return ENTRY_OVERHEAD + sys.getsizeof(key) + _value_size(value)
+
+
+def _value_size(value):
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(sys.getsizeof(k) + _value_size(v) for k, v in value.items())
+    elif isinstance(value, list):
+        size += sum(_value_size(v) for v in value)
+    return size
+
+
+class Shard:
+    """
+    Один шард: словарь, блокировка и служебные структуры для TTL и вытеснения.
+    """
+
+    __slots__ = ("data", "lock", "expires", "heap", "sizes", "used",
+                 "keys", "positions", "hits", "evictions", "expirations", "detached")
+
+    def __init__(self, policy):
+        self.lock = threading.Lock()
+        self.clear(policy)
+
+    def clear(self, policy):
+        """
+        Очищает шард (блокировка остаётся прежней).
+        """
+        # Для lru порядок ключей в OrderedDict — это порядок последнего обращения.
+        self.data = OrderedDict() if policy == EVICT_LRU else {}
+        # Срок жизни: ключ -> unix-время истечения, и куча (время, ключ) для уборщика.
+        self.expires = {}
+        self.heap = []
+        # Оценка занятой памяти: размер каждой записи и сумма.
+        self.sizes = {}
+        self.used = 0
+        # Для lfu и random — список ключей и позиции в нём (случайный ключ за O(1)).
+        self.keys = [] if policy != EVICT_LRU else None
+        self.positions = {}
+        # Для lfu — счётчик обращений к ключу.
+        self.hits = {}
+        # Статистика.
+        self.evictions = 0
+        self.expirations = 0
+        # Ключи двоичного снимка, которые больше не читаются из него:
+        # уже подгружены в data (или перезаписаны), либо удалены.
+        self.detached = set()
+
+
+class StoreSnapshot:
+    """
+    Согласованный срез хранилища на один момент времени.
+    Хранит копии словарей шардов; итерация выдаёт пары (ключ, значение).
+    token — то, что вернул колбэк on_frozen, пока все шарды были заблокированы
+    (например, номер последней записи журнала, вошедшей в срез).
+    """
+
+    def __init__(self, parts, token=None, expires=None, base=None, detached=None):
+        self.parts = parts
+        self.token = token
+        self.expires = expires or []
+        # Двоичный снимок, из которого ещё не подгружены ключи (кроме detached).
+        self.base = base
+        self.detached = detached or set()
+
+    def _base_items(self):
+        """
+        Пары (ключ, номер записи) из базового снимка, которые ещё актуальны (по возрастанию).
+        """
+        if self.base is None:
+            return iter(())
+        detached = self.detached
+        return ((key, i) for i, key in enumerate(self.base.keys) if key not in detached)
+
+    def __iter__(self):
+        for part in self.parts:
+            yield from part.items()
+        for key, i in self._base_items():
+            yield key, self.base.value(i)
+
+    def __len__(self):
+        base = len(self.base) - len(self.detached) if self.base is not None else 0
+        return sum(len(part) for part in self.parts) + base
+
+    def to_dict(self):
+        return dict(self)
+
+    def entries(self):
+        """
+        Пары (ключ, значение в виде JSON-байтов) по возрастанию ключа — для записи
+        двоичного снимка. Значения из базового снимка копируются как есть, без декодирования.
+        """
+        overlay = {}
+        for part in self.parts:
+            overlay.update(part)
+        merged = heapq.merge(((key, -1) for key in sorted(overlay)), self._base_items())
+        for key, i in merged:
+            yield key, encode_value(overlay[key]) if i < 0 else self.base.raw(i)
+
+    def expires_dict(self):
+        merged = {}
+        for part in self.expires:
+            merged.update(part)
+        return merged
+
+
+class ShardedStore:
+    """
+    Словарь, разбитый на шарды с отдельными блокировками.
+
+    Одиночные операции берут блокировку одного шарда. Операции над несколькими ключами
+    (set_many, delete_many, get_many) берут блокировки всех затронутых шардов
+    в порядке возрастания номера — так не бывает взаимных блокировок.
+
+    max_memory — примерный лимит памяти на все данные (в байтах, 0 — без лимита);
+    он делится поровну между шардами, и вытеснение идёт внутри шарда.
+
+    ordered=True — вести упорядоченный индекс ключей для scan(). Индекс общий на все шарды
+    и меняется только при появлении и удалении ключей (под блокировкой шарда, затем индекса).
+    """
+
+    def __init__(self, shards=16, journal=None, max_memory=0, policy=EVICT_LRU, ordered=False):
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(f"Neizvestnaya politika vytesneniya: {policy}")
+        self.policy = policy
+        self.shards = [Shard(policy) for _ in range(shards)]
+        self.journal = journal
+        self.shard_budget = max_memory // shards if max_memory else 0
+        self.index = SortedKeyIndex() if ordered else None
+        self.base = None
+        self._sweeper_stop = None
+
+    def _shard(self, key):
+        return self.shards[hash(key) % len(self.shards)]
+
+    @contextmanager
+    def _locked(self, keys):
+        """
+        Блокирует все шарды, в которые попадают keys (по возрастанию номера шарда).
+        """
+        indexes = sorted({hash(key) % len(self.shards) for key in keys})
+        locks = [self.shards[i].lock for i in indexes]
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    @contextmanager
+    def frozen(self):
+        """
+        Блокирует все шарды сразу: пока блок выполняется, хранилище не меняется.
+        """
+        for shard in self.shards:
+            shard.lock.acquire()
+        try:
+            yield
+        finally:
+            for shard in reversed(self.shards):
+                shard.lock.release()
+
+    # ==================== Служебные операции (под блокировкой шарда) ====================
+
+    def _put(self, shard, key, value, expire, indexed=True):
+        data = shard.data
+        is_new = key not in data
+        if is_new and self.base is not None and key not in shard.detached and self.base.find(key) >= 0:
+            # Ключ был в снимке: теперь его значение живёт в data, а индекс уже знает о нём.
+            shard.detached.add(key)
+            indexed = False
+        # Сначала индекс: если ключ в него не годится (например, не строка), исключение
+        # вылетит до изменения data, и шард не останется наполовину обновлённым.
+        if is_new and indexed and self.index is not None:
+            self.index.add(key)
+        data[key] = value
+
+        if self.policy == EVICT_LRU:
+            data.move_to_end(key)
+        elif is_new:
+            shard.positions[key] = len(shard.keys)
+            shard.keys.append(key)
+        if self.policy == EVICT_LFU:
+            shard.hits[key] = shard.hits.get(key, 0) + 1
+
+        if expire is not None:
+            shard.expires[key] = expire
+            heapq.heappush(shard.heap, (expire, key))
+        elif shard.expires:
+            shard.expires.pop(key, None)
+
+        if self.shard_budget:
+            size = entry_size(key, value)
+            shard.used += size - shard.sizes.get(key, 0)
+            shard.sizes[key] = size
+
+    def _remove(self, shard, key):
+        del shard.data[key]
+        if self.index is not None:
+            self.index.discard(key)
+        shard.expires.pop(key, None)
+        if shard.keys is not None:
+            # Удаление из списка за O(1): на место ключа ставим последний.
+            index = shard.positions.pop(key)
+            last = shard.keys.pop()
+            if last != key:
+                shard.keys[index] = last
+                shard.positions[last] = index
+        shard.hits.pop(key, None)
+        if self.shard_budget:
+            shard.used -= shard.sizes.pop(key)
+
+    def _touch(self, shard, key):
+        """
+        Отмечает обращение к ключу (для lru и lfu).
+        """
+        if self.policy == EVICT_LRU:
+            shard.data.move_to_end(key)
+        elif self.policy == EVICT_LFU:
+            shard.hits[key] += 1
+
+    def _fault(self, shard, key):
+        """
+        Подгружает ключ из двоичного снимка при первом обращении к нему.
+        """
+        if key in shard.data or key in shard.detached:
+            return
+        i = self.base.find(key)
+        if i >= 0:
+            shard.detached.add(key)
+            self._put(shard, key, self.base.value(i), shard.expires.get(key), indexed=False)
+
+    def _alive(self, shard, key, now):
+        """
+        Есть ли ключ в шарде. Истёкший ключ заодно удаляется (ленивое истечение).
+        """
+        if self.base is not None:
+            self._fault(shard, key)
+        if key not in shard.data:
+            return False
+        expire = shard.expires.get(key)
+        if expire is not None and expire <= now:
+            self._remove(shard, key)
+            shard.expirations += 1
+            return False
+        return True
+
+    def _victim(self, shard, protected):
+        if self.policy == EVICT_LRU:
+            for key in shard.data:
+                if key not in protected:
+                    return key
+            return None
+        if not shard.keys:
+            return None
+        candidates = [k for k in (random.choice(shard.keys) for _ in range(LFU_SAMPLES))
+                      if k not in protected]
+        if not candidates:
+            return None
+        if self.policy == EVICT_RANDOM:
+            return candidates[0]
+        return min(candidates, key=shard.hits.__getitem__)
+
+    def _evict(self, shard, protected=()):
+        """
+        Вытесняет ключи, пока шард не уложится в свою долю лимита памяти.
+        protected — только что записанные ключи, их не трогаем.
+        Возвращает список вытесненных ключей (их удаление нужно записать в журнал).
+        """
+        evicted = []
+        while self.shard_budget and shard.used > self.shard_budget:
+            key = self._victim(shard, protected)
+            if key is None:
+                break
+            self._remove(shard, key)
+            shard.evictions += 1
+            evicted.append(key)
+        return evicted
+
+    # ==================== Загрузка ====================
+
+    def load_from(self, storage):
+        """
+        Восстанавливает хранилище из storage.LogStorage: снимок + хвост журнала.
+        """
+        data = storage.load()
+        self.load(data, storage.expires, storage.base, storage.deleted)
+
+    def load(self, data, expires=None, base=None, deleted=()):
+        """
+        Заполняет хранилище из обычного словаря (при старте, без записи в журнал).
+        base — двоичный снимок, поверх которого лежат data; его значения не копируются,
+        а подгружаются при первом обращении. deleted — ключи снимка, удалённые после него.
+        Уже истёкшие ключи пропускаются. Если данные не влезают в лимит памяти,
+        лишнее вытесняется и это удаление пишется в журнал.
+        """
+        self.base = base
+        expires = expires or {}
+        now = time.time()
+        for key, value in data.items():
+            expire = expires.get(key)
+            if expire is not None and expire <= now:
+                continue
+            self._put(self._shard(key), key, value, expire, indexed=False)
+
+        if base is not None:
+            for key in deleted:
+                if base.find(key) >= 0:
+                    self._shard(key).detached.add(key)
+            # Сроки жизни ключей снимка нужны уборщику сразу, а не после подгрузки значения.
+            for key, expire in base.expires.items():
+                shard = self._shard(key)
+                if key in shard.detached:
+                    continue
+                if expire <= now:
+                    shard.detached.add(key)
+                else:
+                    shard.expires[key] = expire
+                    heapq.heappush(shard.heap, (expire, key))
+
+        if self.index is not None:
+            if base is None:
+                # Индекс строим одной сортировкой, а не вставкой по одному ключу.
+                self.index.build(key for shard in self.shards for key in shard.data)
+            else:
+                # Ключи снимка уже отсортированы; поверх добавляем и убираем изменения журнала.
+                self.index.build(base.keys, presorted=True)
+                for shard in self.shards:
+                    for key in shard.data:
+                        self.index.add(key)
+                    for key in shard.detached:
+                        if key not in shard.data:
+                            self.index.discard(key)
+        for shard in self.shards:
+            evicted = self._evict(shard)
+            if evicted and self.journal is not None:
+                self.journal.append_batch([("delete", key, None) for key in evicted])
+
+    def reset(self, data, expires=None, base=None, deleted=()):
+        """
+        Заменяет всё содержимое хранилища (полная синхронизация реплики).
+        Аргументы — как у load(); пока идёт замена, все шарды заблокированы.
+        """
+        with self.frozen():
+            for shard in self.shards:
+                shard.clear(self.policy)
+            self.load(data, expires, base, deleted)
+
+    # ==================== Чтение ====================
+
+    def get(self, key, default=None):
+        shard = self._shard(key)
+        with shard.lock:
+            if not self._alive(shard, key, time.time()):
+                return default
+            self._touch(shard, key)
+            return shard.data[key]
+
+    def __contains__(self, key):
+        shard = self._shard(key)
+        with shard.lock:
+            return self._alive(shard, key, time.time())
+
+    def __len__(self):
+        count = sum(len(shard.data) for shard in self.shards)
+        if self.base is not None:
+            # Ключи снимка, которые ещё не подгружены и не удалены.
+            count += len(self.base) - sum(len(shard.detached) for shard in self.shards)
+        return count
+
+    def get_many(self, keys):
+        """
+        Читает несколько ключей одним согласованным срезом.
+        Возвращает (словарь найденных значений, список отсутствующих ключей).
+        """
+        values = {}
+        missing = []
+        now = time.time()
+        with self._locked(keys):
+            for key in keys:
+                shard = self._shard(key)
+                if self._alive(shard, key, now):
+                    self._touch(shard, key)
+                    values[key] = shard.data[key]
+                else:
+                    missing.append(key)
+        return values, missing
+
+    def ttl(self, key):
+        """
+        Сколько секунд осталось жить ключу (None — ключ без срока или его нет).
+        """
+        shard = self._shard(key)
+        with shard.lock:
+            expire = shard.expires.get(key)
+            if expire is None or not self._alive(shard, key, time.time()):
+                return None
+            return expire - time.time()
+
+    def scan(self, prefix=None, start=None, end=None, after=None, limit=100):
+        """
+        Постраничная выборка по упорядоченному индексу: ключи k с данным префиксом,
+        start <= k < end и k > after (after — последний ключ предыдущей страницы).
+        Возвращает (список пар (ключ, значение), after для следующей страницы или None).
+        Стоимость — O(log n + limit).
+        """
+        if self.index is None:
+            raise RuntimeError("Uporyadochennyj indeks vyklyuchen")
+        low, high = start, end
+        if prefix:
+            low = max(low, prefix) if low is not None else prefix
+            upper = prefix_end(prefix)
+            if upper is not None:
+                high = min(high, upper) if high is not None else upper
+        keys = self.index.range(low, high, after, limit)
+        values, _ = self.get_many(keys)
+        items = [(key, values[key]) for key in keys if key in values]
+        # Ключи, истёкшие между индексом и чтением, просто пропускаются.
+        return items, (keys[-1] if len(keys) == limit else None)
+
+    # ==================== Запись ====================
+
+    def _log(self, ops):
+        if self.journal is None:
+            return None
+        if len(ops) == 1:
+            op, key, value, expire = ops[0]
+            return self.journal.append(op, key, value, expire)
+        return self.journal.append_batch(ops)
+
+    def set(self, key, value, ttl=None):
+        """
+        Сохраняет значение (ttl — срок жизни в секундах).
+        Возвращает номер записи журнала (или None без журнала).
+        """
+        expire = time.time() + ttl if ttl is not None else None
+        shard = self._shard(key)
+        with shard.lock:
+            self._put(shard, key, value, expire)
+            evicted = self._evict(shard, (key,))
+            # Запись и вытеснения, которые она вызвала, — одна запись журнала.
+            return self._log([("set", key, value, expire)] + [("delete", k, None, None) for k in evicted])
+
+    def delete(self, key):
+        """
+        Удаляет ключ. Возвращает (был ли ключ, номер записи журнала).
+        """
+        shard = self._shard(key)
+        with shard.lock:
+            if not self._alive(shard, key, time.time()):
+                return False, None
+            self._remove(shard, key)
+            return True, self._log([("delete", key, None, None)])
+
+    def set_many(self, items, ttl=None):
+        """
+        Атомарно сохраняет все пары из словаря items одной записью журнала.
+        """
+        expire = time.time() + ttl if ttl is not None else None
+        with self._locked(items):
+            touched = {}
+            for key, value in items.items():
+                shard = self._shard(key)
+                self._put(shard, key, value, expire)
+                touched[id(shard)] = shard
+            ops = [("set", key, value, expire) for key, value in items.items()]
+            for shard in touched.values():
+                ops += [("delete", k, None, None) for k in self._evict(shard, items)]
+            return self._log(ops)
+
+    def delete_many(self, keys):
+        """
+        Атомарно удаляет ключи. Возвращает (удалённые, отсутствовавшие, номер записи журнала).
+        """
+        deleted = []
+        missing = []
+        now = time.time()
+        with self._locked(keys):
+            for key in dict.fromkeys(keys):
+                shard = self._shard(key)
+                if self._alive(shard, key, now):
+                    self._remove(shard, key)
+                    deleted.append(key)
+                else:
+                    missing.append(key)
+            if deleted:
+                return deleted, missing, self._log([("delete", key, None, None) for key in deleted])
+        return deleted, missing, None
+
+    def apply(self, record):
+        """
+        Применяет запись журнала ведущего (на реплике) и дописывает её в свой журнал
+        с тем же seq — под блокировками затронутых шардов, как и обычные мутации.
+        Реплика хранит все ключи ведущего: вытеснения приходят от него как delete.
+        """
+        if record["op"] == "batch":
+            ops = record["ops"]
+        else:
+            ops = [[record["op"], record["key"], record.get("value"), record.get("expire")]]
+        with self._locked([item[1] for item in ops]):
+            for item in ops:
+                op, key = item[0], item[1]
+                shard = self._shard(key)
+                if op == "set":
+                    self._put(shard, key, item[2], item[3] if len(item) > 3 else None)
+                    continue
+                if self.base is not None:
+                    self._fault(shard, key)
+                if key in shard.data:
+                    self._remove(shard, key)
+            if self.journal is not None:
+                return self.journal.append_replicated(record)
+        return None
+
+    # ==================== Фоновый уборщик истёкших ключей ====================
+
+    def sweep(self, limit=100):
+        """
+        Один проход уборщика: в каждом шарде удаляет не больше limit истёкших ключей.
+        Блокировка шарда держится недолго, поэтому запросы почти не ждут.
+        Возвращает, сколько ключей удалено.
+        """
+        removed = 0
+        now = time.time()
+        for shard in self.shards:
+            with shard.lock:
+                heap = shard.heap
+                for _ in range(limit):
+                    if not heap or heap[0][0] > now:
+                        break
+                    expire, key = heapq.heappop(heap)
+                    # В куче могут остаться устаревшие пары (ключ перезаписан или удалён).
+                    # _alive() сам удалит истёкший ключ (подгрузив его из снимка, если нужно).
+                    if shard.expires.get(key) == expire and not self._alive(shard, key, now):
+                        removed += 1
+                # Если устаревших пар накопилось много — пересобираем кучу.
+                if len(heap) > 2 * len(shard.expires) + 64:
+                    shard.heap = [(e, k) for k, e in shard.expires.items()]
+                    heapq.heapify(shard.heap)
+        return removed
+
+    def start_sweeper(self, interval=0.1, limit=100):
+        """
+        Запускает фоновый поток, который каждые interval секунд вызывает sweep(limit).
+        """
+        self._sweeper_stop = threading.Event()
+
+        def run():
+            while not self._sweeper_stop.wait(interval):
+                self.sweep(limit)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def stop_sweeper(self):
+        if self._sweeper_stop is not None:
+            self._sweeper_stop.set()
+
+    # ==================== Снимок и статистика ====================
+
+    def snapshot(self, on_frozen=None):
+        """
+        Согласованный срез всех шардов. Пока шарды заблокированы, копируются их словари
+        и вызывается on_frozen() — его результат сохраняется в StoreSnapshot.token.
+        """
+        with self.frozen():
+            parts = [dict(shard.data) for shard in self.shards]
+            expires = [dict(shard.expires) for shard in self.shards]
+            detached = set().union(*(shard.detached for shard in self.shards)) if self.base else None
+            token = on_frozen() if on_frozen is not None else None
+        return StoreSnapshot(parts, token, expires, self.base, detached)
+
+    def stats(self):
+        return {
+            "keys": len(self),
+            "keys_with_ttl": sum(len(shard.expires) for shard in self.shards),
+            "memory_used": sum(shard.used for shard in self.shards),
+            "memory_limit": self.shard_budget * len(self.shards),
+            "eviction_policy": self.policy,
+            "evictions": sum(shard.evictions for shard in self.shards),
+            "expirations": sum(shard.expirations for shard in self.shards),
+        }
@@ -0,0 +1,132 @@
+# Модуль sorted_index — упорядоченный индекс ключей для диапазонных запросов (/scan).
+#
+# Ключи хранятся в нескольких отсортированных списках ("корзинах") длиной около LOAD,
+# плюс отдельный список максимумов корзин. Поиск позиции — два bisect: O(log n).
+# Вставка и удаление сдвигают элементы только внутри одной корзины, а не всего индекса,
+# поэтому остаются быстрыми и на миллионах ключей. Выдача страницы из limit ключей —
+# O(log n + limit).
+
+# bisect — двоичный поиск в отсортированных списках.
+from bisect import bisect_left, bisect_right
+
+# threading — индекс общий для всех шардов, у него своя блокировка.
+import threading
+
+
+# Целевой размер корзины. Корзина делится пополам, когда вырастает вдвое больше.
+LOAD = 512
+
+
+def prefix_end(prefix):
+    """
+    Наименьшая строка, которая больше всех строк с данным префиксом
+    (None — такой строки нет, диапазон открыт сверху).
+    """
+    while prefix:
+        last = ord(prefix[-1])
+        if last < 0x10FFFF:
+            return prefix[:-1] + chr(last + 1)
+        prefix = prefix[:-1]
+    return None
+
+
+class SortedKeyIndex:
+    """
+    Отсортированное множество строковых ключей.
+    """
+
+    def __init__(self):
+        self._lists = []
+        self._maxes = []
+        self._len = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self._len
+
+    def build(self, keys, presorted=False):
+        """
+        Строит индекс с нуля (при старте) — одна сортировка вместо n вставок.
+        presorted=True — ключи уже отсортированы и без повторов (например, из двоичного снимка).
+        """
+        ordered = list(keys) if presorted else sorted(set(keys))
+        with self.lock:
+            self._lists = [ordered[i:i + LOAD] for i in range(0, len(ordered), LOAD)]
+            self._maxes = [chunk[-1] for chunk in self._lists]
+            self._len = len(ordered)
+
+    def add(self, key):
+        with self.lock:
+            maxes, lists = self._maxes, self._lists
+            if not maxes:
+                lists.append([key])
+                maxes.append(key)
+                self._len = 1
+                return
+
+            i = bisect_left(maxes, key)
+            if i == len(maxes):
+                # Ключ больше всех — в конец последней корзины.
+                i -= 1
+                lists[i].append(key)
+                maxes[i] = key
+            else:
+                chunk = lists[i]
+                j = bisect_left(chunk, key)
+                if chunk[j] == key:
+                    return
+                chunk.insert(j, key)
+            self._len += 1
+
+            chunk = lists[i]
+            if len(chunk) > 2 * LOAD:
+                lists[i:i + 1] = [chunk[:LOAD], chunk[LOAD:]]
+                maxes[i:i + 1] = [lists[i][-1], lists[i + 1][-1]]
+
+    def discard(self, key):
+        with self.lock:
+            maxes, lists = self._maxes, self._lists
+            i = bisect_left(maxes, key)
+            if i == len(maxes):
+                return
+            chunk = lists[i]
+            j = bisect_left(chunk, key)
+            if chunk[j] != key:
+                return
+            del chunk[j]
+            self._len -= 1
+            if not chunk:
+                del lists[i]
+                del maxes[i]
+            elif j == len(chunk):
+                maxes[i] = chunk[-1]
+
+    def range(self, low=None, high=None, after=None, limit=100):
+        """
+        До limit ключей k по возрастанию, таких что low <= k < high и k > after.
+        Любая из границ может быть None.
+        """
+        with self.lock:
+            maxes, lists = self._maxes, self._lists
+            if after is not None and (low is None or after >= low):
+                i = bisect_right(maxes, after)
+                if i == len(maxes):
+                    return []
+                j = bisect_right(lists[i], after)
+            elif low is not None:
+                i = bisect_left(maxes, low)
+                if i == len(maxes):
+                    return []
+                j = bisect_left(lists[i], low)
+            else:
+                i, j = 0, 0
+
+            result = []
+            while i < len(lists) and len(result) < limit:
+                chunk = lists[i]
+                for key in chunk[j:j + limit - len(result)]:
+                    if high is not None and key >= high:
+                        return result
+                    result.append(key)
+                i, j = i + 1, 0
+            return result
@@ -0,0 +1,574 @@
+# Модуль storage — движок хранения для key-value сервиса из app.py.
+#
+# Вместо полной перезаписи data.json на каждую операцию мы:
+#   1) дописываем каждую мутацию (set/delete) одной строкой в журнал (write-ahead log);
+#   2) время от времени в фоне пишем компактный снимок (snapshot) всего словаря;
+#   3) при старте восстанавливаем состояние: снимок + "хвост" журнала после него.
+#
+# Журнал разбит на сегменты wal-<номер первой записи>.log. Когда снимок записан,
+# сегменты, целиком попавшие в снимок, удаляются — так журнал не растёт бесконечно.
+#
+# Снимки пишутся в двоичном формате (binary_snapshot.py) в файлы snapshot-<seq>.kvb.
+# При старте последний снимок не читается целиком, а открывается через mmap (self.base):
+# значения из него хранилище подгружает лениво. Старый формат snapshot.json
+# и самый первый data.json по-прежнему читаются.
+
+# json — формат записей журнала и снимка.
+import json
+
+# os — работа с файлами, fsync, переименование.
+import os
+
+# threading — фоновые потоки (снимки, периодический fsync) и блокировки.
+import threading
+
+# time — для режима fsync по интервалу.
+import time
+
+# zlib.crc32 — контрольная сумма строки журнала, чтобы отличить "оборванную" запись после сбоя.
+from zlib import crc32
+
+from binary_snapshot import BinarySnapshot, write_dict_snapshot, write_snapshot
+
+
+# Режимы сброса журнала на диск (fsync):
+# always   — fsync после каждой записи (самый надёжный и самый медленный);
+# batch    — fsync после каждых fsync_batch записей;
+# interval — fsync в фоновом потоке раз в fsync_interval секунд;
+# group    — групповая фиксация (group commit): мутации, пришедшие за group_window секунд
+#            (или пока не наберётся group_max_ops штук), пишутся и сбрасываются на диск
+#            одной операцией, а каждый вызывающий ждёт в wait(), пока его пачка не окажется на диске.
+FSYNC_ALWAYS = "always"
+FSYNC_BATCH = "batch"
+FSYNC_INTERVAL = "interval"
+FSYNC_GROUP = "group"
+FSYNC_MODES = (FSYNC_ALWAYS, FSYNC_BATCH, FSYNC_INTERVAL, FSYNC_GROUP)
+
+# Границы корзин гистограммы размеров пачек: 1, 2, 4, ..., 256 и "больше".
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+# Префикс и суффикс имён файлов-сегментов журнала.
+SEGMENT_PREFIX = "wal-"
+SEGMENT_SUFFIX = ".log"
+
+# Префикс и суффикс имён двоичных снимков.
+SNAPSHOT_PREFIX = "snapshot-"
+SNAPSHOT_SUFFIX = ".kvb"
+
+
+def encode_record(record):
+    """
+    Превращает запись журнала в строку вида "<crc32> <json>\\n" (в байтах).
+    """
+    payload = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return b"%08x " % crc32(payload) + payload + b"\n"
+
+
+def decode_record(line):
+    """
+    Разбирает строку журнала. Возвращает словарь записи
+    или None, если строка повреждена (не совпала контрольная сумма или оборвана).
+    """
+    if not line.endswith(b"\n") or len(line) < 10:
+        return None
+    checksum, payload = line[:8], line[9:-1]
+    try:
+        if int(checksum, 16) != crc32(payload):
+            return None
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+
+def apply_record(data, record, expires=None, deleted=None):
+    """
+    Применяет одну запись журнала к словарю data.
+    Запись "batch" содержит список операций [op, key, value] или [op, key, value, expire]
+    и применяется целиком. expires — словарь сроков жизни ключей (unix-время), если он нужен.
+    deleted — множество удалённых ключей (нужно, когда data — лишь "надстройка" над снимком).
+    """
+    op, key = record["op"], record.get("key")
+    if op == "set":
+        data[key] = record["value"]
+        if deleted is not None:
+            deleted.discard(key)
+        if expires is not None:
+            if record.get("expire") is not None:
+                expires[key] = record["expire"]
+            else:
+                expires.pop(key, None)
+    elif op == "delete":
+        data.pop(key, None)
+        if deleted is not None:
+            deleted.add(key)
+        if expires is not None:
+            expires.pop(key, None)
+    elif op == "batch":
+        for item in record["ops"]:
+            apply_record(data, {"op": item[0], "key": item[1], "value": item[2],
+                                "expire": item[3] if len(item) > 3 else None}, expires, deleted)
+
+
+class LogStorage:
+    """
+    Журнал мутаций + периодические снимки.
+
+    Использование:
+        storage = LogStorage("data")
+        store = ShardedStore(journal=storage)
+        store.load_from(storage)     # снимок (через mmap) + хвост журнала
+        seq = store.set("a", 1)      # мутация + запись в журнал
+        storage.wait(seq)            # нужно только в режиме group
+        storage.maybe_snapshot(store)
+    """
+
+    def __init__(self, directory, fsync_mode=FSYNC_ALWAYS, fsync_batch=64,
+                 fsync_interval=1.0, group_window=0.002, group_max_ops=256,
+                 snapshot_every=100_000, legacy_file=None):
+        if fsync_mode not in FSYNC_MODES:
+            raise ValueError(f"Neizvestnyj rezhim fsync: {fsync_mode}")
+
+        # Каталог, где лежат сегменты журнала и снимки.
+        self.directory = directory
+        # Снимок в старом формате JSON (до перехода на двоичный) — только для чтения.
+        self.json_snapshot_path = os.path.join(directory, "snapshot.json")
+        # Старый файл data.json — при первом запуске переносим из него данные.
+        self.legacy_file = legacy_file
+
+        self.fsync_mode = fsync_mode
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        # Окно (в секундах) и максимальный размер пачки для режима group.
+        self.group_window = group_window
+        self.group_max_ops = group_max_ops
+        # Через сколько записей журнала запускать новый снимок.
+        self.snapshot_every = snapshot_every
+
+        # Номер последней записанной записи (LSN — log sequence number).
+        self.seq = 0
+        # Номер последней записи, попавшей в снимок.
+        self.snapshot_seq = 0
+        # Результат load(), кроме самого словаря: двоичный снимок, открытый через mmap
+        # (или None), сроки жизни ключей и ключи, удалённые журналом после снимка.
+        self.base = None
+        self.expires = {}
+        self.deleted = set()
+        # Сколько записей ещё не сброшено на диск через fsync.
+        self._unsynced = 0
+
+        # Блокировка на запись в журнал: номер и порядок строк должны совпадать.
+        self._lock = threading.Lock()
+        # Блокировка на сам файл: в режиме group запись и fsync идут вне self._lock,
+        # чтобы новые мутации могли копиться в следующую пачку.
+        self._io_lock = threading.Lock()
+
+        # Режим group: закодированные, но ещё не записанные мутации,
+        # время появления первой из них и условие "есть что писать".
+        self._pending = []
+        self._pending_since = 0.0
+        self._pending_cond = threading.Condition(self._lock)
+        # Номер последней записи, которая уже точно на диске, и условие для ожидающих.
+        self._durable_seq = 0
+        self._durable_cond = threading.Condition()
+        # Ошибка записи в фоне — отдаём её всем, кто ждёт своей пачки.
+        self._error = None
+
+        # Счётчики фиксаций: сколько было сбросов на диск, сколько в них записей,
+        # гистограмма размеров пачек и задержка фиксации.
+        self.commits = 0
+        self.committed_ops = 0
+        self.max_batch = 0
+        self.batch_histogram = [0] * (len(BATCH_BUCKETS) + 1)
+        self.commit_latency_total = 0.0
+        self.commit_latency_max = 0.0
+        # Получатель новых записей для репликации (replication.ReplicationBacklog) или None.
+        # Вызывается под self._lock, поэтому видит записи строго в порядке seq.
+        self.replication = None
+        # Текущий открытый сегмент журнала.
+        self._file = None
+        # Поток, который сейчас пишет снимок, и замок "снимок уже пишется" (не больше одного сразу).
+        self._snapshot_thread = None
+        self._snapshot_guard = threading.Lock()
+        self._closed = False
+
+        os.makedirs(directory, exist_ok=True)
+
+    # ==================== Восстановление при старте ====================
+
+    def _segments(self):
+        """
+        Возвращает список (номер первой записи, путь) всех сегментов, по возрастанию.
+        """
+        result = []
+        for name in os.listdir(self.directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                start = int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+                result.append((start, os.path.join(self.directory, name)))
+        return sorted(result)
+
+    def _snapshots(self):
+        """
+        Возвращает список (seq, путь) всех двоичных снимков, по возрастанию seq.
+        """
+        result = []
+        for name in os.listdir(self.directory):
+            if name.startswith(SNAPSHOT_PREFIX) and name.endswith(SNAPSHOT_SUFFIX):
+                seq = int(name[len(SNAPSHOT_PREFIX):-len(SNAPSHOT_SUFFIX)])
+                result.append((seq, os.path.join(self.directory, name)))
+        return sorted(result)
+
+    def snapshot_file(self, seq):
+        return os.path.join(self.directory, f"{SNAPSHOT_PREFIX}{seq:020d}{SNAPSHOT_SUFFIX}")
+
+    def _segment_path(self, start):
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{start:020d}{SEGMENT_SUFFIX}")
+
+    def load(self):
+        """
+        Восстанавливает состояние: открывает последний снимок, затем применяет все записи
+        журнала после него. Оборванный "хвост" последнего сегмента (после сбоя) обрезается.
+
+        Возвращает словарь ключей из журнала. Если есть двоичный снимок, это лишь
+        "надстройка" над self.base, а удалённые журналом ключи снимка — в self.deleted.
+        Полное состояние собирает ShardedStore.load_from().
+        """
+        data = {}
+
+        snapshots = self._snapshots()
+        if snapshots:
+            self.base = BinarySnapshot(snapshots[-1][1])
+            self.snapshot_seq = self.base.seq
+        elif os.path.exists(self.json_snapshot_path):
+            with open(self.json_snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            data = snapshot["data"]
+            self.expires = snapshot.get("expires", {})
+            self.snapshot_seq = snapshot["seq"]
+        elif self.legacy_file and os.path.exists(self.legacy_file) and not self._segments():
+            # Первый запуск после перехода с data.json — переносим данные в двоичный снимок.
+            # Сразу фиксируем их, иначе после первой же записи в журнал
+            # data.json при следующем старте уже не будет прочитан.
+            with open(self.legacy_file, "r", encoding="utf-8") as f:
+                write_dict_snapshot(self.snapshot_file(0), 0, json.load(f), {})
+            self.base = BinarySnapshot(self.snapshot_file(0))
+
+        self.seq = self.snapshot_seq
+        for _, path in self._segments():
+            valid_size = 0
+            with open(path, "rb") as f:
+                for line in f:
+                    record = decode_record(line)
+                    if record is None:
+                        # Дальше этой точки запись была прервана — остальное игнорируем.
+                        break
+                    valid_size += len(line)
+                    if record["seq"] > self.snapshot_seq:
+                        apply_record(data, record, self.expires, self.deleted)
+                    self.seq = max(self.seq, record["seq"])
+            if valid_size != os.path.getsize(path):
+                with open(path, "r+b") as f:
+                    f.truncate(valid_size)
+
+        # Новые записи пишем в новый сегмент.
+        self._open_segment(self.seq + 1)
+        self._durable_seq = self.seq
+
+        if self.fsync_mode == FSYNC_INTERVAL:
+            threading.Thread(target=self._interval_sync, daemon=True).start()
+        elif self.fsync_mode == FSYNC_GROUP:
+            threading.Thread(target=self._group_commit, daemon=True).start()
+        return data
+
+    # ==================== Запись в журнал ====================
+
+    def _open_segment(self, start):
+        self._file = open(self._segment_path(start), "ab")
+
+    def _sync(self, started=None):
+        """
+        Сбрасывает файл на диск и обновляет счётчики фиксаций.
+        started — когда появилась первая запись этой пачки (для задержки фиксации).
+        """
+        if started is None:
+            started = time.perf_counter()
+        ops = self._unsynced
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        if ops:
+            self._record_commit(ops, time.perf_counter() - started)
+
+    def _record_commit(self, ops, latency):
+        self.commits += 1
+        self.committed_ops += ops
+        self.max_batch = max(self.max_batch, ops)
+        bucket = len(BATCH_BUCKETS)
+        for i, bound in enumerate(BATCH_BUCKETS):
+            if ops <= bound:
+                bucket = i
+                break
+        self.batch_histogram[bucket] += 1
+        self.commit_latency_total += latency
+        self.commit_latency_max = max(self.commit_latency_max, latency)
+
+    def append(self, op, key, value=None, expire=None):
+        """
+        Дописывает мутацию в журнал. Возвращает её номер (seq).
+        expire — unix-время, когда ключ истечёт (для set с TTL).
+        В режиме always запись уже на диске к моменту возврата,
+        в режиме group — только поставлена в пачку: дождаться её можно через wait(seq).
+        """
+        record = {"op": op, "key": key}
+        if op == "set":
+            record["value"] = value
+            if expire is not None:
+                record["expire"] = expire
+        return self._append_record(record)
+
+    def append_batch(self, ops):
+        """
+        Дописывает пачку мутаций [(op, key, value) или (op, key, value, expire), ...]
+        одной записью журнала.
+        Одна запись — одна контрольная сумма: после сбоя пачка восстановится либо целиком,
+        либо никак. Возвращает номер записи (seq).
+        """
+        return self._append_record({"op": "batch", "ops": [list(op) for op in ops]})
+
+    def append_replicated(self, record):
+        """
+        Дописывает запись, полученную репликой от ведущего, с тем же номером seq.
+        Так номера в журнале реплики совпадают с номерами ведущего.
+        """
+        return self._append_record(dict(record), record["seq"])
+
+    def _append_record(self, record, seq=None):
+        with self._lock:
+            self.seq = self.seq + 1 if seq is None else seq
+            record["seq"] = self.seq
+            line = encode_record(record)
+            if self.replication is not None:
+                self.replication.publish(self.seq, line)
+
+            if self.fsync_mode == FSYNC_GROUP:
+                if not self._pending:
+                    self._pending_since = time.perf_counter()
+                self._pending.append(line)
+                if len(self._pending) == 1 or len(self._pending) >= self.group_max_ops:
+                    self._pending_cond.notify()
+                return self.seq
+
+            self._file.write(line)
+            self._unsynced += 1
+
+            if self.fsync_mode == FSYNC_ALWAYS:
+                self._sync()
+            elif self.fsync_mode == FSYNC_BATCH and self._unsynced >= self.fsync_batch:
+                self._sync()
+            return self.seq
+
+    def wait(self, seq):
+        """
+        Ждёт, пока запись с номером seq окажется на диске.
+        Нужен только в режиме group; в остальных режимах возвращается сразу.
+        """
+        if self.fsync_mode != FSYNC_GROUP:
+            return
+        with self._durable_cond:
+            while self._durable_seq < seq and self._error is None:
+                self._durable_cond.wait()
+            if self._error is not None:
+                raise self._error
+
+    def _flush_pending(self):
+        """
+        Пишет накопленную пачку одним вызовом write и сбрасывает на диск.
+        Вызывается под self._io_lock.
+        """
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        self._file.write(b"".join(batch))
+        self._unsynced += len(batch)
+        self._sync(self._pending_since)
+
+    def _mark_durable(self, seq):
+        with self._durable_cond:
+            self._durable_seq = max(self._durable_seq, seq)
+            self._durable_cond.notify_all()
+
+    def _group_commit(self):
+        """
+        Фоновый поток режима group. Ждёт первую мутацию, затем ещё до group_window секунд
+        (или до group_max_ops мутаций), после чего фиксирует всю пачку одним write + fsync.
+        """
+        while True:
+            with self._pending_cond:
+                while not self._pending and not self._closed:
+                    self._pending_cond.wait()
+                if self._closed:
+                    return
+                deadline = self._pending_since + self.group_window
+                while len(self._pending) < self.group_max_ops:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0 or self._closed:
+                        break
+                    self._pending_cond.wait(remaining)
+                batch, self._pending = self._pending, []
+                started, last_seq = self._pending_since, self.seq
+                # Берём файл до того, как отпустить self._lock: так следующая пачка
+                # (или поворот сегмента при снимке) не обгонит эту.
+                self._io_lock.acquire()
+            try:
+                self._file.write(b"".join(batch))
+                self._unsynced += len(batch)
+                self._sync(started)
+            except OSError as error:
+                with self._durable_cond:
+                    self._error = error
+                    self._durable_cond.notify_all()
+                return
+            finally:
+                self._io_lock.release()
+            self._mark_durable(last_seq)
+
+    def stats(self):
+        """
+        Счётчики фиксаций: число сбросов на диск, размеры пачек и задержка фиксации (в мс).
+        """
+        histogram = {f"<={bound}": count for bound, count in zip(BATCH_BUCKETS, self.batch_histogram)}
+        histogram[f">{BATCH_BUCKETS[-1]}"] = self.batch_histogram[-1]
+        return {
+            "fsync_mode": self.fsync_mode,
+            "seq": self.seq,
+            "snapshot_seq": self.snapshot_seq,
+            "commits": self.commits,
+            "committed_ops": self.committed_ops,
+            "avg_batch": self.committed_ops / self.commits if self.commits else 0,
+            "max_batch": self.max_batch,
+            "batch_histogram": histogram,
+            "avg_commit_latency_ms": self.commit_latency_total / self.commits * 1000 if self.commits else 0,
+            "max_commit_latency_ms": self.commit_latency_max * 1000,
+        }
+
+    def _interval_sync(self):
+        """
+        Фоновый поток для режима interval: раз в fsync_interval секунд сбрасывает журнал на диск.
+        """
+        while not self._closed:
+            time.sleep(self.fsync_interval)
+            with self._lock:
+                if self._unsynced and not self._closed:
+                    self._sync()
+
+    # ==================== Снимки ====================
+
+    def maybe_snapshot(self, store):
+        """
+        Запускает фоновый снимок, если с прошлого снимка накопилось snapshot_every записей
+        и другой снимок сейчас не пишется. store — sharded_store.ShardedStore.
+        """
+        if self.seq - self.snapshot_seq < self.snapshot_every:
+            return
+        if not self._snapshot_guard.acquire(blocking=False):
+            return
+        self._start_snapshot(store)
+
+    def snapshot(self, store, wait=False):
+        """
+        Делает снимок хранилища store. Согласованная копия снимается, пока все шарды
+        заблокированы (быстро), а сериализация и запись на диск идут в фоновом потоке.
+        """
+        self._snapshot_guard.acquire()
+        self._start_snapshot(store)
+        if wait:
+            self._snapshot_thread.join()
+
+    def _rotate(self):
+        """
+        Дописывает всё накопленное, закрывает текущий сегмент и открывает новый.
+        Возвращает номер последней записи старого сегмента.
+        Вызывается, пока все шарды хранилища заблокированы, — новых мутаций в этот момент нет.
+        """
+        with self._lock, self._io_lock:
+            seq = self.seq
+            self._flush_pending()
+            self._sync()
+            self._file.close()
+            # Дальнейшие записи пойдут в новый сегмент — старые можно будет удалить.
+            self._open_segment(seq + 1)
+        self._mark_durable(seq)
+        return seq
+
+    def reset(self, seq, entries, expires):
+        """
+        Полная синхронизация реплики: всё состояние заменяется снимком, присланным ведущим
+        (entries и expires — как у write_snapshot). Остальные снимки и весь журнал удаляются.
+        Возвращает новый снимок, открытый через mmap.
+        """
+        # Пока держим замок снимков, фоновый снимок не начнётся и не удалит новый файл.
+        with self._snapshot_guard:
+            path = self.snapshot_file(seq)
+            write_snapshot(path, seq, entries, expires)
+            base = BinarySnapshot(path)
+            with self._lock, self._io_lock:
+                self._pending = []
+                self._file.close()
+                for _, old_path in self._snapshots():
+                    if old_path != path:
+                        os.remove(old_path)
+                if os.path.exists(self.json_snapshot_path):
+                    os.remove(self.json_snapshot_path)
+                for _, old_path in self._segments():
+                    os.remove(old_path)
+                self.base = base
+                self.seq = self.snapshot_seq = seq
+                self._unsynced = 0
+                self._open_segment(seq + 1)
+        self._mark_durable(seq)
+        return base
+
+    def _start_snapshot(self, store):
+        snapshot = store.snapshot(on_frozen=self._rotate)
+        self._snapshot_thread = threading.Thread(
+            target=self._snapshot_worker, args=(snapshot,), daemon=True
+        )
+        self._snapshot_thread.start()
+
+    def _snapshot_worker(self, snapshot):
+        try:
+            seq = snapshot.token
+            write_snapshot(self.snapshot_file(seq), seq, snapshot.entries(), snapshot.expires_dict())
+            self.snapshot_seq = seq
+            self._cleanup(seq)
+        finally:
+            self._snapshot_guard.release()
+
+    def _cleanup(self, seq):
+        """
+        После записи снимка seq удаляет старые снимки и сегменты журнала, вошедшие в него.
+        Снимок, открытый как self.base, не трогаем: из него ещё читаются значения.
+        """
+        for old_seq, path in self._snapshots():
+            if old_seq < seq and (self.base is None or path != self.base.path):
+                os.remove(path)
+        if os.path.exists(self.json_snapshot_path):
+            os.remove(self.json_snapshot_path)
+        for start, path in self._segments():
+            if start <= seq:
+                os.remove(path)
+
+    def close(self):
+        """
+        Сбрасывает журнал на диск и закрывает файл.
+        """
+        with self._lock, self._io_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._pending_cond.notify_all()
+            self._flush_pending()
+            self._sync()
+            self._file.close()
+        self._mark_durable(self.seq)
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join()
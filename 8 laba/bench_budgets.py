@@ -0,0 +1,192 @@
+# Проверка и бенчмарк бюджетов по окнам времени (budgets.py, process_transactions.py --windows).
+#
+# --check: предупреждения у границ окон — полночь, смена ISO-недели, конец месяца и года,
+# ровно лимит и на копейку больше, выход записи из скользящего окна ровно через его длину,
+# повторное превышение, запоздавшие записи, перевод категорий и немедленность предупреждения.
+# Без --check: пропускная способность — поток транзакций (reader) с подсчётом сумм
+# (aggregate) без окон и с окнами разных видов; печатаются записей в секунду и цена окон
+# на одну запись.
+#
+# Запуск:
+#   python bench_budgets.py
+#   python bench_budgets.py --records 2000000
+#   python bench_budgets.py --check
+
+# Импортируем необходимые библиотеки
+import argparse  # Для разбора аргументов командной строки
+import io  # Перехват вывода process_transactions.main
+import json  # Файлы настроек для проверки
+import os  # Пути
+import shutil  # Удаление временного каталога
+import sys  # Код возврата
+import tempfile  # Временный каталог для файлов
+import time  # Замер времени
+from contextlib import redirect_stdout  # Перехват вывода process_transactions.main
+from datetime import datetime, timedelta  # Метки времени для проверки
+
+from bench_stream import write_transactions
+from budgets import PERIODS, BudgetTracker
+from process_transactions import CATEGORY_MAP, WINDOW_LIMITS, aggregate
+from process_transactions import main as process_main
+from reader import iter_transactions
+
+
+# Транзакция для проверки
+def tx(timestamp, amount, category="еда"):
+    return {"timestamp": timestamp, "category": category, "amount": amount}
+
+
+# Прогоняет транзакции и возвращает номера записей с предупреждениями: [(номер, вид, период, сумма)]
+def alerts_for(transactions, limits, periods=PERIODS, kinds=("tumbling",), category_map=None):
+    tracker = BudgetTracker(limits, category_map, periods, kinds)
+    return [(i, a.kind, a.period, a.total) for i, t in enumerate(transactions) for a in tracker.add(t)], tracker
+
+
+# ==================== Проверка ====================
+
+def check(workdir, failures):
+    def expect(label, got, expected):
+        if got != expected:
+            failures.append(f"{label}: {got} != {expected}")
+
+    day = {"day": {"еда": 100}}
+    # Полночь: 99.99 в последнюю микросекунду дня и 0.02 в первую следующего — разные окна
+    got, _ = alerts_for([tx("2025-03-01T23:59:59.999999", 99.99), tx("2025-03-02T00:00:00", 0.02),
+                         tx("2025-03-02T23:59:59", 99.98), tx("2025-03-02T23:59:59.5", 0.01)], day, ["day"])
+    expect("polnoch", got, [(3, "tumbling", "day", 100.01)])
+    # Ровно лимит — не превышение, копейка сверху — превышение; повторно в том же окне — нет
+    got, _ = alerts_for([tx("2025-03-01T10:00:00", 60), tx("2025-03-01T11:00:00", 40),
+                         tx("2025-03-01T12:00:00", 0.01), tx("2025-03-01T13:00:00", 500)], day, ["day"])
+    expect("rovno limit", got, [(2, "tumbling", "day", 100.01)])
+    # Суммы в копейках: 0.1 + 0.2 во float больше 0.3, а здесь — ровно лимит
+    got, _ = alerts_for([tx("2025-03-01T10:00:00", 0.1), tx("2025-03-01T10:00:01", 0.2)],
+                        {"day": {"еда": 0.3}}, ["day"])
+    expect("kopejki", got, [])
+    # Неделя с понедельника: воскресенье 2025-03-09 и понедельник 2025-03-10 — разные недели
+    week = {"week": {"еда": 100}}
+    got, _ = alerts_for([tx("2025-03-03T00:00:00", 50), tx("2025-03-09T23:59:59", 50),
+                         tx("2025-03-10T00:00:00", 50), tx("2025-03-16T23:59:59", 50.01)], week, ["week"])
+    expect("nedelya", got, [(3, "tumbling", "week", 100.01)])
+    # Конец месяца и года: 31 декабря -> 1 января, 31 января -> 1 февраля
+    month = {"month": {"еда": 100}}
+    got, _ = alerts_for([tx("2024-12-31T23:59:59", 100), tx("2025-01-01T00:00:00", 100),
+                         tx("2025-01-31T23:59:59", 0.01), tx("2025-02-01T00:00:00", 100),
+                         tx("2025-02-28T23:59:59", 0.01)], month, ["month"])
+    expect("mesyac i god", got, [(2, "tumbling", "month", 100.01), (4, "tumbling", "month", 100.01)])
+    _, tracker = alerts_for([tx("2024-12-31T23:59:59", 1)], month, ["month"])
+    window = tracker.windows["еда"][0]
+    expect("granicy mesyaca", window.bounds(), (datetime(2024, 12, 1), datetime(2025, 1, 1)))
+
+    # Скользящее окно (t - 24ч, t]: запись ровно суточной давности уже вышла, на микросекунду моложе — ещё нет
+    start = datetime(2025, 3, 1, 12)
+    stamps = [start, start + timedelta(days=1), start + timedelta(days=2) - timedelta(microseconds=1)]
+    got, _ = alerts_for([tx(s.isoformat(), 60) for s in stamps], day, ["day"], ["sliding"])
+    expect("skolzyashchee okno", got, [(2, "sliding", "day", 120.0)])
+    # Сумма ушла ниже лимита и снова перешла через него — новое предупреждение
+    stamps = [start, start + timedelta(hours=1), start + timedelta(hours=25), start + timedelta(hours=26)]
+    got, _ = alerts_for([tx(s.isoformat(), 60) for s in stamps], day, ["day"], ["sliding"])
+    expect("povtornoe prevyshenie", got, [(1, "sliding", "day", 120.0), (3, "sliding", "day", 120.0)])
+    # Оба вида сразу, у календарного — граница суток
+    got, _ = alerts_for([tx("2025-03-01T20:00:00", 60), tx("2025-03-02T04:00:00", 60)], day, ["day"],
+                        ["tumbling", "sliding"])
+    expect("oba vida", got, [(1, "sliding", "day", 120.0)])
+
+    # Запоздавшая запись считается в текущем окне и учитывается в stats
+    got, tracker = alerts_for([tx("2025-03-02T10:00:00", 60), tx("2025-03-01T10:00:00", 60)], day, ["day"],
+                              ["tumbling", "sliding"])
+    expect("opozdavshaya", (got, tracker.stats()["late"]),
+           ([(1, "tumbling", "day", 120.0), (1, "sliding", "day", 120.0)], 1))
+
+    # Перевод категорий: food -> еда, и обе делят одно окно; без перевода ищется как есть;
+    # без лимита — не отслеживается
+    got, tracker = alerts_for([tx("2025-03-01T10:00:00", 60, "food"), tx("2025-03-01T10:00:00", 60, "еда"),
+                               tx("2025-03-01T10:00:00", 1e6, "other")], day, ["day"],
+                              category_map={"food": "еда"})
+    expect("perevod kategorij", (got, tracker.windows["other"]), ([(1, "tumbling", "day", 120.0)], []))
+
+    # Предупреждение приходит сразу, до чтения следующей записи
+    events = []
+    tracker = BudgetTracker(day, periods=["day"], on_alert=lambda alert: events.append("alert"))
+
+    def source():
+        for i, amount in enumerate([50, 60, 10]):
+            events.append(f"read {i}")
+            yield tx(f"2025-03-01T1{i}:00:00", amount)
+
+    aggregate(tracker.track(source()))
+    expect("srazu", events, ["read 0", "read 1", "alert", "read 2"])
+
+    # process_transactions.py: лимиты и перевод категорий из файлов, проверка итогов с переводом
+    path = os.path.join(workdir, "t.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([tx("2025-03-01T10:00:00", 30, "груши"), tx("2025-03-01T11:00:00", 30, "pears")], f)
+    limits, mapping = os.path.join(workdir, "limits.json"), os.path.join(workdir, "map.json")
+    with open(limits, "w", encoding="utf-8") as f:
+        json.dump({"day": {"груши": 50}}, f, ensure_ascii=False)
+    with open(mapping, "w", encoding="utf-8") as f:
+        json.dump({"pears": "груши"}, f, ensure_ascii=False)
+    output = io.StringIO()
+    with redirect_stdout(output):
+        process_main([path, "--windows", "day", "--limits", limits, "--category-map", mapping])
+    lines = output.getvalue().splitlines()
+    expect("process_transactions --windows", [line for line in lines if "ПРЕВЫШЕНИЕ" in line],
+           ["[ПРЕВЫШЕНИЕ] 2025-03-01T11:00:00 категория 'груши (pears)', день с 2025-03-01: 60.00 / 50.00"])
+    output = io.StringIO()
+    with redirect_stdout(output):
+        process_main([os.path.join(os.path.dirname(os.path.abspath(__file__)), "transactions.json")])
+    # В transactions.json категории английские: лимит развлечений (25000) теперь находится
+    expect("check_limits s perevodom", [line for line in output.getvalue().splitlines() if "ПРЕДУПРЕЖДЕНИЕ" in line],
+           ["[ПРЕДУПРЕЖДЕНИЕ] Категория 'entertainment' превысила лимит! 29883.52 / 25000"])
+    print("границы окон, повторы, опоздания, перевод категорий:", "OK" if not failures else "ОШИБКА")
+
+
+# ==================== Бенчмарк ====================
+
+def bench(path, n):
+    variants = [("без окон", None), ("tumbling", ["tumbling"]), ("sliding", ["sliding"]),
+                ("оба вида", ["tumbling", "sliding"])]
+    base = None
+    for label, kinds in variants:
+        with open(path, "r", encoding="utf-8") as f:
+            transactions = iter_transactions(f)
+            tracker = None
+            if kinds:
+                tracker = BudgetTracker(WINDOW_LIMITS, CATEGORY_MAP, PERIODS, kinds)
+                transactions = tracker.track(transactions)
+            started = time.perf_counter()
+            aggregate(transactions)
+            elapsed = time.perf_counter() - started
+        line = f"  {label:<9} {n / elapsed:>10,.0f} записей/с | {elapsed:6.2f} с"
+        if base is None:
+            base = elapsed
+        else:
+            line += f" | окна: {(elapsed - base) / n * 1e6:5.2f} мкс на запись"
+            line += f" | предупреждений {tracker.stats()['alerts']}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бюджеты по окнам времени: проверка и пропускная способность")
+    parser.add_argument("--records", type=int, default=1_000_000, help="число транзакций (по одной в секунду)")
+    parser.add_argument("--check", action="store_true", help="проверить предупреждения у границ окон")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_budgets_")
+    try:
+        if args.check:
+            failures = []
+            check(workdir, failures)
+            for failure in failures:
+                print("ОШИБКА:", failure)
+            print("OK" if not failures else f"ошибок: {len(failures)}")
+            sys.exit(0 if not failures else 1)
+        path = os.path.join(workdir, "transactions.json")
+        write_transactions(path, args.records)
+        print(f"{args.records} транзакций (окна: день, неделя, месяц по 5 категориям)")
+        bench(path, args.records)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+# Бенчмарк колоночного движка (columnar.py) против прежнего пути: json.load всего файла
+# и корутина с await asyncio.sleep(0) на каждую транзакцию.
+#
+# Каждый способ работает в отдельном процессе; замер делится на два этапа:
+#   загрузка  — разбор файла (для columnar — сразу в колонки: коды категорий, копейки, время);
+#   агрегация — число записей, сумма, минимум, максимум и среднее по категориям
+#               (прежний путь считает только суммы — и всё равно на порядки медленнее).
+# Способы:
+#   legacy    json.load + asyncio.gather по корутине на запись;
+#   stream    потоковый разбор и словарь сумм (process_transactions.aggregate);
+#   columnar  read_columns (поля из текста регулярными выражениями) + векторные свёртки NumPy.
+# Прежнему пути ограничивается адресное пространство (--legacy-memory), как в bench_stream.py.
+#
+# Запуск:
+#   python bench_columnar.py
+#   python bench_columnar.py --sizes 1000000 5000000
+#   python bench_columnar.py --check
+
+# Импортируем необходимые библиотеки
+import argparse  # Для разбора аргументов командной строки
+import asyncio  # Прежний путь — на корутинах
+import io  # Проверка на строках в памяти
+import json  # Обмен результатами с дочерним процессом
+import os  # Пути
+import random  # Данные для проверки
+import shutil  # Удаление временного каталога
+import subprocess  # Дочерние процессы для замеров
+import sys  # Путь к интерпретатору, код возврата
+import tempfile  # Временный каталог для файлов
+import time  # Замер времени
+from contextlib import redirect_stdout  # Перехват вывода process_transactions.main
+from decimal import Decimal  # Точные суммы для проверки
+
+from bench_stream import legacy_process_transaction, peak_rss_mb, write_transactions
+
+
+# Выполняется в дочернем процессе: загрузка и агрегация, печатает JSON с итогами
+def child(mode, path, memory_limit):
+    if mode == "legacy" and memory_limit:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    started = time.perf_counter()
+    loaded = started
+    try:
+        if mode == "legacy":
+            with open(path, "r", encoding="utf-8") as f:
+                transactions = json.load(f)
+            loaded = time.perf_counter()
+            totals = {}
+
+            async def run():
+                await asyncio.gather(*(legacy_process_transaction(t, totals) for t in transactions))
+
+            asyncio.run(run())
+        elif mode == "stream":
+            from process_transactions import aggregate
+            from reader import iter_transactions
+            with open(path, "r", encoding="utf-8") as f:
+                totals = aggregate(iter_transactions(f))
+            loaded = time.perf_counter()
+        else:
+            from columnar import GroupStats, read_columns
+            with open(path, "r", encoding="utf-8") as f:
+                batches = list(read_columns(f))
+            loaded = time.perf_counter()
+            stats = GroupStats.empty()
+            for columns in batches:
+                stats = stats.merge(columns.group_by_category())
+            totals = stats.totals()
+        error = None
+    except MemoryError:
+        totals, error = {}, "MemoryError"
+    finished = time.perf_counter()
+    print(json.dumps({
+        "load": loaded - started,
+        # У stream разбор и агрегация идут вместе, отдельно не измерить
+        "aggregate": finished - loaded if mode != "stream" else None,
+        "rss_mb": peak_rss_mb(),
+        "totals": {category: round(total, 2) for category, total in totals.items()},
+        "error": error,
+    }))
+
+
+def measure(mode, path, memory_limit):
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", mode, path, str(memory_limit)],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if completed.returncode != 0:
+        return {"error": f"код {completed.returncode}: {completed.stderr.strip()[-200:]}"}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+# ==================== Проверка ====================
+
+def check(failures):
+    from columnar import Categories, Columns, GroupStats, aggregate_columns, read_columns
+    from process_transactions import main as process_main
+    from reader import iter_transactions
+
+    rng = random.Random(3)
+    records = [{"timestamp": f"2025-03-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:00:00",
+                "category": rng.choice(["food", "transport", "health", "кино"]),
+                "amount": round(rng.uniform(0.01, 5000), 2)} for _ in range(20_000)]
+    # Точные итоги "в лоб"
+    expected = {}
+    for t in records:
+        row = expected.setdefault(t["category"], {"count": 0, "sum": Decimal(0), "values": []})
+        row["count"] += 1
+        row["sum"] += Decimal(str(t["amount"]))
+        row["values"].append(t["amount"])
+    expected = {name: {"count": row["count"], "sum": float(row["sum"]), "min": min(row["values"]),
+                       "max": max(row["values"]), "mean": float(row["sum"] / row["count"])}
+                for name, row in expected.items()}
+
+    def same(stats, label):
+        got = stats.as_dict()
+        if list(got) != list(expected) or any(
+                got[name]["count"] != row["count"] or got[name]["sum"] != row["sum"]
+                or got[name]["min"] != row["min"] or got[name]["max"] != row["max"]
+                or abs(got[name]["mean"] - row["mean"]) > 1e-9 for name, row in expected.items()):
+            failures.append(f"{label}: {got}")
+
+    text = json.dumps(records, indent=4, ensure_ascii=False)
+    same(aggregate_columns(records, batch_size=999), "iz slovarej pachkami po 999")
+    for chunk_size in (100, 4096, 1 << 20):
+        stats = GroupStats.empty()
+        for columns in read_columns(io.StringIO(text), chunk_size):
+            stats = stats.merge(columns.group_by_category())
+        same(stats, f"iz teksta kuskami po {chunk_size}")
+
+    # Время и колонки одинаковы у обоих способов сборки (from_text получает записи без скобок массива)
+    categories = Categories()
+    by_text = Columns.from_text(text[1:-1], categories)
+    by_records = Columns.from_records(list(iter_transactions(io.StringIO(text))), categories)
+    if by_text is None or not (by_text.codes.tolist() == by_records.codes.tolist()
+            and by_text.amounts.tolist() == by_records.amounts.tolist()
+            and by_text.timestamps.tolist() == by_records.timestamps.tolist()):
+        failures.append("from_text i from_records razoshlis")
+
+    # Запасной путь: фигурная скобка внутри строки и другой порядок полей
+    odd = [{"category": "a{b", "amount": 1.25, "timestamp": "2025-01-01T00:00:00"},
+           {"amount": 2, "timestamp": "2025-01-02T00:00:00", "category": "x"}]
+    got = GroupStats.empty()
+    for columns in read_columns(io.StringIO(json.dumps(odd)), 16):
+        got = got.merge(columns.group_by_category())
+    if got.totals() != {"a{b": 1.25, "x": 2.0}:
+        failures.append(f"zapasnoj put: {got.totals()}")
+
+    # Быстрый путь не принимает того, что не принял бы reader: такие куски уходят в запасной
+    # путь и дают ошибку формата, а не молча посчитанные записи
+    record = '{"timestamp": "2025-01-01T00:00:00", "category": "a", "amount": 1}'
+    broken = {
+        "massiv ne zakryt": f"[{record}, {record}",
+        "musor mezhdu zapisyami": f"{record} x {record}",
+        "net zapyatoj v zapisi": record.replace('", "category"', '" "category"'),
+        "summa ne chislo": record.replace("1}", "1.2.3}"),
+        "perevod stroki v stroke": record.replace('"a"', '"a\nb"'),
+    }
+    for label, text in broken.items():
+        for chunk_size in (16, 1 << 20):
+            try:
+                got = [len(columns) for columns in read_columns(io.StringIO(text), chunk_size)]
+                failures.append(f"{label} ({chunk_size}): prinyato {got}")
+            except ValueError:
+                pass
+    if Columns.from_text(f"{record},\n{record}", Categories()) is None or Columns.from_text(
+            f'{record}, {{"timestamp": "t", "category": "a", "amount": 1, "x": {{}}}}', Categories()) is not None:
+        failures.append("from_text: zashchita bystrogo puti")
+
+    # process_transactions.py --engine columnar: число записей, сумма, минимум, максимум, среднее
+    output = io.StringIO()
+    with redirect_stdout(output):
+        process_main([os.path.join(os.path.dirname(os.path.abspath(__file__)), "transactions.json"),
+                      "--engine", "columnar"])
+    line = next((line for line in output.getvalue().splitlines() if line.startswith("food:")), None)
+    if line != "food: 19589.71 (записей 8, мин 347.12, макс 4630.74, среднее 2448.71)":
+        failures.append(f"--engine columnar: {line}")
+
+    # Слияние: категория, которой нет в одной из частей
+    left = aggregate_columns(records[:10], batch_size=10)
+    right = aggregate_columns([{"timestamp": "2025-01-01T00:00:00", "category": "new", "amount": 7}])
+    merged = left.merge(right).merge(GroupStats.empty())
+    if merged.as_dict()["new"]["sum"] != 7 or list(merged.as_dict())[:-1] != list(left.as_dict()):
+        failures.append(f"sliyanie: {merged.as_dict()}")
+    print("колонки, свёртки, слияние, запасной путь и --engine columnar:", "OK" if not failures else "ОШИБКА")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Колоночный движок против корутины на каждую транзакцию")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000_000, 2_000_000, 5_000_000])
+    parser.add_argument("--modes", nargs="+", choices=["legacy", "stream", "columnar"],
+                        default=["legacy", "stream", "columnar"])
+    parser.add_argument("--legacy-memory", type=float, default=3.0,
+                        help="предел адресного пространства прежнего пути, ГБ (0 — без предела)")
+    parser.add_argument("--check", action="store_true", help="проверить точность движка (код выхода 0 — всё в порядке)")
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        mode, path, memory_limit = args.child
+        child(mode, path, int(memory_limit))
+        return
+    if args.check:
+        failures = []
+        check(failures)
+        for failure in failures:
+            print("ОШИБКА:", failure)
+        print("OK" if not failures else f"ошибок: {len(failures)}")
+        sys.exit(0 if not failures else 1)
+
+    workdir = tempfile.mkdtemp(prefix="bench_columnar_")
+    memory_limit = int(args.legacy_memory * 1024 ** 3)
+    try:
+        for n in args.sizes:
+            path = os.path.join(workdir, f"transactions_{n}.json")
+            write_transactions(path, n)
+            print(f"\n{n} транзакций")
+            results = {}
+            for mode in args.modes:
+                result = measure(mode, path, memory_limit)
+                if result.get("error"):
+                    print(f"  {mode:<8} не справился: {result['error']}")
+                    continue
+                results[mode] = result
+                total = result["load"] + (result["aggregate"] or 0)
+                aggregate = f"{result['aggregate']:7.3f} с" if result["aggregate"] is not None else "   вместе"
+                print(f"  {mode:<8} загрузка {result['load']:6.2f} с | агрегация {aggregate}"
+                      f" | всего {n / total:>10,.0f} записей/с | пик RSS {result['rss_mb']:7.1f} МБ")
+            if "legacy" in results and "columnar" in results:
+                print(f"  агрегация быстрее в {results['legacy']['aggregate'] / results['columnar']['aggregate']:.0f} раз")
+            # Суммы совпадают с точностью до копейки (прежние пути складывают float)
+            totals = [r["totals"] for r in results.values()]
+            if any(t.keys() != totals[0].keys() or any(abs(t[k] - totals[0][k]) > 0.011 for k in t) for t in totals):
+                print("  ОШИБКА: суммы по категориям не совпадают", totals)
+            os.remove(path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+# Бенчмарк генератора транзакций (generate_transactions.py) против прежней реализации:
+# корутина на каждую транзакцию и save_batch, который на каждую пачку из 10 записей читает
+# весь transactions.json, дописывает пачку и перезаписывает файл целиком (O(N²) ввода-вывода).
+#
+# Прежняя реализация меряется на небольших N (время растёт квадратично — видно по строкам),
+# новая — на миллионах записей в каждом формате; печатаются записей в секунду, МБ/с и время.
+#
+# Запуск:
+#   python bench_generate.py
+#   python bench_generate.py --records 10000000 --legacy 1000 2000 4000
+#   python bench_generate.py --check
+
+# Импортируем необходимые библиотеки
+import argparse  # Для разбора аргументов командной строки
+import asyncio  # Прежняя реализация — на корутинах
+import csv  # Проверка вывода CSV
+import io  # Проверка на строках в памяти
+import json  # Прежняя реализация и проверка вывода
+import os  # Пути и размер файла
+import random  # Прежняя реализация
+import shutil  # Удаление временного каталога
+import subprocess  # Запуск generate_transactions.py как программы
+import sys  # Путь к интерпретатору, код возврата
+import tempfile  # Временный каталог для файлов
+import time  # Замер времени
+from datetime import datetime  # Метки времени
+from pathlib import Path  # Прежняя реализация
+
+from generate_transactions import CATEGORIES, FORMATS, write_transactions
+from process_transactions import aggregate
+from reader import iter_transactions
+
+
+# ==================== Прежняя реализация (для сравнения) ====================
+
+async def legacy_generate_transaction():
+    await asyncio.sleep(0)
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "category": random.choice(CATEGORIES),
+        "amount": round(random.uniform(50, 5000), 2)
+    }
+
+
+async def legacy_save_batch(batch, filename):
+    if not filename.exists():
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump([], f)
+    with open(filename, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    data.extend(batch)
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4)
+
+
+async def legacy_main(n, filename, batch_size=10):
+    for i in range(0, n, batch_size):
+        batch = [await legacy_generate_transaction() for _ in range(min(batch_size, n - i))]
+        await legacy_save_batch(batch, filename)
+
+
+# ==================== Проверка ====================
+
+# Читает транзакции любого формата в список словарей
+def load(text, fmt):
+    if fmt == "csv":
+        return [{"timestamp": row["timestamp"], "category": row["category"], "amount": float(row["amount"])}
+                for row in csv.DictReader(io.StringIO(text))]
+    return list(iter_transactions(io.StringIO(text)))
+
+
+def generate(n, fmt="json", **options):
+    out = io.StringIO()
+    write_transactions(out, n, fmt, **options)
+    return out.getvalue()
+
+
+def check(workdir, failures):
+    start = datetime(2025, 3, 1)
+    for fmt in FORMATS:
+        text = generate(2500, fmt, batch_size=700, seed=11, start=start)
+        records = load(text, fmt)
+        if fmt == "json" and json.loads(text) != records:
+            failures.append("json: ne sovpadaet s json.loads")
+        stamps = [t["timestamp"] for t in records]
+        # Время первой записи — ровно start, дальше не убывает
+        if len(records) != 2500 or stamps != sorted(stamps) or datetime.fromisoformat(stamps[0]) != start:
+            failures.append(f"{fmt}: chislo zapisej ili poryadok vremeni")
+        if {t["category"] for t in records} != set(CATEGORIES):
+            failures.append(f"{fmt}: kategorii {sorted({t['category'] for t in records})}")
+        if not all(50 <= t["amount"] <= 5000 and round(t["amount"], 2) == t["amount"] for t in records):
+            failures.append(f"{fmt}: summy vne diapazona ili ne v kopejkah")
+        # При том же seed вывод не зависит от размера пачки, а все форматы несут одни и те же данные
+        for batch_size in (1, 999, 100_000):
+            if generate(2500, fmt, batch_size=batch_size, seed=11, start=start) != text:
+                failures.append(f"{fmt}: vyvod zavisit ot razmera pachki {batch_size}")
+        if fmt != "json" and records != load(generate(2500, "json", seed=11, start=start), "json"):
+            failures.append(f"{fmt}: dannye otlichayutsya ot json")
+    # Пустой вывод и необычные названия категорий
+    if json.loads(generate(0)) != [] or generate(0, "jsonl") != "" or generate(0, "csv") != "timestamp,category,amount\n":
+        failures.append("pustoj vyvod")
+    odd = ['a,"b"', "c\\d", "е\nд"]
+    for fmt in FORMATS:
+        got = {t["category"] for t in load(generate(300, fmt, seed=1, categories=odd), fmt)}
+        if got != set(odd):
+            failures.append(f"{fmt}: ekranirovanie kategorij {got}")
+    # Программа целиком: формат по расширению, вывод читается process_transactions
+    def run(args, check=True):
+        return subprocess.run([sys.executable, "generate_transactions.py", *args], check=check, capture_output=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)))
+
+    path = os.path.join(workdir, "t.jsonl")
+    run(["1000", "-o", path, "--seed", "3"])
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+        f.seek(0)
+        totals = aggregate(iter_transactions(f))
+    if not text.startswith('{"timestamp": ') or sum(1 for _ in text.splitlines()) != 1000 or set(totals) != set(CATEGORIES):
+        failures.append(f"generate_transactions.py -o t.jsonl: {text[:80]!r}")
+    # По умолчанию записи дописываются к существующему файлу (как у прежнего генератора),
+    # --overwrite пишет файл заново
+    for fmt in FORMATS:
+        path = os.path.join(workdir, f"append.{fmt}")
+        for extra in ([], [], ["--seed", "4"], ["--overwrite"], []):
+            run(["700", "-o", path, *extra])
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        records = load(text, fmt)
+        if len(records) != 1400 or (fmt == "json" and json.loads(text) != records) or (
+                fmt == "csv" and text.count("timestamp,category,amount") != 1):
+            failures.append(f"{fmt}: dopisyvanie {len(records)} zapisej: {text[-80:]!r}")
+    path = os.path.join(workdir, "empty.json")
+    for content in ("[]", "[\n]\n", "  "):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        run(["5", "-o", path])
+        with open(path, "r", encoding="utf-8") as f:
+            if len(json.load(f)) != 5:
+                failures.append(f"dopisyvanie k {content!r}")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"not": "array"}')
+    if run(["5", "-o", path], check=False).returncode == 0:
+        failures.append("dopisano k fajlu, kotoryj ne JSON-massiv")
+    print("форматы, пачки, seed, экранирование, CLI и дописывание:", "OK" if not failures else "ОШИБКА")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Генератор транзакций: потоковая запись против перезаписи файла")
+    parser.add_argument("--records", type=int, default=10_000_000, help="записей для нового генератора")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--legacy", type=int, nargs="*", default=[1000, 2000, 4000],
+                        help="размеры для прежней реализации (пусто — не мерить)")
+    parser.add_argument("--check", action="store_true", help="проверить вывод генератора")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_generate_")
+    try:
+        if args.check:
+            failures = []
+            check(workdir, failures)
+            for failure in failures:
+                print("ОШИБКА:", failure)
+            print("OK" if not failures else f"ошибок: {len(failures)}")
+            sys.exit(0 if not failures else 1)
+
+        if args.legacy:
+            print("прежняя реализация (пачки по 10, файл перезаписывается на каждую пачку)")
+        for n in args.legacy:
+            filename = Path(workdir) / f"legacy_{n}.json"
+            started = time.perf_counter()
+            asyncio.run(legacy_main(n, filename))
+            elapsed = time.perf_counter() - started
+            print(f"  {n:>10} записей {elapsed:8.2f} с | {n / elapsed:>12,.0f} записей/с")
+            filename.unlink()
+
+        print("generate_transactions.py (потоковая запись, векторная генерация)")
+        for fmt in args.formats:
+            path = os.path.join(workdir, f"transactions.{fmt}")
+            started = time.perf_counter()
+            with open(path, "w", encoding="utf-8", newline="\n") as out:
+                write_transactions(out, args.records, fmt, seed=1)
+            elapsed = time.perf_counter() - started
+            size_mb = os.path.getsize(path) / 1024 ** 2
+            print(f"  {fmt:<5} {args.records:>10} записей {elapsed:8.2f} с | {args.records / elapsed:>12,.0f} записей/с"
+                  f" | {size_mb / elapsed:6.0f} МБ/с | файл {size_mb:,.0f} МБ")
+            os.remove(path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# Бенчмарк параллельного режима (parallel.py, process_transactions.py --workers N).
+#
+# Генерируется файл в формате transactions.json (по умолчанию 20 млн записей — около 2 ГБ),
+# затем он обрабатывается:
+#   single   — однопроцессный поток (reader.iter_transactions + process_transactions.aggregate);
+#   N        — parallel.aggregate_file на N процессах (диапазоны байтов + слияние итогов).
+# Для каждого N печатаются время, записей в секунду, ускорение T(1) / T(N) и эффективность
+# масштабирования T(1) / (N * T(N)); итоги каждого прогона сверяются с single до копейки.
+# Ядер больше, чем есть у машины, давать бессмысленно: ускорения не будет (это тоже видно).
+#
+# Запуск:
+#   python bench_parallel.py
+#   python bench_parallel.py --records 50000000 --workers 1 2 4 8
+#   python bench_parallel.py --check
+
+# Импортируем необходимые библиотеки
+import argparse  # Для разбора аргументов командной строки
+import json  # Файлы для проверки
+import os  # Пути, размер файла, число ядер
+import random  # Данные для проверки
+import shutil  # Удаление временного каталога
+import subprocess  # Запуск process_transactions.py для сравнения вывода
+import sys  # Путь к интерпретатору, код возврата
+import tempfile  # Временный каталог для файлов
+import time  # Замер времени
+
+from bench_stream import write_transactions
+from parallel import aggregate_file, split_ranges
+from process_transactions import aggregate
+from reader import MAX_RECORD, TransactionFormatError, iter_transactions
+
+
+# Итоги однопроцессного пути (как process_transactions.py без --workers)
+def single(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return aggregate(iter_transactions(f))
+
+
+# ==================== Проверка ====================
+
+def check(workdir, failures):
+    rng = random.Random(5)
+    records = [{"timestamp": f"2025-04-{rng.randint(1, 30):02d}T12:00:00",
+                "category": rng.choice(["food", "transport", "здоровье", "кино и театр"]),
+                "amount": round(rng.uniform(0.01, 5000), 2)} for _ in range(3000)]
+    files = {
+        "indent.json": json.dumps(records, indent=4, ensure_ascii=False),
+        "compact.json": json.dumps(records, ensure_ascii=False, separators=(",", ":")),
+        "lines.jsonl": "".join(json.dumps(t, ensure_ascii=False) + "\n" for t in records),
+        "one.json": json.dumps(records[:1]),
+        "empty.json": "[]",
+    }
+    for name, text in files.items():
+        path = os.path.join(workdir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        expected = single(path)
+        with open(path, "rb") as f:
+            data = f.read()
+        for parts in (1, 2, 3, 7, 64, 5000):
+            ranges = split_ranges(path, parts)
+            # Диапазоны идут подряд, покрывают весь файл, и каждый (кроме первого) начинается с записи
+            if ranges[0][0] != 0 or ranges[-1][1] != len(data) or any(
+                    a[1] != b[0] for a, b in zip(ranges, ranges[1:])) or any(
+                    data[start:start + 1] != b"{" for start, _ in ranges[1:]):
+                failures.append(f"{name}: diapazony {parts}: {ranges[:5]}")
+            for workers in (1, 3):
+                got = aggregate_file(path, workers, parts=parts, chunk_size=4096).totals()
+                # Совпадают и суммы, и порядок категорий
+                if list(got.items()) != list(expected.items()):
+                    failures.append(f"{name}: {workers} processa, {parts} chastej: {got} != {expected}")
+
+    # Повреждённый файл: после "}" нет "{" дольше MAX_RECORD байтов — ошибка формата,
+    # а не буфер размером с файл
+    path = os.path.join(workdir, "broken.json")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(files["one.json"][:-1] + "x" * (2 * MAX_RECORD) + "}" + "x" * (2 * MAX_RECORD) + "]")
+    try:
+        split_ranges(path, 4)
+        failures.append("broken.json: diapazony bez oshibki")
+    except TransactionFormatError:
+        pass
+
+    # Вывод process_transactions.py одинаков с --workers и без
+    path = os.path.join(workdir, "indent.json")
+    outputs = [subprocess.run([sys.executable, "process_transactions.py", path, *extra],
+                              capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+               for extra in ([], ["--workers", "2"], ["--workers", "0"])]
+    if not outputs[0] or len(set(outputs)) != 1:
+        failures.append(f"vyvod process_transactions.py raznyj: {outputs}")
+    print("границы диапазонов, слияние и вывод --workers:", "OK" if not failures else "ОШИБКА")
+
+
+def main():
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Масштабирование подсчёта по числу процессов")
+    parser.add_argument("--records", type=int, default=20_000_000, help="число транзакций в файле")
+    parser.add_argument("--workers", type=int, nargs="+", help="числа процессов (ускорение считается от 1)",
+                        default=sorted({1, *(2 ** i for i in range(1, cores.bit_length()) if 2 ** i <= cores), cores}))
+    parser.add_argument("--dir", default=None, help="каталог для файла (по умолчанию временный)")
+    parser.add_argument("--check", action="store_true", help="проверить совпадение с однопроцессным подсчётом")
+    args = parser.parse_args()
+
+    workdir = args.dir or tempfile.mkdtemp(prefix="bench_parallel_")
+    try:
+        if args.check:
+            failures = []
+            check(workdir, failures)
+            for failure in failures:
+                print("ОШИБКА:", failure)
+            print("OK" if not failures else f"ошибок: {len(failures)}")
+            sys.exit(0 if not failures else 1)
+
+        path = os.path.join(workdir, f"transactions_{args.records}.json")
+        if not os.path.exists(path):
+            started = time.perf_counter()
+            write_transactions(path, args.records)
+            print(f"сгенерировано {args.records} транзакций за {time.perf_counter() - started:.1f} с")
+        n = args.records
+        print(f"{n} транзакций, файл {os.path.getsize(path) / 1024 ** 3:.2f} ГБ, доступно ядер: {cores}")
+
+        started = time.perf_counter()
+        expected = single(path)
+        elapsed = time.perf_counter() - started
+        print(f"  single   {elapsed:7.1f} с | {n / elapsed:>10,.0f} записей/с")
+
+        base = None
+        for workers in args.workers:
+            started = time.perf_counter()
+            totals = aggregate_file(path, workers).totals()
+            elapsed = time.perf_counter() - started
+            if workers == 1:
+                base = elapsed
+            line = f"  {workers:>3} пр.  {elapsed:7.1f} с | {n / elapsed:>10,.0f} записей/с"
+            if base:
+                speedup = base / elapsed
+                line += f" | ускорение {speedup:5.2f}x | эффективность {speedup / workers:6.1%}"
+            if workers > cores:
+                line += " (процессов больше, чем ядер)"
+            print(line)
+            if totals != expected or list(totals) != list(expected):
+                print("  ОШИБКА: итоги не совпадают с однопроцессным подсчётом", totals, expected)
+    finally:
+        if args.dir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+# Бенчмарк потоковой обработки транзакций (reader.py + process_transactions.py)
+# против прежней реализации: json.load всего файла и корутина на каждую транзакцию
+# (asyncio.gather по всем сразу).
+#
+# Для каждого размера генерируется файл в формате transactions.json (JSON-массив с indent=4),
+# и каждый способ запускается в отдельном процессе: печатаются записей в секунду и пиковая
+# память процесса (RSS). Прежней реализации ограничивается адресное пространство
+# (--legacy-memory): когда данные не помещаются, вместо падения всей машины от нехватки
+# памяти она получает MemoryError, и это видно в отчёте.
+# Суммы по категориям у обоих способов сравниваются.
+#
+# Запуск:
+#   python bench_stream.py
+#   python bench_stream.py --sizes 1000000 10000000 50000000
+#   python bench_stream.py --check
+#   python bench_stream.py --sizes 1000000 5000000 --check
+
+# Импортируем необходимые библиотеки
+import argparse  # Для разбора аргументов командной строки
+import asyncio  # Прежняя реализация — на корутинах
+import json  # Обмен результатами с дочерним процессом
+import os  # Пути и размер файла
+import random  # Случайные суммы и категории
+import shutil  # Удаление временного каталога
+import subprocess  # Дочерние процессы для замеров
+import sys  # Путь к интерпретатору, код возврата
+import tempfile  # Временный каталог для файлов
+import time  # Замер времени
+from datetime import datetime, timedelta  # Метки времени транзакций
+
+# Размеры по умолчанию: для замера и для --check (проверке хватает секунд, а не минут;
+# память потоковой обработки сравнивается между ними так же)
+SIZES = [1_000_000, 10_000_000, 50_000_000]
+CHECK_SIZES = [20_000, 200_000]
+
+# Категории — как в transactions.json
+CATEGORIES = ["food", "transport", "entertainment", "shopping", "health"]
+
+
+# Функция для записи файла из n транзакций в формате transactions.json (JSON-массив, indent=4)
+def write_transactions(path, n, seed=1):
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[\n")
+        batch = []
+        for i in range(n):
+            timestamp = (start + timedelta(seconds=i)).isoformat()
+            batch.append(
+                "    {\n"
+                f'        "timestamp": "{timestamp}",\n'
+                f'        "category": "{rng.choice(CATEGORIES)}",\n'
+                f'        "amount": {round(rng.uniform(50, 5000), 2)}\n'
+                "    }"
+            )
+            if len(batch) == 10000:
+                f.write(",\n".join(batch) + (",\n" if i + 1 < n else ""))
+                batch = []
+        f.write(",\n".join(batch) + "\n]")
+
+
+# Пик RSS этого процесса в МБ (в Linux — VmHWM из /proc)
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return float("nan")
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# ==================== Прежняя реализация (для сравнения) ====================
+
+async def legacy_process_transaction(transaction, result_dict):
+    await asyncio.sleep(0)
+    cat = transaction["category"]
+    amount = transaction["amount"]
+    result_dict[cat] = result_dict.get(cat, 0) + amount
+
+
+async def legacy_main(path):
+    await asyncio.sleep(0)
+    with open(path, "r", encoding="utf-8") as f:
+        transactions = json.load(f)
+    result = {}
+    tasks = [legacy_process_transaction(t, result) for t in transactions]
+    await asyncio.gather(*tasks)
+    return result
+
+
+# ==================== Дочерний процесс ====================
+
+# Выполняется в дочернем процессе: обрабатывает файл и печатает JSON с итогами замера
+def child(mode, path, memory_limit):
+    started = time.perf_counter()
+    try:
+        if mode == "legacy":
+            if memory_limit:
+                import resource
+                resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+            result = asyncio.run(legacy_main(path))
+        elif mode == "stdin":
+            from process_transactions import aggregate
+            from reader import iter_transactions
+            result = aggregate(iter_transactions(sys.stdin))
+        else:
+            from process_transactions import aggregate
+            from reader import iter_transactions
+            with open(path, "r", encoding="utf-8") as f:
+                result = aggregate(iter_transactions(f))
+        error = None
+    except MemoryError:
+        result, error = {}, "MemoryError"
+    elapsed = time.perf_counter() - started
+    print(json.dumps({
+        "seconds": elapsed,
+        "rss_mb": peak_rss_mb(),
+        "totals": {category: f"{total:.2f}" for category, total in result.items()},
+        "error": error,
+    }))
+
+
+# Проверка разбора: крошечные куски (объекты и числа режутся границей куска), JSON Lines,
+# пустой массив и повреждённые данные
+def check_reader(workdir, failures):
+    import io
+    from reader import TransactionFormatError, iter_transactions
+
+    path = os.path.join(workdir, "small.json")
+    write_transactions(path, 1000, seed=7)
+    with open(path, "r", encoding="utf-8") as f:
+        expected = json.load(f)
+    for chunk_size in (1, 7, 64, 4096):
+        with open(path, "r", encoding="utf-8") as f:
+            if list(iter_transactions(f, chunk_size)) != expected:
+                failures.append(f"razbor kuskami po {chunk_size} ne sovpal s json.load")
+    lines = "\n".join(json.dumps(t) for t in expected) + "\n"
+    if list(iter_transactions(io.StringIO(lines), 50)) != expected:
+        failures.append("JSON Lines razobran neverno")
+    if list(iter_transactions(io.StringIO(" [ ] "), 1)) != [] or list(iter_transactions(io.StringIO(""))) != []:
+        failures.append("pustoj vvod")
+    # Массив без "]" (в том числе обрезанный ровно по записи) и "]" в JSON Lines — тоже ошибки
+    for broken in ('[{"amount": 1}, {"amount": ', '[{"amount": 1}] x', '[1, 2]', '[{"amount": 1}',
+                   '[{"amount": 1},\n', '{"amount": 1}\n]\n{"amount": 2}\n', '{"amount": 1}\n]'):
+        try:
+            list(iter_transactions(io.StringIO(broken), 4))
+            failures.append(f"ne zamechena oshibka v {broken!r}")
+        except TransactionFormatError:
+            pass
+    print("разбор кусками, JSON Lines и повреждённые данные:", "OK" if not failures else "ОШИБКА")
+
+
+# Запускает замер в отдельном процессе
+def measure(mode, path, memory_limit):
+    stdin = open(path, "r", encoding="utf-8") if mode == "stdin" else subprocess.DEVNULL
+    try:
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", mode, path, str(memory_limit)],
+            stdin=stdin, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+    finally:
+        if stdin is not subprocess.DEVNULL:
+            stdin.close()
+    if completed.returncode != 0:
+        return {"error": f"код {completed.returncode}: {completed.stderr.strip()[-200:]}"}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Потоковая обработка транзакций против json.load + gather")
+    parser.add_argument("--sizes", type=int, nargs="+", default=None,
+                        help=f"числа транзакций (по умолчанию {SIZES}, с --check — {CHECK_SIZES})")
+    parser.add_argument("--modes", nargs="+", choices=["legacy", "stream", "stdin"],
+                        default=["legacy", "stream", "stdin"])
+    parser.add_argument("--legacy-memory", type=float, default=3.0,
+                        help="предел адресного пространства прежней реализации, ГБ (0 — без предела)")
+    parser.add_argument("--dir", default=None, help="каталог для сгенерированных файлов (по умолчанию временный)")
+    parser.add_argument("--check", action="store_true",
+                        help="проверить, что суммы совпадают, а память потоковой обработки не растёт с размером")
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        mode, path, memory_limit = args.child
+        child(mode, path, int(memory_limit))
+        return
+    if args.sizes is None:
+        args.sizes = CHECK_SIZES if args.check else SIZES
+
+    workdir = args.dir or tempfile.mkdtemp(prefix="bench_stream_")
+    memory_limit = int(args.legacy_memory * 1024 ** 3)
+    failures = []
+    stream_rss = []
+    try:
+        if args.check:
+            check_reader(workdir, failures)
+        for n in args.sizes:
+            path = os.path.join(workdir, f"transactions_{n}.json")
+            if not os.path.exists(path):
+                started = time.perf_counter()
+                write_transactions(path, n)
+                print(f"сгенерировано {n} транзакций за {time.perf_counter() - started:.1f} с")
+            size_mb = os.path.getsize(path) / 1024 ** 2
+            print(f"\n{n} транзакций, файл {size_mb:.0f} МБ")
+            totals = {}
+            for mode in args.modes:
+                result = measure(mode, path, memory_limit)
+                if result.get("error"):
+                    print(f"  {mode:<7} не справилась: {result['error']}")
+                    continue
+                totals[mode] = result["totals"]
+                if mode != "legacy":
+                    stream_rss.append(result["rss_mb"])
+                print(f"  {mode:<7} {n / result['seconds']:>12,.0f} записей/с | {result['seconds']:7.1f} с"
+                      f" | пик RSS {result['rss_mb']:8.1f} МБ")
+            if len({json.dumps(t, sort_keys=True) for t in totals.values()}) > 1:
+                failures.append(f"{n}: summy ne sovpadayut {totals}")
+                print("  ОШИБКА: суммы по категориям не совпадают")
+    finally:
+        if args.dir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.check:
+        # Память потоковой обработки не зависит от размера входа (в пределах шума интерпретатора)
+        if stream_rss and max(stream_rss) - min(stream_rss) > 20:
+            failures.append(f"pamyat rastyot: {stream_rss}")
+        for failure in failures:
+            print("ОШИБКА:", failure)
+        print("OK" if not failures else f"ошибок: {len(failures)}")
+        sys.exit(0 if not failures else 1)
+
+
+if __name__ == "__main__":
+    main()
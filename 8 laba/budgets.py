@@ -0,0 +1,199 @@
+# Бюджеты по окнам времени: суммы по категориям за день, неделю и месяц и предупреждения
+# в тот момент, когда текущее окно превышает лимит.
+#
+# check_limits() в process_transactions.py сравнивает с LIMITS только итоги за всё время и
+# только после обработки всех записей, а поле timestamp не смотрит. Здесь каждая транзакция
+# сразу добавляется в окна своей категории, и если сумма окна перешла через лимит
+# (была не больше лимита, стала больше), предупреждение отдаётся немедленно — до чтения
+# следующей записи.
+#
+# Виды окон:
+#   * tumbling — календарные: день, неделя (с понедельника, как ISO), месяц. Состояние окна —
+#     начало текущего периода и сумма; новый период обнуляет сумму. O(1) на запись;
+#   * sliding — скользящие: последние 24 часа, 7 суток, 30 суток до текущей записи, то есть
+#     интервал (t - длина, t]. Состояние — очередь записей окна и сумма; вышедшие из окна
+#     записи вычитаются из суммы при следующей записи. O(1) амортизированно на запись.
+# Суммы считаются в копейках (целых), как в process_transactions.aggregate().
+#
+# Записи должны идти по возрастанию времени (так пишет generate_transactions.py). Запоздавшая
+# запись (раньше последней в своём окне) считается пришедшей в момент последней: окна не
+# пересчитываются задним числом, а такие записи учитываются в stats()["late"].
+#
+# Категории в данных могут называться не так, как в лимитах (food в transactions.json и "еда"
+# в LIMITS), поэтому название сначала переводится через category_map; категории без перевода
+# ищутся в лимитах как есть, категории без лимита окнами не отслеживаются.
+
+# Импортируем необходимые библиотеки
+from collections import deque, namedtuple  # Очередь записей скользящего окна, предупреждение
+from datetime import date, datetime, timedelta  # Границы окон
+
+# Окна: календарный период и длина скользящего окна
+PERIODS = ("day", "week", "month")
+SLIDING_LENGTHS = {
+    "day": timedelta(days=1),
+    "week": timedelta(days=7),
+    "month": timedelta(days=30),
+}
+KINDS = ("tumbling", "sliding")
+
+# Названия для вывода
+PERIOD_NAMES = {"day": "день", "week": "неделя", "month": "месяц"}
+SLIDING_NAMES = {"day": "24 часа", "week": "7 суток", "month": "30 суток"}
+
+# Предупреждение о превышении: окно [start, end), сумма и лимит — в рублях
+Alert = namedtuple("Alert", "timestamp category budget kind period start end total limit")
+
+
+# Календарное окно: сумма за текущий день, неделю или месяц
+class Tumbling:
+    __slots__ = ("period", "limit", "key", "total")
+
+    def __init__(self, period, limit):
+        self.period = period
+        self.limit = limit
+        self.key = None
+        self.total = 0
+
+    # Номер периода, в который попадает момент when (растёт вместе со временем)
+    def window_key(self, when):
+        if self.period == "day":
+            return when.toordinal()
+        if self.period == "week":
+            return when.toordinal() - when.weekday()
+        return when.year * 12 + when.month - 1
+
+    # Границы периода по его номеру
+    def bounds(self):
+        if self.period == "month":
+            year, month = divmod(self.key, 12)
+            start = datetime(year, month + 1, 1)
+            year, month = divmod(self.key + 1, 12)
+            return start, datetime(year, month + 1, 1)
+        start = datetime.combine(date.fromordinal(self.key), datetime.min.time())
+        return start, start + timedelta(days=1 if self.period == "day" else 7)
+
+    # Добавляет сумму; True — если окно только что превысило лимит. False вторым значением —
+    # запись опоздала в уже закрытый период
+    def add(self, when, cents):
+        key = self.window_key(when)
+        on_time = self.key is None or key >= self.key
+        if self.key is None or key > self.key:
+            self.key, self.total = key, 0
+        before = self.total
+        self.total += cents
+        return before <= self.limit < self.total, on_time
+
+
+# Скользящее окно: сумма записей за последние length до текущей
+class Sliding:
+    __slots__ = ("period", "length", "limit", "events", "total", "last")
+
+    def __init__(self, period, limit):
+        self.period = period
+        self.length = SLIDING_LENGTHS[period]
+        self.limit = limit
+        self.events = deque()
+        self.total = 0
+        self.last = None
+
+    def bounds(self):
+        return self.last - self.length, self.last
+
+    def add(self, when, cents):
+        on_time = self.last is None or when >= self.last
+        if not on_time:
+            when = self.last
+        self.last = when
+        # Вычитаем записи, которые вышли из окна (t - length, t]
+        events, cutoff = self.events, when - self.length
+        while events and events[0][0] <= cutoff:
+            self.total -= events.popleft()[1]
+        before = self.total
+        events.append((when, cents))
+        self.total += cents
+        return before <= self.limit < self.total, on_time
+
+
+# Отслеживание бюджетов по окнам для потока транзакций
+class BudgetTracker:
+    def __init__(self, limits, category_map=None, periods=PERIODS, kinds=("tumbling",), on_alert=None):
+        # limits: {"day": {категория: рубли}, "week": {...}, "month": {...}}
+        self.limits = {period: {name: round(limit * 100) for name, limit in limits.get(period, {}).items()}
+                       for period in periods}
+        self.category_map = dict(category_map or {})
+        self.kinds = tuple(kinds)
+        self.on_alert = on_alert
+        # Окна по названию лимита (food и "еда" делят одни окна) и кэш: категория из данных -> окна
+        self.windows = {}
+        self._by_category = {}
+        self.records = 0
+        self.late = 0
+        self.alerts = 0
+
+    # Окна категории (создаются при первой записи; без лимитов — пустой список)
+    def _windows(self, category):
+        budget = self.category_map.get(category, category)
+        windows = self.windows.get(budget)
+        if windows is not None:
+            self._by_category[category] = windows
+            return windows
+        windows = []
+        for period, limits in self.limits.items():
+            limit = limits.get(budget)
+            if limit is None:
+                continue
+            if "tumbling" in self.kinds:
+                windows.append(Tumbling(period, limit))
+            if "sliding" in self.kinds:
+                windows.append(Sliding(period, limit))
+        self.windows[budget] = self._by_category[category] = windows
+        return windows
+
+    # Учитывает одну транзакцию; возвращает список предупреждений (обычно пустой)
+    def add(self, transaction):
+        self.records += 1
+        category = transaction["category"]
+        windows = self._by_category.get(category)
+        if windows is None:
+            windows = self._windows(category)
+        if not windows:
+            return []
+        when = datetime.fromisoformat(transaction["timestamp"])
+        cents = round(transaction["amount"] * 100)
+        alerts = []
+        late = False
+        for window in windows:
+            crossed, on_time = window.add(when, cents)
+            late = late or not on_time
+            if crossed:
+                start, end = window.bounds()
+                alert = Alert(when, category, self.category_map.get(category, category),
+                              "sliding" if isinstance(window, Sliding) else "tumbling", window.period,
+                              start, end, window.total / 100, window.limit / 100)
+                alerts.append(alert)
+                self.alerts += 1
+                if self.on_alert is not None:
+                    self.on_alert(alert)
+        self.late += late
+        return alerts
+
+    # Пропускает транзакции через окна и отдаёт их дальше (например, в aggregate())
+    def track(self, transactions):
+        add = self.add
+        for transaction in transactions:
+            add(transaction)
+            yield transaction
+
+    def stats(self):
+        return {"records": self.records, "late": self.late, "alerts": self.alerts}
+
+
+# Функция для текста предупреждения
+def format_alert(alert):
+    name = alert.budget if alert.budget == alert.category else f"{alert.budget} ({alert.category})"
+    if alert.kind == "tumbling":
+        window = f"{PERIOD_NAMES[alert.period]} с {alert.start:%Y-%m-%d}"
+    else:
+        window = f"за {SLIDING_NAMES[alert.period]} до {alert.end.isoformat(timespec='seconds')}"
+    return (f"[ПРЕВЫШЕНИЕ] {alert.timestamp.isoformat(timespec='seconds')} категория '{name}', "
+            f"{window}: {alert.total:.2f} / {alert.limit:.2f}")
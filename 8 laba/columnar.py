@@ -0,0 +1,260 @@
+# Колоночный движок агрегации транзакций на NumPy.
+#
+# Раньше суммы по категориям считались по одной записи: на каждую транзакцию — корутина
+# и переключение цикла событий (await asyncio.sleep(0)) перед обновлением словаря.
+# Здесь транзакции складываются в колонки (массивы NumPy) пачками по batch_size записей:
+#   * codes       — код категории (int32), сами названия — в общем списке categories;
+#   * amounts     — сумма в копейках (int64): сложение целых точное и не зависит от порядка,
+#                   поэтому итоги пачек (и частей файла) можно складывать в любом порядке;
+#   * timestamps  — время транзакции (datetime64[us]).
+# По колонкам группировка считается целиком в NumPy: число записей — np.bincount, сумма —
+# np.add.at (в int64, без потери точности, как было бы с весами bincount во float64),
+# минимум и максимум — np.minimum.at / np.maximum.at, среднее — сумма / число.
+# Итоги пачек сливаются (GroupStats.merge), так что память не зависит от размера входа.
+#
+# Колонки можно собрать из словарей (Columns.from_records — любой поток транзакций) или
+# прямо из текста файла (read_columns): записи вынимаются одним регулярным выражением по
+# целому куску текста, без создания словаря на каждую запись. Выражение описывает запись
+# целиком (строки и числа — по грамматике JSON), а между записями допускаются только
+# пробелы и запятые, так что быстрый путь принимает ровно то, что принял бы reader.
+# Если в куске что-то не сходится (другой порядок полей, лишнее поле, экранирование в
+# строке, мусор между записями), кусок разбирается обычным reader.iter_transactions —
+# он и сообщит об ошибке формата. Скобки JSON-массива read_columns проверяет сам: "["
+# только в начале потока и тогда "]" — в конце.
+
+# Импортируем необходимые библиотеки
+import io  # Разбор куска через reader, если быстрый путь не подошёл
+import re  # Значения полей из текста куска
+from itertools import islice  # Нарезка потока транзакций на пачки
+
+import numpy as np  # Колонки и векторные свёртки
+
+from reader import TransactionFormatError, iter_transactions  # Обычный разбор JSON (запасной путь)
+
+# Размер пачки по умолчанию (записей)
+BATCH_SIZE = 100_000
+
+# Размер куска текста для read_columns (символов)
+TEXT_CHUNK_SIZE = 4 << 20
+
+# Запись целиком, поля в порядке generate_transactions.py: строки без экранирования и
+# управляющих символов, сумма — число JSON. Пробелы — только те, что допускает JSON.
+# Группы — время (если нужно), категория и сумма
+_WS = r"[ \t\n\r]*"
+_STRING = r'"([^"\\\x00-\x1f]*)"'
+_NUMBER = r"(-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?)"
+
+
+def _record(timestamp):
+    return re.compile(
+        r"\{" + _WS + r'"timestamp"' + _WS + ":" + _WS + timestamp + _WS + "," + _WS
+        + r'"category"' + _WS + ":" + _WS + _STRING + _WS + "," + _WS
+        + r'"amount"' + _WS + ":" + _WS + _NUMBER + _WS + r"\}"
+    )
+
+
+_RECORD = {True: _record(_STRING), False: _record(_STRING.replace("(", "(?:"))}
+
+# Что может стоять между записями (как reader._SEPARATORS)
+_GAP = re.compile(r"[\s,]*")
+
+# Пустые значения минимума и максимума для категорий без записей в пачке
+_NO_MIN = np.iinfo(np.int64).max
+_NO_MAX = np.iinfo(np.int64).min
+
+
+# Справочник категорий: название <-> код (общий для всех пачек одного потока)
+class Categories:
+    def __init__(self, names=()):
+        self.names = []
+        self.codes = {}
+        for name in names:
+            self.code(name)
+
+    # Код категории (новая категория получает следующий номер)
+    def code(self, name):
+        code = self.codes.get(name)
+        if code is None:
+            code = self.codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+    def __len__(self):
+        return len(self.names)
+
+
+# Пачка транзакций в колонках
+class Columns:
+    __slots__ = ("categories", "codes", "amounts", "timestamps")
+
+    def __init__(self, categories, codes, amounts, timestamps):
+        self.categories = categories
+        self.codes = codes
+        self.amounts = amounts
+        self.timestamps = timestamps
+
+    def __len__(self):
+        return len(self.codes)
+
+    # Складывает пачку из списка транзакций-словарей
+    @classmethod
+    def from_records(cls, records, categories=None, timestamps=True):
+        if categories is None:
+            categories = Categories()
+        known, add = categories.codes, categories.code
+        names = [t["category"] for t in records]
+        codes = np.array([known[name] if name in known else add(name) for name in names], dtype=np.int32)
+        # Суммы — в копейки: 4335.84 * 100 = 433583.99999999994, поэтому округляем до целого
+        amounts = np.rint(np.array([t["amount"] for t in records], dtype=np.float64) * 100).astype(np.int64)
+        stamps = None
+        if timestamps:
+            stamps = np.array([t["timestamp"] for t in records], dtype="datetime64[us]")
+        return cls(categories, codes, amounts, stamps)
+
+    # Складывает пачку прямо из текста с целыми объектами; None — если текст не подходит
+    # для быстрого пути (тогда его нужно разобрать как JSON). Каждая запись должна целиком
+    # совпасть с _RECORD, а между записями — только разделители: иначе какая-то запись
+    # не распознана (или это вовсе не JSON), и считать записи по найденным полям нельзя
+    @classmethod
+    def from_text(cls, text, categories, timestamps=True):
+        # split отдаёт [разделитель, (время,) категория, сумма, разделитель, ...]
+        step = 4 if timestamps else 3
+        parts = _RECORD[bool(timestamps)].split(text)
+        if len(parts) < step or not _GAP.fullmatch("".join(parts[::step])):
+            return None
+        names, amounts = parts[step - 2::step], parts[step - 1::step]
+        stamps = None
+        if timestamps:
+            stamps = np.array(parts[1::step], dtype="datetime64[us]")
+        known, add = categories.codes, categories.code
+        codes = np.array([known[name] if name in known else add(name) for name in names], dtype=np.int32)
+        amounts = np.rint(np.array(amounts, dtype=np.float64) * 100).astype(np.int64)
+        return cls(categories, codes, amounts, stamps)
+
+    # Число записей, сумма, минимум и максимум по категориям — векторными свёртками
+    def group_by_category(self):
+        size = len(self.categories)
+        counts = np.bincount(self.codes, minlength=size).astype(np.int64)
+        sums = np.zeros(size, dtype=np.int64)
+        np.add.at(sums, self.codes, self.amounts)
+        mins = np.full(size, _NO_MIN, dtype=np.int64)
+        maxs = np.full(size, _NO_MAX, dtype=np.int64)
+        np.minimum.at(mins, self.codes, self.amounts)
+        np.maximum.at(maxs, self.codes, self.amounts)
+        return GroupStats(self.categories.names[:], counts, sums, mins, maxs)
+
+
+# Итоги группировки по категориям (суммы, минимумы и максимумы — в копейках)
+class GroupStats:
+    def __init__(self, names, counts, sums, mins, maxs):
+        self.names = names
+        self.counts = counts
+        self.sums = sums
+        self.mins = mins
+        self.maxs = maxs
+
+    @classmethod
+    def empty(cls):
+        empty = np.zeros(0, dtype=np.int64)
+        return cls([], empty, empty, empty, empty)
+
+    # Сливает итоги другой пачки (или другой части файла) с этими — по названиям категорий
+    def merge(self, other):
+        names = list(self.names)
+        index = {name: i for i, name in enumerate(names)}
+        for name in other.names:
+            if name not in index:
+                index[name] = len(names)
+                names.append(name)
+        size = len(names)
+        where = np.array([index[name] for name in other.names], dtype=np.int64)
+
+        def widen(values, fill):
+            result = np.full(size, fill, dtype=np.int64)
+            result[:len(values)] = values
+            return result
+
+        counts, sums = widen(self.counts, 0), widen(self.sums, 0)
+        mins, maxs = widen(self.mins, _NO_MIN), widen(self.maxs, _NO_MAX)
+        if len(where):
+            counts[where] += other.counts
+            sums[where] += other.sums
+            mins[where] = np.minimum(mins[where], other.mins)
+            maxs[where] = np.maximum(maxs[where], other.maxs)
+        return GroupStats(names, counts, sums, mins, maxs)
+
+    # Итоги в рублях: {категория: {"count", "sum", "min", "max", "mean"}} (в порядке появления)
+    def as_dict(self):
+        result = {}
+        for i, name in enumerate(self.names):
+            count = int(self.counts[i])
+            if not count:
+                continue
+            total = int(self.sums[i])
+            result[name] = {
+                "count": count,
+                "sum": total / 100,
+                "min": int(self.mins[i]) / 100,
+                "max": int(self.maxs[i]) / 100,
+                "mean": total / count / 100,
+            }
+        return result
+
+    # Суммы по категориям в рублях — как aggregate() в process_transactions.py
+    def totals(self):
+        return {name: stats["sum"] for name, stats in self.as_dict().items()}
+
+
+# Поток транзакций -> пачки в колонках (справочник категорий общий)
+def iter_columns(transactions, batch_size=BATCH_SIZE, timestamps=True):
+    categories = Categories()
+    iterator = iter(transactions)
+    while True:
+        records = list(islice(iterator, batch_size))
+        if not records:
+            return
+        yield Columns.from_records(records, categories, timestamps)
+
+
+# Текстовый поток (файл или stdin) -> пачки в колонках, кусками по chunk_size символов.
+# Поток — JSON-массив (тогда "]" обязательна в конце) или JSON Lines (тогда скобок нет).
+# whole=False — поток лишь часть файла (диапазон parallel.py): "[" в начале и "]" в конце
+# тогда необязательны, их проверяют соседние диапазоны
+def read_columns(stream, chunk_size=TEXT_CHUNK_SIZE, timestamps=True, whole=True):
+    categories = Categories()
+    tail = ""
+    array = None  # Массив или JSON Lines — по первому значимому символу
+    while True:
+        chunk = stream.read(chunk_size)
+        text = tail + chunk
+        # Кусок режем после последнего закрытого объекта, остаток уходит в следующий
+        cut = len(text) if not chunk else text.rfind("}") + 1
+        piece, tail = text[:cut], text[cut:]
+        if array is None and piece.strip():
+            piece = piece.lstrip()
+            array = piece.startswith("[")
+            if array:
+                piece = piece[1:]
+        if not chunk:
+            # Последний кусок: закрывающая скобка массива
+            piece = piece.rstrip()
+            if piece.endswith("]") and (array or not whole):
+                piece, array = piece[:-1], False
+            if array and whole:
+                raise TransactionFormatError("Массив не закрыт: нет \"]\" в конце данных")
+        if piece.strip():
+            columns = Columns.from_text(piece, categories, timestamps)
+            if columns is None:
+                columns = Columns.from_records(list(iter_transactions(io.StringIO(piece))), categories, timestamps)
+            if len(columns):
+                yield columns
+        if not chunk:
+            return
+
+
+# Итоги по категориям для потока транзакций: пачка за пачкой, память — одна пачка
+def aggregate_columns(transactions, batch_size=BATCH_SIZE, timestamps=False):
+    stats = GroupStats.empty()
+    for columns in iter_columns(transactions, batch_size, timestamps):
+        stats = stats.merge(columns.group_by_category())
+    return stats
@@ -1,78 +1,193 @@
 # Импортируем необходимые библиотеки
-import asyncio  # Для асинхронного выполнения задач
-import json  # Для работы с форматом JSON
-import random  # Для генерации случайных данных
-import time  # Для работы со временем (не используется напрямую, но может понадобиться)
-from datetime import datetime  # Для получения текущего времени
-from pathlib import Path  # Для работы с путями к файлам
+import argparse  # Для разбора аргументов командной строки
+import json  # Для экранирования названий категорий в JSON
+import os  # Для проверки, есть ли уже файл для дописывания
+import sys  # Для вывода в stdout
+from datetime import datetime  # Для времени первой транзакции
+
+import numpy as np  # Для векторной генерации случайных данных
 
 # Задаём список категорий для транзакций
 CATEGORIES = ["еда", "транспорт", "развлечения", "шоппинг", "здоровье"]
 
-# Функция для генерации одной транзакции
-async def generate_transaction():
-    # Задержка для асинхронного выполнения (имитация выполнения асинхронной задачи)
-    await asyncio.sleep(0)
-    
-    # Возвращаем транзакцию с текущей временной меткой, случайной категорией и случайной суммой
-    return {
-        "timestamp": datetime.now().isoformat(),  # Текущее время в формате ISO
-        "category": random.choice(CATEGORIES),  # Случайно выбираем категорию из списка
-        "amount": round(random.uniform(50, 5000), 2)  # Генерируем случайную сумму от 50 до 5000 с двумя знаками после запятой
-    }
+# Форматы вывода
+FORMATS = ("json", "jsonl", "csv")
+
+# Размер пачки по умолчанию: столько записей генерируется и записывается за раз
+BATCH_SIZE = 100_000
+
+# Функция для создания генераторов случайных чисел: отдельный поток на каждую колонку,
+# поэтому результат при том же seed не зависит от размера пачки
+def make_generators(seed):
+    return [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(3)]
+
+# Функция для генерации пачки транзакций в колонках (векторно, без цикла по записям).
+# Раньше каждая транзакция создавалась своей корутиной; теперь пачка — это три массива:
+# время (интервалы между транзакциями — экспоненциальные, время растёт), коды категорий
+# и суммы в копейках (равномерно от min_amount до max_amount, как round(uniform(), 2)).
+# last — время предыдущей записи; у самой первой пачки (first) интервала перед первой
+# записью нет — её время и есть last (то есть start)
+def generate_batch(generators, size, last, interval, min_amount, max_amount, categories, first=False):
+    time_rng, category_rng, amount_rng = generators
+    gaps = np.rint(time_rng.exponential(interval * 1e6, size)).astype(np.int64)  # Интервалы в микросекундах
+    if first:
+        gaps[0] = 0  # Интервал всё равно выбирается: вывод при том же seed не зависит от размера пачки
+    timestamps = last + np.cumsum(gaps).astype("timedelta64[us]")
+    codes = category_rng.integers(0, len(categories), size)
+    cents = amount_rng.integers(round(min_amount * 100), round(max_amount * 100), size, endpoint=True)
+    return timestamps, codes, cents
+
+# Функция для поля CSV: кавычки — только если в значении есть запятая, кавычка или перевод строки
+def csv_field(value):
+    if any(ch in value for ch in ',"\r\n'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
 
-# Функция для генерации партии транзакций
-async def generate_batch(batch_size: int):
-    # Генерируем заданное количество транзакций (batch_size)
-    return [await generate_transaction() for _ in range(batch_size)]  # Генерация списка из batch_size транзакций
+# Функция для перевода пачки в текст нужного формата.
+# Неизменные куски записи (названия полей и категория) собираются заранее, так что на
+# запись остаётся одно соединение трёх строк
+def format_batch(timestamps, codes, cents, fmt, categories):
+    stamps = np.datetime_as_string(timestamps).tolist()  # Время в формате ISO: 2025-11-20T14:41:54.243114
+    amounts = list(map(repr, (cents / 100).tolist()))  # Суммы как в json.dump: 4335.84, 50.1
+    if fmt == "csv":
+        categories = [csv_field(c) for c in categories]
+    else:
+        categories = [json.dumps(c, ensure_ascii=False)[1:-1] for c in categories]
+    if fmt == "json":
+        # Как json.dump(data, f, indent=4)
+        middles = [f'",\n        "category": "{c}",\n        "amount": ' for c in categories]
+        head, tail, sep = '    {\n        "timestamp": "', "\n    }", ",\n"
+    elif fmt == "jsonl":
+        middles = [f'", "category": "{c}", "amount": ' for c in categories]
+        head, tail, sep = '{"timestamp": "', "}", "\n"
+    else:
+        middles = [f",{c}," for c in categories]
+        head, tail, sep = "", "", "\n"
+    middles = list(map(middles.__getitem__, codes.tolist()))
+    # Записи отделяем друг от друга одним соединением: tail + sep + head
+    return head + (tail + sep + head).join(map("".join, zip(stamps, middles, amounts))) + tail
 
-# Функция для сохранения пачки транзакций в файл
-async def save_batch(batch, batch_number):
-    # Задаём путь к файлу, где будут храниться транзакции
-    filename = Path("transactions.json")
-    
-    # Если файл не существует, создаём пустой файл с пустым массивом
-    if not filename.exists():
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump([], f)  # Записываем пустой список в файл
-    
-    # Читаем уже существующие данные из файла
-    with open(filename, "r", encoding="utf-8") as f:
-        data = json.load(f)  # Загружаем данные в формате JSON
-    
-    # Добавляем новые транзакции к существующим
-    data.extend(batch)
-    
-    # Сохраняем обновлённый список транзакций в файл
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4)  # Сохраняем данные в формате JSON с отступами для читаемости
-    
-    # Выводим сообщение о том, сколько записей было добавлено
-    print(f"[ИНФО] Сохранена пачка #{batch_number} — {len(batch)} записей")
+# Функция для потоковой записи n транзакций: пачка генерируется, форматируется и сразу
+# дописывается в вывод. Раньше на каждую пачку весь файл читался заново и перезаписывался
+# (O(N²) ввода-вывода); теперь каждая запись пишется ровно один раз, память — одна пачка.
+# header=False — вывод продолжает уже начатые данные (см. prepare_append): без "[" у JSON
+# и без строки заголовка у CSV
+def write_transactions(out, n, fmt="json", batch_size=BATCH_SIZE, seed=None, start=None, interval=1.0,
+                       min_amount=50, max_amount=5000, categories=CATEGORIES, header=True):
+    generators = make_generators(seed)
+    last = np.datetime64(start or datetime.now(), "us")
+    # Заголовок и разделитель между пачками для каждого формата
+    if fmt == "json":
+        if header:
+            out.write("[\n" if n else "[")
+        between = ",\n"
+    else:
+        if fmt == "csv" and header:
+            out.write("timestamp,category,amount\n")
+        between = "\n"
+    written = 0
+    while written < n:
+        size = min(batch_size, n - written)
+        timestamps, codes, cents = generate_batch(generators, size, last, interval, min_amount, max_amount,
+                                                  categories, first=not written)
+        last = timestamps[-1]
+        text = format_batch(timestamps, codes, cents, fmt, categories)
+        if fmt == "json":
+            out.write(between + text if written else text)  # Запятая — между пачками, не после последней
+        else:
+            out.write(text + between)
+        written += size
+    if fmt == "json":
+        out.write("\n]" if n else "]")
+    return written
+
+# Функция для поиска последнего значимого (не пробельного) байта файла до позиции end:
+# возвращает (позиция, байт) или (None, b"") — до end одни пробелы
+def last_significant(f, end):
+    while end > 0:
+        begin = max(0, end - 4096)
+        f.seek(begin)
+        block = f.read(end - begin).rstrip()
+        if block:
+            return begin + len(block) - 1, block[-1:]
+        end = begin
+    return None, b""
+
+# Функция для подготовки файла к дописыванию. Прежний генератор дописывал пачки к уже
+# существующему transactions.json, и по умолчанию так и осталось (--overwrite — писать
+# файл заново). Возвращает (нужен ли заголовок, текст перед первой новой записью).
+# У JSON-массива отрезается закрывающая "]" — новые записи продолжают тот же массив,
+# а write_transactions закроет его снова; файл при этом не читается целиком
+def prepare_append(path, fmt):
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return True, ""
+    with open(path, "r+b") as f:
+        pos, char = last_significant(f, f.seek(0, os.SEEK_END))
+        if pos is None:
+            # В файле одни пробелы — пишем его как новый
+            f.truncate(0)
+            return True, ""
+        if fmt != "json":
+            f.truncate(pos + 1)
+            return False, "\n"
+        if char != b"]":
+            raise ValueError(f"{path}: не JSON-массив (нет \"]\" в конце), дописать нельзя — нужен --overwrite")
+        pos, char = last_significant(f, pos)
+        f.truncate(pos + 1)
+        # Пустой массив продолжается без запятой
+        return False, "\n" if char == b"[" else ",\n"
 
 # Главная функция, которая управляет всей логикой
-async def main():
-    # Запрашиваем у пользователя количество транзакций, которые нужно сгенерировать
-    n = int(input("Введите количество транзакций: "))
-    
-    # Устанавливаем размер пачки — 10 транзакций в одну партию
-    batch_size = 10
-    
-    # Вычисляем, сколько всего пачек нужно создать
-    total_batches = (n + batch_size - 1) // batch_size  # Округление вверх для получения количества пачек
-    batch_number = 1  # Номер текущей пачки, начиная с 1
-    
-    # Генерируем и сохраняем транзакции партиями
-    for i in range(0, n, batch_size):
-        # Генерируем пачку транзакций
-        batch = await generate_batch(min(batch_size, n - i))  # Генерируем до 10 транзакций, если осталось меньше
-        # Сохраняем текущую пачку
-        await save_batch(batch, batch_number)
-        batch_number += 1  # Увеличиваем номер пачки на 1
-    
-    # Сообщаем, что генерация завершена
-    print("\nГенерация завершена. Файл сохранён как transactions.json")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Генерация случайных транзакций")
+    parser.add_argument("count", type=int, help="количество транзакций")
+    parser.add_argument("-o", "--output", default="transactions.json", help='файл для записи, "-" — stdout')
+    parser.add_argument("--format", choices=FORMATS, default=None,
+                        help="формат: JSON-массив, JSON Lines или CSV (по умолчанию — по расширению файла, иначе json)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="записей в пачке")
+    parser.add_argument("--seed", type=int, default=None, help="зерно генератора (для воспроизводимых данных)")
+    parser.add_argument("--start", type=datetime.fromisoformat, default=None,
+                        help="время первой транзакции, ISO (по умолчанию — сейчас)")
+    parser.add_argument("--interval", type=float, default=1.0, help="средний интервал между транзакциями, секунд")
+    parser.add_argument("--min-amount", type=float, default=50, help="минимальная сумма")
+    parser.add_argument("--max-amount", type=float, default=5000, help="максимальная сумма")
+    parser.add_argument("--categories", nargs="+", default=CATEGORIES, help="категории транзакций")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="записать файл заново (по умолчанию записи дописываются к существующему файлу)")
+    args = parser.parse_args(argv)
+    if args.count < 0 or args.batch_size < 1:
+        parser.error("количество транзакций не может быть отрицательным, а размер пачки — меньше 1")
+    if args.interval < 0 or args.min_amount > args.max_amount:
+        parser.error("интервал не может быть отрицательным, а минимальная сумма — больше максимальной")
+    if args.format is None:
+        # Формат по расширению файла: .jsonl и .csv, всё остальное — JSON-массив
+        args.format = next((fmt for fmt in ("jsonl", "csv") if args.output.endswith("." + fmt)), "json")
+
+    # Пишем транзакции пачками прямо в файл (или stdout): по умолчанию — в конец существующего файла
+    header, glue, mode = True, "", "w"
+    if args.output != "-" and not args.overwrite:
+        if not args.count and os.path.exists(args.output):
+            # Дописывать нечего, файл остаётся как был
+            print(f"[ИНФО] Сгенерировано 0 транзакций ({args.format}) -> {args.output}", file=sys.stderr)
+            return
+        try:
+            header, glue = prepare_append(args.output, args.format)
+        except ValueError as error:
+            parser.error(str(error))
+        mode = "w" if header else "a"
+    out = sys.stdout if args.output == "-" else open(args.output, mode, encoding="utf-8", newline="\n")
+    try:
+        out.write(glue)
+        written = write_transactions(out, args.count, args.format, args.batch_size, args.seed, args.start,
+                                     args.interval, args.min_amount, args.max_amount, args.categories, header)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    # Сообщаем, что генерация завершена (в stderr, чтобы не смешивать с данными при выводе в stdout)
+    action = "дописано к" if not header else "->"
+    print(f"[ИНФО] Сгенерировано {written} транзакций ({args.format}) {action} {args.output}", file=sys.stderr)
 
 # Если скрипт запускается напрямую, вызываем главную функцию
 if __name__ == "__main__":
-    asyncio.run(main())  # Запускаем главную асинхронную функцию
+    main()
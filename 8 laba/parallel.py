@@ -0,0 +1,121 @@
+# Параллельная обработка файла транзакций: map-reduce на пуле процессов.
+#
+# Файл делится на диапазоны байтов (split_ranges), каждый процесс пула считает итоги своего
+# диапазона (aggregate_range: columnar.read_columns + свёртки NumPy), а координатор сливает
+# частичные итоги (GroupStats.merge) в порядке диапазонов. Суммы хранятся в копейках (int64),
+# поэтому итог не зависит ни от числа процессов, ни от порядка сложения и совпадает с
+# однопроцессным process_transactions.aggregate() до копейки, а категории идут в порядке
+# первого появления в файле.
+#
+# Границы диапазонов выравниваются по началу записи: от примерной границы ищется ближайшее
+# место, где закрытый объект "}" через пробелы и запятые продолжается открывающей "{".
+# Подходит и для JSON-массива (в том числе с indent=4), и для JSON Lines; внутри строковых
+# значений не должно быть такой последовательности (у generate_transactions.py её нет).
+# Поток stdin так разделить нельзя — только файл.
+
+# Импортируем необходимые библиотеки
+import io  # Текстовое чтение диапазона байтов
+import os  # Размер файла и число ядер
+import re  # Поиск начала записи возле границы
+from concurrent.futures import ProcessPoolExecutor  # Пул процессов
+
+from columnar import TEXT_CHUNK_SIZE, GroupStats, read_columns  # Итоги диапазона в колонках
+from reader import MAX_RECORD, TransactionFormatError  # Предел записи и ошибка формата
+
+# Диапазонов на процесс: несколько мелких частей выравнивают нагрузку, если один процесс отстаёт
+PARTS_PER_WORKER = 4
+
+# Сколько байтов читать за раз при поиске границы записи
+_SCAN_SIZE = 1 << 16
+
+# Конец объекта, разделители и начало следующего — позиция "{" и есть граница
+_RECORD_START = re.compile(rb"}[\s,]*{")
+
+
+# Диапазон байтов файла как поток: читает не дальше end
+class _Range(io.RawIOBase):
+    def __init__(self, file, start, end):
+        self.file = file
+        self.file.seek(start)
+        self.left = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self.left)
+        if size <= 0:
+            return 0
+        read = self.file.readinto(memoryview(buffer)[:size])
+        self.left -= read
+        return read
+
+
+# Функция для поиска начала первой записи на позиции offset или после неё (size — если записей нет).
+# Между "}" и "{" копится не больше MAX_RECORD байтов: если разделитель настолько длинный
+# (или после "}" идёт что-то, кроме разделителей и "{"), файл повреждён — иначе буфер
+# рос бы до конца файла
+def _record_boundary(f, offset, size):
+    f.seek(offset)
+    data = b""
+    while True:
+        block = f.read(_SCAN_SIZE)
+        # От прошлого блока остаётся только хвост с последней "}" — последовательность,
+        # разрезанная границей блока, найдётся целиком
+        data += block
+        match = _RECORD_START.search(data)
+        if match:
+            return offset + match.end() - 1
+        if not block:
+            return size
+        # Длинные пробелы между записями не копим целиком: хватит хвоста от последней "}"
+        last = data.rfind(b"}")
+        if last < 0:
+            offset, data = offset + len(data), b""
+        elif last > 0:
+            offset, data = offset + last, data[last:]
+        if len(data) > MAX_RECORD:
+            raise TransactionFormatError(f"Нет начала записи в {len(data)} байтах после позиции {offset}: "
+                                         f"{data[:80]!r}")
+
+
+# Функция для деления файла на parts диапазонов байтов [start, end), выровненных по началу записи
+def split_ranges(path, parts):
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, "rb") as f:
+        for i in range(1, parts):
+            bound = _record_boundary(f, max(size * i // parts, bounds[-1]), size)
+            if bounds[-1] < bound < size:
+                bounds.append(bound)
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+# Функция для подсчёта итогов одного диапазона (выполняется в процессе пула)
+def aggregate_range(path, start, end, chunk_size=TEXT_CHUNK_SIZE):
+    stats = GroupStats.empty()
+    with open(path, "rb", buffering=0) as f, \
+            io.TextIOWrapper(io.BufferedReader(_Range(f, start, end)), encoding="utf-8") as stream:
+        # Диапазон — часть файла: скобки массива есть только у первого и последнего
+        for columns in read_columns(stream, chunk_size, timestamps=False, whole=False):
+            stats = stats.merge(columns.group_by_category())
+    return stats
+
+
+# Функция для подсчёта итогов файла на workers процессах (0 — по числу ядер)
+def aggregate_file(path, workers=0, parts=None, chunk_size=TEXT_CHUNK_SIZE):
+    workers = workers or os.cpu_count() or 1
+    ranges = split_ranges(path, parts or workers * PARTS_PER_WORKER)
+    stats = GroupStats.empty()
+    if workers == 1:
+        # Один процесс — без пула: не тратим время на запуск и передачу итогов
+        for start, end in ranges:
+            stats = stats.merge(aggregate_range(path, start, end, chunk_size))
+        return stats
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # map отдаёт итоги в порядке диапазонов — категории остаются в порядке появления в файле
+        columns = zip(*[(path, start, end, chunk_size) for start, end in ranges])
+        for partial in pool.map(aggregate_range, *columns):
+            stats = stats.merge(partial)
+    return stats
@@ -1,6 +1,12 @@
 # Импортируем необходимые библиотеки
-import asyncio  # Для асинхронного выполнения задач
-import json  # Для работы с форматом JSON
+import argparse  # Для разбора аргументов командной строки
+import json  # Для чтения лимитов и перевода категорий из файлов
+import sys  # Для чтения транзакций из stdin
+
+from reader import CHUNK_SIZE, iter_transactions  # Потоковое чтение транзакций по одной
+from parallel import aggregate_file  # Параллельный подсчёт на пуле процессов
+from columnar import TEXT_CHUNK_SIZE, GroupStats, read_columns  # Колоночный движок на NumPy
+from budgets import KINDS, PERIODS, BudgetTracker, format_alert  # Лимиты по окнам времени
 
 # Задаём лимиты для категорий расходов
 LIMITS = {
@@ -11,30 +17,62 @@ LIMITS = {
     "здоровье": 30000  # Лимит для категории "здоровье"
 }
 
-# Функция для загрузки транзакций из файла
-async def load_transactions():
-    await asyncio.sleep(0)  # Асинхронная задержка (имитация асинхронного выполнения)
-    
-    # Открываем файл для чтения и загружаем данные в формате JSON
-    with open("transactions.json", "r", encoding="utf-8") as f:
-        return json.load(f)  # Возвращаем данные из файла в виде списка
+# Лимиты для окон времени (--windows): за день, неделю и месяц (месячные — те же LIMITS)
+WINDOW_LIMITS = {
+    "day": {"еда": 3000, "транспорт": 1500, "развлечения": 2500, "шоппинг": 5000, "здоровье": 3000},
+    "week": {"еда": 15000, "транспорт": 6000, "развлечения": 8000, "шоппинг": 20000, "здоровье": 10000},
+    "month": LIMITS,
+}
+
+# Перевод категорий из данных в названия лимитов (в transactions.json категории английские)
+CATEGORY_MAP = {
+    "food": "еда",
+    "transport": "транспорт",
+    "entertainment": "развлечения",
+    "shopping": "шоппинг",
+    "health": "здоровье"
+}
+
+# Функция для открытия входных данных: путь к файлу или "-" для stdin
+def open_input(path):
+    if path == "-":
+        return sys.stdin  # Читаем поток, например: cat transactions.json | python process_transactions.py -
+    return open(path, "r", encoding="utf-8")
+
+# Функция для подсчёта сумм по категориям по мере чтения транзакций.
+# Раньше все транзакции загружались в список, и на каждую создавалась корутина
+# (asyncio.gather по миллионам объектов). Теперь каждая запись сразу добавляется
+# к сумме своей категории и больше не хранится: память не зависит от размера входа.
+# Суммы копятся в копейках (целых): итог не зависит от порядка сложения и совпадает
+# с параллельным режимом (--workers) до копейки.
+def aggregate(transactions):
+    # Создаём пустой словарь для хранения суммы по каждой категории (в копейках)
+    result = {}
+    for transaction in transactions:
+        # Извлекаем категорию и сумму транзакции
+        cat = transaction["category"]
+        # Добавляем сумму к соответствующей категории в словарь
+        result[cat] = result.get(cat, 0) + round(transaction["amount"] * 100)  # Если категория уже есть, добавляем сумму
+    return {cat: cents / 100 for cat, cents in result.items()}
 
-# Функция для обработки одной транзакции
-async def process_transaction(transaction, result_dict):
-    await asyncio.sleep(0)  # Асинхронная задержка для имитации работы
-    
-    # Извлекаем категорию и сумму транзакции
-    cat = transaction["category"]
-    amount = transaction["amount"]
-    
-    # Добавляем сумму к соответствующей категории в словарь
-    result_dict[cat] = result_dict.get(cat, 0) + amount  # Если категория уже есть, добавляем сумму
+# Функция для подсчёта колоночным движком: файл читается кусками прямо в колонки NumPy,
+# итоги пачек сливаются — число записей, сумма, минимум, максимум и среднее по категориям
+def aggregate_stats(stream, chunk_size=TEXT_CHUNK_SIZE):
+    stats = GroupStats.empty()
+    for columns in read_columns(stream, chunk_size, timestamps=False):
+        stats = stats.merge(columns.group_by_category())
+    return stats
+
+# Функция для чтения JSON-файла настроек (лимиты, перевод категорий)
+def load_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
 
 # Функция для проверки лимитов
-async def check_limits(result_dict):
+def check_limits(result_dict, category_map=CATEGORY_MAP):
     # Проходим по всем категориям и проверяем, не превышены ли лимиты
     for category, total in result_dict.items():
-        limit = LIMITS.get(category, None)  # Получаем лимит для текущей категории
+        limit = LIMITS.get(category_map.get(category, category), None)  # Получаем лимит для текущей категории
         if limit and total > limit:  # Если лимит существует и сумма превышает лимит
             # Выводим предупреждение о превышении лимита
             print(f"[ПРЕДУПРЕЖДЕНИЕ] Категория '{category}' превысила лимит! {total:.2f} / {limit}")
@@ -43,27 +81,81 @@ async def check_limits(result_dict):
             print(f"[ОК] {category}: {total:.2f}")
 
 # Главная функция, которая управляет всей логикой
-async def main():
-    # Загружаем транзакции из файла
-    transactions = await load_transactions()
-    
-    # Создаём пустой словарь для хранения суммы по каждой категории
-    result = {}
-    
-    # Создаём список задач для обработки всех транзакций
-    tasks = [process_transaction(t, result) for t in transactions]
-    
-    # Выполняем все задачи асинхронно
-    await asyncio.gather(*tasks)
-    
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Суммы транзакций по категориям и проверка лимитов")
+    parser.add_argument("input", nargs="?", default="transactions.json",
+                        help='файл с транзакциями (JSON-массив или JSON Lines), "-" — читать stdin')
+    parser.add_argument("--chunk-size", type=int, default=None,
+                        help=f"размер куска чтения, символов (по умолчанию {CHUNK_SIZE}, для columnar — {TEXT_CHUNK_SIZE})")
+    parser.add_argument("--engine", choices=("stream", "columnar"), default="stream",
+                        help="stream — запись за записью; columnar — колонки NumPy, печатает число записей, "
+                             "сумму, минимум, максимум и среднее по категориям")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="число процессов для параллельного подсчёта (0 — по числу ядер, 1 — в одном процессе)")
+    parser.add_argument("--windows", nargs="*", choices=PERIODS,
+                        help="следить за лимитами по окнам времени (без значений — день, неделя и месяц)")
+    parser.add_argument("--kinds", nargs="+", choices=KINDS, default=["tumbling"],
+                        help="виды окон: календарные (tumbling) и/или скользящие (sliding)")
+    parser.add_argument("--limits", help="JSON-файл с лимитами окон: {\"day\": {категория: сумма}, ...}")
+    parser.add_argument("--category-map", help="JSON-файл с переводом категорий: {\"food\": \"еда\", ...}")
+    args = parser.parse_args(argv)
+    if args.workers < 0:
+        parser.error("--workers не может быть отрицательным")
+    if args.workers != 1 and args.input == "-":
+        parser.error("stdin нельзя разделить между процессами: для --workers нужен файл")
+    if args.workers != 1 and args.windows is not None:
+        parser.error("окна времени считаются по порядку записей: --windows работает только без --workers")
+    if args.engine == "columnar" and args.windows is not None:
+        parser.error("окна времени обновляются на каждой записи: --windows работает только с --engine stream")
+    category_map = load_json(args.category_map) if args.category_map else CATEGORY_MAP
+    columnar = args.engine == "columnar" or args.workers != 1
+    chunk_size = args.chunk_size or (TEXT_CHUNK_SIZE if columnar else CHUNK_SIZE)
+
+    stats = None
+    if args.workers != 1:
+        # Делим файл на диапазоны байтов, считаем их на пуле процессов и сливаем итоги
+        stats = aggregate_file(args.input, args.workers, chunk_size=chunk_size)
+    elif columnar:
+        # Читаем файл кусками прямо в колонки и считаем итоги векторно
+        f = open_input(args.input)
+        try:
+            stats = aggregate_stats(f, chunk_size)
+        finally:
+            if f is not sys.stdin:
+                f.close()
+    else:
+        # Читаем транзакции потоком и сразу складываем суммы по категориям
+        f = open_input(args.input)
+        try:
+            transactions = iter_transactions(f, chunk_size)
+            if args.windows is not None:
+                # Окна обновляются на каждой записи, предупреждения печатаются сразу
+                tracker = BudgetTracker(load_json(args.limits) if args.limits else WINDOW_LIMITS, category_map,
+                                        args.windows or PERIODS, args.kinds,
+                                        on_alert=lambda alert: print(format_alert(alert)))
+                transactions = tracker.track(transactions)
+            result = aggregate(transactions)
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+    if stats is not None:
+        result = stats.totals()
+
     # Выводим результаты по категориям
     print("\nРезультаты по категориям:")
-    for k, v in result.items():
-        print(f"{k}: {v:.2f}")
-    
+    if args.engine == "columnar":
+        # Колоночный движок считает не только суммы
+        for k, row in stats.as_dict().items():
+            print(f"{k}: {row['sum']:.2f} (записей {row['count']}, мин {row['min']:.2f}, "
+                  f"макс {row['max']:.2f}, среднее {row['mean']:.2f})")
+    else:
+        for k, v in result.items():
+            print(f"{k}: {v:.2f}")
+
     # Проверяем лимиты по категориям
-    await check_limits(result)
+    check_limits(result, category_map)
 
 # Если скрипт запускается напрямую, вызываем главную функцию
 if __name__ == "__main__":
-    asyncio.run(main())  # Запускаем главную асинхронную функцию
+    main()
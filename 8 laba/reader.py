@@ -0,0 +1,90 @@
+# Потоковое чтение транзакций: записи разбираются по одной, по мере чтения файла.
+#
+# Раньше load_transactions() делал json.load всего transactions.json: в памяти
+# одновременно оказывался весь список словарей. Здесь файл читается кусками по
+# chunk_size символов, а из буфера по очереди вынимаются готовые JSON-объекты
+# (json.JSONDecoder.raw_decode), так что в памяти — только текущий кусок и одна запись.
+#
+# Понимает оба формата, которые встречаются на входе:
+#   * JSON-массив объектов (как пишет generate_transactions.py, в том числе с indent=4);
+#   * JSON Lines — по объекту на строку (например, поток из другой программы в stdin).
+# Массив должен быть закрыт "]" (иначе файл обрезан), а в JSON Lines скобок нет вовсе —
+# в обоих случаях иначе TransactionFormatError, а не молча потерянные записи.
+
+# Импортируем необходимые библиотеки
+import json  # Разбор отдельных JSON-объектов
+import re  # Пропуск пробелов и разделителей между объектами
+
+# Размер куска чтения по умолчанию (в символах)
+CHUNK_SIZE = 1 << 20
+
+# Запись длиннее этого (и двух кусков) считается повреждённой: иначе на испорченном файле
+# буфер рос бы до его конца
+MAX_RECORD = 1 << 20
+
+# Между объектами могут стоять пробелы, переводы строк и запятые
+_SEPARATORS = re.compile(r"[\s,]*")
+
+# Один декодер на все вызовы (у него нет изменяемого состояния)
+_DECODER = json.JSONDecoder()
+
+
+# Ошибка формата входных данных
+class TransactionFormatError(ValueError):
+    pass
+
+
+# Генератор транзакций из текстового потока (файл или sys.stdin)
+def iter_transactions(stream, chunk_size=CHUNK_SIZE):
+    decode = _DECODER.raw_decode
+    skip = _SEPARATORS.match
+    max_tail = max(MAX_RECORD, 2 * chunk_size)
+    # Читаем до первого значимого символа: по нему видно, массив это или JSON Lines
+    buffer = ""
+    chunk = stream.read(chunk_size)
+    while chunk and not buffer.strip():
+        buffer = buffer.lstrip() + chunk
+        chunk = stream.read(chunk_size) if not buffer.strip() else ""
+    eof = not buffer
+    pos = skip(buffer).end()
+    # Файл-массив: пропускаем открывающую скобку. Тогда массив обязан закрыться "]",
+    # а в JSON Lines скобки "]" быть не может
+    array = buffer.startswith("[", pos)
+    if array:
+        pos = skip(buffer, pos + 1).end()
+    while True:
+        # Разбираем все целые объекты, которые уже есть в буфере
+        while pos < len(buffer):
+            if buffer[pos] == "]":
+                if not array:
+                    raise TransactionFormatError(f"Лишняя \"]\" в JSON Lines: {buffer[pos:pos + 80]!r}")
+                # Конец массива — дальше могут быть только пробелы
+                rest = buffer[pos + 1:]
+                while rest:
+                    if rest.strip():
+                        raise TransactionFormatError("Лишние данные после конца массива")
+                    rest = stream.read(chunk_size)
+                return
+            try:
+                record, end = decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Объект обрезан концом куска — дочитаем и попробуем снова
+                if eof or len(buffer) - pos > max_tail:
+                    raise TransactionFormatError(f"Неполная или повреждённая запись: {buffer[pos:pos + 80]!r}")
+                break
+            if end == len(buffer) and not eof:
+                # Число на самом краю куска могло быть обрезано — дочитываем
+                break
+            if not isinstance(record, dict):
+                raise TransactionFormatError(f"Транзакция должна быть объектом, а не {record!r:.80}")
+            yield record
+            pos = skip(buffer, end).end()
+        if eof:
+            if array:
+                raise TransactionFormatError("Массив не закрыт: нет \"]\" в конце данных")
+            return
+        # Оставляем только неразобранный хвост и дочитываем следующий кусок
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = skip(buffer).end()